@@ -2,6 +2,7 @@ from slips_files.common.abstracts import Module
 from slips_files.common.config_parser import ConfigParser
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 import multiprocessing
 import sys
 from ..CESNET.warden_client import Client, read_cfg
@@ -27,7 +28,8 @@ class Module(Module, multiprocessing.Process):
         self.outputqueue = outputqueue
         __database__.start(redis_port)
         self.read_configuration()
-        self.c1 = __database__.subscribe('export_evidence')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('export_evidence', self.handle_export_evidence)
         self.stop_module = False
 
     def print(self, text, verbose=1, debug=0):
@@ -286,12 +288,19 @@ class Module(Module, multiprocessing.Process):
 
                 src_ips.update({srcip: json.dumps(event_info)})
 
-        __database__.add_ips_to_IoC(src_ips)
+        if __database__.add_ips_to_IoC(src_ips):
+            __database__.publish_IoC_filter_update()
 
     def shutdown_gracefully(self):
         # Confirm that the module is done processing
         __database__.publish('finished_modules', self.name)
 
+    def handle_export_evidence(self, message):
+        # in case of an interface or a file, push every time we get an alert
+        if self.send_to_warden:
+            evidence = json.loads(message['data'])
+            self.export_evidence(self.wclient, evidence)
+
     def run(self):
         utils.drop_root_privs()
         # Stop module if the configuration file is invalid or not found
@@ -299,7 +308,7 @@ class Module(Module, multiprocessing.Process):
             return False
 
         # create the warden client
-        wclient = Client(**read_cfg(self.configuration_file))
+        self.wclient = Client(**read_cfg(self.configuration_file))
 
         # All methods return something.
         # If you want to catch possible errors (for example implement some
@@ -313,13 +322,13 @@ class Module(Module, multiprocessing.Process):
         # self.print(info, 0, 1)
 
         self.node_info = [
-            {'Name': wclient.name, 'Type': ['IPS'], 'SW': ['Slips']}
+            {'Name': self.wclient.name, 'Type': ['IPS'], 'SW': ['Slips']}
         ]
 
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                if message and message['data'] == 'stop_process':
+                # returns at least once per second when idle, so warden is still polled
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
@@ -328,18 +337,10 @@ class Module(Module, multiprocessing.Process):
                     now = time.time()
                     # did we wait the poll_delay period since last poll?
                     if last_update + self.poll_delay < now:
-                        self.import_alerts(wclient)
+                        self.import_alerts(self.wclient)
                         # set last poll time to now
                         __database__.set_last_warden_poll_time(now)
 
-                # in case of an interface or a file, push every time we get an alert
-                if (
-                    utils.is_msg_intended_for(message, 'export_evidence')
-                    and self.send_to_warden
-                ):
-                    evidence = json.loads(message['data'])
-                    self.export_evidence(wclient, evidence)
-
             except KeyboardInterrupt:
                 # Confirm that the module is done processing
                 self.shutdown_gracefully()
@@ -4,6 +4,7 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 import traceback
 
 # Your imports
@@ -23,7 +24,8 @@ class Module(Module, multiprocessing.Process):
         multiprocessing.Process.__init__(self)
         self.outputqueue = outputqueue
         __database__.start(redis_port)
-        self.c1 = __database__.subscribe('new_ip')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_ip', self.handle_new_ip)
         self.read_configuration()
 
     def read_configuration(self):
@@ -113,6 +115,18 @@ class Module(Module, multiprocessing.Process):
         # Confirm that the module is done processing
         __database__.publish('finished_modules', self.name)
 
+    def handle_new_ip(self, message):
+        ip = message['data']
+        if utils.is_ignored_ip(ip):
+            return
+        # Only get passive total dns data if we don't have it in the db
+        if __database__.get_passive_dns(ip):
+            return
+        # we don't have it in the db , get it from passive total
+        if passive_dns := self.get_passive_dns(ip):
+            # we found data from passive total, store it in the db
+            __database__.set_passive_dns(ip, passive_dns)
+
     def run(self):
         utils.drop_root_privs()
         if not self.riskiq_email or not self.riskiq_key:
@@ -120,23 +134,10 @@ class Module(Module, multiprocessing.Process):
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                if message and message['data'] == 'stop_process':
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_ip'):
-                    ip = message['data']
-                    if utils.is_ignored_ip(ip):
-                        continue
-                    # Only get passive total dns data if we don't have it in the db
-                    if __database__.get_passive_dns(ip):
-                        continue
-                    # we don't have it in the db , get it from passive total
-                    if passive_dns := self.get_passive_dns(ip):
-                        # we found data from passive total, store it in the db
-                        __database__.set_passive_dns(ip, passive_dns)
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
@@ -2,14 +2,40 @@ from slips_files.common.abstracts import Module
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
+from slips_files.common.cardinality_sketch import DistinctCounter, UidReservoir
+from slips_files.common.scheduler import Scheduler
+from slips_files.common.state_store import StateStore
 import multiprocessing
 import traceback
 import json
 import sys
 import ipaddress
 import time
-import threading
-from multiprocessing import Queue
+
+class ARPRequests:
+    """The arp requests sent by a profile in a tw, to detect arp scans"""
+    __slots__ = ('daddrs', 'uids', 'first_daddr', 'first_ts', 'last_daddr', 'last_ts')
+
+    def __init__(self, daddrs: DistinctCounter, uids: UidReservoir, daddr, uid, ts):
+        self.daddrs = daddrs
+        self.uids = uids
+        # the first and the last new daddr requested, and when they were requested last time
+        self.first_daddr = self.last_daddr = daddr
+        self.first_ts = self.last_ts = ts
+        self.add(daddr, uid, ts)
+
+    def add(self, daddr, uid, ts):
+        self.uids.add(uid)
+        if self.daddrs.add(daddr):
+            self.last_daddr = daddr
+            self.last_ts = ts
+            return
+        if daddr == self.first_daddr:
+            self.first_ts = ts
+        if daddr == self.last_daddr:
+            self.last_ts = ts
+
 
 class Module(Module, multiprocessing.Process):
     # Name: short name of the module. Do not use spaces
@@ -24,11 +50,12 @@ class Module(Module, multiprocessing.Process):
         self.outputqueue = outputqueue
         # Start the DB
         __database__.start(redis_port)
-        self.c1 = __database__.subscribe('new_arp')
-        self.c2 = __database__.subscribe('tw_closed')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_arp', self.handle_new_arp)
+        self.dispatcher.register('tw_closed', self.handle_tw_closed)
         self.read_configuration()
-        # this dict will categorize arp requests by profileid_twid
-        self.cache_arp_requests = {}
+        # the ARPRequests of each profileid_twid, deleted when the tw is closed
+        self.cache_arp_requests = StateStore()
         # Threshold to use to detect a port scan. How many arp minimum are required?
         self.arp_scan_threshold = 5
         self.delete_arp_periodically = False
@@ -43,11 +70,11 @@ class Module(Module, multiprocessing.Process):
             self.arp_ts = time.time()
             # in seconds
             self.period_before_deleting = 3600
-        self.timer_thread_arp_scan = threading.Thread(
-                                target=self.wait_for_arp_scans,
-                                daemon=True
-        )
-        self.pending_arp_scan_evidence = Queue()
+        # combines the arp scan evidence of each profile and tw some seconds
+        # after the first one is pending
+        self.scheduler = Scheduler(self.name, print_error=lambda error: self.print(error, 0, 1))
+        # {(profileid, twid): [(ts, uids, conn_count), ...]}
+        self.pending_arp_scan_evidence = {}
         self.alerted_once_arp_scan = False
         # wait 10s for mmore arp scan evidence to come
         self.time_to_wait = 10
@@ -83,62 +110,34 @@ class Module(Module, multiprocessing.Process):
         self.home_network = conf.home_network_ranges
         self.delete_zeek_files = conf.delete_zeek_files()
         self.store_zeek_files_copy = conf.store_zeek_files_copy()
-
-    def wait_for_arp_scans(self):
+        # by default all the daddrs and uids of the arp requests are kept
+        self.sketch_precision = None
+        self.sketch_max_uids = None
+        if conf.scan_sketches():
+            self.sketch_precision = conf.sketch_precision()
+            self.sketch_max_uids = conf.sketch_max_uids()
+
+    def combine_arp_scans(self, profileid, twid):
         """
-        This thread waits for 10s then checks if more
-        arp scans happened to reduce the number of alerts
+        Called by the scheduler some seconds after an arp scan evidence of
+        this profile and tw is pending, combines the evidence that arrived meanwhile
+        to reduce the number of alerts
         """
-        # this evidence is the one that triggered this thread
-        scans_ctr = 0
-        while True:
-            try:
-                evidence: dict = self.pending_arp_scan_evidence.get(timeout=0.5)
-            except Exception as ex:
-                # nothing in queue
-                time.sleep(5)
-                continue
-            # unpack the evidence that triggered the thread
-            (ts, profileid, twid, uids, conn_count) = evidence
-
-            # wait 10s if a new evidence arrived
-            time.sleep(self.time_to_wait)
-
-            while True:
-                try:
-                    new_evidence = self.pending_arp_scan_evidence.get(timeout=0.5)
-                except Exception as ex:
-                    # queue is empty
-                    break
-
-                (ts2, profileid2, twid2, uids2, conn_count2) = new_evidence
-                if (
-                    profileid == profileid2
-                    and twid == twid2
-                ):
-                    # this should be combined with the past alert
-                    ts = ts2
-                    uids += uids2
-                    conn_count = conn_count2
-                else:
-                    # this is an ip performing arp scan in a diff profile or a diff twid,
-                    # we shouldn't accumulate its evidence
-                    # store it back in the queue until we're done with the current one
-                    scans_ctr += 1
-                    self.pending_arp_scan_evidence.put(new_evidence)
-                    if scans_ctr == 3:
-                        scans_ctr = 0
-                        break
-
-            self.set_evidence_arp_scan(
-                ts,
-                profileid,
-                twid,
-                uids,
-                conn_count
-            )
-
-
+        evidence_list = self.pending_arp_scan_evidence.pop((profileid, twid), [])
+        if not evidence_list:
+            return
+        uids = []
+        for ts, evidence_uids, conn_count in evidence_list:
+            # in the final evidence, we'll be using the ts and conn_count of the last evidence
+            uids += evidence_uids
+
+        self.set_evidence_arp_scan(
+            ts,
+            profileid,
+            twid,
+            uids,
+            conn_count
+        )
 
     def check_arp_scan(
         self, profileid, twid, daddr, uid, ts, dst_mac, src_mac, operation, dst_hw, src_hw
@@ -154,16 +153,6 @@ class Module(Module, multiprocessing.Process):
         if 'request' not in operation or '00:00:00:00:00:00' not in dst_hw:
             return False
 
-        def get_uids():
-            """
-            get the uids causing this evidence
-            """
-            res = []
-            for daddr, daddr_info in cached_requests.items():
-                for uid in daddr_info['uids']:
-                    res.append(uid)
-            return res
-
         # The Gratuitous arp is sent as a broadcast, as a way for a node to announce or update its IP to MAC mapping to the entire network.
         # It shouldn't be marked as an arp scan
         saddr = profileid.split('_')[1]
@@ -176,55 +165,57 @@ class Module(Module, multiprocessing.Process):
         if saddr == '0.0.0.0':
             return False
 
-        daddr_info = {
-            daddr: {
-                'uids': [uid],
-                'ts': ts
-            }
-        }
         try:
             # Get together all the arp requests to IPs in this TW
             cached_requests = self.cache_arp_requests[f'{profileid}_{twid}']
-            # Append the arp request, and when it happened
-            if daddr in cached_requests:
-                cached_requests[daddr]['uids'].append(uid)
-                cached_requests[daddr]['ts'] = ts
-                self.cache_arp_requests[f'{profileid}_{twid}'] = cached_requests
-            else:
-                cached_requests.update(
-                    daddr_info
-                )
         except KeyError:
             # create the key for this profileid_twid if it doesn't exist
-            self.cache_arp_requests[f'{profileid}_{twid}'] = daddr_info
-
+            self.cache_arp_requests.set(
+                f'{profileid}_{twid}',
+                ARPRequests(
+                    DistinctCounter(self.sketch_precision),
+                    UidReservoir(self.sketch_max_uids),
+                    daddr,
+                    uid,
+                    ts
+                ),
+                f'{profileid}_{twid}'
+            )
             return True
 
-        # the list of daddrs that are scanned by the current proffileid in the curr tw
-        daddrs = list(cached_requests.keys())
+        # Append the arp request, and when it happened
+        cached_requests.add(daddr, uid, ts)
+        # the amount of daddrs that are scanned by the current proffileid in the curr tw
+        amount_of_daddrs = len(cached_requests.daddrs)
 
         # The minimum amount of arp packets to send to be considered as scan is 5
-        if len(daddrs) >= self.arp_scan_threshold:
+        if amount_of_daddrs >= self.arp_scan_threshold:
             # check if these requests happened within 30 secs
             # get the first and the last request of the 10
-            first_daddr = daddrs[0]
-            last_daddr = daddrs[-1]
-            starttime = cached_requests[first_daddr]['ts']
-            endtime = cached_requests[last_daddr]['ts']
+            starttime = cached_requests.first_ts
+            endtime = cached_requests.last_ts
             # todo do we need mac addresses?
             self.diff = utils.get_time_diff(starttime, endtime)
 
             # in seconds
             if self.diff <= 30.00:
-                conn_count = len(daddrs)
-                uids = get_uids()
+                conn_count = amount_of_daddrs
+                uids = cached_requests.uids.uids.copy()
                 # we are sure this is an arp scan
                 if not self.alerted_once_arp_scan:
                     self.alerted_once_arp_scan = True
                     self.set_evidence_arp_scan(ts, profileid, twid, uids, conn_count)
                 else:
                     # after alerting once, wait 10s to see if more evidence are coming
-                    self.pending_arp_scan_evidence.put((ts, profileid, twid, uids, conn_count))
+                    self.pending_arp_scan_evidence.setdefault((profileid, twid), []).append(
+                        (ts, uids, conn_count)
+                    )
+                    self.scheduler.schedule(
+                        self.time_to_wait,
+                        self.combine_arp_scans,
+                        (profileid, twid),
+                        key=('arp_scan', profileid, twid)
+                    )
 
                 return True
         return False
@@ -245,13 +236,8 @@ class Module(Module, multiprocessing.Process):
                                  ts, category, source_target_tag=source_target_tag, conn_count=conn_count,
                                  profileid=profileid, twid=twid, uid=uids)
         # after we set evidence, clear the dict so we can detect if it does another scan
-        try:
-            self.cache_arp_requests.pop(f'{profileid}_{twid}')
-        except KeyError:
-            # when a tw is closed, we clear all its' entries from the cache_arp_requests dict
-            # having keyerr is a result of closing a timewindow before setting an evidence
-            # ignore it
-            pass
+        # when a tw is closed, its entry is already deleted from the cache_arp_requests
+        self.cache_arp_requests.pop(f'{profileid}_{twid}')
 
     def check_dstip_outside_localnet(
         self, profileid, twid, daddr, uid, saddr, ts
@@ -375,6 +361,9 @@ class Module(Module, multiprocessing.Process):
             return True
 
     def shutdown_gracefully(self):
+        # set the pending evidence
+        self.scheduler.shutdown()
+        self.print(f'cache_arp_requests: {self.cache_arp_requests.stats()}', 3, 0)
         # Confirm that the module is done processing
         __database__.publish('finished_modules', self.name)
 
@@ -407,9 +396,65 @@ class Module(Module, multiprocessing.Process):
             is_gratuitous = True
         return is_gratuitous
 
+    def handle_new_arp(self, message):
+        """Detects ARP scans, MITM and unsolicited ARPs and ARPs to IPs outside of the local network"""
+        flow = json.loads(message['data'])
+        ts = flow['ts']
+        profileid = flow['profileid']
+        twid = flow['twid']
+        daddr = flow['daddr']
+        saddr = flow['saddr']
+        dst_mac = flow['dst_mac']
+        src_mac = flow['src_mac']
+        dst_hw = flow['dst_hw']
+        src_hw = flow['src_hw']
+        operation = flow['operation']
+        # arp flows don't have uids, the uids received are randomly generated by slips
+        uid = flow['uid']
+
+        # Check if it is gratuitous ARP
+        is_gratuitous = self.check_if_gratutitous_ARP(
+                        saddr, daddr, src_mac, dst_mac, src_hw, dst_hw, operation
+                        )
+        if is_gratuitous:
+            # for MITM arp attack, the arp has to be gratuitous
+            # and it has to be a reply operation, not a request.
+            # A gratuitous ARP is always a reply. A MITM attack happens when there is a reply without a request
+            self.detect_MITM_ARP_attack(
+                profileid, twid, uid, saddr, ts, src_mac
+            )
+        else:
+            # not gratuitous and request, may be an arp scan
+            self.check_arp_scan(
+                profileid, twid, daddr, uid, ts, dst_mac, src_mac, operation, dst_hw, src_hw
+            )
+
+        if 'request' in operation:
+            self.check_dstip_outside_localnet(
+                profileid, twid, daddr, uid, saddr, ts
+            )
+        elif 'reply' in operation:
+            # Unsolicited ARPs should be of type reply only, not request
+            self.detect_unsolicited_arp(
+                profileid,
+                twid,
+                uid,
+                ts,
+                dst_mac,
+                src_mac,
+                dst_hw,
+                src_hw,
+            )
+
+    def handle_tw_closed(self, message):
+        """removes all the entries of the closed tw from the arp requests cache"""
+        # when a tw is closed, this means that it's too old so we don't check for arp scan in this time
+        # range anymore
+        self.cache_arp_requests.close_tw(message['data'])
+
     def run(self):
         utils.drop_root_privs()
-        self.timer_thread_arp_scan.start()
+        self.scheduler.start()
         while True:
             try:
                 if (
@@ -422,77 +467,11 @@ class Module(Module, multiprocessing.Process):
                     # update ts of the new arp.log
                     self.arp_ts = time.time()
 
-                message = __database__.get_message(self.c1)
-                if message and message['data'] == 'stop_process':
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_arp'):
-                    flow = json.loads(message['data'])
-                    ts = flow['ts']
-                    profileid = flow['profileid']
-                    twid = flow['twid']
-                    daddr = flow['daddr']
-                    saddr = flow['saddr']
-                    dst_mac = flow['dst_mac']
-                    src_mac = flow['src_mac']
-                    dst_hw = flow['dst_hw']
-                    src_hw = flow['src_hw']
-                    operation = flow['operation']
-                    # arp flows don't have uids, the uids received are randomly generated by slips
-                    uid = flow['uid']
-
-                    # Check if it is gratuitous ARP
-                    is_gratuitous = self.check_if_gratutitous_ARP(
-                                    saddr, daddr, src_mac, dst_mac, src_hw, dst_hw, operation
-                                    )
-                    if is_gratuitous:
-                        # for MITM arp attack, the arp has to be gratuitous
-                        # and it has to be a reply operation, not a request.
-                        # A gratuitous ARP is always a reply. A MITM attack happens when there is a reply without a request
-                        self.detect_MITM_ARP_attack(
-                            profileid, twid, uid, saddr, ts, src_mac
-                        )
-                    else:
-                        # not gratuitous and request, may be an arp scan
-                        self.check_arp_scan(
-                            profileid, twid, daddr, uid, ts, dst_mac, src_mac, operation, dst_hw, src_hw
-                        )
-
-                    if 'request' in operation:
-                        self.check_dstip_outside_localnet(
-                            profileid, twid, daddr, uid, saddr, ts
-                        )
-                    elif 'reply' in operation:
-                        # Unsolicited ARPs should be of type reply only, not request
-                        self.detect_unsolicited_arp(
-                            profileid,
-                            twid,
-                            uid,
-                            ts,
-                            dst_mac,
-                            src_mac,
-                            dst_hw,
-                            src_hw,
-                        )
-
-                # if the tw is closed, remove all its entries from the cache dict
-                message = __database__.get_message(self.c2)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-
-                if utils.is_msg_intended_for(message, 'tw_closed'):
-                    profileid_tw = message['data']
-                    # when a tw is closed, this means that it's too old so we don't check for arp scan in this time
-                    # range anymore
-                    # this copy is made to avoid dictionary changed size during iteration err
-                    cache_copy = self.cache_arp_requests.copy()
-                    for key in cache_copy:
-                        if profileid_tw in key:
-                            self.cache_arp_requests.pop(key)
-                            # don't break, keep looking for more keys that belong to the same tw
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
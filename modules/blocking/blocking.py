@@ -3,6 +3,7 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 import platform
 import traceback
 import sys
@@ -28,7 +29,8 @@ class Module(Module, multiprocessing.Process):
         # The outputqueue is connected to another process called OutputProcess
         self.outputqueue = outputqueue
         __database__.start(redis_port)
-        self.c1 = __database__.subscribe('new_blocking')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_blocking', self.handle_new_blocking)
         self.os = platform.system()
         if self.os == 'Darwin':
             self.print('Mac OS blocking is not supported yet.')
@@ -363,52 +365,53 @@ class Module(Module, multiprocessing.Process):
     def shutdown_gracefully(self):
         __database__.publish('finished_modules', self.name)
 
+    def handle_new_blocking(self, message):
+        """There's an IP that needs to be blocked"""
+        # message['data'] in the new_blocking channel is a dictionary that contains
+        # the ip and the blocking options
+        # Example of the data dictionary to block or unblock an ip:
+        # (notice you have to specify from,to,dport,sport,protocol or at least 2 of them when unblocking)
+        #   blocking_data = {
+        #       "ip"       : "0.0.0.0"
+        #       "block"    : True to block  - False to unblock
+        #       "from"     : True to block traffic from ip (default) - False does nothing
+        #       "to"       : True to block traffic to ip  (default)  - False does nothing
+        #       "dport"    : Optional destination port number
+        #       "sport"    : Optional source port number
+        #       "protocol" : Optional protocol
+        #       'block_for': Optional, after this time (in seconds) this ip will be unblocked
+        #   }
+        # Example of passing blocking_data to this module:
+        #   blocking_data = json.dumps(blocking_data)
+        #   __database__.publish('new_blocking', blocking_data )
+
+        # Decode(deserialize) the python dict into JSON formatted string
+        data = json.loads(message['data'])
+        # Parse the data dictionary
+        ip = data.get('ip')
+        block = data.get('block')
+        from_ = data.get('from')
+        to = data.get('to')
+        dport = data.get('dport')
+        sport = data.get('sport')
+        protocol = data.get('protocol')
+        block_for = data.get('block_for')
+        if block:
+            self.block_ip(
+                ip, from_, to, dport, sport, protocol, block_for
+            )
+        else:
+            self.unblock_ip(ip, from_, to, dport, sport, protocol)
+
     def run(self):
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                # Check that the message is for you. Probably unnecessary...
-                if message and message['data'] == 'stop_process':
+                # returns at least once per second when idle,
+                # so the IPs blocked for some time are still unblocked on time
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
-                # There's an IP that needs to be blocked
-                if utils.is_msg_intended_for(message, 'new_blocking'):
-                    # message['data'] in the new_blocking channel is a dictionary that contains
-                    # the ip and the blocking options
-                    # Example of the data dictionary to block or unblock an ip:
-                    # (notice you have to specify from,to,dport,sport,protocol or at least 2 of them when unblocking)
-                    #   blocking_data = {
-                    #       "ip"       : "0.0.0.0"
-                    #       "block"    : True to block  - False to unblock
-                    #       "from"     : True to block traffic from ip (default) - False does nothing
-                    #       "to"       : True to block traffic to ip  (default)  - False does nothing
-                    #       "dport"    : Optional destination port number
-                    #       "sport"    : Optional source port number
-                    #       "protocol" : Optional protocol
-                    #       'block_for': Optional, after this time (in seconds) this ip will be unblocked
-                    #   }
-                    # Example of passing blocking_data to this module:
-                    #   blocking_data = json.dumps(blocking_data)
-                    #   __database__.publish('new_blocking', blocking_data )
-
-                    # Decode(deserialize) the python dict into JSON formatted string
-                    data = json.loads(message['data'])
-                    # Parse the data dictionary
-                    ip = data.get('ip')
-                    block = data.get('block')
-                    from_ = data.get('from')
-                    to = data.get('to')
-                    dport = data.get('dport')
-                    sport = data.get('sport')
-                    protocol = data.get('protocol')
-                    block_for = data.get('block_for')
-                    if block:
-                        self.block_ip(
-                            ip, from_, to, dport, sport, protocol, block_for
-                        )
-                    else:
-                        self.unblock_ip(ip, from_, to, dport, sport, protocol)
 
                 unblocked_ips = set()
                 # check if any ip needs to be unblocked
@@ -2,9 +2,8 @@ from slips_files.common.abstracts import Module
 import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
-from slips_files.common.config_parser import ConfigParser
+from slips_files.common.dispatcher import Dispatcher
 import sys
-import json
 import traceback
 
 class Module(Module, multiprocessing.Process):
@@ -22,8 +21,9 @@ class Module(Module, multiprocessing.Process):
         # Retrieve the labels
         self.normal_label = __database__.normal_label
         self.malicious_label = __database__.malicious_label
-        self.c1 = __database__.subscribe('tw_closed')
         self.separator = __database__.separator
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('tw_closed', self.handle_tw_closed)
 
     def print(self, text, verbose=1, debug=0):
         """
@@ -48,85 +48,38 @@ class Module(Module, multiprocessing.Process):
     def set_label_per_flow_dstip(self, profileid, twid):
         """
         Funciton to perform first and second stage of the ensembling.
-        Function assigns ensembling label per each flow in this profileid and twid,
-        groups the flows with same destination IP, and calculates the amount
-        of normal and malicious flows per each dstip in this profileid and twid.
+        The ensembling label of each flow is set by the db when the modules label it,
+        and the amount of normal and malicious flows per each dstip is counted
+        as the flows are added and labeled, so this only reads the counts of the closed tw.
         : param: profileid, twid
-        : return: None
+        : return: {dstip: {'normal': amount, 'malicious': amount}}
         """
+        return __database__.get_dstip_labels(profileid, twid)
 
-        flows = __database__.get_all_flows_in_profileid_twid(profileid, twid)
-        dstip_labels_total = dict()
-        for flow_uid, flow_data in flows.items():
-            flow_data = json.loads(flow_data)
-            flow_module_labels = flow_data['module_labels']
-            # First stage - calculate the amount of malicious and normal labels per each flow.
-            # Set the final label per flow using majority voting
-            flow_labels = list(flow_module_labels.values())
-            normal_label_total = flow_labels.count(self.normal_label)
-            malicious_label_total = flow_labels.count(self.malicious_label)
-            # initialize the amount of normal and malicious flows per dstip.
-            try:
-                dstip_labels_total[flow_data['daddr']]
-            except KeyError as err:
-                dstip_labels_total[flow_data['daddr']] = {
-                    self.normal_label: 0,
-                    self.malicious_label: 0,
-                }
+    def handle_tw_closed(self, message):
+        data = message['data']
+        if type(data) == str:
+            # Convert from json to dict
+            profileip = data.split(self.separator)[1]
+            twid = data.split(self.separator)[2]
+            profileid = 'profile' + self.separator + profileip
+
+            # First stage -  define the final label for each flow in profileid and twid
+            # by the majority vote of malicious and normal
+            # Second stage - group the flows with same dstip and calculate the amount of
+            # normal and malicious flows
 
-            if (
-                malicious_label_total == normal_label_total == 0
-                or normal_label_total > malicious_label_total
-            ):
-                __database__.set_first_stage_ensembling_label_to_flow(
-                    profileid, twid, flow_uid, self.normal_label
-                )
-                # Second stage - calculate the amount of normal and malicious labels per daddr
-                dstip_labels_total[flow_data['daddr']][self.normal_label] = (
-                    dstip_labels_total[flow_data['daddr']].get(
-                        self.normal_label, 0
-                    )
-                    + 1
-                )
-            elif malicious_label_total >= normal_label_total:
-                __database__.set_first_stage_ensembling_label_to_flow(
-                    profileid, twid, flow_uid, self.malicious_label
-                )
-                # Second stage - calculate the amount of normal and malicious labels per daddr
-                dstip_labels_total[flow_data['daddr']][
-                    self.malicious_label
-                ] = (
-                    dstip_labels_total[flow_data['daddr']].get(
-                        self.malicious_label, 0
-                    )
-                    + 1
-                )
+            self.set_label_per_flow_dstip(profileid, twid)
 
     def run(self):
         utils.drop_root_privs()
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                # Check that the message is for you. Probably unnecessary...
-                if message and message['data'] == 'stop_process':
+                if not self.dispatcher.dispatch():
                     # Confirm that the module is done processing
                     self.shutdown_gracefully()
                     return True
-                if message and message['channel'] == 'tw_closed':
-                    data = message['data']
-                    if type(data) == str:
-                        # Convert from json to dict
-                        profileip = data.split(self.separator)[1]
-                        twid = data.split(self.separator)[2]
-                        profileid = 'profile' + self.separator + profileip
-
-                        # First stage -  define the final label for each flow in profileid and twid
-                        # by the majority vote of malicious and normal
-                        # Second stage - group the flows with same dstip and calculate the amount of
-                        # normal and malicious flows
-
-                        self.set_label_per_flow_dstip(profileid, twid)
 
             except KeyboardInterrupt:
                 # Confirm that the module is done processing
@@ -1,6 +1,7 @@
 from slips_files.common.abstracts import Module
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 from slips_files.common.config_parser import ConfigParser
 import multiprocessing
 from slack import WebClient
@@ -30,7 +31,8 @@ class Module(Module, multiprocessing.Process):
         self.port = None
         self.outputqueue = outputqueue
         __database__.start(redis_port)
-        self.c1 = __database__.subscribe('export_evidence')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('export_evidence', self.handle_export_evidence)
         self.read_configuration()
         if 'slack' in self.export_to:
             self.get_slack_token()
@@ -320,6 +322,25 @@ class Module(Module, multiprocessing.Process):
         __database__.publish('finished_modules', self.name)
         return
 
+    def handle_export_evidence(self, msg):
+        evidence = json.loads(msg['data'])
+        description = evidence['description']
+        if 'slack' in self.export_to and hasattr(self, 'BOT_TOKEN'):
+            srcip = evidence['profileid'].split("_")[-1]
+            msg_to_send = f'Src IP {srcip} Detected {description}'
+            self.send_to_slack(msg_to_send)
+
+        if 'stix' in self.export_to:
+            msg_to_send = (
+                evidence['evidence_type'],
+                evidence['attacker_direction'],
+                evidence['attacker'],
+                description,
+            )
+            exported_to_stix = self.export_to_STIX(msg_to_send)
+            if not exported_to_stix:
+                self.print('Problem in export_to_STIX()', 0, 3)
+
     def run(self):
         utils.drop_root_privs()
         if (
@@ -338,32 +359,10 @@ class Module(Module, multiprocessing.Process):
 
         while True:
             try:
-                msg = __database__.get_message(self.c1)
-
-                if msg and msg['data'] == 'stop_process':
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(msg, 'export_evidence'):
-                    evidence = json.loads(msg['data'])
-                    description = evidence['description']
-                    if 'slack' in self.export_to and hasattr(self, 'BOT_TOKEN'):
-                        srcip = evidence['profileid'].split("_")[-1]
-                        msg_to_send = f'Src IP {srcip} Detected {description}'
-                        self.send_to_slack(msg_to_send)
-
-                    if 'stix' in self.export_to:
-                        msg_to_send = (
-                            evidence['evidence_type'],
-                            evidence['attacker_direction'],
-                            evidence['attacker'],
-                            description,
-                        )
-                        exported_to_stix = self.export_to_STIX(msg_to_send)
-                        if not exported_to_stix:
-                            self.print('Problem in export_to_STIX()', 0, 3)
-                            continue
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
@@ -1,8 +1,11 @@
 from slips_files.common.abstracts import Module
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.flow_message import decode_flow_msg
 from slips_files.common.config_parser import ConfigParser
-from .TimerThread import TimerThread
+from slips_files.common.dispatcher import Dispatcher
+from slips_files.common.scheduler import Scheduler
+from slips_files.common.state_store import StateStore
 from .set_evidence import Helper
 from slips_files.core.whitelist import Whitelist
 import multiprocessing
@@ -38,54 +41,67 @@ class Module(Module, multiprocessing.Process):
         # Retrieve the labels
         self.normal_label = __database__.normal_label
         self.malicious_label = __database__.malicious_label
-        self.c1 = __database__.subscribe('new_flow')
-        self.c2 = __database__.subscribe('new_ssh')
-        self.c3 = __database__.subscribe('new_notice')
-        self.c4 = __database__.subscribe('new_ssl')
-        self.c5 = __database__.subscribe('tw_closed')
-        self.c6 = __database__.subscribe('new_dns_flow')
-        self.c7 = __database__.subscribe('new_downloaded_file')
-        self.c8 = __database__.subscribe('new_smtp')
-        self.c9 = __database__.subscribe('new_software')
-        self.c10 = __database__.subscribe('new_weird')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_flow', self.handle_new_flow)
+        self.dispatcher.register('new_ssh', self.handle_new_ssh)
+        self.dispatcher.register('new_notice', self.handle_new_notice)
+        self.dispatcher.register('new_ssl', self.handle_new_ssl)
+        self.dispatcher.register('tw_closed', self.handle_tw_closed)
+        self.dispatcher.register('new_dns_flow', self.handle_new_dns_flow)
+        self.dispatcher.register('new_downloaded_file', self.handle_new_downloaded_file)
+        self.dispatcher.register('new_smtp', self.handle_new_smtp)
+        self.dispatcher.register('new_software', self.handle_new_software)
+        self.dispatcher.register('new_weird', self.handle_new_weird)
         self.whitelist = Whitelist(outputqueue, redis_port)
         # helper contains all functions used to set evidence
         self.helper = Helper()
-        self.p2p_daddrs = {}
+        # the state of the detections is deleted when the tw it was last updated in is closed.
+        # {daddr: number of connections to unknown 30000+/udp ports}
+        self.p2p_daddrs = StateStore()
         # get the default gateway
         self.gateway = __database__.get_gateway_ip()
-        # Cache list of connections that we already checked in the timer
-        # thread (we waited for the connection of these dns resolutions)
-        self.connections_checked_in_dns_conn_timer_thread = []
-        # Cache list of connections that we already checked in the timer
-        # thread (we waited for the dns resolution for these connections)
-        self.connections_checked_in_conn_dns_timer_thread = []
-        # Cache list of connections that we already checked in the timer thread for ssh check
-        self.connections_checked_in_ssh_timer_thread = []
+        # checks the connections without dns, the dns without connection and the ssh
+        # flows again after waiting for their dns, connection or conn.log flow to arrive.
+        # the key of each check is (check name, uid), while it's in the scheduler
+        # we're waiting for it or checking it again
+        self.scheduler = Scheduler(self.name, print_error=lambda error: self.print(error, 0, 1))
         # Threshold how much time to wait when capturing in an interface, to start reporting connections without DNS
         # Usually the computer resolved DNS already, so we need to wait a little to report
         # In mins
         self.conn_without_dns_interface_wait_time = 30
-        # this dict will contain the number of nxdomains found in every profile
-        self.nxdomains = {}
+        # the nxdomains found in every profile and tw
+        # format {profileid_twid: ([query, ...], [uid, ...])}
+        self.nxdomains = StateStore()
         # if nxdomains are >= this threshold, it's probably DGA
         self.nxdomains_threshold = 10
         # when the ctr reaches the threshold in 10 seconds,
         # we detect an smtp bruteforce
         self.smtp_bruteforce_threshold = 3
-        # dict to keep track of bad smtp logins to check for bruteforce later
-        # format {profileid: [ts,ts,...]}
-        self.smtp_bruteforce_cache = {}
-        # dict to keep track of arpa queries to check for DNS arpa scans later
-        # format {profileid: [ts,ts,...]}
-        self.dns_arpa_queries = {}
+        # bad smtp logins to check for bruteforce later
+        # format {profileid: ([ts, ts, ...], [uid, uid, ...])}
+        self.smtp_bruteforce_cache = StateStore()
+        # arpa queries to check for DNS arpa scans later
+        # format {profileid: ([ts, ts, ...], [uid, uid, ...], {domain, ...})}
+        self.dns_arpa_queries = StateStore()
         # after this number of arpa queries, slips will detect an arpa scan
         self.arpa_scan_threshold = 10
         # If 1 flow uploaded this amount of MBs or more, slips will alert data upload
         self.flow_upload_threshold = 100
         # after this number of failed ssh logins, we alert pw guessing
         self.pw_guessing_threshold = 20
-        self.password_guessing_cache = {}
+        # failed ssh logins, format {profileid-twid-daddr: [uid, uid, ...]}
+        self.password_guessing_cache = StateStore()
+        # the bytes sent to each daddr in each tw, checked for data exfiltration when the tw is closed
+        # format {profileid_twid: {daddr: [bytes sent, [uid, uid, ...]]}}
+        self.bytes_sent = StateStore()
+        self.state_stores = {
+            'bytes_sent': self.bytes_sent,
+            'p2p_daddrs': self.p2p_daddrs,
+            'nxdomains': self.nxdomains,
+            'smtp_bruteforce_cache': self.smtp_bruteforce_cache,
+            'dns_arpa_queries': self.dns_arpa_queries,
+            'password_guessing_cache': self.password_guessing_cache,
+        }
         # in pastebin download detection, we wait for each conn.log flow of the seen ssl flow to appear
         # this is the dict of ssl flows we're waiting for
         self.pending_ssl_flows = multiprocessing.Queue()
@@ -204,22 +220,19 @@ class Module(Module, multiprocessing.Process):
             profileid, twid, uid, module_name, module_label
         )
 
-    def is_p2p(self, dport, proto, daddr):
+    def is_p2p(self, dport, proto, daddr, profileid, twid):
         """
         P2P is defined as following : proto is udp, port numbers are higher than 30000 at least 5 connections to different daddrs
         OR trying to connct to 1 ip on more than 5 unkown 30000+/udp ports
         """
         if proto.lower() == 'udp' and int(dport) > 30000:
-            try:
-                # trying to connct to 1 ip on more than 5 unknown ports
-                if self.p2p_daddrs[daddr] >= 6:
-                    return True
-                self.p2p_daddrs[daddr] = self.p2p_daddrs[daddr] + 1
-                # now check if we have more than 4 different dst ips
-            except KeyError:
-                # first time seeing this daddr
-                self.p2p_daddrs[daddr] = 1
-
+            # 0 if it's the first time seeing this daddr
+            connections = self.p2p_daddrs.get(daddr, 0)
+            # trying to connct to 1 ip on more than 5 unknown ports
+            if connections >= 6:
+                return True
+            self.p2p_daddrs.set(daddr, connections + 1, f'{profileid}_{twid}')
+            # now check if we have more than 4 different dst ips
             if len(self.p2p_daddrs) == 5:
                 # this is another connection on port 3000+/udp and we already have 5 of them
                 # probably p2p
@@ -409,45 +422,45 @@ class Module(Module, multiprocessing.Process):
             return False
 
 
-    def detect_data_upload_in_twid(self, profileid, twid):
+    def add_bytes_sent(self, sbytes, daddr, uid, profileid, twid):
         """
-        For each contacted ip in this twid,
-        check if the total bytes sent to this ip is >= data_exfiltration_threshold
+        Adds the bytes sent in this flow to the bytes sent to its daddr in this tw,
+        detect_data_upload_in_twid() checks them when the tw is closed
         """
-        def get_sent_bytes(all_flows):
-            """Returns a dict of sent bytes to all ips {contacted_ip: (mbs_sent, [uids])}"""
+        if not sbytes:
+            return
+        profileid_twid = f'{profileid}_{twid}'
+        bytes_sent: dict = self.bytes_sent.get(profileid_twid)
+        if bytes_sent is None:
             bytes_sent = {}
-            for flow in all_flows:
-                uid = next(iter(flow))
-                flow = flow[uid]
-                daddr = flow['daddr']
-                sbytes: int = flow.get('sbytes', 0)
-
-                if self.is_ignored_ip_data_upload(daddr) or not sbytes:
-                    continue
-
-                if daddr in bytes_sent:
-                    mbs_sent, uids = bytes_sent[daddr]
-                    mbs_sent += sbytes
-                    uids.append(uid)
-                    bytes_sent[daddr] = (mbs_sent, uids)
-                else:
-                    bytes_sent[daddr] = (sbytes, [uid])
+            self.bytes_sent.set(profileid_twid, bytes_sent, profileid_twid)
 
-            return bytes_sent
-
-        all_flows = __database__.get_all_flows_in_profileid(
-            profileid
-        )
-        if not all_flows:
+        try:
+            sent = bytes_sent[daddr]
+        except KeyError:
+            # first time seeing this daddr in this tw, None if we shouldn't alert about it
+            sent = bytes_sent[daddr] = (
+                None if self.is_ignored_ip_data_upload(daddr) else [0, []]
+            )
+        if sent is None:
             return
-        bytes_sent: dict = get_sent_bytes(all_flows)
+        sent[0] += int(sbytes)
+        sent[1].append(uid)
 
-        for ip, ip_info in bytes_sent.items():
-            # ip_info is a tuple (bytes_sent, [uids])
-            uids = ip_info[1]
+    def detect_data_upload_in_twid(self, profileid, twid):
+        """
+        For each contacted ip in this twid,
+        check if the total bytes sent to this ip is >= data_exfiltration_threshold
+        """
+        bytes_sent: dict = self.bytes_sent.pop(f'{profileid}_{twid}')
+        if not bytes_sent:
+            return
 
-            bytes_uploaded = ip_info[0]
+        for ip, sent in bytes_sent.items():
+            if sent is None:
+                # ignored ip
+                continue
+            bytes_uploaded, uids = sent
             mbs_uploaded = utils.convert_to_mb(bytes_uploaded)
             if mbs_uploaded < self.data_exfiltration_threshold:
                 continue
@@ -487,7 +500,7 @@ class Module(Module, multiprocessing.Process):
 
         if (
             not 'icmp' in proto
-            and not self.is_p2p(dport, proto, daddr)
+            and not self.is_p2p(dport, proto, daddr, profileid, twid)
             and not __database__.is_ftp_port(dport)
         ):
             # we don't have info about this port
@@ -549,17 +562,18 @@ class Module(Module, multiprocessing.Process):
             return False
 
         try:
-            # format of this dict is {profileid: [stime of first arpa query, stime eof second, etc..]}
+            # the stime of first arpa query, stime of the second, etc..
             timestamps, uids, domains_scanned = self.dns_arpa_queries[profileid]
             timestamps.append(stime)
             uids.append(uid)
             uids.append(uid)
             domains_scanned.add(domain)
-            self.dns_arpa_queries[profileid] = (timestamps, uids, domains_scanned)
+            # keep them until the tw of this query is closed
+            self.dns_arpa_queries.set(profileid, (timestamps, uids, domains_scanned), f'{profileid}_{twid}')
         except KeyError:
             # first time for this profileid to perform an arpa query
-            self.dns_arpa_queries[profileid] = (
-                [stime], [uid], {domain}
+            self.dns_arpa_queries.set(
+                profileid, ([stime], [uid], {domain}), f'{profileid}_{twid}'
             )
             return False
 
@@ -683,20 +697,17 @@ class Module(Module, multiprocessing.Process):
 
         # Create a timer thread that will wait 15 seconds for the dns to arrive and then check again
         # self.print(f'Cache of conns not to check: {self.conn_checked_dns}')
-        if uid not in self.connections_checked_in_conn_dns_timer_thread:
-            # comes here if we haven't started the timer thread for this connection before
-            # mark this connection as checked
-            self.connections_checked_in_conn_dns_timer_thread.append(uid)
-            params = [flow_type, appproto, daddr, twid, profileid, timestamp, uid]
-            # self.print(f'Starting the timer to check on {daddr}, uid {uid}.
+        if ('conn_without_dns', uid) not in self.scheduler:
+            # comes here if we haven't scheduled this connection to be checked again before
+            params = (flow_type, appproto, daddr, twid, profileid, timestamp, uid)
+            # self.print(f'Scheduling the check on {daddr}, uid {uid}.
 
             # time {datetime.datetime.now()}')
-            timer = TimerThread(
-                15, self.check_connection_without_dns_resolution, params
+            self.scheduler.schedule(
+                15, self.check_connection_without_dns_resolution, params, key=('conn_without_dns', uid)
             )
-            timer.start()
         else:
-            # It means we already checked this conn with the Timer process
+            # It means we already checked this conn in the scheduler
             # (we waited 15 seconds for the dns to arrive after the connection was made)
             # but still no dns resolution for it.
             # Sometimes the same computer makes requests using its ipv4 and ipv6 address, check if this is the case
@@ -711,14 +722,6 @@ class Module(Module, multiprocessing.Process):
             self.helper.set_evidence_conn_without_dns(
                 daddr, timestamp, profileid, twid, uid
             )
-            # This UID will never appear again, so we can remove it and
-            # free some memory
-            try:
-                self.connections_checked_in_conn_dns_timer_thread.remove(
-                    uid
-                )
-            except ValueError:
-                pass
 
     def is_CNAME_contacted(self, answers, contacted_ips) -> bool:
         """
@@ -816,31 +819,22 @@ class Module(Module, multiprocessing.Process):
         # self.print(f'It seems that none of the IPs were contacted')
         # Found a DNS query which none of its IPs was contacted
         # It can be that Slips is still reading it from the files. Lets check back in some time
-        # Create a timer thread that will wait some seconds for the connection to arrive and then check again
-        if uid not in self.connections_checked_in_dns_conn_timer_thread:
-            # comes here if we haven't started the timer thread for this dns before
-            # mark this dns as checked
-            self.connections_checked_in_dns_conn_timer_thread.append(uid)
-            params = [domain, answers, rcode_name, timestamp, profileid, twid, uid]
-            # self.print(f'Starting the timer to check on {domain}, uid {uid}.
+        # Wait some seconds for the connection to arrive and then check again
+        if ('dns_without_conn', uid) not in self.scheduler:
+            # comes here if we haven't scheduled this dns to be checked again before
+            params = (domain, answers, rcode_name, timestamp, profileid, twid, uid)
+            # self.print(f'Scheduling the check on {domain}, uid {uid}.
             # time {datetime.datetime.now()}')
-            timer = TimerThread(
-                40, self.check_dns_without_connection, params
+            self.scheduler.schedule(
+                40, self.check_dns_without_connection, params, key=('dns_without_conn', uid)
             )
-            timer.start()
         else:
             # self.print(f'Alerting on {domain}, uid {uid}. time {datetime.datetime.now()}')
-            # It means we already checked this dns with the Timer process
+            # It means we already checked this dns in the scheduler
             # but still no connection for it.
             self.helper.set_evidence_DNS_without_conn(
                 domain, timestamp, profileid, twid, uid
             )
-            # This UID will never appear again, so we can remove it and
-            # free some memory
-            try:
-                self.connections_checked_in_dns_conn_timer_thread.remove(uid)
-            except ValueError:
-                pass
 
     def detect_successful_ssh_by_zeek(self, uid, timestamp, profileid, twid):
         """
@@ -865,26 +859,15 @@ class Module(Module, multiprocessing.Process):
                 timestamp,
                 by='Zeek',
             )
-            try:
-                self.connections_checked_in_ssh_timer_thread.remove(
-                    uid
-                )
-            except ValueError:
-                pass
             return True
-        elif uid not in self.connections_checked_in_ssh_timer_thread:
+        elif ('ssh', uid) not in self.scheduler:
             # It can happen that the original SSH flow is not in the DB yet
-            # comes here if we haven't started the timer thread for this connection before
-            # mark this connection as checked
-            # self.print(f'Starting the timer to check on {flow_dict}, uid {uid}. time {datetime.datetime.now()}')
-            self.connections_checked_in_ssh_timer_thread.append(
-                uid
+            # comes here if we haven't scheduled this connection to be checked again before
+            # self.print(f'Scheduling the check on {flow_dict}, uid {uid}. time {datetime.datetime.now()}')
+            params = (uid, timestamp, profileid, twid)
+            self.scheduler.schedule(
+                15, self.detect_successful_ssh_by_zeek, params, key=('ssh', uid)
             )
-            params = [uid, timestamp, profileid, twid]
-            timer = TimerThread(
-                15, self.detect_successful_ssh_by_zeek, params
-            )
-            timer.start()
 
     def detect_successful_ssh_by_slips(self, uid, timestamp, profileid, twid, auth_success):
         """
@@ -914,12 +897,6 @@ class Module(Module, multiprocessing.Process):
                     timestamp,
                     by='Slips',
                 )
-                try:
-                    self.connections_checked_in_ssh_timer_thread.remove(
-                        uid
-                    )
-                except ValueError:
-                    pass
                 return True
 
             else:
@@ -927,19 +904,14 @@ class Module(Module, multiprocessing.Process):
                 pass
         else:
             # It can happen that the original SSH flow is not in the DB yet
-            if uid not in self.connections_checked_in_ssh_timer_thread:
-                # comes here if we haven't started the timer thread for this connection before
-                # mark this connection as checked
-                # self.print(f'Starting the timer to check on {flow_dict}, uid {uid}.
+            if ('ssh', uid) not in self.scheduler:
+                # comes here if we haven't scheduled this connection to be checked again before
+                # self.print(f'Scheduling the check on {flow_dict}, uid {uid}.
                 # time {datetime.datetime.now()}')
-                self.connections_checked_in_ssh_timer_thread.append(
-                    uid
-                )
-                params = [uid, timestamp, profileid, twid, auth_success]
-                timer = TimerThread(
-                    15, self.check_successful_ssh, params
+                params = (uid, timestamp, profileid, twid, auth_success)
+                self.scheduler.schedule(
+                    15, self.check_successful_ssh, params, key=('ssh', uid)
                 )
-                timer.start()
 
     def check_successful_ssh(self, uid, timestamp, profileid, twid, auth_success):
         """
@@ -1111,19 +1083,17 @@ class Module(Module, multiprocessing.Process):
 
         # found NXDOMAIN by this profile
         try:
-            # make sure all domains are unique
-            if query not in self.nxdomains[profileid_twid]:
-                queries, uids = self.nxdomains[profileid_twid]
-                queries.append(query)
-                uids.append(uid)
-                self.nxdomains[profileid_twid] = (queries, uids)
+            queries, uids = self.nxdomains[profileid_twid]
         except KeyError:
             # first time seeing nxdomain in this profile and tw
-            self.nxdomains.update({profileid_twid: ([query], [uid])})
+            self.nxdomains.set(profileid_twid, ([query], [uid]), profileid_twid)
             return False
+        # make sure all domains are unique
+        if query not in queries:
+            queries.append(query)
+            uids.append(uid)
 
         # every 5 nxdomains, generate an alert.
-        queries, uids = self.nxdomains[profileid_twid]
         number_of_nxdomains = len(queries)
         if (
             number_of_nxdomains % 5 == 0
@@ -1133,7 +1103,7 @@ class Module(Module, multiprocessing.Process):
                 number_of_nxdomains, stime, profileid, twid, uids
             )
             # clear the list of alerted queries and uids
-            self.nxdomains[profileid_twid] = ([],[])
+            self.nxdomains.set(profileid_twid, ([], []), profileid_twid)
             return True
 
     def check_conn_to_port_0(
@@ -1262,6 +1232,10 @@ class Module(Module, multiprocessing.Process):
         return True
 
     def shutdown_gracefully(self):
+        # check the connections we're still waiting for before finishing
+        self.scheduler.shutdown()
+        for name, store in self.state_stores.items():
+            self.print(f'{name}: {store.stats()}', 3, 0)
         __database__.publish('finished_modules', self.name)
 
     def check_smtp_bruteforce(self,last_reply, stime, saddr, daddr, profileid, twid, uid):
@@ -1272,22 +1246,16 @@ class Module(Module, multiprocessing.Process):
             timestamps, uids = self.smtp_bruteforce_cache[profileid]
             timestamps.append(stime)
             uids.append(uid)
-            self.smtp_bruteforce_cache[profileid] = (timestamps, uids)
         except KeyError:
             # first time for this profileid to make bad smtp login
-            self.smtp_bruteforce_cache.update(
-                {
-                    profileid: ([stime], [uid])
-                }
-            )
+            timestamps, uids = [stime], [uid]
+        # keep them until the tw of this login is closed
+        self.smtp_bruteforce_cache.set(profileid, (timestamps, uids), f'{profileid}_{twid}')
 
         self.helper.set_evidence_bad_smtp_login(
             saddr, daddr, stime, profileid, twid, uid
         )
 
-        timestamps = self.smtp_bruteforce_cache[profileid][0]
-        uids = self.smtp_bruteforce_cache[profileid][1]
-
         # check if 3 bad login attemps happened within 10 seconds or less
         if not (
             len(timestamps) == self.smtp_bruteforce_threshold
@@ -1303,8 +1271,8 @@ class Module(Module, multiprocessing.Process):
         if diff > 10:
             # didnt happen within 10s!
             # remove the first login from cache so we can check the next 3 logins
-            self.smtp_bruteforce_cache[profileid][0].pop(0)
-            self.smtp_bruteforce_cache[profileid][1].pop(0)
+            timestamps.pop(0)
+            uids.pop(0)
             return
 
         self.helper.set_evidence_smtp_bruteforce(
@@ -1318,7 +1286,7 @@ class Module(Module, multiprocessing.Process):
         )
 
         # remove all 3 logins that caused this alert
-        self.smtp_bruteforce_cache[profileid] = ([],[])
+        self.smtp_bruteforce_cache.set(profileid, ([], []), f'{profileid}_{twid}')
 
     def detect_connection_to_multiple_ports(
             self,
@@ -1523,22 +1491,20 @@ class Module(Module, multiprocessing.Process):
 
         cache_key = f'{profileid}-{twid}-{daddr}'
         # update the number of times this ip performed a failed ssh login
-        if cache_key in self.password_guessing_cache:
-            self.password_guessing_cache[cache_key].append(uid)
-        else:
-            self.password_guessing_cache = {cache_key: [uid]}
+        uids = self.password_guessing_cache.get(cache_key, [])
+        uids.append(uid)
+        self.password_guessing_cache.set(cache_key, uids, f'{profileid}_{twid}')
 
-        conn_count = len(self.password_guessing_cache[cache_key])
+        conn_count = len(uids)
 
         if conn_count >= self.pw_guessing_threshold:
             description = f'SSH password guessing to IP {daddr}'
-            uids = self.password_guessing_cache[cache_key]
             self.helper.set_evidence_pw_guessing(
                 description, timestamp, profileid, twid, uids, conn_count, profileid.split('_')[-1], by='Slips'
             )
 
             #reset the counter
-            del self.password_guessing_cache[cache_key]
+            self.password_guessing_cache.pop(cache_key)
 
 
 
@@ -1752,453 +1718,405 @@ class Module(Module, multiprocessing.Process):
                 )
 
 
-    def run(self):
-        utils.drop_root_privs()
-        self.ssl_waiting_thread.start()
-        while True:
-            try:
-                # ---------------------------- new_flow channel
-                message = __database__.get_message(self.c1)
-                # if timewindows are not updated for a long time, Slips is stopped automatically.
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_flow'):
-                    new_flow = json.loads(message['data'])
-                    profileid = new_flow['profileid']
-                    twid = new_flow['twid']
-                    flow = new_flow['flow']
-                    flow = json.loads(flow)
-                    uid = next(iter(flow))
-                    flow_dict = json.loads(flow[uid])
-                    # Flow type is 'conn' or 'dns', etc.
-                    flow_type = flow_dict['flow_type']
-                    dur = flow_dict['dur']
-                    saddr = flow_dict['saddr']
-                    daddr = flow_dict['daddr']
-                    origstate = flow_dict['origstate']
-                    state = flow_dict['state']
-                    timestamp = new_flow['stime']
-                    sport: int = flow_dict['sport']
-                    dport: int = flow_dict.get('dport', None)
-                    proto = flow_dict.get('proto')
-                    sbytes = flow_dict.get('sbytes', 0)
-                    appproto = flow_dict.get('appproto', '')
-                    smac = flow_dict.get('smac', '')
-                    if not appproto or appproto == '-':
-                        appproto = flow_dict.get('type', '')
-                    # dmac = flow_dict.get('dmac', '')
-                    # stime = flow_dict['ts']
-                    # timestamp = new_flow['stime']
-                    # pkts = flow_dict['pkts']
-                    # allbytes = flow_dict['allbytes']
-
-                    self.check_long_connection(
-                        dur, daddr, saddr, profileid, twid, uid, timestamp
-                    )
-                    self.check_unknown_port(
-                        dport,
-                        proto.lower(),
-                        daddr,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp,
-                        state
-                    )
-                    self.check_multiple_reconnection_attempts(
-                            origstate,
-                            saddr,
-                            daddr,
-                            dport,
-                            uid,
-                            profileid,
-                            twid,
-                            timestamp
-                    )
-                    self.check_conn_to_port_0(
-                        sport,
-                        dport,
-                        proto,
-                        saddr,
-                        daddr,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp
-                    )
-                    self.check_different_localnet_usage(
-                        saddr,
-                        daddr,
-                        dport,
-                        proto,
-                        profileid,
-                        timestamp,
-                        twid,
-                        uid,
-                        what_to_check='srcip'
-                    )
-                    self.check_different_localnet_usage(
-                        saddr,
-                        daddr,
-                        dport,
-                        proto,
-                        profileid,
-                        timestamp,
-                        twid,
-                        uid,
-                        what_to_check='dstip'
-                    )
-
-                    self.check_connection_without_dns_resolution(
-                        flow_type, appproto, daddr, twid, profileid, timestamp, uid
-                    )
+    def handle_new_flow(self, message):
+        new_flow = decode_flow_msg(message['data'])
+        profileid = new_flow['profileid']
+        twid = new_flow['twid']
+        uid = new_flow['uid']
+        flow_dict = new_flow['flow']
+        # Flow type is 'conn' or 'dns', etc.
+        flow_type = flow_dict['flow_type']
+        dur = flow_dict['dur']
+        saddr = flow_dict['saddr']
+        daddr = flow_dict['daddr']
+        origstate = flow_dict['origstate']
+        state = flow_dict['state']
+        timestamp = new_flow['stime']
+        sport: int = flow_dict['sport']
+        dport: int = flow_dict.get('dport', None)
+        proto = flow_dict.get('proto')
+        sbytes = flow_dict.get('sbytes', 0)
+        appproto = flow_dict.get('appproto', '')
+        smac = flow_dict.get('smac', '')
+        if not appproto or appproto == '-':
+            appproto = flow_dict.get('type', '')
+        # dmac = flow_dict.get('dmac', '')
+        # stime = flow_dict['ts']
+        # timestamp = new_flow['stime']
+        # pkts = flow_dict['pkts']
+        # allbytes = flow_dict['allbytes']
+
+        self.check_long_connection(
+            dur, daddr, saddr, profileid, twid, uid, timestamp
+        )
+        self.check_unknown_port(
+            dport,
+            proto.lower(),
+            daddr,
+            profileid,
+            twid,
+            uid,
+            timestamp,
+            state
+        )
+        self.check_multiple_reconnection_attempts(
+                origstate,
+                saddr,
+                daddr,
+                dport,
+                uid,
+                profileid,
+                twid,
+                timestamp
+        )
+        self.check_conn_to_port_0(
+            sport,
+            dport,
+            proto,
+            saddr,
+            daddr,
+            profileid,
+            twid,
+            uid,
+            timestamp
+        )
+        self.check_different_localnet_usage(
+            saddr,
+            daddr,
+            dport,
+            proto,
+            profileid,
+            timestamp,
+            twid,
+            uid,
+            what_to_check='srcip'
+        )
+        self.check_different_localnet_usage(
+            saddr,
+            daddr,
+            dport,
+            proto,
+            profileid,
+            timestamp,
+            twid,
+            uid,
+            what_to_check='dstip'
+        )
 
-                    self.detect_connection_to_multiple_ports(
-                        saddr,
-                        daddr,
-                        proto,
-                        state,
-                        appproto,
-                        dport,
-                        timestamp,
-                        profileid,
-                        twid
-                    )
-                    self.check_data_upload(
-                        sbytes,
-                        daddr,
-                        uid,
-                        profileid,
-                        twid
-                    )
+        self.check_connection_without_dns_resolution(
+            flow_type, appproto, daddr, twid, profileid, timestamp, uid
+        )
 
-                    self.check_non_http_port_80_conns(
-                        state,
-                        daddr,
-                        dport,
-                        proto,
-                        appproto,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp
-                    )
-                    self.check_non_ssl_port_443_conns(
-                        state,
-                        daddr,
-                        dport,
-                        proto,
-                        appproto,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp
-                    )
-                    self.check_connection_to_local_ip(
-                        daddr,
-                        dport,
-                        proto,
-                        saddr,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp,
-                    )
+        self.detect_connection_to_multiple_ports(
+            saddr,
+            daddr,
+            proto,
+            state,
+            appproto,
+            dport,
+            timestamp,
+            profileid,
+            twid
+        )
+        self.check_data_upload(
+            sbytes,
+            daddr,
+            uid,
+            profileid,
+            twid
+        )
+        self.add_bytes_sent(
+            sbytes,
+            daddr,
+            uid,
+            profileid,
+            twid
+        )
 
-                    self.check_device_changing_ips(
-                        flow_type, smac, profileid, twid, uid, timestamp
-                    )
+        self.check_non_http_port_80_conns(
+            state,
+            daddr,
+            dport,
+            proto,
+            appproto,
+            profileid,
+            twid,
+            uid,
+            timestamp
+        )
+        self.check_non_ssl_port_443_conns(
+            state,
+            daddr,
+            dport,
+            proto,
+            appproto,
+            profileid,
+            twid,
+            uid,
+            timestamp
+        )
+        self.check_connection_to_local_ip(
+            daddr,
+            dport,
+            proto,
+            saddr,
+            profileid,
+            twid,
+            uid,
+            timestamp,
+        )
 
-                # --- Detect successful SSH connections ---
-                message = __database__.get_message(self.c2)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_ssh'):
-                    data = message['data']
-                    data = json.loads(data)
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    # Get flow as a json
-                    flow = data['flow']
-                    flow = json.loads(flow)
-                    timestamp = flow['stime']
-                    uid = flow['uid']
-                    daddr = flow['daddr']
-                    # it's set to true in zeek json files, T in zeke tab files
-                    auth_success = flow['auth_success']
-
-                    self.check_successful_ssh(
-                        uid,
-                        timestamp,
-                        profileid,
-                        twid,
-                        auth_success
-                    )
+        self.check_device_changing_ips(
+            flow_type, smac, profileid, twid, uid, timestamp
+        )
 
-                    self.check_ssh_password_guessing(
-                        daddr,
-                        uid,
-                        timestamp,
-                        profileid,
-                        twid,
-                        auth_success
-                    )
+    def handle_new_ssh(self, message):
+        """Detect successful SSH connections and SSH password guessing"""
+        data = decode_flow_msg(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        flow = data['flow']
+        timestamp = flow['stime']
+        uid = flow['uid']
+        daddr = flow['daddr']
+        # it's set to true in zeek json files, T in zeke tab files
+        auth_success = flow['auth_success']
+
+        self.check_successful_ssh(
+            uid,
+            timestamp,
+            profileid,
+            twid,
+            auth_success
+        )
 
-                # --- Detect alerts from Zeek: Self-signed certs,
-                # invalid certs, port-scans and address scans, and password guessing ---
-                message = __database__.get_message(self.c3)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_notice'):
-                    data = message['data']
-                    # Convert from json to dict
-                    data = json.loads(data)
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    # Get flow as a json
-                    flow = data['flow']
-                    # Convert flow to a dict
-                    flow = json.loads(flow)
-                    timestamp = flow['stime']
-                    uid = data['uid']
-                    msg = flow['msg']
-                    note = flow['note']
-
-                    # --- Detect port scans from Zeek logs ---
-                    # We're looking for port scans in notice.log in the note field
-                    if 'Port_Scan' in note:
-                        # Vertical port scan
-                        scanning_ip = flow.get('scanning_ip', '')
-                        self.helper.set_evidence_vertical_portscan(
-                            msg,
-                            scanning_ip,
-                            timestamp,
-                            profileid,
-                            twid,
-                            uid,
-                        )
-
-                    # --- Detect horizontal portscan by zeek ---
-                    if 'Address_Scan' in note:
-                        # Horizontal port scan
-                        # scanned_port = flow.get('scanned_port', '')
-                        self.helper.set_evidence_horizontal_portscan(
-                            msg,
-                            timestamp,
-                            profileid,
-                            twid,
-                            uid,
-                        )
-                    # --- Detect password guessing by zeek ---
-                    if 'Password_Guessing' in note:
-                        self.helper.set_evidence_pw_guessing(
-                            msg,
-                            timestamp,
-                            profileid,
-                            twid,
-                            uid,
-                            by='Zeek'
-                        )
-
-                # --- Detect maliciuos JA3 TLS servers ---
-                message = __database__.get_message(self.c4)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_ssl'):
-                    # Check for self signed certificates in new_ssl channel (ssl.log)
-                    data = message['data']
-                    # Convert from json to dict
-                    data = json.loads(data)
-                    # Get flow as a json
-                    flow = data['flow']
-                    # Convert flow to a dict
-                    flow = json.loads(flow)
-                    uid = flow['uid']
-                    timestamp = flow['stime']
-                    ja3 = flow.get('ja3', False)
-                    ja3s = flow.get('ja3s', False)
-                    issuer = flow.get('issuer', False)
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    daddr = flow['daddr']
-                    saddr = profileid.split('_')[1]
-                    server_name = flow.get('server_name')
-
-                    # we'll be checking pastebin downloads of this ssl flow
-                    # later
-                    self.pending_ssl_flows.put(
-                        (daddr, server_name, uid, timestamp, profileid, twid)
-                    )
+        self.check_ssh_password_guessing(
+            daddr,
+            uid,
+            timestamp,
+            profileid,
+            twid,
+            auth_success
+        )
 
-                    self.check_self_signed_certs(
-                        flow['validation_status'],
-                        daddr,
-                        server_name,
-                        profileid,
-                        twid,
-                        timestamp,
-                        uid
-                    )
+    def handle_new_notice(self, message):
+        """Detect alerts from Zeek: Self-signed certs, invalid certs, port-scans and address scans, and password guessing"""
+        data = decode_flow_msg(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        flow = data['flow']
+        timestamp = flow['stime']
+        uid = data['uid']
+        msg = flow['msg']
+        note = flow['note']
+
+        # --- Detect port scans from Zeek logs ---
+        # We're looking for port scans in notice.log in the note field
+        if 'Port_Scan' in note:
+            # Vertical port scan
+            scanning_ip = flow.get('scanning_ip', '')
+            self.helper.set_evidence_vertical_portscan(
+                msg,
+                scanning_ip,
+                timestamp,
+                profileid,
+                twid,
+                uid,
+            )
 
-                    self.detect_malicious_ja3(
-                        saddr,
-                        daddr,
-                        ja3,
-                        ja3s,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp
-                    )
+        # --- Detect horizontal portscan by zeek ---
+        if 'Address_Scan' in note:
+            # Horizontal port scan
+            # scanned_port = flow.get('scanned_port', '')
+            self.helper.set_evidence_horizontal_portscan(
+                msg,
+                timestamp,
+                profileid,
+                twid,
+                uid,
+            )
+        # --- Detect password guessing by zeek ---
+        if 'Password_Guessing' in note:
+            self.helper.set_evidence_pw_guessing(
+                msg,
+                timestamp,
+                profileid,
+                twid,
+                uid,
+                by='Zeek'
+            )
 
-                    self.detect_incompatible_CN(
-                        daddr,
-                        server_name,
-                        issuer,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp
-                    )
+    def handle_new_ssl(self, message):
+        """Detect maliciuos JA3 TLS servers, self signed certs and incompatible CNs"""
+        # Check for self signed certificates in new_ssl channel (ssl.log)
+        data = decode_flow_msg(message['data'])
+        flow = data['flow']
+        uid = flow['uid']
+        timestamp = flow['stime']
+        ja3 = flow.get('ja3', False)
+        ja3s = flow.get('ja3s', False)
+        issuer = flow.get('issuer', False)
+        profileid = data['profileid']
+        twid = data['twid']
+        daddr = flow['daddr']
+        saddr = profileid.split('_')[1]
+        server_name = flow.get('server_name')
+
+        # we'll be checking pastebin downloads of this ssl flow
+        # later
+        self.pending_ssl_flows.put(
+            (daddr, server_name, uid, timestamp, profileid, twid)
+        )
 
+        self.check_self_signed_certs(
+            flow['validation_status'],
+            daddr,
+            server_name,
+            profileid,
+            twid,
+            timestamp,
+            uid
+        )
 
-                message = __database__.get_message(self.c5)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
+        self.detect_malicious_ja3(
+            saddr,
+            daddr,
+            ja3,
+            ja3s,
+            profileid,
+            twid,
+            uid,
+            timestamp
+        )
 
-                if utils.is_msg_intended_for(message, 'tw_closed'):
-                    profileid_tw = message['data'].split('_')
-                    profileid, twid = f'{profileid_tw[0]}_{profileid_tw[1]}', profileid_tw[-1]
-                    self.detect_data_upload_in_twid(profileid, twid)
+        self.detect_incompatible_CN(
+            daddr,
+            server_name,
+            issuer,
+            profileid,
+            twid,
+            uid,
+            timestamp
+        )
 
-                # --- Detect DNS issues: 1) DNS resolutions without connection, 2) DGA, 3) young domains, 4) ARPA SCANs
-                message = __database__.get_message(self.c6)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_dns_flow'):
-                    data = json.loads(message['data'])
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    uid = data['uid']
-                    daddr = data.get('daddr', False)
-                    flow_data = json.loads(
-                        data['flow']
-                    )   # this is a dict {'uid':json flow data}
-                    domain = flow_data.get('query', False)
-                    answers = flow_data.get('answers', False)
-                    rcode_name = flow_data.get('rcode_name', False)
-                    stime = data.get('stime', False)
-
-                    # only check dns without connection if we have answers(we're sure the query is resolved)
-                    # sometimes we have 2 dns flows, 1 for ipv4 and 1 fo ipv6, both have the
-                    # same uid, this causes FP dns without connection,
-                    # so make sure we only check the uid once
-                    if answers and uid not in self.connections_checked_in_dns_conn_timer_thread:
-                        self.check_dns_without_connection(
-                            domain, answers, rcode_name, stime, profileid, twid, uid
-                        )
-
-                    self.check_suspicious_dns_answers(
-                        domain, answers, daddr, profileid, twid, stime, uid
-                    )
-                    self.detect_DGA(
-                        rcode_name, domain, stime, daddr, profileid, twid, uid
-                    )
+    def handle_tw_closed(self, message):
+        profileid_tw = message['data'].split('_')
+        profileid, twid = f'{profileid_tw[0]}_{profileid_tw[1]}', profileid_tw[-1]
+        self.detect_data_upload_in_twid(profileid, twid)
+        # forget the state last updated in this tw
+        for store in self.state_stores.values():
+            store.close_tw(message['data'])
+
+    def handle_new_dns_flow(self, message):
+        """Detect DNS issues: 1) DNS resolutions without connection, 2) DGA, 3) young domains, 4) ARPA SCANs"""
+        data = decode_flow_msg(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        uid = data['uid']
+        daddr = data.get('daddr', False)
+        flow_data = data['flow']
+        domain = flow_data.get('query', False)
+        answers = flow_data.get('answers', False)
+        rcode_name = flow_data.get('rcode_name', False)
+        stime = data.get('stime', False)
+
+        # only check dns without connection if we have answers(we're sure the query is resolved)
+        # sometimes we have 2 dns flows, 1 for ipv4 and 1 fo ipv6, both have the
+        # same uid, this causes FP dns without connection,
+        # so make sure we only check the uid once
+        if answers and ('dns_without_conn', uid) not in self.scheduler:
+            self.check_dns_without_connection(
+                domain, answers, rcode_name, stime, profileid, twid, uid
+            )
 
-                    # TODO: not sure how to make sure IP_info is done adding domain age to the db or not
-                    self.detect_young_domains(
-                        domain, stime, profileid, twid, uid
-                    )
-                    self.check_dns_arpa_scan(
-                        domain, stime, profileid, twid, uid
-                    )
+        self.check_suspicious_dns_answers(
+            domain, answers, daddr, profileid, twid, stime, uid
+        )
+        self.detect_DGA(
+            rcode_name, domain, stime, daddr, profileid, twid, uid
+        )
 
-                # --- Detect malicious SSL certificates ---
-                message = __database__.get_message(self.c7)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_downloaded_file'):
-                    ssl_info = json.loads(message['data'])
-                    self.check_malicious_ssl(ssl_info)
+        # TODO: not sure how to make sure IP_info is done adding domain age to the db or not
+        self.detect_young_domains(
+            domain, stime, profileid, twid, uid
+        )
+        self.check_dns_arpa_scan(
+            domain, stime, profileid, twid, uid
+        )
 
-                # --- Detect Bad SMTP logins ---
-                message = __database__.get_message(self.c8)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_smtp'):
-                    data = json.loads(message['data'])
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    uid = data['uid']
-                    daddr = data['daddr']
-                    saddr = data['saddr']
-                    stime = data.get('ts', False)
-                    last_reply = data.get('last_reply', False)
-                    self.check_smtp_bruteforce(
-                        last_reply,
-                        stime,
-                        saddr,
-                        daddr,
-                        profileid,
-                        twid,
-                        uid
-                    )
+    def handle_new_downloaded_file(self, message):
+        """Detect malicious SSL certificates"""
+        ssl_info = json.loads(message['data'])
+        self.check_malicious_ssl(ssl_info)
+
+    def handle_new_smtp(self, message):
+        """Detect Bad SMTP logins"""
+        data = json.loads(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        uid = data['uid']
+        daddr = data['daddr']
+        saddr = data['saddr']
+        stime = data.get('ts', False)
+        last_reply = data.get('last_reply', False)
+        self.check_smtp_bruteforce(
+            last_reply,
+            stime,
+            saddr,
+            daddr,
+            profileid,
+            twid,
+            uid
+        )
 
+    def handle_new_software(self, message):
+        """Detect multiple used SSH versions"""
+        flow = json.loads(message['data'])
+        starttime = flow.get('starttime', '')
+        saddr = flow.get('saddr', '')
+        uid = flow.get('uid', '')
+        twid = flow.get('twid', '')
+        # can be 'SSH::SERVER' or 'SSH::CLIENT'
+        software_type = flow.get('software_type', '')
+        major_v = flow.get('version.major', '')
+        minor_v = flow.get('version.minor', '')
+        self.check_multiple_ssh_versions(
+            starttime,
+            saddr,
+            software_type,
+            major_v,
+            minor_v,
+            twid,
+            uid,
+            role='SSH::CLIENT'
+        )
+        self.check_multiple_ssh_versions(
+            starttime,
+            saddr,
+            software_type,
+            major_v,
+            minor_v,
+            twid,
+            uid,
+            role='SSH::SERVER'
+        )
 
-                # --- Detect multiple used SSH versions ---
-                message = __database__.get_message(self.c9)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_software'):
-                    flow = json.loads(message['data'])
-                    starttime = flow.get('starttime', '')
-                    saddr = flow.get('saddr', '')
-                    uid = flow.get('uid', '')
-                    twid = flow.get('twid', '')
-                    # can be 'SSH::SERVER' or 'SSH::CLIENT'
-                    software_type = flow.get('software_type', '')
-                    major_v = flow.get('version.major', '')
-                    minor_v = flow.get('version.minor', '')
-                    self.check_multiple_ssh_versions(
-                        starttime,
-                        saddr,
-                        software_type,
-                        major_v,
-                        minor_v,
-                        twid,
-                        uid,
-                        role='SSH::CLIENT'
-                    )
-                    self.check_multiple_ssh_versions(
-                        starttime,
-                        saddr,
-                        software_type,
-                        major_v,
-                        minor_v,
-                        twid,
-                        uid,
-                        role='SSH::SERVER'
-                    )
+    def handle_new_weird(self, message):
+        msg = json.loads(message['data'])
+        self.check_weird_http_method(msg)
 
-                message = __database__.get_message(self.c10)
-                if message and message['data'] == 'stop_process':
+    def run(self):
+        utils.drop_root_privs()
+        self.ssl_waiting_thread.start()
+        self.scheduler.start()
+        while True:
+            try:
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
+                    # if timewindows are not updated for a long time, Slips is stopped automatically.
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_weird'):
-                    msg = json.loads(message['data'])
-                    self.check_weird_http_method(msg)
-
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
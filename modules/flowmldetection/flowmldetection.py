@@ -3,11 +3,12 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.flow_message import decode_flow_msg
+from slips_files.common.dispatcher import Dispatcher
 from sklearn.linear_model import SGDClassifier
 from sklearn.preprocessing import StandardScaler
 import pickle
 import pandas as pd
-import json
 import datetime
 import traceback
 # Only for debbuging
@@ -37,7 +38,8 @@ class Module(Module, multiprocessing.Process):
         self.outputqueue = outputqueue
         __database__.start(redis_port)
         # Subscribe to the channel
-        self.c1 = __database__.subscribe('new_flow')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_flow', self.handle_new_flow)
         self.fieldseparator = __database__.getFieldSeparator()
         # Set the output queue of our database instance
         __database__.setOutputQueue(self.outputqueue)
@@ -405,101 +407,92 @@ class Module(Module, multiprocessing.Process):
         self.store_model()
         __database__.publish('finished_modules', self.name)
 
+    def handle_new_flow(self, message):
+        """trains the model or predicts the label of the flow, depending on the mode"""
+        data = decode_flow_msg(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        uid = data['uid']
+        self.flow_dict = data['flow']
+
+        if self.mode == 'train':
+            # We are training
+
+            # Is the amount in the DB of labels enough to retrain?
+            # Use labeled flows
+            labels = __database__.get_labels()
+            sum_labeled_flows = sum([i[1] for i in labels])
+            if (
+                sum_labeled_flows >= self.minimum_lables_to_retrain
+                and sum_labeled_flows
+                % self.minimum_lables_to_retrain
+                == 1
+            ):
+                # We get here every 'self.minimum_lables_to_retrain' amount of labels
+                # So for example we retrain every 100 labels and only when we have at least 100 labels
+                self.print(
+                    f'Training the model with the last group of flows and labels. Total flows: {sum_labeled_flows}.'
+                )
+                # Process all flows in the DB and make them ready for pandas
+                self.process_flows()
+                # Train an algorithm
+                self.train()
+        elif self.mode == 'test':
+            # We are testing, which means using the model to detect
+            self.process_flow()
+
+            # After processing the flow, it may happen that we delete icmp/arp/etc
+            # so the dataframe can be empty
+            if not self.flow.empty:
+                # Predict
+                pred = self.detect()
+                label = self.flow_dict['label']
+
+                # Report
+                if (
+                    label
+                    and label != 'unknown'
+                    and label != pred[0]
+                ):
+                    # If the user specified a label in test mode, and the label
+                    # is diff from the prediction, print in debug mode
+                    self.print(
+                        f'Report Prediction {pred[0]} for label {label} flow {self.flow_dict["saddr"]}:'
+                        f'{self.flow_dict["sport"]} -> {self.flow_dict["daddr"]}:'
+                        f'{self.flow_dict["dport"]}/{self.flow_dict["proto"]}',
+                        0,
+                        3,
+                    )
+                if pred[0] == 'Malware':
+                    # Generate an alert
+                    self.set_evidence_malicious_flow(
+                        self.flow_dict['saddr'],
+                        self.flow_dict['sport'],
+                        self.flow_dict['daddr'],
+                        self.flow_dict['dport'],
+                        profileid,
+                        twid,
+                        uid,
+                    )
+                    self.print(
+                        f'Prediction {pred[0]} for label {label} flow {self.flow_dict["saddr"]}:'
+                        f'{self.flow_dict["sport"]} -> {self.flow_dict["daddr"]}:'
+                        f'{self.flow_dict["dport"]}/{self.flow_dict["proto"]}',
+                        0,
+                        2,
+                    )
+
     def run(self):
         utils.drop_root_privs()
         # Load the model
         self.read_model()
         while True:
             try:
-                message = __database__.get_message(self.c1)
-
-                if message and message['data'] == 'stop_process':
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_flow'):
-                    data = message['data']
-                    # Convert from json to dict
-                    data = json.loads(data)
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    # Get flow that is now in json format
-                    flow = data['flow']
-                    # Convert flow to a dict
-                    flow = json.loads(flow)
-                    # Convert the common fields to something that can
-                    # be interpreted
-                    # Get the uid which is the key
-                    uid = next(iter(flow))
-                    self.flow_dict = json.loads(flow[uid])
-
-                    if self.mode == 'train':
-                        # We are training
-
-                        # Is the amount in the DB of labels enough to retrain?
-                        # Use labeled flows
-                        labels = __database__.get_labels()
-                        sum_labeled_flows = sum([i[1] for i in labels])
-                        if (
-                            sum_labeled_flows >= self.minimum_lables_to_retrain
-                            and sum_labeled_flows
-                            % self.minimum_lables_to_retrain
-                            == 1
-                        ):
-                            # We get here every 'self.minimum_lables_to_retrain' amount of labels
-                            # So for example we retrain every 100 labels and only when we have at least 100 labels
-                            self.print(
-                                f'Training the model with the last group of flows and labels. Total flows: {sum_labeled_flows}.'
-                            )
-                            # Process all flows in the DB and make them ready for pandas
-                            self.process_flows()
-                            # Train an algorithm
-                            self.train()
-                    elif self.mode == 'test':
-                        # We are testing, which means using the model to detect
-                        self.process_flow()
-
-                        # After processing the flow, it may happen that we delete icmp/arp/etc
-                        # so the dataframe can be empty
-                        if not self.flow.empty:
-                            # Predict
-                            pred = self.detect()
-                            label = self.flow_dict['label']
-
-                            # Report
-                            if (
-                                label
-                                and label != 'unknown'
-                                and label != pred[0]
-                            ):
-                                # If the user specified a label in test mode, and the label
-                                # is diff from the prediction, print in debug mode
-                                self.print(
-                                    f'Report Prediction {pred[0]} for label {label} flow {self.flow_dict["saddr"]}:'
-                                    f'{self.flow_dict["sport"]} -> {self.flow_dict["daddr"]}:'
-                                    f'{self.flow_dict["dport"]}/{self.flow_dict["proto"]}',
-                                    0,
-                                    3,
-                                )
-                            if pred[0] == 'Malware':
-                                # Generate an alert
-                                self.set_evidence_malicious_flow(
-                                    self.flow_dict['saddr'],
-                                    self.flow_dict['sport'],
-                                    self.flow_dict['daddr'],
-                                    self.flow_dict['dport'],
-                                    profileid,
-                                    twid,
-                                    uid,
-                                )
-                                self.print(
-                                    f'Prediction {pred[0]} for label {label} flow {self.flow_dict["saddr"]}:'
-                                    f'{self.flow_dict["sport"]} -> {self.flow_dict["daddr"]}:'
-                                    f'{self.flow_dict["dport"]}/{self.flow_dict["proto"]}',
-                                    0,
-                                    2,
-                                )
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
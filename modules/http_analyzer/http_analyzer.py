@@ -3,6 +3,8 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
+from slips_files.common.flow_message import decode_flow_msg
 import sys
 import traceback
 import json
@@ -21,7 +23,8 @@ class Module(Module, multiprocessing.Process):
         # The outputqueue is connected to another process called OutputProcess
         self.outputqueue = outputqueue
         __database__.start(redis_port)
-        self.c1 = __database__.subscribe('new_http')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_http', self.handle_new_http)
         self.connections_counter = {}
         self.empty_connections_threshold = 4
         # this is a list of hosts known to be resolved by malware
@@ -482,112 +485,107 @@ class Module(Module, multiprocessing.Process):
     def shutdown_gracefully(self):
         __database__.publish('finished_modules', self.name)
 
-    def run(self):
-        utils.drop_root_privs()
-        # Main loop function
-        while True:
-            try:
-                message = __database__.get_message(self.c1)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
+    def handle_new_http(self, message):
+        message = decode_flow_msg(message['data'])
+        profileid = message['profileid']
+        twid = message['twid']
+        flow = message['flow']
+        uid = flow['uid']
+        host = flow['host']
+        uri = flow['uri']
+        daddr = flow['daddr']
+        timestamp = flow.get('stime', '')
+        user_agent = flow.get('user_agent', False)
+        request_body_len = flow.get('request_body_len')
+        response_body_len = flow.get('response_body_len')
+        method = flow.get('method')
+        resp_mime_types = flow.get('resp_mime_types')
+
+        self.check_suspicious_user_agents(
+            uid, host, uri, timestamp, user_agent, profileid, twid
+        )
+        self.check_multiple_empty_connections(
+            uid, host, timestamp, request_body_len, profileid, twid
+        )
+        # find the UA of this profileid if we don't have it
+        # get the last used ua of this profile
+        cached_ua = __database__.get_user_agent_from_profile(
+            profileid
+        )
+        if cached_ua:
+            self.check_multiple_UAs(
+                cached_ua,
+                user_agent,
+                timestamp,
+                profileid,
+                twid,
+                uid,
+            )
 
-                if utils.is_msg_intended_for(message, 'new_http'):
-                    message = json.loads(message['data'])
-                    profileid = message['profileid']
-                    twid = message['twid']
-                    flow = json.loads(message['flow'])
-                    uid = flow['uid']
-                    host = flow['host']
-                    uri = flow['uri']
-                    daddr = flow['daddr']
-                    timestamp = flow.get('stime', '')
-                    user_agent = flow.get('user_agent', False)
-                    request_body_len = flow.get('request_body_len')
-                    response_body_len = flow.get('response_body_len')
-                    method = flow.get('method')
-                    resp_mime_types = flow.get('resp_mime_types')
-
-                    self.check_suspicious_user_agents(
-                        uid, host, uri, timestamp, user_agent, profileid, twid
-                    )
-                    self.check_multiple_empty_connections(
-                        uid, host, timestamp, request_body_len, profileid, twid
-                    )
-                    # find the UA of this profileid if we don't have it
-                    # get the last used ua of this profile
-                    cached_ua = __database__.get_user_agent_from_profile(
-                        profileid
-                    )
-                    if cached_ua:
-                        self.check_multiple_UAs(
-                            cached_ua,
-                            user_agent,
-                            timestamp,
-                            profileid,
-                            twid,
-                            uid,
-                        )
-
-                    if (
-                        not cached_ua
-                        or (type(cached_ua) == dict
-                            and cached_ua.get('user_agent', '') != user_agent
-                            and 'server-bag' not in user_agent)
-                    ):
-                        # only UAs of type dict are browser UAs, skips str UAs as they are SSH clients
-                        self.get_user_agent_info(
-                            user_agent,
-                            profileid
-                        )
-
-                    if 'server-bag' in user_agent:
-                        self.extract_info_from_UA(
-                            user_agent,
-                            profileid
-                        )
-
-                    if self.detect_executable_mime_types(resp_mime_types):
-                        self.report_executable_mime_type(
-                            resp_mime_types,
-                            daddr,
-                            profileid,
-                            twid,
-                            uid,
-                            timestamp
-                        )
-
-                    self.check_incompatible_user_agent(
-                        host,
-                        uri,
-                        timestamp,
-                        profileid,
-                        twid,
-                        uid
-                    )
+        if (
+            not cached_ua
+            or (type(cached_ua) == dict
+                and cached_ua.get('user_agent', '') != user_agent
+                and 'server-bag' not in user_agent)
+        ):
+            # only UAs of type dict are browser UAs, skips str UAs as they are SSH clients
+            self.get_user_agent_info(
+                user_agent,
+                profileid
+            )
 
-                    self.check_pastebin_downloads(
-                        daddr,
-                        response_body_len,
-                        method,
-                        profileid,
-                        twid,
-                        timestamp,
-                        uid
-                    )
+        if 'server-bag' in user_agent:
+            self.extract_info_from_UA(
+                user_agent,
+                profileid
+            )
 
+        if self.detect_executable_mime_types(resp_mime_types):
+            self.report_executable_mime_type(
+                resp_mime_types,
+                daddr,
+                profileid,
+                twid,
+                uid,
+                timestamp
+            )
 
-                    self.set_evidence_http_traffic(
-                        daddr,
-                        profileid,
-                        twid,
-                        uid,
-                        timestamp
-                    )
+        self.check_incompatible_user_agent(
+            host,
+            uri,
+            timestamp,
+            profileid,
+            twid,
+            uid
+        )
 
+        self.check_pastebin_downloads(
+            daddr,
+            response_body_len,
+            method,
+            profileid,
+            twid,
+            timestamp,
+            uid
+        )
 
 
+        self.set_evidence_http_traffic(
+            daddr,
+            profileid,
+            twid,
+            uid,
+            timestamp
+        )
 
+    def run(self):
+        utils.drop_root_privs()
+        # Main loop function
+        while True:
+            try:
+                if not self.dispatcher.dispatch():
+                    self.shutdown_gracefully()
+                    return True
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
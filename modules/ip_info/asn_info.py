@@ -1,7 +1,7 @@
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.ip_range_index import IPRangeIndex
 import time
-import ipaddress
 import ipwhois
 import json
 import requests
@@ -9,6 +9,9 @@ import maxminddb
 
 class ASN:
     def __init__(self):
+        # the index of the cached asn ranges of each first octet
+        # {first_octet: (serialized ranges from the db, IPRangeIndex)}
+        self.cached_asn_index = {}
         # Open the maxminddb ASN offline db
         try:
             self.asn_db = maxminddb.open_database(
@@ -33,22 +36,28 @@ class ASN:
         if not cached_asn:
             return
 
-        cached_asn: dict = json.loads(cached_asn)
+        cached_index = self.cached_asn_index.get(first_octet)
+        if not cached_index or cached_index[0] != cached_asn:
+            # the ranges of this octet changed since we indexed them
+            cached_index = (
+                cached_asn,
+                IPRangeIndex(json.loads(cached_asn).items())
+            )
+            self.cached_asn_index[first_octet] = cached_index
 
-        for range, range_info in cached_asn.items():
-            # convert to objects
-            ip_range = ipaddress.ip_network(range)
-            ip = ipaddress.ip_address(ip)
-            if ip in ip_range:
-                asn_info = {
-                    'asn': {
-                        'org': range_info['org'],
+        range_info = cached_index[1].lookup(ip)
+        if not range_info:
+            return
 
-                    }
-                }
-                if 'number' in range_info:
-                    asn_info['asn'].update({"number": range_info['number']})
-                return asn_info
+        asn_info = {
+            'asn': {
+                'org': range_info['org'],
+
+            }
+        }
+        if 'number' in range_info:
+            asn_info['asn'].update({"number": range_info['number']})
+        return asn_info
 
     def update_asn(self, cached_data, update_period) -> bool:
         """
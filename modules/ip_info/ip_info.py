@@ -2,6 +2,8 @@ from slips_files.common.abstracts import Module
 import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.flow_message import decode_flow_msg
+from slips_files.common.dispatcher import Dispatcher
 from .asn_info import ASN
 import platform
 import sys
@@ -36,9 +38,10 @@ class Module(Module, multiprocessing.Process):
         # Set the output queue of our database instance
         __database__.setOutputQueue(self.outputqueue)
         # To which channels do you wnat to subscribe? When a message arrives on the channel the module will wakeup
-        self.c1 = __database__.subscribe('new_ip')
-        self.c2 = __database__.subscribe('new_MAC')
-        self.c3 = __database__.subscribe('new_dns_flow')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_MAC', self.handle_new_MAC)
+        self.dispatcher.register('new_dns_flow', self.handle_new_dns_flow)
+        self.dispatcher.register('new_ip', self.handle_new_ip)
         # update asn every 1 month
         self.update_period = 2592000
         self.is_gw_mac_set = False
@@ -491,6 +494,69 @@ class Module(Module, multiprocessing.Process):
         # to wait for update manager to finish updating the mac db to start this module
         loop.run_until_complete(self.open_dbs())
 
+    def handle_new_MAC(self, message):
+        """gets the vendor of the MAC"""
+        data = json.loads(message['data'])
+        mac_addr = data['MAC']
+        host_name = data.get('host_name', False)
+        profileid = data['profileid']
+        self.get_vendor(mac_addr, host_name, profileid)
+        self.check_if_we_have_pending_mac_queries()
+        # set the gw mac and ip if they're not set yet
+        if not self.is_gw_mac_set:
+            # whether we found the gw ip using dhcp in profileprocess
+            # or using ip route using self.get_gateway_ip()
+            # now that it's found, get and store the mac addr of it
+            if ip:= __database__.get_gateway_ip():
+                # now that we know the GW IP address,
+                # try to get the MAC of this IP (of the gw)
+                self.get_gateway_MAC(ip)
+                self.is_gw_mac_set = True
+
+    def handle_new_dns_flow(self, message):
+        """stores the age of the queried domain"""
+        data = decode_flow_msg(message['data'])
+        flow_data = data['flow']
+        if domain := flow_data.get('query', False):
+            self.get_age(domain)
+
+    def handle_new_ip(self, message):
+        """gets the geolocation, ASN and rDNS of the new IP"""
+        # Get the IP from the message
+        ip = message['data']
+        try:
+            # make sure its a valid ip
+            ip_addr = ipaddress.ip_address(ip)
+        except ValueError:
+            # not a valid ip skip
+            return
+
+        if not ip_addr.is_multicast:
+            # Do we have cached info about this ip in redis?
+            # If yes, load it
+            cached_ip_info = __database__.getIPData(ip)
+            if not cached_ip_info:
+                cached_ip_info = {}
+
+            # ------ GeoCountry -------
+            # Get the geocountry
+            if (
+                    cached_ip_info == {}
+                    or 'geocountry' not in cached_ip_info
+            ):
+                self.get_geocountry(ip)
+
+            # ------ ASN -------
+            # Get the ASN
+            # only update the ASN for this IP if more than 1 month
+            # passed since last ASN update on this IP
+            if update_asn := self.asn.update_asn(
+                    cached_ip_info,
+                    self.update_period
+            ):
+                self.asn.get_asn(ip, cached_ip_info)
+            self.get_rdns(ip)
+
     def run(self):
         utils.drop_root_privs()
 
@@ -503,89 +569,11 @@ class Module(Module, multiprocessing.Process):
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c2)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-                if utils.is_msg_intended_for(message, 'new_MAC'):
-                    data = json.loads(message['data'])
-                    mac_addr = data['MAC']
-                    host_name = data.get('host_name', False)
-                    profileid = data['profileid']
-                    self.get_vendor(mac_addr, host_name, profileid)
-                    self.check_if_we_have_pending_mac_queries()
-                    # set the gw mac and ip if they're not set yet
-                    if not self.is_gw_mac_set:
-                        # whether we found the gw ip using dhcp in profileprocess
-                        # or using ip route using self.get_gateway_ip()
-                        # now that it's found, get and store the mac addr of it
-                        if ip:= __database__.get_gateway_ip():
-                            # now that we know the GW IP address,
-                            # try to get the MAC of this IP (of the gw)
-                            self.get_gateway_MAC(ip)
-                            self.is_gw_mac_set = True
-
-                message = __database__.get_message(self.c3)
-                if message and message['data'] == 'stop_process':
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_dns_flow'):
-                    data = message['data']
-                    data = json.loads(data)
-                    # profileid = data['profileid']
-                    # twid = data['twid']
-                    # uid = data['uid']
-                    flow_data = json.loads(
-                        data['flow']
-                    )   # this is a dict {'uid':json flow data}
-                    if domain := flow_data.get('query', False):
-                        self.get_age(domain)
-
-                message = __database__.get_message(self.c1)
-                # if timewindows are not updated for a long time (see at logsProcess.py),
-                # we will stop slips automatically.The 'stop_process' line is sent from logsProcess.py.
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-
-                if utils.is_msg_intended_for(message, 'new_ip'):
-                    # Get the IP from the message
-                    ip = message['data']
-                    try:
-                        # make sure its a valid ip
-                        ip_addr = ipaddress.ip_address(ip)
-                    except ValueError:
-                        # not a valid ip skip
-                        continue
-
-                    if not ip_addr.is_multicast:
-                        # Do we have cached info about this ip in redis?
-                        # If yes, load it
-                        cached_ip_info = __database__.getIPData(ip)
-                        if not cached_ip_info:
-                            cached_ip_info = {}
-
-                        # ------ GeoCountry -------
-                        # Get the geocountry
-                        if (
-                                cached_ip_info == {}
-                                or 'geocountry' not in cached_ip_info
-                        ):
-                            self.get_geocountry(ip)
-
-                        # ------ ASN -------
-                        # Get the ASN
-                        # only update the ASN for this IP if more than 1 month
-                        # passed since last ASN update on this IP
-                        if update_asn := self.asn.update_asn(
-                                cached_ip_info,
-                                self.update_period
-                        ):
-                            self.asn.get_asn(ip, cached_ip_info)
-                        self.get_rdns(ip)
-
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
@@ -67,11 +67,13 @@ class Redis{
       });})
     }
 
-    /*Get evidence for specific profile and timewindow*/
+    /*Get evidence for specific profile and timewindow as a json string of {evidence_ID: evidence}.
+    Slips stores each evidence as a field in the hash profile_<ip>_<timewindow>_evidence*/
     getEvidence(ip, timewindow){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow,'Evidence',(err,reply)=>{
+      return new Promise ((resolve, reject)=>{this.db.hgetall("profile_"+ip+"_"+timewindow+"_evidence",(err,reply)=>{
         if(err){console.log("Error in getEvidence() in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
+        else if(reply == null){resolve(null);}
+        else{resolve(JSON.stringify(reply));}
       });})
     }
 
@@ -99,60 +101,95 @@ class Redis{
       });})
     }
 
+    /*Get the tuples of a direction (OutTuples or InTuples) for specific profile and timewindow as a json string
+    in the form {tuple: [letters, [last_last_ts, last_ts]]}.
+    Slips stores the letters of each tuple in a hash field and the ts of its last 2 flows in the field <tuple>|timestamps*/
+    getTuples(ip, timewindow, direction){
+      return new Promise ((resolve, reject)=>{this.db.hgetall("profile_"+ip+"_"+timewindow+"_"+direction,(err,reply)=>{
+        if(err){console.log("Error in getTuples in kalipso_redis.js. Error: ",err); reject(err);}
+        else if(reply == null){resolve(null);}
+        else{
+          var tuples = {};
+          for (const [field, value] of Object.entries(reply)){
+            if(field.endsWith('|timestamps')){continue;}
+            var timestamps = (reply[field+'|timestamps'] || ',').split(',').map(ts => ts ? Number(ts) : false);
+            tuples[field] = [value, timestamps];
+          }
+          resolve(JSON.stringify(tuples));
+        }
+      });})
+    }
+
     /*Get outtuples for specific profile and timewindow.*/
     getOutTuples(ip,timewindow){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow,'OutTuples',(err,reply)=>{
-        if(err){console.log("Error in getOutTuples in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
-      });})
+      return this.getTuples(ip, timewindow, 'OutTuples')
     }
 
     /*Get intuples for specific profile and timewindow*/
     getInTuples(ip,timewindow){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow,'InTuples',(err,reply)=>{
-        if(err){console.log("Error in getInTuples in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
+      return this.getTuples(ip, timewindow, 'InTuples')
+    }
+
+    /*Get the data of a key like DstPortsClientTCPEstablished for specific profile and timewindow as a json string.
+    Slips stores it in a hash with the keys of the data joined by | as fields, e.g. '80|dstips|1.1.1.1|pkts'*/
+    getAggregatedData(ip, timewindow, key){
+      return new Promise ((resolve, reject)=>{this.db.hgetall("profile_"+ip+"_"+timewindow+"_"+key,(err,reply)=>{
+        if(err){console.log("Error in getAggregatedData in kalipso_redis.js. Error: ",err); reject(err);}
+        else if(reply == null){resolve(null);}
+        else{
+          var data = {};
+          for (const [field, value] of Object.entries(reply)){
+            var keys = field.split('|');
+            var entry = data[keys[0]] = data[keys[0]] || {};
+            if(keys.length == 2){entry[keys[1]] = keys[1] == 'stime' ? value : Number(value);}
+            else{
+              entry[keys[1]] = entry[keys[1]] || {};
+              if(keys.length == 3){entry[keys[1]][keys[2]] = Number(value);}
+              else{
+                var ip_data = entry[keys[1]][keys[2]] = entry[keys[1]][keys[2]] || {};
+                ip_data[keys[3]] = keys[3] == 'stime' ? value : Number(value);
+              }
+            }
+          }
+          resolve(JSON.stringify(data));
+        }
       });})
     }
 
     /*Get data for UDP established connections (dst/src ports/ips client/server) for specific profile and timewindow*/
     getUDPest(ip, timewindow,udp_key){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow, udp_key,(err,reply)=>{
-        if(err){console.log("Error in getUDPest in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
-      });})
+      return this.getAggregatedData(ip, timewindow, udp_key)
     }
 
     /*Get data for TCP established (dst/src ports/IPs client/server) for specific profile and timewindow.*/
     getTCPest(ip, timewindow,tcp_key){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow,tcp_key,(err,reply)=>{
-        if(err){console.log("Error in getTCPest in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
-      });})
+      return this.getAggregatedData(ip, timewindow, tcp_key)
     }
 
     /*Get data for UDP notestablished (dst/src ports/IPs client/server) for specific profile and timewindow*/
     getUDPnotest(ip, timewindow,udp_key){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow, udp_key,(err,reply)=>{
-        if(err){console.log("Error in getUDPnotest in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
-      });})
+      return this.getAggregatedData(ip, timewindow, udp_key)
     }
 
     /*Get data for TCP notestablished (dst/src port/ips client/server) for specific profile and timewindow*/
     getTCPnotest(ip, timewindow,tcp_key){
-      return new Promise ((resolve, reject)=>{this.db.hget("profile_"+ip+"_"+timewindow,tcp_key,(err,reply)=>{
-        if(err){console.log("Error in getTCPnotest in kalipso_redis.js. Error: ",err); reject(err);}
-        else{resolve(reply);}
-      });})
+      return this.getAggregatedData(ip, timewindow, tcp_key)
     }
 
-    /*Get all evidence for specific profile.*/
+    /*Get all evidence for specific profile as {twid: json string of the tw evidence}.*/
     getAllProfileEvidences(ip){
         return new Promise(
-               (resolve,reject)=>{this.db.hgetall("evidenceprofile_"+ip, (err,reply)=>{
+               (resolve,reject)=>{this.db.zrange("twsprofile_"+ip, 0, -1, (err,twids)=>{
                    if(err){console.log("Error in getAllProfileEvidences in kalipso_redis.js. Error: ",err); reject(err);}
-                   else{resolve(reply);}
+                   else{
+                       Promise.all(twids.map(twid => this.getEvidence(ip, twid))).then(all_evidence=>{
+                           var profile_evidence = {};
+                           twids.forEach((twid, index)=>{
+                               if(all_evidence[index] != null){profile_evidence[twid] = all_evidence[index];}
+                           });
+                           resolve(Object.keys(profile_evidence).length ? profile_evidence : null);
+                       }).catch(reject);
+                   }
                })}
         )
     }
@@ -2,12 +2,15 @@ from slips_files.common.abstracts import Module
 import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.flow_message import decode_flow_msg
+from slips_files.common.dispatcher import Dispatcher
+from slips_files.common.config_parser import ConfigParser
+from slips_files.common.scheduler import Scheduler
+from .portscan_state import PortscanState, DstPort, DstIP, ICMPScan, crossed_threshold
 import sys
 import traceback
-import time
 import ipaddress
 import json
-import threading
 
 
 class PortScanProcess(Module, multiprocessing.Process):
@@ -29,13 +32,16 @@ class PortScanProcess(Module, multiprocessing.Process):
         # Get from the database the separator used to separate the IP and the word profile
         self.fieldseparator = __database__.getFieldSeparator()
         # To which channels do you wnat to subscribe? When a message arrives on the channel the module will wakeup
-        self.c1 = __database__.subscribe('tw_modified')
-        self.c2 = __database__.subscribe('new_notice')
-        self.c3 = __database__.subscribe('new_dhcp')
-        # We need to know that after a detection, if we receive another flow
-        # that does not modify the count for the detection, we are not
-        # re-detecting again only because the threshold was overcomed last time.
-        self.cache_det_thresholds = {}
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_flow', self.handle_new_flow)
+        self.dispatcher.register('tw_closed', self.handle_tw_closed)
+        self.dispatcher.register('new_notice', self.handle_new_notice)
+        self.dispatcher.register('new_dhcp', self.handle_new_dhcp)
+        self.read_configuration()
+        # the dst IPs and ports contacted by each profile in each tw, to detect port scans and ICMP scans
+        self.portscans = PortscanState(
+            self.is_resolved, sketch_precision=self.sketch_precision, max_uids=self.sketch_max_uids
+        )
         # Retrieve malicious/benigh labels
         self.normal_label = __database__.normal_label
         self.malicious_label = __database__.malicious_label
@@ -45,6 +51,14 @@ class PortScanProcess(Module, multiprocessing.Process):
         # The minimum amount of ports to scan in vertical scan
         self.port_scan_minimum_dports = 5
         self.pingscan_minimum_flows = 5
+        # Map the ICMP port scanned to it's attack
+        self.icmp_scan_types = {
+            '0x0008': 'AddressScan',
+            '0x0013': 'TimestampScan',
+            '0x0014': 'TimestampScan',
+            '0x0017': 'AddressMaskScan',
+            '0x0018': 'AddressMaskScan',
+        }
         self.pingscan_minimum_scanned_ips = 5
         # time in seconds to wait before alerting port scan
         self.time_to_wait_before_generating_new_alert = 25
@@ -54,21 +68,25 @@ class PortScanProcess(Module, multiprocessing.Process):
         # this flag will be true after the first portscan alert
         self.alerted_once_vertical_ps = False
         self.alerted_once_horizontal_ps = False
-        # the threads are responsible for combining all evidence each 10 seconds to
-        # avoid many alerts
-        self.timer_thread_vertical_ps = threading.Thread(
-                                target=self.wait_for_vertical_scans,
-                                daemon=True
-        )
-        self.timer_thread_horizontal_ps = threading.Thread(
-                                target=self.wait_for_horizontal_scans,
-                                daemon=True
-        )
+        # combines all the pending evidence of each type some seconds after the first one
+        # is pending to avoid many alerts
+        self.scheduler = Scheduler(self.name, print_error=lambda error: self.print(error, 0, 1))
         # when a client is seen requesting this minimum addresses in 1 tw,
         # slips sets dhcp scan evidence
         self.minimum_requested_addrs = 4
 
+    def read_configuration(self):
+        conf = ConfigParser()
+        # by default the scan detections count every dst IP and port exactly
+        self.sketch_precision = None
+        self.sketch_max_uids = None
+        if conf.scan_sketches():
+            self.sketch_precision = conf.sketch_precision()
+            self.sketch_max_uids = conf.sketch_max_uids()
+
     def shutdown_gracefully(self):
+        # set the pending evidence
+        self.scheduler.shutdown()
         # Confirm that the module is done processing
         __database__.publish('finished_modules', self.name)
 
@@ -92,190 +110,134 @@ class PortScanProcess(Module, multiprocessing.Process):
         levels = f'{verbose}{debug}'
         self.outputqueue.put(f'{levels}|{self.name}|{text}')
 
-    def check_horizontal_portscan(self, profileid, twid):
+    def is_resolved(self, ip) -> bool:
+        """dst IPs with a dns resolution aren't counted in horizontal port scans"""
+        dns_resolution = __database__.get_dns_resolution(ip)
+        return bool(dns_resolution.get('domains', []))
 
-        def get_uids():
-            """
-            returns all the uids of flows to this port
-            """
-            uids = []
-            for dip in dstips:
-                for uid in dstips[dip]['uid']:
-                     uids.append(uid)
-            return uids
-
-        saddr = profileid.split(self.fieldseparator)[1]
+    def is_broadcast_or_multicast(self, saddr) -> bool:
         try:
             saddr_obj = ipaddress.ip_address(saddr)
-            if saddr == '255.255.255.255' or saddr_obj.is_multicast:
-                # don't report port scans on the broadcast or multicast addresses
-                return False
+            return saddr == '255.255.255.255' or saddr_obj.is_multicast
         except ValueError:
             # it's a mac
-            pass
-
-        # Get the list of dports that we connected as client using TCP not established
-        direction = 'Dst'
-        role = 'Client'
-        type_data = 'Ports'
-        for state in ('Established', 'Not Established'):
-            for protocol in ('TCP', 'UDP'):
-                dports = __database__.getDataFromProfileTW(
-                    profileid, twid, direction, state, protocol, role, type_data
-                )
+            return False
 
-                # For each port, see if the amount is over the threshold
-                for dport in dports.keys():
-                    # PortScan Type 2. Direction OUT
-                    dstips = dports[dport]['dstips']
-                    # this is the list of dstips that have dns resolution, we will remove them from the dstips
-                    dstips_to_discard = []
-                    # Remove dstips that have DNS resolution already
-                    for dip in dstips:
-                        dns_resolution = __database__.get_dns_resolution(dip)
-                        dns_resolution = dns_resolution.get('domains', [])
-                        if dns_resolution:
-                            dstips_to_discard.append(dip)
-                    # remove the resolved dstips from dstips dict
-                    for ip in dstips_to_discard:
-                        dstips.pop(ip)
-
-                    amount_of_dips = len(dstips)
-                    # If we contacted more than 3 dst IPs on this port with not established
-                    # connections, we have evidence.
-
-                    cache_key = f'{profileid}:{twid}:dstip:{dport}:HorizontalPortscan'
-                    prev_amount_dips = self.cache_det_thresholds.get(cache_key, 0)
-
-                    # self.print('Key: {}. Prev dips: {}, Current: {}'.format(cache_key,
-                    # prev_amount_dips, amount_of_dips))
-
-                    # We detect a scan every Threshold. So, if threshold is 3,
-                    # we detect when there are 3, 6, 9, 12, etc. dips per port.
-                    # The idea is that after X dips we detect a connection. And then
-                    # we 'reset' the counter until we see again X more.
-                    if (
-                        amount_of_dips % self.port_scan_minimum_dips == 0
-                        and prev_amount_dips < amount_of_dips
-                    ):
-                        # Get the total amount of pkts sent to the same port from all IPs
-                        pkts_sent = 0
-                        for dip in dstips:
-                            if 'spkts' not in dstips[dip]:
-                                # In argus files there are no src pkts, only pkts.
-                                # So it is better to have the total pkts than to have no packets count
-                                pkts_sent += dstips[dip]["pkts"]
-                            else:
-                                pkts_sent += dstips[dip]["spkts"]
-
-                        uids: list = get_uids()
-                        timestamp = next(iter(dstips.values()))['stime']
-
-                        self.cache_det_thresholds[cache_key] = amount_of_dips
-                        if not self.alerted_once_horizontal_ps:
-                            self.alerted_once_horizontal_ps = True
-                            self.set_evidence_horizontal_portscan(
-                                timestamp,
-                                pkts_sent,
-                                protocol,
-                                profileid,
-                                twid,
-                                uids,
-                                dport,
-                                amount_of_dips
-                            )
-                        else:
-                            # we will be combining further alerts to avoid alerting many times every portscan
-                            # for all the combined alerts, the following params should be equal
-                            key = f'{profileid}-{twid}-{state}-{protocol}-{dport}'
-
-                            evidence_details = (timestamp, pkts_sent, uids, amount_of_dips)
-                            try:
-                                self.pending_horizontal_ps_evidence[key].append(evidence_details)
-                            except KeyError:
-                                # first time seeing this key
-                                self.pending_horizontal_ps_evidence[key] = [evidence_details]
-
-    def wait_for_vertical_scans(self):
-        while True:
-            # wait 10s for new evidence to arrive so we can combine them
-            time.sleep(self.time_to_wait_before_generating_new_alert)
-            # to make sure the network_discovery process isn't adding evidence of another ps while this thread is
-            # calling set_evidence
-            lock = threading.Lock()
-            lock.acquire()
-            for key, evidence_list in self.pending_vertical_ps_evidence.items():
-                # each key here is  {profileid}-{twid}-{state}-{protocol}-{dport}
-                # each value here is a list of evidence that should be combined
-                profileid, twid, state, protocol, dstip = key.split('-')
-                final_evidence_uids = []
-                final_pkts_sent = 0
-
-                # combine all evidence that share the above key
-                for evidence in evidence_list:
-                    # each evidence is a tuple of (timestamp, pkts_sent, uids, amount_of_dips)
-                    # in the final evidence, we'll be using the ts of the last evidence
-                    timestamp, pkts_sent, evidence_uids, amount_of_dports = evidence
-                    # since we're combining evidence, we want the uids of the final evidence
-                    # to be the sum of all the evidence we combined
-                    final_evidence_uids += evidence_uids
-                    final_pkts_sent += pkts_sent
-
-                self.set_evidence_vertical_portscan(
-                    timestamp,
-                    final_pkts_sent,
-                    protocol,
-                    profileid,
-                    twid,
-                    final_evidence_uids,
-                    amount_of_dports,
-                    dstip
-                )
-            # reset the dict sinse we already combiner
-            self.pending_vertical_ps_evidence = {}
-            lock.release()
+    def check_horizontal_portscan(self, profileid, twid, protocol, state, dport, port: DstPort):
+        """
+        Called when a flow adds a new dst IP to the given port
+        :param port: the dst IPs the profile contacted on this port in this tw
+        """
+        amount_of_dips = len(port.dstips)
+        # We detect a scan every Threshold. So, if threshold is 3,
+        # we detect when there are 3, 6, 9, 12, etc. dips per port.
+        # The idea is that after X dips we detect a connection. And then
+        # we 'reset' the counter until we see again X more.
+        if not crossed_threshold(amount_of_dips, port.detected, self.port_scan_minimum_dips):
+            return
+
+        port.detected = amount_of_dips
+        # the total amount of pkts sent to the same port from all IPs
+        pkts_sent = port.pkts_sent
+        uids = port.uids.uids.copy()
+        timestamp = port.stime
+        if not self.alerted_once_horizontal_ps:
+            self.alerted_once_horizontal_ps = True
+            self.set_evidence_horizontal_portscan(
+                timestamp,
+                pkts_sent,
+                protocol,
+                profileid,
+                twid,
+                uids,
+                dport,
+                amount_of_dips
+            )
+        else:
+            # we will be combining further alerts to avoid alerting many times every portscan
+            # for all the combined alerts, the following params should be equal
+            key = f'{profileid}-{twid}-{state}-{protocol}-{dport}'
 
-    def wait_for_horizontal_scans(self):
+            evidence_details = (timestamp, pkts_sent, uids, amount_of_dips)
+            try:
+                self.pending_horizontal_ps_evidence[key].append(evidence_details)
+            except KeyError:
+                # first time seeing this key
+                self.pending_horizontal_ps_evidence[key] = [evidence_details]
+            self.scheduler.schedule(
+                self.time_to_wait_before_generating_new_alert,
+                self.combine_horizontal_scans,
+                key='horizontal_ps'
+            )
+
+    def combine_vertical_scans(self):
         """
-        This thread waits for 10s then checks if more horizontal scans happened
-         to combine evidence
+        Called by the scheduler some seconds after a vertical scan evidence is pending,
+        combines the evidence that arrived meanwhile
         """
-        while True:
-            # wait 10s for new evidence to arrive so we can combine them
-            time.sleep(self.time_to_wait_before_generating_new_alert)
-            # to make sure the network_discovery process isn't adding evidence of another ps while this thread is
-            # calling set_evidence
-            lock = threading.Lock()
-            lock.acquire()
-            for key, evidence_list in self.pending_horizontal_ps_evidence.items():
-                # each key here is {profileid}-{twid}-{state}-{protocol}-{dport}
-                # each value here is a list of evidence that should be combined
-                profileid, twid, state, protocol, dport = key.split('-')
-                final_evidence_uids = []
-                final_pkts_sent = 0
-                # combine all evidence that share the above key
-                for evidence in evidence_list:
-                    # each evidence is a tuple of (timestamp, pkts_sent, uids, amount_of_dips)
-                    # in the final evidence, we'll be using the ts of the last evidence
-                    timestamp, pkts_sent, evidence_uids, amount_of_dips = evidence
-                    # since we're combining evidence, we want the uids of the final evidence
-                    # to be the sum of all the evidence we combined
-                    final_evidence_uids += evidence_uids
-                    final_pkts_sent += pkts_sent
-
-                self.set_evidence_horizontal_portscan(
-                    timestamp,
-                    final_pkts_sent,
-                    protocol,
-                    profileid,
-                    twid,
-                    final_evidence_uids,
-                    dport,
-                    amount_of_dips
-                )
-            # reset the dict sinse we already combiner
-            self.pending_horizontal_ps_evidence = {}
-            lock.release()
+        # new evidence that arrives while this runs is combined in the next call
+        pending_evidence, self.pending_vertical_ps_evidence = self.pending_vertical_ps_evidence, {}
+        for key, evidence_list in pending_evidence.items():
+            # each key here is  {profileid}-{twid}-{state}-{protocol}-{dport}
+            # each value here is a list of evidence that should be combined
+            profileid, twid, state, protocol, dstip = key.split('-')
+            final_evidence_uids = []
+            final_pkts_sent = 0
+
+            # combine all evidence that share the above key
+            for evidence in evidence_list:
+                # each evidence is a tuple of (timestamp, pkts_sent, uids, amount_of_dips)
+                # in the final evidence, we'll be using the ts of the last evidence
+                timestamp, pkts_sent, evidence_uids, amount_of_dports = evidence
+                # since we're combining evidence, we want the uids of the final evidence
+                # to be the sum of all the evidence we combined
+                final_evidence_uids += evidence_uids
+                final_pkts_sent += pkts_sent
+
+            self.set_evidence_vertical_portscan(
+                timestamp,
+                final_pkts_sent,
+                protocol,
+                profileid,
+                twid,
+                final_evidence_uids,
+                amount_of_dports,
+                dstip
+            )
+
+    def combine_horizontal_scans(self):
+        """
+        Called by the scheduler some seconds after a horizontal scan evidence is pending,
+        combines the evidence that arrived meanwhile
+        """
+        # new evidence that arrives while this runs is combined in the next call
+        pending_evidence, self.pending_horizontal_ps_evidence = self.pending_horizontal_ps_evidence, {}
+        for key, evidence_list in pending_evidence.items():
+            # each key here is {profileid}-{twid}-{state}-{protocol}-{dport}
+            # each value here is a list of evidence that should be combined
+            profileid, twid, state, protocol, dport = key.split('-')
+            final_evidence_uids = []
+            final_pkts_sent = 0
+            # combine all evidence that share the above key
+            for evidence in evidence_list:
+                # each evidence is a tuple of (timestamp, pkts_sent, uids, amount_of_dips)
+                # in the final evidence, we'll be using the ts of the last evidence
+                timestamp, pkts_sent, evidence_uids, amount_of_dips = evidence
+                # since we're combining evidence, we want the uids of the final evidence
+                # to be the sum of all the evidence we combined
+                final_evidence_uids += evidence_uids
+                final_pkts_sent += pkts_sent
+
+            self.set_evidence_horizontal_portscan(
+                timestamp,
+                final_pkts_sent,
+                protocol,
+                profileid,
+                twid,
+                final_evidence_uids,
+                dport,
+                amount_of_dips
+            )
 
 
     def set_evidence_horizontal_portscan(
@@ -361,71 +323,56 @@ class PortScanProcess(Module, multiprocessing.Process):
             confidence = pkts_sent / 10.0
         return confidence
 
-    def check_vertical_portscan(self, profileid, twid):
-        # Get the list of dstips that we connected as client using TCP not
-        # established, and their ports
-        direction = 'Dst'
-        role = 'Client'
-        type_data = 'IPs'
-        # self.print('Vertical Portscan check. Amount of dports: {}.
-        # Threshold=3'.format(amount_of_dports), 3, 0)
-        evidence_type = 'VerticalPortscan'
-        for state in ('Not Established', 'Established'):
-            for protocol in ('TCP', 'UDP'):
-                dstips = __database__.getDataFromProfileTW(
-                    profileid, twid, direction, state, protocol, role, type_data
-                )
-                # For each dstip, see if the amount of ports connections is over the threshold
-                for dstip in dstips.keys():
-                    ### PortScan Type 1. Direction OUT
-                    dstports: dict = dstips[dstip]['dstports']
-                    amount_of_dports = len(dstports)
-                    cache_key = f'{profileid}:{twid}:dstip:{dstip}:{evidence_type}'
-                    prev_amount_dports = self.cache_det_thresholds.get(cache_key, 0)
-                    # self.print('Key: {}, Prev dports: {}, Current: {}'.format(cache_key,
-                    # prev_amount_dports, amount_of_dports))
-
-                    # We detect a scan every Threshold. So we detect when there
-                    # is 6, 9, 12, etc. dports per dip.
-                    # The idea is that after X dips we detect a connection.
-                    # And then we 'reset' the counter
-                    # until we see again X more.
-                    if (
-                            amount_of_dports % self.port_scan_minimum_dports == 0
-                            and prev_amount_dports < amount_of_dports
-                    ):
-                        # Get the total amount of pkts sent different ports on the same host
-                        pkts_sent = sum(dstports[dport] for dport in dstports)
-                        uid = dstips[dstip]['uid']
-                        timestamp = dstips[dstip]['stime']
-
-                        # Store in our local cache how many dips were there:
-                        self.cache_det_thresholds[cache_key] = amount_of_dports
-                        if not self.alerted_once_vertical_ps:
-                            self.alerted_once_vertical_ps = True
-                            self.set_evidence_vertical_portscan(
-                                timestamp,
-                                pkts_sent,
-                                protocol,
-                                profileid,
-                                twid,
-                                uid,
-                                amount_of_dports,
-                                dstip
-                            )
-                        else:
-                             # we will be combining further alerts to avoid alerting
-                             # many times every portscan
-                            # for all the combined alerts, the following params should be equal
-                            key = f'{profileid}-{twid}-{state}-{protocol}-{dstip}'
-
-                            evidence_details = (timestamp, pkts_sent, uid, amount_of_dports)
-
-                            try:
-                                self.pending_vertical_ps_evidence[key].append(evidence_details)
-                            except KeyError:
-                                # first time seeing this key
-                                self.pending_vertical_ps_evidence[key] = [evidence_details]
+    def check_vertical_portscan(self, profileid, twid, protocol, state, dstip, ip: DstIP):
+        """
+        Called when a flow adds a new dst port to the given IP
+        :param ip: the dst ports the profile contacted on this IP in this tw
+        """
+        ### PortScan Type 1. Direction OUT
+        amount_of_dports = len(ip.dports)
+        # We detect a scan every Threshold. So we detect when there
+        # is 6, 9, 12, etc. dports per dip.
+        # The idea is that after X dips we detect a connection.
+        # And then we 'reset' the counter
+        # until we see again X more.
+        if not crossed_threshold(amount_of_dports, ip.detected, self.port_scan_minimum_dports):
+            return
+
+        ip.detected = amount_of_dports
+        # the total amount of pkts sent different ports on the same host
+        pkts_sent = ip.pkts_sent
+        uid = ip.uids.uids.copy()
+        timestamp = ip.stime
+        if not self.alerted_once_vertical_ps:
+            self.alerted_once_vertical_ps = True
+            self.set_evidence_vertical_portscan(
+                timestamp,
+                pkts_sent,
+                protocol,
+                profileid,
+                twid,
+                uid,
+                amount_of_dports,
+                dstip
+            )
+        else:
+            # we will be combining further alerts to avoid alerting
+            # many times every portscan
+            # for all the combined alerts, the following params should be equal
+            key = f'{profileid}-{twid}-{state}-{protocol}-{dstip}'
+
+            evidence_details = (timestamp, pkts_sent, uid, amount_of_dports)
+
+            try:
+                self.pending_vertical_ps_evidence[key].append(evidence_details)
+            except KeyError:
+                # first time seeing this key
+                self.pending_vertical_ps_evidence[key] = [evidence_details]
+            self.scheduler.schedule(
+                self.time_to_wait_before_generating_new_alert,
+                self.combine_vertical_scans,
+                key='vertical_ps'
+            )
 
     def check_icmp_sweep(self, msg, note, profileid, uid, twid, timestamp):
         """
@@ -488,100 +435,63 @@ class PortScanProcess(Module, multiprocessing.Process):
             self.print('Too Many Not Estab TCP to same port {} from IP: {}. Amount: {}'.format(dport, profileid.split('_')[1], totalpkts),6,0)
         """
 
-    def check_icmp_scan(self, profileid, twid):
-        # Map the ICMP port scanned to it's attack
-        port_map = {
-            '0x0008': 'AddressScan',
-            '0x0013': 'TimestampScan',
-            '0x0014': 'TimestampScan',
-            '0x0017': 'AddressMaskScan',
-            '0x0018': 'AddressMaskScan',
-        }
-
-        direction = 'Src'
-        role = 'Client'
-        type_data = 'Ports'
+    def check_icmp_scan(self, profileid, twid, icmp_type, scan: ICMPScan, is_new_dstip: bool):
+        """
+        Called for every ICMP flow of this type sent by the profile
+        :param scan: the dst IPs the profile sent this type of ICMP msgs to in this tw
+        :param is_new_dstip: True if this flow was sent to a new dst IP
+        """
+        attack = self.icmp_scan_types[icmp_type]
         protocol = 'ICMP'
-        state = 'Established'
-        sports = __database__.getDataFromProfileTW(
-                    profileid, twid, direction, state, protocol, role, type_data
-                )
-        for sport, sport_info in sports.items():
-            # get the name of this attack
-            attack = port_map.get(sport)
-            if not attack:
+        # are we pinging a single IP or ping scanning several IPs?
+        amount_of_scanned_ips = len(scan.dstips)
+
+        if amount_of_scanned_ips == 1:
+            # how many flows are responsible for this attack
+            # (from this srcip to this dstip on the same port)
+            number_of_flows = len(scan.uids)
+            # We detect a scan every Threshold. So we detect when there
+            # is 5,10,15 etc. scan to the same dstip on the same port
+            # The idea is that after X dips we detect a connection.
+            # And then we 'reset' the counter
+            # until we see again X more.
+            if not crossed_threshold(number_of_flows, scan.detected_flows, self.pingscan_minimum_flows):
                 return
 
-            # get the IPs attacked
-            scanned_ips = sport_info['dstips']
-            # are we pinging a single IP or ping scanning several IPs?
-            amount_of_scanned_ips = len(scanned_ips)
-
-            if amount_of_scanned_ips == 1:
-                # how many icmp flows were found?
-                for scanned_ip, scan_info in scanned_ips.items():
-                    icmp_flows_uids = scan_info['uid']
-                    number_of_flows = len(icmp_flows_uids)
-                    # how many flows are responsible for this attack
-                    # (from this srcip to this dstip on the same port)
-                    cache_key = f'{profileid}:{twid}:dstip:{scanned_ip}:{sport}:{attack}'
-                    prev_flows = self.cache_det_thresholds.get(cache_key, 0)
-
-                    # We detect a scan every Threshold. So we detect when there
-                    # is 5,10,15 etc. scan to the same dstip on the same port
-                    # The idea is that after X dips we detect a connection.
-                    # And then we 'reset' the counter
-                    # until we see again X more.
-                    if (
-                            number_of_flows % self.pingscan_minimum_flows == 0
-                            and prev_flows < number_of_flows
-                    ):
-                        self.cache_det_thresholds[cache_key] = number_of_flows
-                        pkts_sent = scan_info['spkts']
-                        timestamp = scan_info['stime']
-                        self.set_evidence_icmpscan(
-                            amount_of_scanned_ips,
-                            timestamp,
-                            pkts_sent,
-                            protocol,
-                            profileid,
-                            twid,
-                            icmp_flows_uids,
-                            attack,
-                            scanned_ip=scanned_ip
-                        )
+            scan.detected_flows = number_of_flows
+            self.set_evidence_icmpscan(
+                amount_of_scanned_ips,
+                scan.stime,
+                scan.pkts_sent,
+                protocol,
+                profileid,
+                twid,
+                scan.uids.uids.copy(),
+                number_of_flows,
+                attack,
+                scanned_ip=scan.first_dstip
+            )
 
-            elif amount_of_scanned_ips > 1:
-                # this srcip is scanning several IPs (a network maybe)
-                # how many dstips scanned by this srcip on this port?
-                cache_key = f'{profileid}:{twid}:{attack}'
-                prev_scanned_ips = self.cache_det_thresholds.get(cache_key, 0)
-                # detect every 5, 10, 15 scanned IPs
-                if (
-                        amount_of_scanned_ips % self.pingscan_minimum_scanned_ips == 0
-                        and prev_scanned_ips < amount_of_scanned_ips
-                ):
-
-                    pkts_sent = 0
-                    uids = []
-                    for scanned_ip, scan_info in scanned_ips.items():
-                        # get the total amount of pkts sent to all scanned IP
-                        pkts_sent += scan_info['spkts']
-                        # get all flows that were part of this scan
-                        uids.extend(scan_info['uid'])
-                        timestamp = scan_info['stime']
-
-                    self.set_evidence_icmpscan(
-                            amount_of_scanned_ips,
-                            timestamp,
-                            pkts_sent,
-                            protocol,
-                            profileid,
-                            twid,
-                            uids,
-                            attack
-                        )
-                    self.cache_det_thresholds[cache_key] = amount_of_scanned_ips
+        elif is_new_dstip:
+            # this srcip is scanning several IPs (a network maybe)
+            # detect every 5, 10, 15 scanned IPs
+            if not crossed_threshold(
+                amount_of_scanned_ips, scan.detected_dstips, self.pingscan_minimum_scanned_ips
+            ):
+                return
+
+            scan.detected_dstips = amount_of_scanned_ips
+            self.set_evidence_icmpscan(
+                amount_of_scanned_ips,
+                scan.last_dstip_stime,
+                scan.pkts_sent,
+                protocol,
+                profileid,
+                twid,
+                scan.uids.uids.copy(),
+                len(scan.uids),
+                attack
+            )
 
 
     def set_evidence_icmpscan(
@@ -593,6 +503,7 @@ class PortScanProcess(Module, multiprocessing.Process):
             profileid,
             twid,
             icmp_flows_uids,
+            number_of_flows,
             attack,
             scanned_ip=False
     ):
@@ -608,13 +519,13 @@ class PortScanProcess(Module, multiprocessing.Process):
         if number_of_scanned_ips == 1:
             description = (
                             f'ICMP scanning {scanned_ip} ICMP scan type: {attack}. '
-                            f'Total packets sent: {pkts_sent} over {len(icmp_flows_uids)} flows. '
+                            f'Total packets sent: {pkts_sent} over {number_of_flows} flows. '
                             f'Confidence: {confidence}. by Slips'
                         )
         else:
             description = (
                 f'ICMP scanning {number_of_scanned_ips} different IPs. ICMP scan type: {attack}. '
-                f'Total packets sent: {pkts_sent} over {len(icmp_flows_uids)} flows. '
+                f'Total packets sent: {pkts_sent} over {number_of_flows} flows. '
                 f'Confidence: {confidence}. by Slips'
             )
 
@@ -716,85 +627,116 @@ class PortScanProcess(Module, multiprocessing.Process):
             )
 
 
-    def run(self):
-        utils.drop_root_privs()
-        self.timer_thread_vertical_ps.start()
-        self.timer_thread_horizontal_ps.start()
-
-        while True:
-            try:
-                # Wait for a message from the channel that a TW was modified
-                message = __database__.get_message(self.c1)
-                # print('Message received from channel {} with data {}'.format(message['channel'], message['data']))
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
+    def handle_new_flow(self, message):
+        """
+        Adds the flow to the port scan state of its profile and tw
+        and runs the detection of port scans if it added a new dst IP or dst port,
+        and the detection of ICMP scans
+
+        For port scan detection, we will measure different things:
+        1. Vertical port scan:
+        (single IP being scanned for multiple ports)
+        - 1 srcip sends not established flows to > 3 dst ports in the same dst ip. Any number of packets
+        2. Horizontal port scan:
+         (scan against a group of IPs for a single port)
+        - 1 srcip sends not established flows to the same dst ports in > 3 dst ip.
+        3. Too many connections???:
+        - 1 srcip sends not established flows to the same dst ports, > 3 pkts, to the same dst ip
+        4. Slow port scan. Same as the others but distributed in multiple time windows
+
+        Remember that in slips all these port scans can happen for traffic going IN to an IP or going OUT from the IP.
+        """
+        data = decode_flow_msg(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        flow = data['flow']
+        saddr = profileid.split(self.fieldseparator)[1]
+        if flow['saddr'] != saddr:
+            # this flow is going in to this profile, we only use the dst ports and IPs
+            # contacted by the profile as a client
+            return
 
-                if utils.is_msg_intended_for(message, 'tw_modified'):
-                    # Get the profileid and twid
-                    profileid = message['data'].split(':')[0]
-                    twid = message['data'].split(':')[1]
-                    # Start of the port scan detection
-                    self.print(
-                        f'Running the detection of portscans in profile '
-                        f'{profileid} TW {twid}', 3, 0
-                    )
+        protocol = flow['proto'].upper()
+        state = flow['state']
+        profileid_twid = f'{profileid}{self.separator}{twid}'
+        dstip = flow['daddr']
+        spkts = int(flow['spkts'])
+        stime = data['stime']
+        uid = data['uid']
+        flipped = '^' in data.get('state_hist', '')
+
+        if protocol == 'ICMP':
+            # the sport of ICMP flows is the type of the ICMP msg
+            icmp_type = str(flow['sport'])
+            if state == 'Established' and icmp_type in self.icmp_scan_types and not flipped:
+                scan, is_new_dstip = self.portscans.add_to_icmp_scan(
+                    profileid_twid, icmp_type, dstip, spkts, stime, uid
+                )
+                self.check_icmp_scan(profileid, twid, icmp_type, scan, is_new_dstip)
+            return
 
-                    # For port scan detection, we will measure different things:
+        if protocol not in ('TCP', 'UDP') or state not in ('Established', 'Not Established'):
+            return
 
-                    # 1. Vertical port scan:
-                    # (single IP being scanned for multiple ports)
-                    # - 1 srcip sends not established flows to > 3 dst ports in the same dst ip. Any number of packets
-                    # 2. Horizontal port scan:
-                    #  (scan against a group of IPs for a single port)
-                    # - 1 srcip sends not established flows to the same dst ports in > 3 dst ip.
-                    # 3. Too many connections???:
-                    # - 1 srcip sends not established flows to the same dst ports, > 3 pkts, to the same dst ip
-                    # 4. Slow port scan. Same as the others but distributed in multiple time windows
+        dport = str(flow['dport'])
+        ip = self.portscans.add_to_dstip(
+            profileid_twid, protocol, state, dstip, dport, spkts, stime, uid
+        )
+        if ip:
+            self.check_vertical_portscan(profileid, twid, protocol, state, dstip, ip)
+
+        if flipped:
+            # The majority of the FP with horizontal port scan detection happen because a
+            # benign computer changes wifi, and many not established conns are redone,
+            # which look like a port scan to 10 webpages. To avoid this, we IGNORE all
+            # the flows that have in the history of flags (field history in zeek), the ^,
+            # that means that the flow was swapped/flipped.
+            return
 
-                    # Remember that in slips all these port scans can happen for traffic going IN to an IP or going OUT from the IP.
+        if self.is_broadcast_or_multicast(saddr):
+            # don't report port scans on the broadcast or multicast addresses
+            return
 
-                    self.check_horizontal_portscan(profileid, twid)
-                    self.check_vertical_portscan(profileid, twid)
-                    self.check_icmp_scan(profileid, twid)
+        port = self.portscans.add_to_dport(
+            profileid_twid, protocol, state, dport, dstip, spkts, stime, uid
+        )
+        if port:
+            self.check_horizontal_portscan(profileid, twid, protocol, state, dport, port)
+
+    def handle_tw_closed(self, message):
+        """removes the port scan state of the closed tw"""
+        self.portscans.remove_tw(message['data'])
+
+    def handle_new_notice(self, message):
+        """Detect ICMP sweeps from zeek notice.log"""
+        data = decode_flow_msg(message['data'])
+        profileid = data['profileid']
+        twid = data['twid']
+        flow = data['flow']
+        timestamp = flow['stime']
+        uid = data['uid']
+        msg = flow['msg']
+        note = flow['note']
+        self.check_icmp_sweep(
+            msg, note, profileid, uid, twid, timestamp
+        )
 
-                message = __database__.get_message(self.c2)
-                # print('Message received from channel {} with data {}'.format(message['channel'], message['data']))
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
+    def handle_new_dhcp(self, message):
+        """Detect DHCP scans"""
+        flow = json.loads(message['data'])
+        self.check_dhcp_scan(flow)
 
-                if utils.is_msg_intended_for(message, 'new_notice'):
-                    data = message['data']
-                    if type(data) != str:
-                        continue
-                    # Convert from json to dict
-                    data = json.loads(data)
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    # Get flow as a json
-                    flow = data['flow']
-                    # Convert flow to a dict
-                    flow = json.loads(flow)
-                    timestamp = flow['stime']
-                    uid = data['uid']
-                    msg = flow['msg']
-                    note = flow['note']
-                    self.check_icmp_sweep(
-                        msg, note, profileid, uid, twid, timestamp
-                    )
+    def run(self):
+        utils.drop_root_privs()
+        self.scheduler.start()
 
-                message = __database__.get_message(self.c3)
-                if message and message['data'] == 'stop_process':
+        while True:
+            try:
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_dhcp'):
-                    flow = json.loads(message['data'])
-                    self.check_dhcp_scan(flow)
-
-
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
@@ -0,0 +1,179 @@
+from slips_files.common.cardinality_sketch import DistinctCounter, UidReservoir
+from slips_files.common.seen_set import SeenSet
+
+
+class DstPort:
+    """The dst IPs a profile contacted on 1 dst port in 1 tw"""
+    __slots__ = ('dstips', 'pkts_sent', 'uids', 'stime', 'detected')
+
+    def __init__(self, dstips: DistinctCounter, uids: UidReservoir):
+        # the dst IPs counted in the horizontal port scan
+        self.dstips = dstips
+        # pkts sent to this port on all the counted dst IPs
+        self.pkts_sent = 0
+        self.uids = uids
+        # stime of the first flow to the first counted dst IP
+        self.stime = None
+        # amount of dst IPs the last time a port scan was detected
+        self.detected = 0
+
+
+class DstIP:
+    """The dst ports a profile contacted on 1 dst IP in 1 tw"""
+    __slots__ = ('dports', 'pkts_sent', 'uids', 'stime', 'detected')
+
+    def __init__(self, dports: DistinctCounter, uids: UidReservoir):
+        self.dports = dports
+        # pkts sent to all the ports of this IP
+        self.pkts_sent = 0
+        self.uids = uids
+        # stime of the first flow to this IP
+        self.stime = None
+        # amount of dst ports the last time a port scan was detected
+        self.detected = 0
+
+
+class ICMPScan:
+    """The dst IPs a profile sent 1 type of ICMP msg to in 1 tw"""
+    __slots__ = (
+        'dstips',
+        'first_dstip',
+        'pkts_sent',
+        'uids',
+        'stime',
+        'last_dstip_stime',
+        'detected_dstips',
+        'detected_flows',
+    )
+
+    def __init__(self, dstips: DistinctCounter, uids: UidReservoir):
+        self.dstips = dstips
+        # the IP scanned while there's only 1
+        self.first_dstip = None
+        # pkts sent to all the IPs
+        self.pkts_sent = 0
+        self.uids = uids
+        # stime of the first flow
+        self.stime = None
+        # stime of the first flow to the last new dst IP
+        self.last_dstip_stime = None
+        # amount of dst IPs and of flows the last time a scan was detected
+        self.detected_dstips = 0
+        self.detected_flows = 0
+
+
+def crossed_threshold(amount: int, detected: int, threshold: int) -> bool:
+    """
+    Scans are detected every time the amount reaches a multiple of the threshold, 5, 10, 15, etc.
+    The amounts counted with sketches can skip a multiple, so this checks if a new multiple
+    was reached since the amount detected last time
+    """
+    return amount // threshold > detected // threshold
+
+
+class PortscanState:
+    """
+    The dst IPs contacted on each dst port and the dst ports contacted on each dst IP by each
+    profile in each tw, updated with every flow.
+    A port scan threshold is crossed when adding 1 flow adds a new dst IP or port, so it is
+    checked in O(1) per flow instead of reading all the ports and IPs of the tw from the db.
+
+    By default all the distinct IPs and ports and all the uids are kept. If a sketch precision
+    is given, each count takes at most 2^precision bytes, see DistinctCounter,
+    and only max_uids uids are kept per scan.
+    """
+
+    def __init__(self, is_resolved, sketch_precision: int = None, max_uids: int = None):
+        """
+        :param is_resolved: function that returns True if the given IP has a dns resolution,
+        these IPs aren't counted in horizontal port scans. It's called once per dst IP of each port
+        """
+        self.is_resolved = is_resolved
+        self.sketch_precision = sketch_precision
+        self.max_uids = max_uids
+        # dst IPs that aren't counted in horizontal port scans because they have a dns resolution
+        self.resolved = SeenSet()
+        # {profileid_twid: {(protocol, state, dport): DstPort}}
+        self.dports = {}
+        # {profileid_twid: {(protocol, state, dstip): DstIP}}
+        self.dstips = {}
+        # {profileid_twid: {icmp_type: ICMPScan}}
+        self.icmp_scans = {}
+
+    def add_to_dport(self, profileid_twid, protocol, state, dport, dstip, spkts, stime, uid):
+        """
+        Adds a flow to the dst IPs of its dst port
+        returns the DstPort if this flow added a new dst IP to it, None otherwise
+        """
+        key = (protocol, state, dport)
+        dports = self.dports.setdefault(profileid_twid, {})
+        try:
+            port = dports[key]
+        except KeyError:
+            port = dports[key] = DstPort(
+                DistinctCounter(self.sketch_precision), UidReservoir(self.max_uids)
+            )
+
+        is_new = dstip not in port.dstips
+        if is_new:
+            if dstip in self.resolved:
+                return None
+            if self.is_resolved(dstip):
+                self.resolved.add(dstip)
+                return None
+            if port.stime is None:
+                port.stime = stime
+            port.dstips.add(dstip)
+
+        port.pkts_sent += spkts
+        port.uids.add(uid)
+        return port if is_new else None
+
+    def add_to_dstip(self, profileid_twid, protocol, state, dstip, dport, spkts, stime, uid):
+        """
+        Adds a flow to the dst ports of its dst IP
+        returns the DstIP if this flow added a new dst port to it, None otherwise
+        """
+        key = (protocol, state, dstip)
+        dstips = self.dstips.setdefault(profileid_twid, {})
+        try:
+            ip = dstips[key]
+        except KeyError:
+            ip = dstips[key] = DstIP(
+                DistinctCounter(self.sketch_precision), UidReservoir(self.max_uids)
+            )
+            ip.stime = stime
+
+        ip.pkts_sent += spkts
+        ip.uids.add(uid)
+        if ip.dports.add(dport):
+            return ip
+        return None
+
+    def add_to_icmp_scan(self, profileid_twid, icmp_type, dstip, spkts, stime, uid):
+        """
+        Adds an ICMP flow to the dst IPs of its type
+        returns the ICMPScan and True if the flow added a new dst IP to it
+        """
+        scans = self.icmp_scans.setdefault(profileid_twid, {})
+        try:
+            scan = scans[icmp_type]
+        except KeyError:
+            scan = scans[icmp_type] = ICMPScan(
+                DistinctCounter(self.sketch_precision), UidReservoir(self.max_uids)
+            )
+            scan.stime = stime
+            scan.first_dstip = dstip
+
+        scan.pkts_sent += spkts
+        scan.uids.add(uid)
+        is_new = scan.dstips.add(dstip)
+        if is_new:
+            scan.last_dstip_stime = stime
+        return scan, is_new
+
+    def remove_tw(self, profileid_twid):
+        """deletes the state of a closed tw"""
+        self.dports.pop(profileid_twid, None)
+        self.dstips.pop(profileid_twid, None)
+        self.icmp_scans.pop(profileid_twid, None)
@@ -15,6 +15,7 @@ import modules.p2ptrust.trust.base_model as reputation_model
 import modules.p2ptrust.trust.trustdb as trustdb
 import modules.p2ptrust.utils.utils as p2p_utils
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 from modules.p2ptrust.utils.go_director import GoDirector
 from modules.p2ptrust.utils.printer import Printer
 from slips_files.common.abstracts import Module
@@ -634,40 +635,20 @@ class Trust(Module, multiprocessing.Process):
                 # rotates p2p.log file every 1 day
                 self.rotator_thread.start()
 
-            self.c1 = __database__.subscribe('report_to_peers', ignore_subscribe_messages=True)
+            self.dispatcher = Dispatcher(self.name)
+            self.dispatcher.register('report_to_peers', self.new_evidence_callback)
             # channel to send msgs to whenever slips needs info from other peers about an ip
-            self.c2 = __database__.subscribe(self.p2p_data_request_channel, ignore_subscribe_messages=True)
+            self.dispatcher.register(self.p2p_data_request_channel, self.data_request_callback)
             # this channel receives peers requests/updates
-            self.c3 = __database__.subscribe(self.gopy_channel, ignore_subscribe_messages=True)
+            self.dispatcher.register(self.gopy_channel, self.gopy_callback)
             # should call self.update_callback
             # self.c4 = __database__.subscribe(self.slips_update_channel)
             while True:
-
-
-                message = __database__.get_message(self.c1)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-
-                if utils.is_msg_intended_for(message, 'report_to_peers'):
-                    self.new_evidence_callback(message)
-
-                message = __database__.get_message(self.c2)
-                if message and message['data'] == 'stop_process':
+                # returns at least once per second when idle, so the pigeon is still checked
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, self.p2p_data_request_channel):
-                    self.data_request_callback(message)
-
-                message = __database__.get_message(self.c3)
-                if message and message['data'] == 'stop_process':
-                    self.shutdown_gracefully()
-                    return True
-
-                if utils.is_msg_intended_for(message, self.gopy_channel):
-                    self.gopy_callback(message)
-
                 ret_code = self.pigeon.poll()
                 if ret_code is not None:
                     self.print(
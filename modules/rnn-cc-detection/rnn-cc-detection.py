@@ -4,6 +4,7 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 import warnings
 import json
 import traceback
@@ -30,7 +31,8 @@ class Module(Module, multiprocessing.Process):
         # outputqueue is connected to another process called OutputProcess
         self.outputqueue = outputqueue
         __database__.start(redis_port)
-        self.c1 = __database__.subscribe('new_letters')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_letters', self.handle_new_letters)
 
     def print(self, text, verbose=1, debug=0):
         """
@@ -133,12 +135,80 @@ class Module(Module, multiprocessing.Process):
         __database__.publish('finished_modules', self.name)
         return True
 
+    def handle_new_letters(self, message):
+        data = message['data']
+        data = json.loads(data)
+        pre_behavioral_model = data['new_symbol']
+        profileid = data['profileid']
+        twid = data['twid']
+        tupleid = data['tupleid']
+        uid = data['uid']
+        stime = data['stime']
+
+        if 'tcp' in tupleid.lower():
+            # to reduce false positives
+            threshold = 0.99
+            # function to convert each letter of behavioral model to ascii
+            behavioral_model = self.convert_input_for_module(
+                pre_behavioral_model
+            )
+            # predict the score of behavioral model being c&c channel
+            self.print(
+                f'predicting the sequence: {pre_behavioral_model}',
+                3,
+                0,
+            )
+            score = self.tcpmodel.predict(behavioral_model)
+            self.print(
+                f' >> sequence: {pre_behavioral_model}. final prediction score: {score[0][0]:.20f}',
+                3,
+                0,
+            )
+            # get a float instead of numpy array
+            score = score[0][0]
+            if score > threshold:
+                threshold_confidence = 100
+                if (
+                    len(pre_behavioral_model)
+                    >= threshold_confidence
+                ):
+                    confidence = 1
+                else:
+                    confidence = (
+                        len(pre_behavioral_model)
+                        / threshold_confidence
+                    )
+                self.set_evidence(
+                    score,
+                    confidence,
+                    uid,
+                    stime,
+                    tupleid,
+                    profileid,
+                    twid,
+                )
+        """
+        elif 'udp' in tupleid.lower():
+            # Define why this threshold
+            threshold = 0.7
+            # function to convert each letter of behavioral model to ascii
+            behavioral_model = self.convert_input_for_module(pre_behavioral_model)
+            # predict the score of behavioral model being c&c channel
+            self.print(f'predicting the sequence: {pre_behavioral_model}', 4, 0)
+            score = udpmodel.predict(behavioral_model)
+            self.print(f' >> sequence: {pre_behavioral_model}. final prediction score: {score[0][0]:.20f}', 5, 0)
+            # get a float instead of numpy array
+            score = score[0][0]
+            if score > threshold:
+                self.set_evidence(score, tupleid, profileid, twid)
+        """
+
     def run(self, model_file='modules/rnn-cc-detection/rnn_model.h5'):
         utils.drop_root_privs()
         # TODO: set the decision threshold in the function call
         try:
             # Download lstm model
-            tcpmodel = load_model(model_file)
+            self.tcpmodel = load_model(model_file)
         except AttributeError as e:
             self.print('Error loading the model.')
             self.print(e)
@@ -154,80 +224,10 @@ class Module(Module, multiprocessing.Process):
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                # Check that the message is for you. Probably unnecessary...
-                if message and message['data'] == 'stop_process':
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_letters'):
-                    data = message['data']
-                    data = json.loads(data)
-                    pre_behavioral_model = data['new_symbol']
-                    profileid = data['profileid']
-                    twid = data['twid']
-                    tupleid = data['tupleid']
-                    uid = data['uid']
-                    stime = data['stime']
-
-                    if 'tcp' in tupleid.lower():
-                        # to reduce false positives
-                        threshold = 0.99
-                        # function to convert each letter of behavioral model to ascii
-                        behavioral_model = self.convert_input_for_module(
-                            pre_behavioral_model
-                        )
-                        # predict the score of behavioral model being c&c channel
-                        self.print(
-                            f'predicting the sequence: {pre_behavioral_model}',
-                            3,
-                            0,
-                        )
-                        score = tcpmodel.predict(behavioral_model)
-                        self.print(
-                            f' >> sequence: {pre_behavioral_model}. final prediction score: {score[0][0]:.20f}',
-                            3,
-                            0,
-                        )
-                        # get a float instead of numpy array
-                        score = score[0][0]
-                        if score > threshold:
-                            threshold_confidence = 100
-                            if (
-                                len(pre_behavioral_model)
-                                >= threshold_confidence
-                            ):
-                                confidence = 1
-                            else:
-                                confidence = (
-                                    len(pre_behavioral_model)
-                                    / threshold_confidence
-                                )
-                            self.set_evidence(
-                                score,
-                                confidence,
-                                uid,
-                                stime,
-                                tupleid,
-                                profileid,
-                                twid,
-                            )
-                    """
-                    elif 'udp' in tupleid.lower():
-                        # Define why this threshold
-                        threshold = 0.7
-                        # function to convert each letter of behavioral model to ascii
-                        behavioral_model = self.convert_input_for_module(pre_behavioral_model)
-                        # predict the score of behavioral model being c&c channel
-                        self.print(f'predicting the sequence: {pre_behavioral_model}', 4, 0)
-                        score = udpmodel.predict(behavioral_model)
-                        self.print(f' >> sequence: {pre_behavioral_model}. final prediction score: {score[0][0]:.20f}', 5, 0)
-                        # get a float instead of numpy array
-                        score = score[0][0]
-                        if score > threshold:
-                            self.set_evidence(score, tupleid, profileid, twid)
-                    """
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
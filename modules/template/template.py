@@ -17,6 +17,7 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 import sys
 import traceback
 
@@ -43,7 +44,10 @@ class Module(Module, multiprocessing.Process):
         # - tw_modified
         # - evidence_added
         # Remember to subscribe to this channel in database.py
-        self.c1 = __database__.subscribe('new_ip')
+        # The dispatcher uses 1 connection for all the channels of this module
+        # and calls the registered handler when a msg arrives in a channel
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_ip', self.handle_new_ip)
 
     def print(self, text, verbose=1, debug=0):
         """
@@ -69,23 +73,23 @@ class Module(Module, multiprocessing.Process):
         # Confirm that the module is done processing
         __database__.publish('finished_modules', self.name)
 
+    def handle_new_ip(self, message):
+        # Example of printing the number of profiles in the
+        # Database every time a new IP is seen
+        data = len(__database__.getProfiles())
+        self.print('Amount of profiles: {}'.format(data), 3, 0)
+
     def run(self):
         utils.drop_root_privs()
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                # Check that the message is for you. Probably unnecessary...
-                if message and message['data'] == 'stop_process':
+                # Blocks until a msg arrives in any of the registered channels
+                # and sends it to its handler. returns False when slips is stopping
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
-                if message and message['channel'] == 'new_ip':
-                    # Example of printing the number of profiles in the
-                    # Database every second
-                    data = len(__database__.getProfiles())
-                    self.print('Amount of profiles: {}'.format(data), 3, 0)
-
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
@@ -1,9 +1,11 @@
 # Must imports
 from slips_files.common.abstracts import Module
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
+from slips_files.common.ip_range_index import IPRangeIndex
 from modules.threat_intelligence.urlhaus import URLhaus
 import sys
 
@@ -30,16 +32,18 @@ class Module(Module, multiprocessing.Process, URLhaus):
         __database__.start(redis_port)
         # Get a separator from the database
         self.separator = __database__.getFieldSeparator()
-        self.c1 = __database__.subscribe('give_threat_intelligence')
-        self.c2 = __database__.subscribe('new_downloaded_file')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('give_threat_intelligence', self.handle_give_threat_intelligence)
+        self.dispatcher.register('IoC_filter_updated', self.handle_IoC_filter_updated)
+        self.dispatcher.register('new_downloaded_file', self.handle_new_downloaded_file)
         self.__read_configuration()
         self.get_malicious_ip_ranges()
+        self.load_IoC_filter()
         self.create_circl_lu_session()
         self.circllu_queue = multiprocessing.Queue()
         self.circllu_calls_thread = threading.Thread(
             target=self.make_pending_query, daemon=True
         )
-        self.should_shutdown = False
         self.urlhaus = URLhaus()
 
     def make_pending_query(self):
@@ -69,27 +73,41 @@ class Module(Module, multiprocessing.Process, URLhaus):
 
     def get_malicious_ip_ranges(self):
         """
-        Cache the IoC IP ranges instead of retrieving them from the db
+        Cache the IoC IP ranges in a sorted index instead of retrieving them from the db
+        the index is replaced with a new one, so lookups never see a half built index
         """
+        self.ip_ranges_version = __database__.get_malicious_ip_ranges_version()
         ip_ranges = __database__.get_malicious_ip_ranges()
-        self.cached_ipv6_ranges = {}
-        self.cached_ipv4_ranges = {}
-        for range in ip_ranges.keys():
-            if '.' in range:
-                first_octet = range.split('.')[0]
-                try:
-                    self.cached_ipv4_ranges[first_octet].append(range)
-                except KeyError:
-                    # first time seeing this octet
-                    self.cached_ipv4_ranges[first_octet] = [range]
-            else:
-                # ipv6 range
-                first_octet = range.split(':')[0]
-                try:
-                    self.cached_ipv6_ranges[first_octet].append(range)
-                except KeyError:
-                    # first time seeing this octet
-                    self.cached_ipv6_ranges[first_octet] = [range]
+        self.ip_ranges_index = IPRangeIndex(ip_ranges.items())
+
+    def update_malicious_ip_ranges(self):
+        """
+        Rebuilds the index of IoC IP ranges if the update manager
+        or the local TI files added ranges since we built it.
+        called after loading the local TI files and when the update manager
+        publishes IoC_filter_updated at the end of an update
+        """
+        if __database__.get_malicious_ip_ranges_version() != self.ip_ranges_version:
+            self.get_malicious_ip_ranges()
+
+    def load_IoC_filter(self):
+        """
+        Loads the filter of IoC IPs and domains published by the update manager.
+        IPs and domains that aren't in the filter aren't in the db either,
+        so we don't look them up. None if there's no filter in the db, or it's being updated
+        """
+        self.IoC_filter = __database__.get_IoC_filter()
+        if self.IoC_filter is not None:
+            self.print(
+                f'Loaded version {self.IoC_filter.version} of the IoC filter. '
+                f'False positive rate: {self.IoC_filter.false_positive_rate():.5f}', 2, 0
+            )
+
+    def is_in_IoC_filter(self, ioc: str) -> bool:
+        """
+        returns False only if the given ip or domain is definitely not in IoC_ips or IoC_domains
+        """
+        return self.IoC_filter is None or ioc in self.IoC_filter
 
     def __read_configuration(self):
         conf = ConfigParser()
@@ -399,11 +417,13 @@ class Module(Module, multiprocessing.Process, URLhaus):
                     )
 
         # Add all loaded malicious ips to the database
-        __database__.add_ips_to_IoC(malicious_ips)
+        filter_updated = __database__.add_ips_to_IoC(malicious_ips)
         # Add all loaded malicious domains to the database
-        __database__.add_domains_to_IoC(malicious_domains)
+        filter_updated = __database__.add_domains_to_IoC(malicious_domains) or filter_updated
         __database__.add_ip_range_to_IoC(malicious_ip_ranges)
         __database__.add_asn_to_IoC(malicious_asns)
+        if filter_updated:
+            __database__.publish_IoC_filter_update()
         return True
 
     def __delete_old_source_IPs(self, file):
@@ -729,6 +749,8 @@ class Module(Module, multiprocessing.Process, URLhaus):
 
     def search_offline_for_ip(self, ip):
         """ Searches the TI files for the given ip """
+        if not self.is_in_IoC_filter(ip):
+            return False
         ip_info = __database__.search_IP_in_IoC(ip)
         # check if it's a blacklisted ip
         if not ip_info:
@@ -777,36 +799,31 @@ class Module(Module, multiprocessing.Process, URLhaus):
             self, ip, uid, daddr, timestamp, profileid, twid, ip_state
     ):
         """ check if this ip belongs to any of our blacklisted ranges"""
-        ip_obj = ipaddress.ip_address(ip)
-        # Malicious IP ranges are stored in slips sorted by the first octet
-        # so get the ranges that match the fist octet of the given IP
-        if validators.ipv4(ip):
-            first_octet = ip.split('.')[0]
-            ranges_starting_with_octet = self.cached_ipv4_ranges.get(first_octet, [])
-        elif validators.ipv6(ip):
-            first_octet = ip.split(':')[0]
-            ranges_starting_with_octet = self.cached_ipv6_ranges.get(first_octet, [])
-        else:
+        ip_info = self.ip_ranges_index.lookup(ip)
+        if not ip_info:
             return False
-        for range in ranges_starting_with_octet:
-            if ip_obj in ipaddress.ip_network(range):
-                # ip was found in one of the blacklisted ranges
-                ip_info = __database__.get_malicious_ip_ranges()[range]
-                ip_info = json.loads(ip_info)
-                self.set_evidence_malicious_ip(
-                    ip,
-                    uid,
-                    daddr,
-                    timestamp,
-                    ip_info,
-                    profileid,
-                    twid,
-                    ip_state,
-                )
-                return True
+
+        # ip was found in one of the blacklisted ranges
+        ip_info = json.loads(ip_info)
+        self.set_evidence_malicious_ip(
+            ip,
+            uid,
+            daddr,
+            timestamp,
+            ip_info,
+            profileid,
+            twid,
+            ip_state,
+        )
+        return True
 
     def search_offline_for_domain(self, domain):
         # Search for this domain in our database of IoC
+        if not any(
+            self.is_in_IoC_filter(parent_domain)
+            for parent_domain in utils.get_domain_and_parents(domain)
+        ):
+            return False, False
         (
             domain_info,
             is_subdomain,
@@ -833,6 +850,9 @@ class Module(Module, multiprocessing.Process, URLhaus):
         __database__.add_ips_to_IoC({
                 ip: json.dumps(ip_info)
         })
+        if self.IoC_filter is not None:
+            # the ip is added to the filter in the db too, no need to load it again
+            self.IoC_filter.add(ip)
         self.set_evidence_malicious_ip(
             ip,
             uid,
@@ -934,11 +954,73 @@ class Module(Module, multiprocessing.Process, URLhaus):
             else:
                 # Load updated data to the database
                 self.parse_local_ti_file(fullpath)
+                self.update_malicious_ip_ranges()
             # Store the new etag and time of file in the database
             malicious_file_info = {'hash': filehash}
             __database__.set_TI_file_info(filename, malicious_file_info)
             return True
 
+    def handle_give_threat_intelligence(self, message):
+        """looks up the IP, domain or URL sent in the msg in all the TI sources"""
+        # Data is sent in the channel as a json dict so we need to deserialize it first
+        data = json.loads(message['data'])
+        # Extract data from dict
+        profileid = data.get('profileid')
+        twid = data.get('twid')
+        timestamp = data.get('stime')
+        uid = data.get('uid')
+        protocol = data.get('proto')
+        daddr = data.get('daddr')
+        # these 2 are only available when looking up dns answers
+        # the query is needed when a malicious answer is found,
+        # for more detailed description of the evidence
+        self.is_dns_response = data.get('is_dns_response')
+        self.dns_query = data.get('dns_query')
+        # IP is the IP that we want the TI for. It can be a SRC or DST IP
+        to_lookup = data.get('to_lookup', '')
+        # detect the type given because sometimes, http.log host field has ips OR domains
+        type_ = utils.detect_data_type(to_lookup)
+
+        # ip_state will say if it is a srcip or if it was a dst_ip
+        ip_state = data.get('ip_state')
+
+        # If given an IP, ask for it
+        # Block only if the traffic isn't outgoing ICMP port unreachable packet
+        if type_ == 'ip':
+            ip = to_lookup
+            if not (
+                    utils.is_ignored_ip(ip)
+                    or self.is_outgoing_icmp_packet(protocol, ip_state)
+                ):
+                self.is_malicious_ip(ip, uid, daddr, timestamp, profileid, twid, ip_state)
+                self.ip_belongs_to_blacklisted_range(ip, uid, daddr, timestamp, profileid, twid, ip_state)
+                self.ip_has_blacklisted_ASN(ip, uid, timestamp, profileid, twid, ip_state)
+        elif type_ == 'domain':
+            self.is_malicious_domain(
+                to_lookup,
+                uid,
+                timestamp,
+                profileid,
+                twid
+            )
+        elif type_ == 'url':
+            self.is_malicious_url(
+                to_lookup,
+                uid,
+                timestamp,
+                profileid,
+                twid
+            )
+
+    def handle_IoC_filter_updated(self, message):
+        self.load_IoC_filter()
+        # the update manager is done updating the IoCs, including the ranges
+        self.update_malicious_ip_ranges()
+
+    def handle_new_downloaded_file(self, message):
+        file_info = json.loads(message['data'])
+        self.is_malicious_hash(file_info)
+
     def run(self):
         try:
             utils.drop_root_privs()
@@ -956,75 +1038,10 @@ class Module(Module, multiprocessing.Process, URLhaus):
 
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                if message and message['data'] == 'stop_process':
-                    self.should_shutdown = True
-
-                # The channel now can receive an IP address or a domain name
-                if utils.is_msg_intended_for(
-                    message, 'give_threat_intelligence'
-                ):
-                    # Data is sent in the channel as a json dict so we need to deserialize it first
-                    data = json.loads(message['data'])
-                    # Extract data from dict
-                    profileid = data.get('profileid')
-                    twid = data.get('twid')
-                    timestamp = data.get('stime')
-                    uid = data.get('uid')
-                    protocol = data.get('proto')
-                    daddr = data.get('daddr')
-                    # these 2 are only available when looking up dns answers
-                    # the query is needed when a malicious answer is found,
-                    # for more detailed description of the evidence
-                    self.is_dns_response = data.get('is_dns_response')
-                    self.dns_query = data.get('dns_query')
-                    # IP is the IP that we want the TI for. It can be a SRC or DST IP
-                    to_lookup = data.get('to_lookup', '')
-                    # detect the type given because sometimes, http.log host field has ips OR domains
-                    type_ = utils.detect_data_type(to_lookup)
-
-                    # ip_state will say if it is a srcip or if it was a dst_ip
-                    ip_state = data.get('ip_state')
-
-                    # If given an IP, ask for it
-                    # Block only if the traffic isn't outgoing ICMP port unreachable packet
-                    if type_ == 'ip':
-                        ip = to_lookup
-                        if not (
-                                utils.is_ignored_ip(ip)
-                                or self.is_outgoing_icmp_packet(protocol, ip_state)
-                            ):
-                            self.is_malicious_ip(ip, uid, daddr, timestamp, profileid, twid, ip_state)
-                            self.ip_belongs_to_blacklisted_range(ip, uid, daddr, timestamp, profileid, twid, ip_state)
-                            self.ip_has_blacklisted_ASN(ip, uid, timestamp, profileid, twid, ip_state)
-                    elif type_ == 'domain':
-                        self.is_malicious_domain(
-                            to_lookup,
-                            uid,
-                            timestamp,
-                            profileid,
-                            twid
-                        )
-                    elif type_ == 'url':
-                        self.is_malicious_url(
-                            to_lookup,
-                            uid,
-                            timestamp,
-                            profileid,
-                            twid
-                        )
-
-                message = __database__.get_message(self.c2)
-                if message and message['data'] == 'stop_process':
-                    self.should_shutdown = True
-
-                if utils.is_msg_intended_for(message, 'new_downloaded_file'):
-                    file_info = json.loads(message['data'])
-                    self.is_malicious_hash(file_info)
-                    continue
-
-                if self.should_shutdown:
-                     self.shutdown_gracefully()
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
+                    self.shutdown_gracefully()
+                    return True
 
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
@@ -4,6 +4,8 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.flow_message import decode_flow_msg
+from slips_files.common.dispatcher import Dispatcher
 import traceback
 import sys
 
@@ -25,7 +27,8 @@ class Module(Module, multiprocessing.Process):
         __database__.start(redis_port)
         self.separator = __database__.getFieldSeparator()
         # Subscribe to 'new_flow' channel
-        self.c1 = __database__.subscribe('new_flow')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_flow', self.handle_new_flow)
         # Read information how we should print timestamp.
         conf = ConfigParser()
         self.is_human_timestamp = conf.timeline_human_timestamp()
@@ -56,7 +59,7 @@ class Module(Module, multiprocessing.Process):
             timestamp = utils.convert_format(timestamp, utils.alerts_format)
         return str(timestamp)
 
-    def process_flow(self, profileid, twid, flow, timestamp: float):
+    def process_flow(self, profileid, twid, uid, flow_dict: dict, timestamp: float):
         """
         Process the received flow  for this profileid and twid
          so its printed by the logprocess later
@@ -65,8 +68,6 @@ class Module(Module, multiprocessing.Process):
 
         try:
             # Convert the common fields to something that can be interpreted
-            uid = next(iter(flow))
-            flow_dict = json.loads(flow[uid])
             profile_ip = profileid.split('_')[1]
             dur = round(float(flow_dict['dur']), 3)
             stime = flow_dict['ts']
@@ -389,31 +390,27 @@ class Module(Module, multiprocessing.Process):
         # Confirm that the module is done processing
         __database__.publish('finished_modules', self.name)
 
+    def handle_new_flow(self, message):
+        """adds the flow to the timeline of its profile and tw"""
+        mdata = decode_flow_msg(message['data'])
+        profileid = mdata['profileid']
+        twid = mdata['twid']
+        timestamp = mdata['stime']
+        return_value = self.process_flow(
+            profileid, twid, mdata['uid'], mdata['flow'], timestamp
+        )
+
     def run(self):
         utils.drop_root_privs()
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                # Check that the message is for you. Probably unnecessary...
-                # if timewindows are not updated for a long time (see at logsProcess.py),
-                # we will stop slips automatically.The 'stop_process' line is sent from logsProcess.py.
-                if message and message['data'] == 'stop_process':
+                # waits for a msg in any of our channels and sends it to its handler
+                if not self.dispatcher.dispatch():
+                    # if timewindows are not updated for a long time, Slips is stopped automatically.
                     self.shutdown_gracefully()
                     return True
 
-                if utils.is_msg_intended_for(message, 'new_flow'):
-                    mdata = message['data']
-                    # Convert from json to dict
-                    mdata = json.loads(mdata)
-                    profileid = mdata['profileid']
-                    twid = mdata['twid']
-                    flow = mdata['flow']
-                    timestamp = mdata['stime']
-                    flow = json.loads(flow)
-                    return_value = self.process_flow(
-                        profileid, twid, flow, timestamp
-                    )
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
                 return True
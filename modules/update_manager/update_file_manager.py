@@ -1491,6 +1491,17 @@ class UpdateFileManager:
 
         os.remove(online_whitelist_download_path)
 
+    def build_IoC_filter(self):
+        """
+        Publishes the filter of all the IoC IPs and domains used by threat_intelligence
+        for skipping the lookups of IPs and domains that aren't in any TI feed
+        """
+        false_positive_rate = __database__.build_IoC_filter()
+        self.print(
+            f'Built the filter of IoC IPs and domains. '
+            f'False positive rate: {false_positive_rate:.5f}', 2, 0,
+        )
+
     async def update(self) -> bool:
         """
         Main function. It tries to update the TI files from a remote server
@@ -1524,6 +1535,8 @@ class UpdateFileManager:
             files_to_download.update(self.ja3_feeds)
             files_to_download.update(self.ssl_feeds)
 
+            # True if we're going to add IoCs to the db
+            updating_iocs = False
             for file_to_download in files_to_download.keys():
                 if self.__check_if_update(file_to_download, self.update_period):
                     # failed to get the response, either a server problem
@@ -1532,6 +1545,10 @@ class UpdateFileManager:
 
                     # this run wasn't started with existing ti files in the db
                     self.first_time_reading_files = True
+                    if not updating_iocs:
+                        # the modules shouldn't use the old filter while we add the new IoCs
+                        __database__.delete_IoC_filter()
+                        updating_iocs = True
 
                     # every function call to update_TI_file is now running concurrently instead of serially
                     # so when a server's taking a while to give us the TI feed, we proceed
@@ -1543,6 +1560,9 @@ class UpdateFileManager:
             # in case of riskiq files, we don't have a link for them in ti_files, We update these files using their API
             # check if we have a username and api key and a week has passed since we last updated
             if self.__check_if_update('riskiq_domains', self.riskiq_update_period):
+                if not updating_iocs:
+                    __database__.delete_IoC_filter()
+                    updating_iocs = True
                 self.update_riskiq_feed()
 
             # wait for all TI files to update
@@ -1555,5 +1575,7 @@ class UpdateFileManager:
             __database__.set_loaded_ti_files(self.loaded_ti_files)
             self.print_duplicate_ip_summary()
             self.loaded_ti_files = 0
+            if updating_iocs or __database__.get_IoC_filter() is None:
+                self.build_IoC_filter()
         except KeyboardInterrupt:
             return False
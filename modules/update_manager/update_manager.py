@@ -2,6 +2,7 @@ from slips_files.common.abstracts import Module
 import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 from slips_files.common.config_parser import ConfigParser
 import sys
 import traceback
@@ -26,7 +27,9 @@ class UpdateManager(Module, multiprocessing.Process):
         # Start the DB
         self.redis_port = redis_port
         __database__.start(self.redis_port)
-        self.c1 = __database__.subscribe('core_messages')
+        # only subscribed to receive the stop msg, the other msgs of this channel are ignored
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('core_messages', lambda message: None)
         # Update file manager
         self.update_manager = UpdateFileManager(
             self.outputqueue, redis_port
@@ -118,9 +121,7 @@ class UpdateManager(Module, multiprocessing.Process):
         # Main loop function
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                # Check that the message is for you. Probably unnecessary...
-                if message and message['data'] == 'stop_process':
+                if not self.dispatcher.dispatch():
                     self.shutdown_gracefully()
                     return True
 
@@ -616,13 +616,16 @@ class Main:
             # when using -D, we kill the processes because
             # the queues are not there yet to send stop msgs
             for process in (
-                        'ProfilerProcess',
                         'logsProcess',
                         'OutputProcess'
 
             ):
                 self.kill(process, INT=True)
 
+            for process in self.PIDs:
+                if process.startswith('Profiler'):
+                    self.kill(process, INT=True)
+
         else:
             # Send manual stops to the processes using queues
             stop_msg = 'stop_process'
@@ -1649,6 +1652,10 @@ class Main:
         )
         modified_ips_in_the_last_tw = len(modified_profiles)
         __database__.set_input_metadata({'modified_ips_in_the_last_tw': modified_ips_in_the_last_tw})
+        # the number of flows read by the input process and not yet received by the profiler
+        __database__.set_input_metadata({'profiler_queue_depth': self.profilerProcessQueue.depth()})
+        # the number of msgs each module didn't read yet from the flow streams
+        __database__.set_input_metadata({'streams_lag': json.dumps(__database__.get_streams_lag())})
         # Get the time of last modified timewindow and set it as a new
         if last_modified_tw_time != 0:
             __database__.setSlipsInternalTime(
@@ -1671,6 +1678,8 @@ class Main:
             from slips_files.core.inputProcess import InputProcess
             from slips_files.core.outputProcess import OutputProcess
             from slips_files.core.profilerProcess import ProfilerProcess
+            from slips_files.common.batch_queue import BatchQueue
+            from slips_files.core.profilerRouter import ProfilerRouter
             from slips_files.core.guiProcess import GuiProcess
             from slips_files.core.logsProcess import LogsProcess
             from slips_files.core.evidenceProcess import EvidenceProcess
@@ -1793,23 +1802,35 @@ class Main:
                 int(self.pid)
             )
 
-            self.profilerProcessQueue = Queue()
-            profiler_process = ProfilerProcess(
-                self.profilerProcessQueue,
-                self.outputqueue,
-                self.args.verbose,
-                self.args.debug,
-                self.redis_port,
-            )
-            profiler_process.start()
-            self.print(
-                f'Started {self.green("Profiler Process")} '
-                f'[PID {self.green(profiler_process.pid)}]', 1, 0
-            )
-            __database__.store_process_PID(
-                'Profiler',
-                int(profiler_process.pid)
-            )
+            # each profiler worker has its own queue,
+            # the router sends each flow to the worker that owns its profile
+            self.profiler_workers = self.conf.profiler_workers()
+            profiler_queues = []
+            for worker_id in range(self.profiler_workers):
+                profiler_queue = BatchQueue(
+                    batch_size=self.conf.profiler_batch_size(),
+                    flush_interval=self.conf.profiler_flush_interval(),
+                    capacity=self.conf.profiler_queue_capacity(),
+                )
+                profiler_queues.append(profiler_queue)
+                profiler_process = ProfilerProcess(
+                    profiler_queue,
+                    self.outputqueue,
+                    self.args.verbose,
+                    self.args.debug,
+                    self.redis_port,
+                    worker_id=worker_id,
+                )
+                profiler_process.start()
+                self.print(
+                    f'Started {self.green("Profiler Process")} '
+                    f'[PID {self.green(profiler_process.pid)}]', 1, 0
+                )
+                __database__.store_process_PID(
+                    ProfilerProcess.get_worker_name(worker_id),
+                    int(profiler_process.pid)
+                )
+            self.profilerProcessQueue = ProfilerRouter(profiler_queues)
 
             self.c1 = __database__.subscribe('finished_modules')
             self.enable_metadata = self.conf.enable_metadata()
@@ -1898,9 +1919,6 @@ class Main:
                         end='\r',
                     )
 
-                # Check if we need to close any TWs
-                __database__.check_TW_to_close()
-
                 if is_interface and hostIP not in modified_profiles:
                     # In interface we keep track of the host IP. If there was no
                     # modified TWs in the host IP, we check if the network was changed.
@@ -0,0 +1,100 @@
+import multiprocessing
+import threading
+import time
+
+
+class BatchQueue:
+    """
+    A bounded multiprocessing queue that ships lists of lines instead of single lines.
+    Used for sending flows from inputProcess to profilerProcess.
+
+    The producer buffers the lines and sends them as 1 batch once there are
+    batch_size lines buffered, or every flush_interval ms, whichever happens first.
+    The queue holds at most capacity batches, once it's full, put() blocks
+    until the consumer catches up, so a fast input can't fill the memory.
+    The consumer gets a list of lines with every get()
+    """
+    def __init__(self, batch_size=100, flush_interval=100, capacity=1000):
+        self.batch_size = max(1, int(batch_size))
+        # convert ms to seconds
+        self.flush_interval = flush_interval / 1000
+        self.queue = multiprocessing.Queue(maxsize=capacity)
+        # the number of lines waiting in the queue
+        self.lines_in_queue = multiprocessing.Value('i', 0)
+        # the lines waiting to be sent by this producer
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def start_flusher(self):
+        """
+        starts the thread that sends the buffered lines every flush_interval
+        so lines don't wait in the buffer when the input is slow, e.g. an interface
+        the thread is started in the producer process on the first put()
+        """
+        self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self.lock:
+                self.flush()
+
+    def flush(self):
+        """
+        sends the buffered lines as 1 batch. the caller should hold self.lock
+        blocks if the queue is full
+        """
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        with self.lines_in_queue.get_lock():
+            self.lines_in_queue.value += len(batch)
+        self.queue.put(batch)
+
+    def put(self, line):
+        """
+        buffers the given line and sends the buffer if it's full
+        control msgs like 'stop' and 'stop_process' are sent right away
+        """
+        if not self.flusher:
+            self.start_flusher()
+
+        with self.lock:
+            self.buffer.append(line)
+            if (
+                len(self.buffer) >= self.batch_size
+                or isinstance(line, str)
+            ):
+                self.flush()
+
+    def get(self) -> list:
+        """
+        blocks until a batch is available
+        returns a list of lines
+        """
+        batch = self.queue.get()
+        with self.lines_in_queue.get_lock():
+            self.lines_in_queue.value -= len(batch)
+        return batch
+
+    def depth(self) -> int:
+        """
+        returns the number of lines sent by the producer and not received by the consumer yet
+        """
+        return self.lines_in_queue.value
+
+    def qsize(self) -> int:
+        """returns the number of batches waiting in the queue"""
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:
+            # not supported on macos
+            return 0
+
+    def close(self):
+        """sends what's left in the buffer and closes the queue"""
+        with self.lock:
+            self.flush()
+        self.queue.close()
@@ -0,0 +1,68 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    A compact probabilistic set used for skipping db lookups of IoCs we know we don't have.
+    If an item is not in the filter, it was never added. If it is, it may or may not
+    have been added, with a probability of false_positive_rate() of being a false positive.
+
+    The bits are stored in the same order redis uses for SETBIT/GETBIT,
+    so a filter stored in a redis string can be updated in place
+    with SETBIT using get_positions() and loaded again with from_bytes()
+    """
+    def __init__(self, bits: int, hashes: int, data: bytes = None):
+        """
+        :param bits: size of the filter in bits
+        :param hashes: number of bits set per item
+        :param data: the bits of the filter, as returned by to_bytes()
+        """
+        self.bits = bits
+        self.hashes = hashes
+        # changes every time the filter stored in the db is rebuilt
+        self.version = 0
+        size = (bits + 7) // 8
+        self.data = bytearray(data or size)
+        if len(self.data) < size:
+            # redis strings are only as long as the highest bit set
+            self.data.extend(bytes(size - len(self.data)))
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.001):
+        """
+        returns an empty filter sized for holding the given number of items
+        with the given false positive rate
+        """
+        capacity = max(1, capacity)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes)
+
+    def get_positions(self, item: str) -> list:
+        """returns the bits the given item sets in the filter"""
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self.get_positions(item):
+            self.data[position >> 3] |= 0x80 >> (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.data[position >> 3] & (0x80 >> (position & 7))
+            for position in self.get_positions(item)
+        )
+
+    def false_positive_rate(self) -> float:
+        """
+        returns the probability of an item that was never added being found in the filter,
+        estimated from the number of bits set
+        """
+        bits_set = bin(int.from_bytes(self.data, 'big')).count('1')
+        return (bits_set / self.bits) ** self.hashes
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.data)
@@ -0,0 +1,125 @@
+import hashlib
+import math
+import random
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct items added using 2^precision registers of 1 byte,
+    no matter how many items are added.
+    The standard error of the estimate is 1.04 / sqrt(2^precision), e.g. 3.25% with precision 10
+    """
+    def __init__(self, precision: int = 10):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        # sum of 2^-register of all the registers and the registers that are still 0,
+        # updated in every add() so len() doesn't go through all the registers
+        self.inverse_sum = float(len(self.registers))
+        self.zeros = len(self.registers)
+
+    def get_register(self, item: str):
+        """returns the index of the register of the given item, and the value it sets there"""
+        x = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), 'big')
+        bits = 64 - self.precision
+        index = x >> bits
+        # position of the first 1 in the remaining bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        return index, rank
+
+    def add(self, item: str) -> bool:
+        """
+        returns True if the item changed the sketch. Items that didn't were either
+        added before, or hash to the same register as a previous one
+        """
+        index, rank = self.get_register(item)
+        old_rank = self.registers[index]
+        if rank <= old_rank:
+            return False
+        self.registers[index] = rank
+        self.inverse_sum += 2.0 ** -rank - 2.0 ** -old_rank
+        if not old_rank:
+            self.zeros -= 1
+        return True
+
+    def __contains__(self, item: str) -> bool:
+        """False if the item was never added, True if it may have been"""
+        index, rank = self.get_register(item)
+        return rank <= self.registers[index]
+
+    def __len__(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / self.inverse_sum
+        if estimate <= 2.5 * m and self.zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / self.zeros)
+        return round(estimate)
+
+
+class DistinctCounter:
+    """
+    Counts distinct items exactly using a set, and if a precision is given,
+    switches to a HyperLogLog once the set would take more memory than the sketch.
+    So counting small scans is exact, and a very wide scan only takes 2^precision bytes
+    """
+    def __init__(self, precision: int = None):
+        """
+        :param precision: of the HyperLogLog, None to always count exactly
+        """
+        self.precision = precision
+        # an IP in a set takes ~8 times more memory than a register
+        self.max_exact = (1 << precision) // 8 if precision else None
+        self.items = set()
+        self.sketch = None
+
+    def add(self, item: str) -> bool:
+        """
+        returns True if the item is new. Once the sketch is used, a few new items
+        aren't detected as new, see HyperLogLog.add()
+        """
+        if self.sketch is not None:
+            return self.sketch.add(item)
+
+        if item in self.items:
+            return False
+        self.items.add(item)
+        if self.max_exact and len(self.items) > self.max_exact:
+            self.sketch = HyperLogLog(self.precision)
+            for seen_item in self.items:
+                self.sketch.add(seen_item)
+            self.items = None
+        return True
+
+    def __contains__(self, item: str) -> bool:
+        if self.sketch is not None:
+            return item in self.sketch
+        return item in self.items
+
+    def __len__(self) -> int:
+        if self.sketch is not None:
+            return len(self.sketch)
+        return len(self.items)
+
+
+class UidReservoir:
+    """
+    Keeps the uids of the flows of a detection.
+    If a max size is given, only a uniform random sample of that many uids is kept
+    """
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size
+        self.uids = []
+        # all the uids added, including the ones that aren't kept
+        self.total = 0
+
+    def add(self, uid: str):
+        self.total += 1
+        if self.max_size is None or len(self.uids) < self.max_size:
+            self.uids.append(uid)
+            return
+        # reservoir sampling, each of the uids added has the same probability of being kept
+        index = random.randrange(self.total)
+        if index < self.max_size:
+            self.uids[index] = uid
+
+    def __len__(self) -> int:
+        return self.total
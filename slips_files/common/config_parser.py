@@ -172,6 +172,37 @@ class ConfigParser(object):
         )
         return  'yes' in popups.lower() 
 
+    def scan_sketches(self):
+        sketches = self.read_configuration(
+            'detection', 'scan_sketches', 'no'
+        )
+        return 'yes' in sketches.lower()
+
+    def sketch_precision(self):
+        """
+        returns the precision of the HyperLogLogs used by the scan detections,
+        each one takes 2^precision bytes
+        """
+        precision = self.read_configuration(
+            'detection', 'sketch_precision', 10
+        )
+        try:
+            precision = int(precision)
+        except ValueError:
+            precision = 10
+        # more than 2^16 registers is more memory than counting most scans exactly
+        return min(max(precision, 4), 16)
+
+    def sketch_max_uids(self):
+        max_uids = self.read_configuration(
+            'detection', 'sketch_max_uids', 1000
+        )
+        try:
+            max_uids = int(max_uids)
+        except ValueError:
+            max_uids = 1000
+        return max_uids
+
     def rotation(self):
         rotation = self.read_configuration(
             'parameters', 'rotation', 'yes'
@@ -677,6 +708,99 @@ class ConfigParser(object):
 
         return period
 
+    def profiler_workers(self) -> int:
+        """
+        returns the number of profiler processes to start
+        """
+        workers = self.read_configuration(
+             'parameters', 'profiler_workers', 1
+        )
+        try:
+            workers = int(workers)
+        except ValueError:
+            workers = 1
+        return max(1, workers)
+
+    def profiler_batch_size(self) -> int:
+        """
+        returns the max number of lines inputProcess sends to the profiler at once
+        """
+        batch_size = self.read_configuration(
+             'parameters', 'profiler_batch_size', 100
+        )
+        try:
+            batch_size = int(batch_size)
+        except ValueError:
+            batch_size = 100
+        return max(1, batch_size)
+
+    def profiler_flush_interval(self) -> float:
+        """
+        returns the max time in ms a line waits in inputProcess before being sent to the profiler
+        """
+        interval = self.read_configuration(
+             'parameters', 'profiler_flush_interval', 100
+        )
+        try:
+            interval = float(interval)
+        except ValueError:
+            interval = 100
+        return interval if interval > 0 else 100
+
+    def profiler_queue_capacity(self) -> int:
+        """
+        returns the max number of batches waiting in the profiler queue
+        """
+        capacity = self.read_configuration(
+             'parameters', 'profiler_queue_capacity', 1000
+        )
+        try:
+            capacity = int(capacity)
+        except ValueError:
+            capacity = 1000
+        return max(1, capacity)
+
+    def stream_max_len(self) -> int:
+        """
+        returns the max number of msgs kept in the stream of each high volume channel
+        """
+        max_len = self.read_configuration(
+             'parameters', 'stream_max_len', 100000
+        )
+        try:
+            max_len = int(max_len)
+        except ValueError:
+            max_len = 100000
+        return max(1, max_len)
+
+    def stream_max_lag(self) -> int:
+        """
+        returns the max number of msgs a module can be behind in a stream
+        before the publishers wait for it
+        """
+        max_lag = self.read_configuration(
+             'parameters', 'stream_max_lag', 50000
+        )
+        try:
+            max_lag = int(max_lag)
+        except ValueError:
+            max_lag = 50000
+        return max(1, max_lag)
+
+    def ip_info_request_ttl(self) -> float:
+        """
+        returns the seconds slips waits before asking the TI modules and the peers
+        about the same IP again in the same profile and tw
+        """
+        ttl = self.read_configuration(
+             'parameters', 'ip_info_request_ttl', 300
+        )
+        try:
+            ttl = float(ttl)
+        except ValueError:
+            ttl = 300
+        return max(0, ttl)
+
     def mac_db_link(self):
         return utils.sanitize(self.read_configuration(
              'threatintelligence', 'mac_db', ''
@@ -694,9 +818,10 @@ class ConfigParser(object):
              'parameters', 'label', 'unknown'
         )
 
-    def get_disabled_modules(self, input_type) -> list:
+    def modules_disabled_in_config(self) -> list:
         """
-        Uses input type to enable leak detector only on pcaps
+        returns the modules listed in modules.disable in slips.conf,
+        without the ones slips disables depending on the input and the other params
         """
         to_ignore = self.read_configuration(
             'modules', 'disable', '[template , ensembling]'
@@ -708,7 +833,13 @@ class ConfigParser(object):
                 .split(',')
         )
         # strip each one of them
-        to_ignore = [mod.strip() for mod in to_ignore]
+        return [mod.strip() for mod in to_ignore]
+
+    def get_disabled_modules(self, input_type) -> list:
+        """
+        Uses input type to enable leak detector only on pcaps
+        """
+        to_ignore = self.modules_disabled_in_config()
         use_p2p = self.use_p2p()
 
         # Ignore exporting alerts module if export_to is empty
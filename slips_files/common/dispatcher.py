@@ -0,0 +1,205 @@
+from slips_files.core.database.database import __database__
+from slips_files.common.slips_utils import utils
+from collections import deque
+
+
+class Dispatcher:
+    """
+    Receives the messages of all the channels a process is subscribed to
+    using 1 redis connection, and sends each one to the handler of its channel.
+
+    Instead of polling a pubsub per channel in a loop, dispatch() blocks until a message
+    arrives in any of the channels, so an idle process doesn't use any CPU.
+
+    The high volume channels in __database__.stream_channels are read from redis streams
+    using a consumer group named after the module, the msgs are acked after their handler
+    returns, so after a restart the module continues from the last msg it processed.
+    The msgs of the pub/sub channels in __database__.after_streams_channels, e.g. tw_closed,
+    are only dispatched after the stream msgs published before them.
+
+    Usage:
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('new_flow', self.handle_new_flow)
+        ...
+        while self.dispatcher.dispatch():
+            pass
+        self.shutdown_gracefully()
+    """
+    def __init__(self, name: str, timeout=1):
+        """
+        :param name: name of the module, used as the consumer group of the streams
+        :param timeout: max seconds dispatch() waits for a msg before returning.
+        the wait is interrupted as soon as a msg arrives, it's only
+        there so the connection health checks keep running when idle
+        """
+        self.name = name
+        self.timeout = timeout
+        self.handlers = {}
+        self.pubsub = None
+        # {channel: offset} offset is the ID of the last pending msg read, or '>' once
+        # all the msgs delivered before a restart were read again
+        self.streams = {}
+        # msgs read from the streams that weren't dispatched yet
+        self.stream_msgs = deque()
+        # {channel: ID of the last msg read from its stream}
+        self.last_read_ids = {}
+        # (msg, {channel: ID of the last msg in its stream when the msg was received})
+        # of the pub/sub msgs waiting for the stream msgs published before them
+        self.deferred_msgs = deque()
+        # max seconds to wait for stream msgs before checking the pub/sub channels
+        self.pubsub_check_interval = 0.1
+        # True once the stop msg is received in the pub/sub channels
+        self.stopping = False
+        # True if the last read of the streams didn't find any new msg
+        self.streams_drained = False
+
+    def register(self, channel: str, handler):
+        """
+        subscribes to the given channel
+        :param handler: function that takes the msg received in this channel as a parameter
+        """
+        if channel not in __database__.supported_channels:
+            raise ValueError(f'Unsupported channel {channel}')
+
+        self.handlers[channel] = handler
+        if channel in __database__.stream_channels:
+            __database__.subscribe_to_stream(channel, self.name)
+            # start by reading the msgs delivered to this module but never acked
+            self.streams[channel] = '0'
+        elif self.pubsub is None:
+            self.pubsub = __database__.subscribe_to_channels([channel])
+        else:
+            self.pubsub.subscribe(channel)
+
+    def get_stream_message(self, timeout):
+        """
+        returns the next msg of the registered streams
+        or None if no msg arrived in the given timeout
+        """
+        if not self.stream_msgs:
+            block = None
+            if all(offset == '>' for offset in self.streams.values()):
+                # redis doesn't block when reading pending msgs
+                block = int(timeout * 1000) or 1
+            msgs = __database__.read_streams(self.streams, self.name, block=block)
+            self.streams_drained = block is not None and not msgs
+            for channel, offset in self.streams.items():
+                if offset == '>':
+                    continue
+                pending = [msg for msg in msgs if msg['channel'] == channel]
+                # the pending msgs are read in order, continue after the last one
+                self.streams[channel] = pending[-1]['id'] if pending else '>'
+            self.stream_msgs.extend(msgs)
+
+        if self.stream_msgs:
+            message = self.stream_msgs.popleft()
+            self.last_read_ids[message['channel']] = message['id']
+            return message
+        return None
+
+    @staticmethod
+    def parse_id(msg_id: str) -> tuple:
+        return tuple(int(part) for part in msg_id.split('-'))
+
+    def defer(self, message):
+        """
+        Keeps the given pub/sub msg until the msgs published to the streams before it are read.
+        the deferred msgs are dispatched in the order they were received
+        """
+        last_ids = {
+            channel: last_id
+            for channel, last_id in __database__.get_last_stream_ids(list(self.streams)).items()
+            if last_id is not None and not self.was_read(channel, last_id)
+        }
+        self.deferred_msgs.append((message, last_ids))
+
+    def was_read(self, channel: str, msg_id: str) -> bool:
+        if channel not in self.streams:
+            # the stop msg of this stream was received, there's nothing else to read
+            return True
+        last_read_id = self.last_read_ids.get(channel)
+        return last_read_id is not None and self.parse_id(last_read_id) >= self.parse_id(msg_id)
+
+    def get_deferred_message(self):
+        """returns the first deferred pub/sub msg if the stream msgs published before it were read"""
+        if not self.deferred_msgs:
+            return None
+        message, last_ids = self.deferred_msgs[0]
+        if not all(self.was_read(channel, last_id) for channel, last_id in last_ids.items()):
+            return None
+        return self.deferred_msgs.popleft()[0]
+
+    def get_message(self, timeout=None):
+        """
+        waits for a msg in any of the registered channels
+        returns None if no msg arrived in the given timeout
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        message = self.get_deferred_message()
+        if message:
+            return message
+
+        if not self.streams:
+            return __database__.get_message(self.pubsub, timeout=timeout)
+
+        if self.pubsub and not self.stopping:
+            # the pub/sub channels are low volume, check them between stream reads
+            message = __database__.get_message(self.pubsub, timeout=0)
+            if (
+                message
+                and message['channel'] in __database__.after_streams_channels
+                and message['data'] != 'stop_process'
+            ):
+                self.defer(message)
+                message = self.get_deferred_message()
+            if message:
+                return message
+            timeout = min(timeout, self.pubsub_check_interval)
+
+        return self.get_stream_message(timeout)
+
+    def dispatch(self, timeout=None) -> bool:
+        """
+        Waits for 1 msg and calls the handler of its channel
+        returns False if slips asked this process to stop, True otherwise
+        """
+        message = self.get_message(timeout=timeout)
+        if not message:
+            # the stop msg is added to the streams right after it's published in
+            # the pub/sub channels, nothing left to read means there's no stop msg to wait for
+            return not (self.stopping and (self.streams_drained or not self.streams))
+
+        channel = message['channel']
+        if message['data'] == 'stop_process':
+            # sent to all channels when slips is stopping
+            self.ack(message)
+            return self.stop(channel)
+
+        if utils.is_msg_intended_for(message, channel):
+            self.handlers[channel](message)
+        self.ack(message)
+        return True
+
+    def stop(self, channel: str) -> bool:
+        """
+        Handles the stop msg received in the given channel.
+        The stream msgs are read after the pub/sub ones, so the msgs published to the streams
+        before slips asked this process to stop are dispatched until the stop msg of each stream
+        returns False once the stop msg was received in all the channels and the deferred msgs
+        were dispatched, True otherwise
+        """
+        if channel in self.streams:
+            # all the msgs published to this stream before stopping were dispatched
+            del self.streams[channel]
+        else:
+            self.stopping = True
+        if self.streams or self.deferred_msgs:
+            return True
+        return self.pubsub is not None and not self.stopping
+
+    def ack(self, message):
+        """marks the msgs received from a stream as processed"""
+        if 'id' in message:
+            __database__.ack_stream_message(message['channel'], self.name, message['id'])
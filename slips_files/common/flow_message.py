@@ -0,0 +1,56 @@
+"""
+The format of the msgs sent to the modules in new_flow and the protocol channels
+(new_dns_flow, new_ssl, new_ssh, new_notice, new_http and new_url)
+
+Each msg is a dict encoded once, with the flow as a nested dict:
+{
+    'version': FLOW_MSG_VERSION,
+    'profileid': 'profile_192.168.1.1',
+    'twid': 'timewindow1',
+    'stime': '1637150000.2',
+    'uid': 'CAeDWs37BipkfP21u8',
+    'flow': {'daddr': '1.1.1.1', ...},
+    # + any extra fields of the channel, like rcode_name in new_dns_flow
+}
+
+orjson is used for encoding and decoding if it's installed, the msgs are the same either way.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+FLOW_MSG_VERSION = 1
+
+
+def encode_flow_msg(profileid: str, twid: str, stime, uid: str, flow: dict, **extra) -> str:
+    """
+    returns the msg to publish for the given flow
+    :param extra: fields to add to the msg besides the flow
+    """
+    msg = {
+        'version': FLOW_MSG_VERSION,
+        'profileid': profileid,
+        'twid': twid,
+        'stime': stime,
+        'uid': uid,
+        'flow': flow,
+    }
+    msg.update(extra)
+    if orjson:
+        return orjson.dumps(msg, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(msg)
+
+
+def decode_flow_msg(data) -> dict:
+    """
+    returns the msg published by encode_flow_msg() as a dict
+    :param data: message['data'] received in the channel
+    """
+    msg = orjson.loads(data) if orjson else json.loads(data)
+    if msg.get('version') != FLOW_MSG_VERSION:
+        raise ValueError(f'Unsupported flow msg version {msg.get("version")}')
+    return msg
@@ -0,0 +1,86 @@
+import bisect
+import ipaddress
+
+
+class IPRangeIndex:
+    """
+    A sorted index of IPv4 and IPv6 ranges for finding the range an IP belongs to
+    with a binary search instead of checking the IP against every range.
+
+    Ranges are stored as integer intervals sorted by their first IP.
+    Since CIDR ranges are either nested or don't overlap at all, each range keeps
+    the index of the smallest range containing it, so when an IP isn't in the closest
+    range, only the ranges containing that one are checked.
+    The index can't be modified after it's built, to update it, build a new one and
+    replace the old one with it.
+    """
+    def __init__(self, ranges=()):
+        """
+        :param ranges: iterable of (range, value) tuples. range is a str like 1.2.3.0/24,
+        value is what lookup() returns for IPs in this range, it shouldn't be None
+        invalid ranges are ignored
+        """
+        intervals = {4: [], 6: []}
+        for ip_range, value in ranges:
+            try:
+                network = ipaddress.ip_network(ip_range.strip(), strict=False)
+            except ValueError:
+                continue
+            intervals[network.version].append(
+                (
+                    int(network.network_address),
+                    int(network.broadcast_address),
+                    value
+                )
+            )
+        self.indexes = {
+            version: self.build(version_intervals)
+            for version, version_intervals in intervals.items()
+        }
+
+    @staticmethod
+    def build(intervals: list) -> tuple:
+        """
+        sorts the given intervals and finds the parent of each one
+        returns a tuple of lists (starts, ends, values, parents)
+        """
+        # bigger ranges go first when 2 ranges start with the same IP
+        intervals.sort(key=lambda interval: (interval[0], -interval[1]))
+        starts, ends, values, parents = [], [], [], []
+        # the ranges containing the current one, the smallest one is the last
+        containing = []
+        for idx, (start, end, value) in enumerate(intervals):
+            while containing and ends[containing[-1]] < start:
+                containing.pop()
+            parents.append(containing[-1] if containing else -1)
+            containing.append(idx)
+            starts.append(start)
+            ends.append(end)
+            values.append(value)
+        return starts, ends, values, parents
+
+    def lookup(self, ip):
+        """
+        returns the value of the smallest range the given IP belongs to,
+        or None if it's not in any of them
+        :param ip: str or ipaddress obj
+        """
+        try:
+            ip = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        starts, ends, values, parents = self.indexes[ip.version]
+        ip = int(ip)
+        idx = bisect.bisect_right(starts, ip) - 1
+        while idx != -1:
+            if ends[idx] >= ip:
+                return values[idx]
+            idx = parents[idx]
+        return None
+
+    def __contains__(self, ip) -> bool:
+        return self.lookup(ip) is not None
+
+    def __len__(self) -> int:
+        return sum(len(index[0]) for index in self.indexes.values())
@@ -0,0 +1,50 @@
+from collections import OrderedDict
+
+
+class RecentRequests:
+    """
+    Remembers the requests sent in the last ttl seconds so the same request
+    isn't sent again until it expires.
+
+    The time used is the one given by the caller, for example the ts of the flow
+    that caused the request, so reading a file faster than real time doesn't
+    make the requests expire later.
+    At most max_size requests are kept, the oldest ones are forgotten first.
+    """
+    def __init__(self, ttl: float, max_size: int = 100000):
+        """
+        :param ttl: seconds a request is remembered for, 0 to never suppress requests
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        # {request: time it was sent}, the oldest request is the first one
+        self.requests = OrderedDict()
+        # number of requests suppressed because they were sent recently
+        self.suppressed = 0
+
+    def should_send(self, request, now: float) -> bool:
+        """
+        returns True if the given request wasn't sent in the last ttl seconds
+        and remembers it as sent now, returns False otherwise
+        :param request: any hashable that identifies the request
+        """
+        sent_at = self.requests.get(request)
+        if sent_at is not None and abs(now - sent_at) < self.ttl:
+            self.suppressed += 1
+            return False
+
+        self.requests[request] = now
+        self.requests.move_to_end(request)
+        self.evict(now)
+        return True
+
+    def evict(self, now: float):
+        """forgets the expired requests and the oldest ones if there are more than max_size"""
+        while self.requests:
+            request, sent_at = next(iter(self.requests.items()))
+            if len(self.requests) <= self.max_size and now - sent_at < self.ttl:
+                break
+            del self.requests[request]
+
+    def __len__(self) -> int:
+        return len(self.requests)
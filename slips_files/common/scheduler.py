@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class Scheduler(threading.Thread):
+    """
+    Calls functions after a delay, all of them from this 1 thread, instead of starting
+    1 thread per delayed call. The calls waiting are kept in a heap sorted by the time
+    they're due, so scheduling and running each call is O(log n).
+
+    Each call has a key, e.g. the uid of the flow to check again.
+    A key that's already waiting isn't scheduled again, and its call can be cancelled.
+    `key in scheduler` is True while its call is waiting or running, so the function
+    called can tell that it's being called again after waiting.
+
+    Usage:
+        self.scheduler = Scheduler(self.name, print_error=lambda error: self.print(error, 0, 1))
+        ...
+        self.scheduler.schedule(15, self.check_again, (uid,), key=('check', uid))
+        ...
+        # in run()
+        self.scheduler.start()
+        # in shutdown_gracefully()
+        self.scheduler.shutdown()
+    """
+
+    def __init__(self, name: str, print_error=None):
+        """
+        :param name: name of the module, used as the name of the thread
+        :param print_error: function that receives the traceback of the
+        scheduled functions that raise an exception
+        """
+        threading.Thread.__init__(self, name=f'{name} scheduler', daemon=True)
+        self.print_error = print_error
+        # (due time, seq, key) of the calls waiting, seq keeps the calls
+        # due at the same time in the order they were scheduled
+        self.queue = []
+        self.seq = itertools.count()
+        # {key: (seq, function, args)} of the calls waiting, and (seq, None, None) of the running one.
+        # cancelled calls are only removed from here, their entry in the queue is skipped when due
+        self.calls = {}
+        self.condition = threading.Condition()
+        # once shutting down, the thread stops when there are no calls waiting
+        self.shutting_down = False
+
+    def schedule(self, delay: float, function, args=(), key=None) -> bool:
+        """
+        Calls function(*args) after delay seconds
+        :param key: any hashable that identifies the call, defaults to the function and args
+        returns False if a call with the same key is already waiting
+        """
+        if key is None:
+            key = (function, *args)
+        with self.condition:
+            call = self.calls.get(key)
+            if call is not None and call[1] is not None:
+                return False
+            seq = next(self.seq)
+            # a running call is replaced by this one, the key stays in the
+            # scheduler until this call returns
+            self.calls[key] = (seq, function, args)
+            heapq.heappush(self.queue, (time.monotonic() + delay, seq, key))
+            if self.queue[0][1] == seq:
+                # this call is due before the one the thread is waiting for
+                self.condition.notify()
+        return True
+
+    def cancel(self, key) -> bool:
+        """
+        Cancels the call with the given key if it's waiting
+        returns False if there's no such call or if it's already running
+        """
+        with self.condition:
+            call = self.calls.get(key)
+            if call is None or call[1] is None:
+                return False
+            del self.calls[key]
+            return True
+
+    def __contains__(self, key) -> bool:
+        return key in self.calls
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def get_next_call(self):
+        """
+        Waits until the next call is due, must be called holding the condition
+        returns the key, seq, function and args of the call, or None if there are
+        no more calls and the scheduler is shutting down
+        """
+        while True:
+            if not self.queue:
+                if self.shutting_down:
+                    return None
+                self.condition.wait()
+                continue
+
+            due, seq, key = self.queue[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                # wakes up earlier if a call due before this one is scheduled.
+                # calls aren't run early when shutting down, the checks done
+                # after waiting would give false positives
+                self.condition.wait(delay)
+                continue
+
+            heapq.heappop(self.queue)
+            call = self.calls.get(key)
+            if call is None or call[0] != seq:
+                # cancelled
+                continue
+            _, function, args = call
+            self.calls[key] = (seq, None, None)
+            return key, seq, function, args
+
+    def run(self):
+        while True:
+            with self.condition:
+                call = self.get_next_call()
+            if call is None:
+                return
+
+            key, seq, function, args = call
+            try:
+                function(*args)
+            except Exception:
+                # 1 failing call shouldn't stop the rest
+                if self.print_error:
+                    self.print_error(traceback.format_exc())
+            finally:
+                with self.condition:
+                    if self.calls.get(key, (None,))[0] == seq:
+                        del self.calls[key]
+
+    def shutdown(self):
+        """
+        Waits for the calls waiting to be run when they're due, then stops the thread.
+        the calls are not run before their delay, e.g. a conn checked again
+        before its DNS resolution had the time to arrive would be a false positive
+        """
+        with self.condition:
+            self.shutting_down = True
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
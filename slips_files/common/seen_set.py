@@ -0,0 +1,29 @@
+from collections import OrderedDict
+
+
+class SeenSet:
+    """
+    A set that keeps at most max_size items, the least recently used ones are forgotten first.
+
+    Used in front of the db to know if an IP, domain or url was stored before without asking redis,
+    so an item that isn't in the set isn't necessarily new, it has to be checked in the db.
+    """
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def __contains__(self, item) -> bool:
+        try:
+            self.items.move_to_end(item)
+            return True
+        except KeyError:
+            return False
+
+    def add(self, item):
+        self.items[item] = None
+        self.items.move_to_end(item)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.items)
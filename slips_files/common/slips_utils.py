@@ -56,6 +56,8 @@ class Utils(object):
             '%Y-%m-%dT%H:%M:%S'
 
          )
+        # the last format found by convert_to_datetime()
+        self.last_time_format = None
         # this format will be used accross all modules and logfiles of slips
         self.alerts_format = '%Y/%m/%d %H:%M:%S.%f%z'
         self.local_tz = self.get_local_timezone()
@@ -227,12 +229,23 @@ class Utils(object):
         if self.is_datetime_obj(ts):
             return ts
 
-        given_format = self.define_time_format(ts)
+        try:
+            # Try unix timestamp in seconds.
+            return datetime.fromtimestamp(float(ts))
+        except ValueError:
+            pass
 
-        if given_format == 'unixtimestamp':
-            datetime_obj = datetime.fromtimestamp(float(ts))
-        else:
-            datetime_obj = datetime.strptime(ts, given_format)
+        # all the flows of a file have the same ts format,
+        # so try the last one found before trying all of them
+        if self.last_time_format:
+            try:
+                return datetime.strptime(ts, self.last_time_format)
+            except ValueError:
+                pass
+
+        given_format = self.define_time_format(ts)
+        datetime_obj = datetime.strptime(ts, given_format)
+        self.last_time_format = given_format
         return datetime_obj
 
 
@@ -328,6 +341,14 @@ class Utils(object):
             return True
         return False
 
+    def get_domain_and_parents(self, domain: str) -> list:
+        """
+        Returns the given domain followed by all its parent domains
+        for example for images.google.com, returns ['images.google.com', 'google.com', 'com']
+        """
+        labels = domain.strip('.').split('.')
+        return ['.'.join(labels[idx:]) for idx in range(len(labels))]
+
     def get_hash_from_file(self, filename):
         """
         Compute the sha256 hash of a file
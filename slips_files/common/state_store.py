@@ -0,0 +1,106 @@
+from collections import OrderedDict
+
+
+class StateStore:
+    """
+    Keeps the state a module needs per profile, tw, IP, etc. between flows.
+
+    Each key is stored with the profileid_twid of the flow that last updated it,
+    and is deleted when that tw is closed, so when slips runs on an interface 24/7
+    the state of the old tws doesn't stay in memory forever.
+    At most max_size keys are kept, the least recently used ones are evicted first.
+
+    Usage:
+        self.nxdomains = StateStore()
+        ...
+        queries = self.nxdomains.get(key, [])
+        self.nxdomains.set(key, queries, profileid_twid)
+        ...
+        # in handle_tw_closed()
+        self.nxdomains.close_tw(message['data'])
+    """
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        # {key: (profileid_twid, value)} the least recently used first
+        self.items = OrderedDict()
+        # {profileid_twid: set of the keys last updated in that tw}
+        self.keys_per_tw = {}
+        self.hits = 0
+        self.misses = 0
+        # keys deleted because their tw was closed
+        self.expired = 0
+        # keys deleted because the store was full
+        self.evicted = 0
+
+    def __getitem__(self, key):
+        try:
+            value = self.items[key][1]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def set(self, key, value, profileid_twid: str):
+        """
+        Stores the value until the given tw is closed or the key is evicted
+        :param profileid_twid: the tw of the flow that updated this key, e.g. profile_1.1.1.1_timewindow1
+        """
+        old = self.items.get(key)
+        if old is not None and old[0] != profileid_twid:
+            self.forget_tw_key(old[0], key)
+        self.items[key] = (profileid_twid, value)
+        self.items.move_to_end(key)
+        self.keys_per_tw.setdefault(profileid_twid, set()).add(key)
+
+        while len(self.items) > self.max_size:
+            evicted_key, (evicted_tw, _) = self.items.popitem(last=False)
+            self.forget_tw_key(evicted_tw, evicted_key)
+            self.evicted += 1
+
+    def pop(self, key, default=None):
+        try:
+            profileid_twid, value = self.items.pop(key)
+        except KeyError:
+            return default
+        self.forget_tw_key(profileid_twid, key)
+        return value
+
+    def forget_tw_key(self, profileid_twid: str, key):
+        # the store isn't locked, a key may be popped by a
+        # module's scheduler thread while its tw is being closed
+        keys = self.keys_per_tw.get(profileid_twid)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            self.keys_per_tw.pop(profileid_twid, None)
+
+    def close_tw(self, profileid_twid: str):
+        """deletes all the keys last updated in the given tw"""
+        for key in self.keys_per_tw.pop(profileid_twid, ()):
+            if self.items.pop(key, None) is not None:
+                self.expired += 1
+
+    def __contains__(self, key) -> bool:
+        return key in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self.items),
+            'tws': len(self.keys_per_tw),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
@@ -0,0 +1,102 @@
+from slips_files.core.database.database import __database__
+import math
+
+
+class TimewindowCache:
+    """
+    Finds the TW a flow belongs to without asking the db, using the TW boundaries of each
+    profile kept in memory.
+
+    The TWs of a profile never overlap and there are no gaps between them, timewindow<n> starts at
+    start of timewindow1 + (n - 1) * width, so the TW of a flow can be calculated from the start of
+    timewindow1 of its profile. The db is only used the first time a profile is seen
+    and when new TWs have to be created.
+    """
+    def __init__(self):
+        # {profileid: [start of timewindow1, number of the first tw, number of the last tw]}
+        self.profiles = {}
+
+    def load(self, profileid: str):
+        """
+        loads the TW boundaries of the given profile from the db
+        returns None if the profile doesn't have TWs yet
+        """
+        first_tw = __database__.getFirstTWforProfile(profileid)
+        last_tw = __database__.getLastTWforProfile(profileid)
+        if not first_tw or not last_tw:
+            return None
+
+        first_twid = first_tw[0][0]
+        last_twid = last_tw[0][0]
+        first = int(first_twid.split('timewindow')[1])
+        last = int(last_twid.split('timewindow')[1])
+        # timewindow1 is the first tw created and is never deleted, use its start as it is,
+        # calculating it from the start of an older tw doesn't give the exact same float
+        start = float(__database__.getTimeTW(profileid, 'timewindow1'))
+        self.profiles[profileid] = [start, first, last]
+        return self.profiles[profileid]
+
+    def create_first_timewindow(self, profileid: str, flowtime: float):
+        """
+        creates timewindow1 of the given profile starting at the given flowtime
+        returns the TW boundaries of the profile
+        """
+        if __database__.width == 9999999999:
+            # If the option for only-one-tw was selected, we should create the TW at least 100 years before the flowtime,
+            # to cover for 'flows in the past'.
+            # Seconds in 1 year = 31536000
+            start = flowtime - (31536000 * 100)
+        else:
+            start = flowtime
+        if not __database__.add_timewindows(profileid, {'timewindow1': start}):
+            # another profiler worker created the first tw of this profile
+            # after this one checked, use the same tws
+            return self.load(profileid)
+        self.profiles[profileid] = [start, 1, 1]
+        return self.profiles[profileid]
+
+    def get_timewindow(self, flowtime, profileid: str):
+        """
+        returns the id of the TW of the given profile the flow belongs to,
+        creates the TWs in the db if they don't exist
+        """
+        if not profileid:
+            # profileid is None if we're dealing with a profile
+            # outside of home_network when this param is given
+            return False
+        flowtime = float(flowtime)
+        boundaries = (
+            self.profiles.get(profileid)
+            or self.load(profileid)
+            or self.create_first_timewindow(profileid, flowtime)
+        )
+        start, first, last = boundaries
+        width = __database__.width
+        tw_number = math.floor((flowtime - start) / width) + 1
+        # the division isn't exact, compare with the boundaries the same
+        # way they're calculated so a flow at the start of a tw belongs to it
+        if flowtime < start + (tw_number - 1) * width:
+            tw_number -= 1
+        elif flowtime >= start + tw_number * width:
+            tw_number += 1
+        if first <= tw_number <= last:
+            return f'timewindow{tw_number}'
+
+        if tw_number > last:
+            # the flow is newer than the last TW, create all the TWs in the middle
+            new_tws = range(last + 1, tw_number + 1)
+            boundaries[2] = tw_number
+        else:
+            # the flow is older than the first TW
+            new_tws = range(tw_number, first)
+            boundaries[1] = tw_number
+
+        __database__.add_timewindows(
+            profileid,
+            {
+                f'timewindow{number}': start + (number - 1) * width
+                for number in new_tws
+            },
+            older=tw_number < first
+        )
+        return f'timewindow{tw_number}'
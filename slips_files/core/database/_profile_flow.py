@@ -1,10 +1,97 @@
 import time
 import json
+import heapq
+import threading
 import traceback
 import ipaddress
 import sys
 import validators
 from slips_files.common.slips_utils import utils
+from slips_files.common.flow_message import encode_flow_msg
+
+# computes the symbol of a new flow of a tuple, appends it to the symbols of the tuple,
+# and stores the ts of this flow, see add_tuple()
+# the periodicity thresholds are the ones of the original stratosphere ips model of letters
+# KEYS[1]: the hash of the tuples of this profile and tw in this direction
+# ARGV[1]: tupleid, ARGV[2]: the ts of this flow
+# ARGV[3]: the letter of this flow for each periodicity -1, 1, 2, 3 and 4
+# returns the symbol added, the new symbols of the tuple if its length is a multiple of 3
+# and the ts of the 2 previous flows
+ADD_TUPLE_LUA = """
+local tupleid = ARGV[1]
+local now_ts = tonumber(ARGV[2])
+local ts_field = tupleid .. '|timestamps'
+local last_last_ts_str, last_ts_str = '', ''
+local timestamps = redis.call('HGET', KEYS[1], ts_field)
+if timestamps then
+    local sep = string.find(timestamps, ',', 1, true)
+    last_last_ts_str = string.sub(timestamps, 1, sep - 1)
+    last_ts_str = string.sub(timestamps, sep + 1)
+end
+local last_last_ts = tonumber(last_last_ts_str)
+local last_ts = tonumber(last_ts_str)
+
+-- the index of the letter of this periodicity in ARGV[3]
+local periodicity = 1
+-- 1 zero for each hour without flows
+local zeros = ''
+if last_last_ts and last_ts then
+    -- Time diff between the past flow and the past-past flow.
+    local T1 = last_ts - last_last_ts
+    -- Time diff between the current flow and the past flow.
+    local T2 = now_ts - last_ts
+    if T2 >= 3600 then
+        zeros = string.rep('0', math.floor(T2 / 3600))
+    end
+    local TD = 1
+    if T2 >= T1 then
+        if T1 ~= 0 then TD = T2 / T1 end
+    elseif T2 ~= 0 then
+        TD = T1 / T2
+    end
+    if TD <= 1.05 then
+        -- Strongly periodicity
+        periodicity = 2
+    elseif TD <= 1.3 then
+        -- Weakly periodicity
+        periodicity = 3
+    elseif TD <= 5 then
+        -- Weakly not periodicity
+        periodicity = 4
+    else
+        -- Strongly not periodicity
+        periodicity = 5
+    end
+end
+
+local timechar = ''
+if now_ts ~= 0 and last_ts and last_ts ~= 0 then
+    local T2 = now_ts - last_ts
+    if T2 <= 5 then
+        timechar = '.'
+    elseif T2 <= 60 then
+        timechar = ','
+    elseif T2 <= 300 then
+        timechar = '+'
+    elseif T2 <= 3600 then
+        timechar = '*'
+    end
+end
+
+local symbol = zeros .. string.sub(ARGV[3], periodicity, periodicity) .. timechar
+local symbols = redis.call('HGET', KEYS[1], tupleid)
+local to_publish = ''
+if symbols then
+    symbols = symbols .. symbol
+    if #symbols % 3 == 0 then
+        to_publish = symbols
+    end
+else
+    symbols = symbol
+end
+redis.call('HSET', KEYS[1], tupleid, symbols, ts_field, last_ts_str .. ',' .. ARGV[2])
+return {symbol, to_publish, last_last_ts_str, last_ts_str}
+"""
 
 class ProfilingFlowsDatabase(object):
     def __init__(self):
@@ -15,7 +102,10 @@ class ProfilingFlowsDatabase(object):
 
     def publish(self, channel, data):
         """Publish something"""
-        self.r.publish(channel, data)
+        if channel in self.stream_channels:
+            self.publish_to_stream(channel, data)
+            return
+        self.write('publish', channel, data)
 
     def getIPData(self, ip: str) -> dict:
         """
@@ -52,16 +142,7 @@ class ProfilingFlowsDatabase(object):
         accessed as str, it is automatically
         converted to str
         """
-        data = self.getIPData(ip)
-        if data is False:
-            # If there is no data about this IP
-            # Set this IP for the first time in the IPsInfo
-            # Its VERY important that the data of the first time we see an IP
-            # must be '{}', an empty dictionary! if not the logic breaks.
-            # We use the empty dictionary to find if an IP exists or not
-            self.rcache.hset('IPsInfo', ip, '{}')
-            # Publish that there is a new IP ready in the channel
-            self.publish('new_ip', ip)
+        self.set_new_item('IPsInfo', ip, channel='new_ip')
 
     def give_threat_intelligence(self, profileid, twid, ip_state, starttime, uid, daddr, proto=False, lookup='', extra_info:dict =False):
         data_to_send = {
@@ -86,7 +167,19 @@ class ProfilingFlowsDatabase(object):
     def ask_for_ip_info(self, ip, profileid, twid, proto, starttime, uid, ip_state, daddr=False):
         """
         is the ip param src or dst
-        """
+        The same ip isn't asked about again for the same profile, tw and ip_state
+        until ip_info_request_ttl seconds pass, in flow time.
+        The request that is sent has the uid and the profileid of the first flow
+        """
+        # the starttime of the flows read from files is a str of a datetime obj
+        flow_time = float(utils.convert_format(starttime, 'unixtimestamp'))
+        if not self.ip_info_requests.should_send(
+                (ip, ip_state, profileid, twid), flow_time
+        ):
+            if self.ip_info_requests.suppressed % 1000 == 0:
+                self.report_suppressed_ip_info_requests()
+            return
+
         # if the daddr key arg is not given, we know for sure that the ip given is the daddr
         daddr = daddr if daddr else ip
         data_to_send = self.give_threat_intelligence(
@@ -113,30 +206,36 @@ class ProfilingFlowsDatabase(object):
         })
         self.publish('p2p_data_request', json.dumps(data_to_send))
 
-    def update_times_contacted(self, ip, direction, profileid, twid):
+    def report_suppressed_ip_info_requests(self):
         """
-        :param ip: the ip that we want to update the times we contacted
+        adds the number of TI and p2p requests suppressed since the last report
+        to the analysis info in the db
         """
+        suppressed = self.ip_info_requests.suppressed
+        if suppressed == self.reported_suppressed_requests:
+            return
+        self.r.hincrby(
+            'analysis',
+            'suppressed_ip_info_requests',
+            suppressed - self.reported_suppressed_requests
+        )
+        self.reported_suppressed_requests = suppressed
 
-        # Get the hash of the timewindow
-        profileid_twid = f'{profileid}{self.separator}{twid}'
-
-        # Get the DstIPs data for this tw in this profile
-        # The format is {'1.1.1.1' :  3}
-        ips_contacted = self.r.hget(profileid_twid, direction + 'IPs')
-        if not ips_contacted:
-            ips_contacted = {}
+    def get_suppressed_ip_info_requests(self) -> int:
+        """returns the number of TI and p2p requests suppressed by all the profilers"""
+        return int(self.r.hget('analysis', 'suppressed_ip_info_requests') or 0)
 
-        try:
-            ips_contacted = json.loads(ips_contacted)
-            # Add 1 because we found this ip again
-            ips_contacted[ip] += 1
-        except (TypeError, KeyError):
-            # There was no previous data stored in the DB
-            ips_contacted[ip] = 1
-
-        ips_contacted = json.dumps(ips_contacted)
-        self.r.hset(profileid_twid, direction + 'IPs', str(ips_contacted))
+    def update_times_contacted(self, ip, direction, profileid, twid):
+        """
+        :param ip: the ip that we want to update the times we contacted
+        """
+        # The DstIPs and SrcIPs of this tw in this profile are stored in the hashes
+        # profile_<ip>_<tw>_DstIPs and SrcIPs with the times each ip was contacted,
+        # see getDstIPsfromProfileTW() for reading them
+        contacted_key = self.get_aggregate_key(
+            f'{profileid}{self.separator}{twid}', f'{direction}IPs'
+        )
+        self.write('hincrby', contacted_key, ip, 1)
 
     def getFinalStateFromFlags(self, state, pkts):
         """
@@ -317,12 +416,10 @@ class ProfilingFlowsDatabase(object):
         try:
             key = direction + type_data + role + protocol + state
             # self.print('Asked Key: {}'.format(key))
-            data = self.r.hget(f'{profileid}{self.separator}{twid}', key)
-            value = {}
-            if data:
-                portdata = json.loads(data)
-                value = portdata
-            elif not data:
+            value = self.get_aggregated_data(
+                f'{profileid}{self.separator}{twid}', key
+            )
+            if not value:
                 self.print(
                     'There is no data for Key: {}. Profile {} TW {}'.format(
                         key, profileid, twid
@@ -336,12 +433,79 @@ class ProfilingFlowsDatabase(object):
             )
             self.outputqueue.put('01|database|[DB] Inst: {}'.format(traceback.print_exc()))
 
-    def add_ips(self, profileid, twid, ip_as_obj, columns, role: str):
+    def get_aggregate_key(self, profileid_twid: str, key_name: str) -> str:
+        """
+        returns the name of the redis hash that has the info about the given key_name in this tw
+        e.g. profile_1.1.1.1_timewindow1_DstIPsClientTCPEstablished
+        key_name = [Src,Dst] + [Ports,IPs] + [Client,Server] + [TCP,UDP, ICMP, ICMP6] + [Established, NotEstablished]
+        """
+        return f'{profileid_twid}{self.separator}{key_name}'
+
+    def get_aggregated_data(self, profileid_twid: str, key_name: str) -> dict:
+        """
+        Rebuilds the dict of the given key_name from the redis hash where add_ips()
+        and add_port() store it.
+        The hash fields are the keys of the dict joined with | e.g. '8.8.8.8|totalflows'
+        and the uids of each ip or port are stored in a separate list
+        returns the same dict we used to store as json e.g.
+        IPs: {ip: {'totalflows', 'totalpkt', 'totalbytes', 'stime', 'uid': [..], 'dstports': {port: spkts}}}
+        Ports: {port: {'totalflows', 'totalpkt', 'totalbytes', 'dstips' or 'srcips': {ip: {'pkts', 'spkts', 'stime', 'uid': [..]}}}}
+        """
+        aggregate_key = self.get_aggregate_key(profileid_twid, key_name)
+        fields = self.r.hgetall(aggregate_key)
+        if not fields:
+            return {}
+
+        data = {}
+        # the keys of the uid lists we need to get, and where to store each of them
+        uid_lists = []
+        for field, value in fields.items():
+            field = field.split('|')
+            entry = data.setdefault(field[0], {})
+            if len(field) == 2:
+                # ip or port counters
+                attribute = field[1]
+                if attribute == 'stime':
+                    entry['stime'] = value
+                    continue
+
+                entry[attribute] = int(value)
+                if attribute == 'totalflows' and 'IPs' in key_name:
+                    entry.setdefault('dstports', {})
+                    entry['uid'] = []
+                    uid_lists.append((f'{aggregate_key}|uid|{field[0]}', entry))
+
+            elif field[1] == 'dstports':
+                # the spkts sent to this port of this ip
+                entry.setdefault('dstports', {})[field[2]] = int(value)
+
+            else:
+                # the ips that used this port
+                port, ip_key, ip, attribute = field
+                ip_data = entry.setdefault(ip_key, {}).setdefault(ip, {})
+                if attribute == 'stime':
+                    ip_data['stime'] = value
+                    continue
+
+                ip_data[attribute] = int(value)
+                if attribute == 'pkts':
+                    ip_data['uid'] = []
+                    uid_lists.append((f'{aggregate_key}|uid|{port}|{ip}', ip_data))
+
+        pipe = self.r.pipeline(transaction=False)
+        for uid_list, _ in uid_lists:
+            pipe.lrange(uid_list, 0, -1)
+        for (_, entry), uids in zip(uid_lists, pipe.execute()):
+            entry['uid'] = uids
+        return data
+
+    def add_ips(self, profileid, twid, ip_as_obj, flow, role: str):
         """
         Function to add information about an IP address
         The flow can go out of the IP (we are acting as Client) or into the IP
         (we are acting as Server)
         ip_as_obj: IP to add. It can be a dstIP or srcIP depending on the role
+        flow: the Conn record of the flow
         role: 'Client' or 'Server'
         This function does two things:
             1- Add the ip to this tw in this profile, counting how many times
@@ -355,20 +519,17 @@ class ProfilingFlowsDatabase(object):
         """
 
         # Get the fields
-        dport = columns['dport']
-        totbytes = columns['bytes']
-        pkts = columns['pkts']
-        spkts = columns['spkts']
-        state = columns['state']
-        proto = columns['proto'].upper()
-        daddr = columns['daddr']
-        saddr = columns['saddr']
-        uid = columns['uid']
-        starttime = str(columns['starttime'])
+        dport = flow.dport
+        totbytes = flow.bytes
+        pkts = flow.pkts
+        spkts = flow.spkts
+        state = flow.state
+        proto = flow.proto.upper()
+        daddr = flow.daddr
+        saddr = flow.saddr
+        uid = flow.uid
+        starttime = str(flow.starttime)
         ip = str(ip_as_obj)
-        # dpkts = columns.get('dpkts', 0)
-        # sport = columns['sport']
-        # sbytes = columns['sbytes']
 
 
         """
@@ -393,7 +554,7 @@ class ProfilingFlowsDatabase(object):
         #############
 
         # OTH means that we didnt see the true src ip and dst ip
-        if columns['state'] != 'OTH':
+        if state != 'OTH':
             self.ask_for_ip_info(saddr, profileid, twid, proto, starttime, uid, 'srcip', daddr=daddr)
             self.ask_for_ip_info(daddr, profileid, twid, proto, starttime, uid, 'dstip')
 
@@ -403,19 +564,14 @@ class ProfilingFlowsDatabase(object):
         # Get the state. Established, NotEstablished
         summaryState = self.getFinalStateFromFlags(state, pkts)
 
-        # Get the previous data about this key
-        old_profileid_twid_data = self.getDataFromProfileTW(
-            profileid,
-            twid,
-            direction,
-            summaryState,
-            proto,
-            role,
-            'IPs',
+        key_name = (
+            f'{direction}IPs{role}{proto}{summaryState}'
         )
-
-        profileid_twid_data = self.update_ip_info(
-            old_profileid_twid_data,
+        aggregate_key = self.get_aggregate_key(
+            f'{profileid}{self.separator}{twid}', key_name
+        )
+        self.update_ip_info(
+            aggregate_key,
             pkts,
             dport,
             spkts,
@@ -424,22 +580,11 @@ class ProfilingFlowsDatabase(object):
             starttime,
             uid
         )
-
-        proto = proto.upper()
-        key_name = (
-            f'{direction}IPs{role}{proto}{summaryState}'
-        )
-        # Store this data in the profile hash
-        self.r.hset(
-            f'{profileid}{self.separator}{twid}',
-            key_name,
-            json.dumps(profileid_twid_data)
-        )
         return True
 
     def update_ip_info(
         self,
-        old_profileid_twid_data,
+        aggregate_key,
         pkts,
         dport,
         spkts,
@@ -453,38 +598,17 @@ class ProfilingFlowsDatabase(object):
         the total flows sent by this ip and their uids,
         the total packets sent by this ip,
         total bytes sent by this ip
-        """
-        dport = str(dport)
-        spkts = int(spkts)
-        pkts = int(pkts)
-        totbytes = int(totbytes)
-
-        try:
-            # update info about an existing ip
-            ip_data = old_profileid_twid_data[ip]
-            ip_data['totalflows'] += 1
-            ip_data['totalpkt'] += pkts
-            ip_data['totalbytes'] += totbytes
-            ip_data['uid'].append(uid)
-            if dport in ip_data['dstports']:
-                ip_data['dstports'][dport] += spkts
-            else:
-                ip_data['dstports'][dport] = spkts
-
-        except KeyError:
-            # First time seeing this ip
-            ip_data = {
-                'totalflows': 1,
-                'totalpkt': pkts,
-                'totalbytes': totbytes,
-                'stime': starttime,
-                'uid': [uid],
-                'dstports': {dport: spkts}
-
-            }
-
-        old_profileid_twid_data[ip] = ip_data
-        return old_profileid_twid_data
+        all of them are updated in redis without reading the old values,
+        see get_aggregated_data() for how they're stored
+        """
+        with self.pipeline():
+            self.write('hincrby', aggregate_key, f'{ip}|totalflows', 1)
+            self.write('hincrby', aggregate_key, f'{ip}|totalpkt', int(pkts))
+            self.write('hincrby', aggregate_key, f'{ip}|totalbytes', int(totbytes))
+            # only set if it's the first time seeing this ip
+            self.write('hsetnx', aggregate_key, f'{ip}|stime', starttime)
+            self.write('hincrby', aggregate_key, f'{ip}|dstports|{dport}', int(spkts))
+            self.write('rpush', f'{aggregate_key}|uid|{ip}', uid)
 
     def print(self, text, verbose=1, debug=0):
         """
@@ -509,12 +633,21 @@ class ProfilingFlowsDatabase(object):
             pass
 
     def add_tuple(
-        self, profileid, twid, tupleid, data_tuple, role, starttime, uid
+        self, profileid, twid, tupleid, letters, role, starttime, uid, callback=None
     ):
         """
         Add the tuple going in or out for this profile
+        Each tuple is stored in the hash profile_<ip>_<tw>_OutTuples or InTuples
+        with 2 fields, the tupleid holding the symbols so far,
+        and <tupleid>|timestamps holding the ts of the last 2 flows.
+        The symbol of this flow is computed and appended by the add_tuple_script in 1 round trip
         :param tupleid: daddr:dport:proto
+        :param letters: the letter of this flow for each periodicity -1, 1, 2, 3 and 4
+        :param callback: called with the symbol added and the ts of the 2 previous flows
+        once the tuple is added, useful inside a unit of work, see Database.pipeline()
         role: 'Client' or 'Server'
+        returns the symbol added and the ts of the 2 previous flows in this tuple,
+        or None if the tuple was queued in a unit of work
         """
         # If the traffic is going out it is part of our outtuples, if not, part of our intuples
         if role == 'Client':
@@ -524,44 +657,17 @@ class ProfilingFlowsDatabase(object):
 
         try:
             self.print(
-                'Add_tuple called with profileid {}, twid {}, tupleid {}, data {}'.format(
-                    profileid, twid, tupleid, data_tuple
+                'Add_tuple called with profileid {}, twid {}, tupleid {}, letters {}'.format(
+                    profileid, twid, tupleid, letters
                 ),3,0,
             )
-            # Get all the InTuples or OutTuples for this profileid in this TW
-            profileid_twid = f'{profileid}{self.separator}{twid}'
-            tuples = self.r.hget(profileid_twid, direction)
-            # Separate the symbold to add and the previous data
-            (symbol_to_add, previous_two_timestamps) = data_tuple
-            if not tuples:
-                # Must be str so we can convert later
-                tuples = '{}'
-            # Convert the json str to a dictionary
-            tuples = json.loads(tuples)
-            try:
-                tuples[tupleid]
-                # Disasemble the input
-                self.print(
-                    'Not the first time for tuple {} as an {} for {} in TW {}. '
-                    'Add the symbol: {}. Store previous_times: {}. Prev Data: {}'.format(
-                        tupleid,
-                        direction,
-                        profileid,
-                        twid,
-                        symbol_to_add,
-                        previous_two_timestamps,
-                        tuples,
-                    ),3,0,
-                )
-                # Get the last symbols of letters in the DB
-                prev_symbols = tuples[tupleid][0]
-                # Add it to form the string of letters
-                new_symbol = f'{prev_symbols}{symbol_to_add}'
-                # Bundle the data together
-                new_data = (new_symbol, previous_two_timestamps)
+            tuples_key = f'{profileid}{self.separator}{twid}{self.separator}{direction}'
+
+            def tuple_added(result):
+                symbol, new_symbol, last_last_ts, last_ts = result
                 # analyze behavioral model with lstm model if the length is divided by 3 -
                 # so we send when there is 3 more characters added
-                if len(new_symbol) % 3 == 0:
+                if new_symbol:
                     to_send = {
                         'new_symbol': new_symbol,
                         'profileid': profileid,
@@ -572,30 +678,21 @@ class ProfilingFlowsDatabase(object):
                     }
                     to_send = json.dumps(to_send)
                     self.publish('new_letters', to_send)
-                tuples[tupleid] = new_data
-                self.print(
-                    '\tLetters so far for tuple {}: {}'.format(
-                        tupleid, new_symbol
-                    ),3,0,
-                )
-                tuples = json.dumps(tuples)
-            except (TypeError, KeyError):
-                # TODO check that this condition is triggered correctly only for the first case and not the rest after...
-                # There was no previous data stored in the DB
-                self.print(
-                    'First time for tuple {} as an {} for {} in TW {}'.format(
-                        tupleid, direction, profileid, twid
-                    ),3,0,
-                )
-                # Here get the info from the ipinfo key
-                new_data = (symbol_to_add, previous_two_timestamps)
-                tuples[tupleid] = new_data
-                # Convet the dictionary to json
-                tuples = json.dumps(tuples)
-            # Store the new data on the db
-            self.r.hset(profileid_twid, direction, str(tuples))
+
+                last_last_ts = float(last_last_ts) if last_last_ts else False
+                last_ts = float(last_ts) if last_ts else False
+                if callback:
+                    callback(symbol, (last_last_ts, last_ts))
+                return symbol, (last_last_ts, last_ts)
+
             # Mark the tw as modified
             self.markProfileTWAsModified(profileid, twid, starttime)
+            return self.run_script(
+                self.add_tuple_script,
+                [tuples_key],
+                [tupleid, float(starttime), letters],
+                callback=tuple_added
+            )
         except Exception as inst:
             exception_line = sys.exc_info()[2].tb_lineno
             self.outputqueue.put(
@@ -604,6 +701,24 @@ class ProfilingFlowsDatabase(object):
             self.outputqueue.put(
                 '01|database|[DB] {}'.format(traceback.format_exc())
             )
+            return False, (False, False)
+
+    def get_tuples(self, profileid, twid, direction) -> dict:
+        """
+        returns the tuples of the given direction in this tw in the form
+        {tupleid: [symbols, [last_last_ts, last_ts]]}
+        :param direction: OutTuples or InTuples
+        """
+        fields = self.r.hgetall(
+            f'{profileid}{self.separator}{twid}{self.separator}{direction}'
+        )
+        tuples = {}
+        for field, value in fields.items():
+            if field.endswith('|timestamps'):
+                continue
+            timestamps = fields.get(f'{field}|timestamps', ',').split(',')
+            tuples[field] = [value, [float(ts) if ts else False for ts in timestamps]]
+        return tuples
 
     def getSlipsInternalTime(self):
         return self.r.get('slips_internal_time')
@@ -685,31 +800,131 @@ class ProfilingFlowsDatabase(object):
     def markProfileTWAsModified(self, profileid, twid, timestamp):
         """
         Mark a TW in a profile as modified
-        This means:
-        1- To add it to the list of ModifiedTW
-        2- Add the timestamp received to the time_of_last_modification
-           in the TW itself
-        3- To update the internal time of slips
-        4- To check if we should 'close' some TW
-        """
-        timestamp = time.time()
-        data = {
-            f'{profileid}{self.separator}{twid}': float(timestamp)
-        }
-        self.r.zadd('ModifiedTW', data)
-        self.publish(
-            'tw_modified',
-            f'{profileid}:{twid}'
+        In the process running the tw_closer thread, the marks are kept in memory and stored
+        in the db by flush_modified_tws() every modified_tws_flush_interval seconds, so a TW
+        modified many times in this interval is only stored and published once
+        """
+        now = time.time()
+        if not self.closing_tws:
+            # nothing would flush the marks of this process
+            self.r.zadd('ModifiedTW', {f'{profileid}{self.separator}{twid}': now})
+            self.publish('tw_modified', f'{profileid}:{twid}')
+            return
+        with self.modified_tws_lock:
+            self.modified_tws[(profileid, twid)] = now
+        if now - self.last_modified_tws_flush >= self.modified_tws_flush_interval:
+            self.flush_modified_tws()
+
+    def flush_modified_tws(self):
+        """
+        Stores the TWs modified since the last flush in the ModifiedTW list of the db,
+        publishes 1 tw_modified msg per modified TW, and schedules them to be closed
+        """
+        with self.modified_tws_lock:
+            modified_tws, self.modified_tws = self.modified_tws, {}
+            self.last_modified_tws_flush = time.time()
+        if not modified_tws:
+            return
+
+        self.r.zadd(
+            'ModifiedTW',
+            {
+                f'{profileid}{self.separator}{twid}': modified
+                for (profileid, twid), modified in modified_tws.items()
+            }
+        )
+        for (profileid, twid), modified in modified_tws.items():
+            self.publish('tw_modified', f'{profileid}:{twid}')
+            self.schedule_tw_closing(f'{profileid}{self.separator}{twid}', modified)
+
+    def schedule_tw_closing(self, profileid_tw, modified):
+        """
+        The TW is closed when it's not modified for a whole TW width.
+        Each TW has 1 entry in the tws_to_close heap, when a TW is modified again
+        only its deadline in tw_deadlines is updated, its entry in the heap is moved when it's popped
+        """
+        deadline = modified + self.width
+        with self.modified_tws_lock:
+            if profileid_tw not in self.tw_deadlines:
+                heapq.heappush(self.tws_to_close, (deadline, profileid_tw))
+            self.tw_deadlines[profileid_tw] = deadline
+
+    def close_expired_tws(self):
+        """
+        Closes the TWs modified by this process that
+        weren't modified for a whole TW width before the slips internal time
+        """
+        sit = float(self.getSlipsInternalTime())
+        expired = []
+        with self.modified_tws_lock:
+            while self.tws_to_close and self.tws_to_close[0][0] <= sit:
+                deadline, profileid_tw = heapq.heappop(self.tws_to_close)
+                current_deadline = self.tw_deadlines[profileid_tw]
+                if current_deadline > deadline:
+                    # modified after this entry was added
+                    heapq.heappush(self.tws_to_close, (current_deadline, profileid_tw))
+                    continue
+                expired.append(profileid_tw)
+        if not expired:
+            return
+
+        # other processes may have modified these tws since this process did,
+        # their last modification is in the db
+        pipe = self.r.pipeline()
+        for profileid_tw in expired:
+            pipe.zscore('ModifiedTW', profileid_tw)
+        last_modifications = pipe.execute()
+
+        to_close = []
+        with self.modified_tws_lock:
+            for profileid_tw, last_modification in zip(expired, last_modifications):
+                # this process may have modified it again while reading the db
+                deadline = self.tw_deadlines[profileid_tw]
+                if last_modification is not None:
+                    deadline = max(deadline, last_modification + self.width)
+                if deadline > sit:
+                    heapq.heappush(self.tws_to_close, (deadline, profileid_tw))
+                    self.tw_deadlines[profileid_tw] = deadline
+                    continue
+                del self.tw_deadlines[profileid_tw]
+                if last_modification is not None:
+                    # otherwise another process closed it already
+                    to_close.append(profileid_tw)
+
+        for profileid_tw in to_close:
+            self.print(
+                f'The profile id {profileid_tw} has to be closed because it was'
+                f' not modified in the last {self.width} seconds. Current time {sit}.',
+                3,
+                0,
             )
-        # Check if we should close some TW
-        self.check_TW_to_close()
+            self.markProfileTWAsClosed(profileid_tw)
+
+    def start_tw_closer(self):
+        """
+        Starts the thread that stores the modified TWs and closes the old ones
+        every modified_tws_flush_interval seconds, even if no new flows arrive
+        """
+        self.closing_tws = True
+        threading.Thread(target=self.tw_closer, daemon=True).start()
+
+    def tw_closer(self):
+        while True:
+            time.sleep(self.modified_tws_flush_interval)
+            try:
+                self.flush_modified_tws()
+                self.close_expired_tws()
+            except Exception as ex:
+                exception_line = sys.exc_info()[2].tb_lineno
+                self.print(f'Problem on tw_closer() line {exception_line}', 0, 1)
+                self.print(traceback.format_exc(), 0, 1)
 
     def add_port(
         self,
         profileid: str,
         twid: str,
         ip_address: str,
-        columns: dict,
+        flow,
         role: str,
         port_type: str,
     ):
@@ -718,23 +933,20 @@ class ProfilingFlowsDatabase(object):
         The flow can go out of the IP (we are acting as Client) or into the IP (we are acting as Server)
         role: 'Client' or 'Server'. Client also defines that the flow is going out, Server that is going in
         port_type: 'Dst' or 'Src'. Depending if this port was a destination port or a source port
-        """
-        # Extract variables from columns
-        dport = columns['dport']
-        sport = columns['sport']
-        totbytes = int(columns['bytes'])
-        pkts = int(columns['pkts'])
-        state = columns['state']
-        proto = columns['proto'].upper()
-        starttime = str(columns['starttime'])
-        uid = columns['uid']
+        flow: the Conn record of the flow
+        """
+        # Extract variables from the flow
+        dport = flow.dport
+        sport = flow.sport
+        totbytes = int(flow.bytes)
+        pkts = int(flow.pkts)
+        state = flow.state
+        proto = flow.proto.upper()
+        starttime = str(flow.starttime)
+        uid = flow.uid
         ip = str(ip_address)
-        spkts = columns['spkts']
-        state_hist = columns.get('state_hist','')
-        # dpkts = columns['dpkts']
-        # daddr = columns['daddr']
-        # saddr = columns['saddr']
-        # sbytes = columns['sbytes']
+        spkts = flow.spkts
+        state_hist = flow.state_hist
 
         if '^' in state_hist:
             # The majority of the FP with horizontal port scan detection happen because a
@@ -758,57 +970,20 @@ class ProfilingFlowsDatabase(object):
         # Get the state. Established, NotEstablished
         summaryState = self.getFinalStateFromFlags(state, pkts)
 
-        old_profileid_twid_data = self.getDataFromProfileTW(
-            profileid,
-            twid,
-            port_type,
-            summaryState,
-            proto,
-            role,
-            'Ports'
+        key_name = f'{port_type}Ports{role}{proto}{summaryState}'
+        aggregate_key = self.get_aggregate_key(
+            f'{profileid}{self.separator}{twid}', key_name
         )
-
-        try:
-            # we already have info about this dport, update it
-            port_data = old_profileid_twid_data[port]
-            port_data['totalflows'] += 1
-            port_data['totalpkt'] += pkts
-            port_data['totalbytes'] += totbytes
-
+        # see get_aggregated_data() for how these are stored
+        with self.pipeline():
+            self.write('hincrby', aggregate_key, f'{port}|totalflows', 1)
+            self.write('hincrby', aggregate_key, f'{port}|totalpkt', pkts)
+            self.write('hincrby', aggregate_key, f'{port}|totalbytes', totbytes)
             # if there's a conn from this ip on this port, add the pkts
-            if ip in port_data[ip_key]:
-                port_data[ip_key][ip]['pkts'] += pkts
-                port_data[ip_key][ip]['spkts'] += spkts
-                port_data[ip_key][ip]['uid'].append(uid)
-            else:
-                port_data[ip_key][ip] = {
-                    'pkts': pkts,
-                    'spkts': spkts,
-                    'stime': starttime,
-                    'uid': [uid]
-                }
-
-        except KeyError:
-            # First time for this dport
-            port_data = {
-                'totalflows': 1,
-                'totalpkt': pkts,
-                'totalbytes': totbytes,
-                ip_key: {
-                    ip: {
-                        'pkts': pkts,
-                        'spkts': spkts,
-                        'stime': starttime,
-                        'uid': [uid]
-                    }
-                }
-            }
-
-        old_profileid_twid_data[port] = port_data
-        data = json.dumps(old_profileid_twid_data)
-        hash_key = f'{profileid}{self.separator}{twid}'
-        key_name = f'{port_type}Ports{role}{proto}{summaryState}'
-        self.r.hset(hash_key, key_name, str(data))
+            self.write('hincrby', aggregate_key, f'{port}|{ip_key}|{ip}|pkts', pkts)
+            self.write('hincrby', aggregate_key, f'{port}|{ip_key}|{ip}|spkts', int(spkts))
+            self.write('hsetnx', aggregate_key, f'{port}|{ip_key}|{ip}|stime', starttime)
+            self.write('rpush', f'{aggregate_key}|uid|{port}|{ip}', uid)
         self.markProfileTWAsModified(profileid, twid, starttime)
 
     def add_flow(
@@ -833,11 +1008,15 @@ class ProfilingFlowsDatabase(object):
         uid='',
         label='',
         flow_type='',
+        state_hist='',
     ):
         """
         Function to add a flow by interpreting the data. The flow is added to the correct TW for this profile.
         The profileid is the main profile that this flow is related too.
         : param new_profile_added : is set to True for everytime we see a new srcaddr
+        returns True if the flow was added, False if it's a duplicate
+        and None if it was queued in a unit of work
+        : param state_hist: the history of flags of the flow, only sent in the new_flow msg
         """
         summaryState = self.getFinalStateFromFlags(state, pkts)
         flow = {
@@ -862,47 +1041,42 @@ class ProfilingFlowsDatabase(object):
             'module_labels': {},
         }
 
-        # Convert to json string
-        flow = json.dumps(flow)
-        # Store in the hash x.x.x.x_timewindowx_flows
-        value = self.r.hset(
-            f'{profileid}{self.separator}{twid}{self.separator}flows',
-            uid,
-            flow,
-        )
-        if not value:
-            # duplicate flow
-            return False
+        def flow_added(value):
+            if not value:
+                # duplicate flow
+                return False
 
-        # The key was not there before. So this flow is not repeated
-        # Store the label in our uniq set, and increment it by 1
-        if label:
-            self.r.zincrby('labels', 1, label)
+            # The key was not there before. So this flow is not repeated
+            # Store the label in our uniq set, and increment it by 1
+            if label:
+                self.write('zincrby', 'labels', 1, label)
+            if self.ensembling_enabled:
+                # the flow doesn't have module labels yet so it's normal until they're set
+                self.count_dstip_label(profileid, twid, daddr, self.normal_label)
 
-        flow = {uid: flow}
+            # Prepare the data to publish.
+            to_send = encode_flow_msg(profileid, twid, stime, uid, flow, state_hist=state_hist)
 
-        # Get the dictionary and convert to json string
-        flow = json.dumps(flow)
-        # Prepare the data to publish.
-        to_send = {
-            'profileid': profileid,
-            'twid': twid,
-            'flow': flow,
-            'stime': stime,
-        }
-        to_send = json.dumps(to_send)
+            # set the pcap/file stime in the analysis key
+            if self.first_flow:
+                self.set_input_metadata({'file_start': stime})
+                self.first_flow = False
 
-        # set the pcap/file stime in the analysis key
-        if self.first_flow:
-            self.set_input_metadata({'file_start': stime})
-            self.first_flow = False
+            self.set_local_network(saddr)
 
-        self.set_local_network(saddr)
+            # dont send arp flows in this channel, they have their own new_arp channel
+            if flow_type != 'arp':
+                self.publish('new_flow', to_send)
+            return True
 
-        # dont send arp flows in this channel, they have their own new_arp channel
-        if flow_type != 'arp':
-            self.publish('new_flow', to_send)
-        return True
+        # Store in the hash x.x.x.x_timewindowx_flows
+        return self.write(
+            'hset',
+            f'{profileid}{self.separator}{twid}{self.separator}flows',
+            uid,
+            json.dumps(flow),
+            callback=flow_added
+        )
     def set_local_network(self, saddr):
         # set the local network used in the db
         if self.is_localnet_set:
@@ -1033,20 +1207,15 @@ class ProfilingFlowsDatabase(object):
             'is_DoH': is_DoH,
         }
         # TODO do something with is_doh
+        to_send = encode_flow_msg(profileid, twid, stime, uid, data)
         # Convert to json string
         data = json.dumps(data)
-        self.r.hset(
+        self.write(
+            'hset',
             f'{profileid}{self.separator}{twid}{self.separator}altflows',
             uid,
             data,
         )
-        to_send = {
-            'profileid': profileid,
-            'twid': twid,
-            'flow': data,
-            'stime': stime,
-        }
-        to_send = json.dumps(to_send)
         self.publish('new_ssl', to_send)
         self.print('Adding SSL flow to DB: {}'.format(data), 3, 0)
         # Check if the server_name (SNI) is detected by the threat intelligence. Empty field in the end, cause we have extrafield for the IP.
@@ -1096,11 +1265,11 @@ class ProfilingFlowsDatabase(object):
         """
         # Get the previous info already stored
         data = self.getIPData(ip)
-        if data is False:
-            # This IP is not in the dictionary, add it first:
-            self.setNewIP(ip)
-            # Now get the data, which should be empty, but just in case
-            data = self.getIPData(ip)
+        is_new_ip = data is False
+        if is_new_ip:
+            # This IP is not in the dictionary, it's stored below instead of using
+            # setNewIP() because that one may be queued in a unit of work
+            data = {}
 
         new_key = False
         for key, val in ipdata.items():
@@ -1111,6 +1280,9 @@ class ProfilingFlowsDatabase(object):
             data[key] = val
 
         self.rcache.hset('IPsInfo', ip, json.dumps(data))
+        if is_new_ip:
+            self.seen_items['IPsInfo'].add(ip)
+            self.publish('new_ip', ip)
         if new_key:
             self.r.publish('ip_info_change', ip)
 
@@ -1205,34 +1377,22 @@ class ProfilingFlowsDatabase(object):
             'stime': stime,
             'daddr': daddr,
         }
+        to_send = encode_flow_msg(profileid, twid, stime, uid, data)
         # Convert to json string
         data = json.dumps(data)
 
-        self.r.hset(
+        self.write(
+            'hset',
             f'{profileid}{ self.separator }{twid}{ self.separator }altflows',
             uid,
             data,
         )
 
-        http_flow = {
-            'profileid': profileid,
-            'twid': twid,
-            'flow': data,
-            'stime': stime,
-        }
-        to_send = json.dumps(http_flow)
         self.publish('new_http', to_send)
         self.publish('new_url', to_send)
 
         self.print('Adding HTTP flow to DB: {}'.format(data), 3, 0)
 
-        http_flow.pop('flow', None)
-        http_flow.update(
-            {
-                'uid': uid,
-            }
-        )
-
         # Check if the host domain AND the url is detected by the threat intelligence.
         # not all flows have a host value so don't send empty hosts to ti module.
         if len(host) > 2:
@@ -1287,24 +1447,17 @@ class ProfilingFlowsDatabase(object):
             'stime': stime,
             'daddr': daddr
         }
+        to_send = encode_flow_msg(profileid, twid, stime, uid, data)
         # Convert to json string
         data = json.dumps(data)
         # Set the dns as alternative flow
-        self.r.hset(
+        self.write(
+            'hset',
             f'{profileid}{self.separator}{twid}{self.separator}altflows',
             uid,
             data,
         )
-        # Publish the new dns received
-        to_send = {
-            'profileid': profileid,
-            'twid': twid,
-            'flow': data,
-            'stime': stime,
-            'uid': uid,
-        }
-        to_send = json.dumps(to_send)
-        # publish a dns with its flow
+        # publish the ssh with its flow
         self.publish('new_ssh', to_send)
         self.print('Adding SSH flow to DB: {}'.format(data), 3, 0)
         # Check if the dns is detected by the threat intelligence. Empty field in the end, cause we have extrafield for the IP.
@@ -1337,18 +1490,10 @@ class ProfilingFlowsDatabase(object):
             'scanning_ip': scanning_ip,
             'stime': stime,
         }
-        data = json.dumps(
-            data
-        )   # this is going to be sent insidethe to_send dict
-        to_send = {
-            'profileid': profileid,
-            'twid': twid,
-            'flow': data,
-            'stime': stime,
-            'uid': uid,
-        }
-        to_send = json.dumps(to_send)
-        self.r.hset(
+        to_send = encode_flow_msg(profileid, twid, stime, uid, data)
+        data = json.dumps(data)
+        self.write(
+            'hset',
             f'{profileid}{self.separator}{twid}{self.separator}altflows',
             uid,
             data,
@@ -1537,16 +1682,7 @@ class ProfilingFlowsDatabase(object):
         2- Publishes in the channels that there is a new domain, and that we want
             data from the Threat Intelligence modules
         """
-        data = self.getDomainData(domain)
-        if data is False:
-            # If there is no data about this domain
-            # Set this domain for the first time in the DomainsInfo
-            # Its VERY important that the data of the first time we see a domain
-            # must be '{}', an empty dictionary! if not the logic breaks.
-            # We use the empty dictionary to find if a domain exists or not
-            self.rcache.hset('DomainsInfo', domain, '{}')
-            # Publish that there is a new domain ready in the channel
-            self.publish('new_dns', domain)
+        self.set_new_item('DomainsInfo', domain, channel='new_dns')
 
     def setInfoForDomains(self, domain: str, info_to_set: dict, mode='leave'):
         """
@@ -1561,11 +1697,14 @@ class ProfilingFlowsDatabase(object):
 
         # Get the previous info already stored
         domain_data = self.getDomainData(domain)
-        if not domain_data:
-            # This domain is not in the dictionary, add it first:
-            self.setNewDomain(domain)
-            # Now get the data, which should be empty, but just in case
-            domain_data = self.getDomainData(domain)
+        if domain_data is False:
+            # This domain is not in the dictionary, add it first.
+            # setNewDomain() may be queued in a unit of work, so the
+            # domain is stored and published here
+            self.rcache.hset('DomainsInfo', domain, '{}')
+            self.seen_items['DomainsInfo'].add(domain)
+            self.publish('new_dns', domain)
+            domain_data = {}
 
         # Let's check each key stored for this domain
         for key in iter(info_to_set):
@@ -1654,28 +1793,26 @@ class ProfilingFlowsDatabase(object):
             'ttls': ttls,
             'stime': stime,
         }
+        to_send = encode_flow_msg(
+            profileid,
+            twid,
+            stime,
+            uid,
+            data,
+            rcode_name=rcode_name,
+            daddr=daddr,
+            answers=answers
+        )
 
         # Convert to json string
         data = json.dumps(data)
         # Set the dns as alternative flow
-        self.r.hset(
+        self.write(
+            'hset',
             f'{profileid}{self.separator}{twid}{self.separator}altflows',
             uid,
             data,
         )
-        # Publish the new dns received
-        to_send = {
-            'profileid': profileid,
-            'twid': twid,
-            'flow': data,
-            'stime': stime,
-            'uid': uid,
-            'rcode_name': rcode_name,
-            'daddr': daddr,
-            'answers': answers
-        }
-
-        to_send = json.dumps(to_send)
         # publish a dns with its flow
         self.publish('new_dns_flow', to_send)
         self.print('Adding DNS flow to DB: {}'.format(data), 3, 0)
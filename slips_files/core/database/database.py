@@ -1,10 +1,17 @@
 from slips_files.common.slips_utils import utils
 from slips_files.common.config_parser import ConfigParser
-from slips_files.core.database._profile_flow import ProfilingFlowsDatabase
+from slips_files.common.bloom_filter import BloomFilter
+from slips_files.common.recent_requests import RecentRequests
+from slips_files.common.seen_set import SeenSet
+from slips_files.core.database._profile_flow import (
+    ProfilingFlowsDatabase,
+    ADD_TUPLE_LUA,
+)
 import os
 import signal
 import redis
 import time
+import threading
 import json
 from typing import Tuple
 import traceback
@@ -15,6 +22,7 @@ import sys
 import validators
 import ast
 from uuid import uuid4
+from contextlib import contextmanager
 
 
 
@@ -58,6 +66,20 @@ class Database(ProfilingFlowsDatabase, object):
         'p2p_data_request',
         'p2p_gopy',
         'report_to_peers',
+        'IoC_filter_updated',
+    }
+    # high volume channels. their msgs are sent through redis streams instead of pub/sub
+    # so slow modules don't make redis buffer them for ever,
+    # and modules can continue from where they stopped after a restart
+    stream_channels = {
+        'new_flow',
+        'new_dns_flow',
+        'tw_modified',
+    }
+    # pub/sub channels whose msgs are only dispatched after the stream msgs published before them,
+    # so the modules get all the flows of a tw before it's closed
+    after_streams_channels = {
+        'tw_closed',
     }
 
     """ Database object management """
@@ -84,6 +106,34 @@ class Database(ProfilingFlowsDatabase, object):
         self.first_flow = True
         # to make sure we only detect and store the user's localnet once
         self.is_localnet_set = False
+        # number of msgs published to each stream by this process
+        self.published_to_stream = {}
+        # the lag of the consumers of a stream is checked every this many msgs published
+        self.stream_lag_check_interval = 100
+        # the labels of the flows are only counted when the ensembling module is enabled,
+        # read from slips.conf in read_configuration()
+        self.ensembling_enabled = False
+        # max msgs read to count the lag of a stream consumer in redis < 7
+        self.stream_lag_sample = 100
+        # {(profileid, twid): last modification time} of the tws modified since the last flush
+        self.modified_tws = {}
+        self.modified_tws_lock = threading.Lock()
+        self.last_modified_tws_flush = 0
+        # True in the process running the tw_closer thread, the only one that keeps
+        # the tws it modifies in memory and closes them
+        self.closing_tws = False
+        # seconds between storing the modified tws in the db
+        self.modified_tws_flush_interval = 1
+        # heap of (deadline, profileid_twid) of the tws modified by this process that aren't closed yet
+        self.tws_to_close = []
+        # {profileid_twid: the time this tw should be closed if it's not modified again}
+        self.tw_deadlines = {}
+        # the TI and p2p requests about IPs sent recently, see ask_for_ip_info()
+        self.ip_info_requests = RecentRequests(ttl=300)
+        # number of suppressed requests already added to the analysis info in the db
+        self.reported_suppressed_requests = 0
+        # the writes queued by the unit of work in progress in each thread, see pipeline()
+        self.unit_of_work = threading.local()
 
 
     def set_redis_options(self):
@@ -167,12 +217,29 @@ class Database(ProfilingFlowsDatabase, object):
                 decode_responses=True,
                 health_check_interval=30,
             )  # password='password')
+            # same as rcache, used for the values that aren't strings, like the IoC filter
+            self.rcache_raw = redis.StrictRedis(
+                host='localhost',
+                port=6379,
+                db=1,
+                socket_keepalive=True,
+                retry_on_timeout=True,
+                health_check_interval=30,
+            )
             # the connection to redis is only established
             # when you try to execute a command on the server.
             # so make sure it's established first
             # fix  ConnectionRefused error by giving redis time to open
             time.sleep(1)
             self.r.client_list()
+            # the script is loaded to redis the first time it's used
+            self.add_tuple_script = self.r.register_script(ADD_TUPLE_LUA)
+            # {hash in the cache db: the items known to be stored in it}, see set_new_item()
+            self.seen_items = {
+                'IPsInfo': SeenSet(),
+                'DomainsInfo': SeenSet(),
+                'URLsInfo': SeenSet(),
+            }
             return True
         except redis.exceptions.ConnectionError as ex:
             # unable to connect to this port
@@ -187,6 +254,116 @@ class Database(ProfilingFlowsDatabase, object):
                 self.close_redis_server(port)
             return False
 
+    @contextmanager
+    def pipeline(self):
+        """
+        Unit of work: the writes and publishes done by the db methods called inside this context
+        are queued and sent to redis when it exits, in 1 round trip per connection
+        instead of 1 per command.
+        usage:
+            with __database__.pipeline():
+                __database__.add_ips(...)
+                __database__.add_flow(...)
+        Can be used for 1 flow or for a batch of them. Reads aren't queued, they go to redis directly.
+        Nested contexts join the outer one. The queued writes are discarded if an exception is raised.
+        """
+        if getattr(self.unit_of_work, 'pipes', None) is not None:
+            # the outer unit of work sends everything
+            yield
+            return
+
+        self.unit_of_work.pipes = {}
+        self.unit_of_work.callbacks = []
+        try:
+            yield
+            self.execute_unit_of_work()
+        finally:
+            self.unit_of_work.pipes = None
+            self.unit_of_work.callbacks = []
+
+    def execute_unit_of_work(self):
+        """
+        sends the writes queued by the unit of work in progress
+        and calls the callbacks of the commands with their results.
+        the writes done by the callbacks are sent in the next round trip
+        """
+        while self.unit_of_work.pipes:
+            pipes = self.unit_of_work.pipes
+            callbacks = self.unit_of_work.callbacks
+            self.unit_of_work.pipes = {}
+            self.unit_of_work.callbacks = []
+
+            results = {
+                connection_id: pipe.execute()
+                for connection_id, pipe in pipes.items()
+            }
+            for connection_id, idx, callback in callbacks:
+                callback(results[connection_id][idx])
+
+    def get_unit_of_work_pipeline(self, connection):
+        """
+        returns the pipeline of the unit of work in progress for the given connection,
+        or None if there's no unit of work in progress
+        """
+        pipes = getattr(self.unit_of_work, 'pipes', None)
+        if pipes is None:
+            return None
+        if id(connection) not in pipes:
+            pipes[id(connection)] = connection.pipeline(transaction=False)
+        return pipes[id(connection)]
+
+    def write(self, command: str, *args, connection=None, callback=None, **kwargs):
+        """
+        Runs the given redis command, or queues it if there's a unit of work in progress
+        :param connection: self.r by default
+        :param callback: function called with the result of the command when it's executed
+        returns the result of the callback, or of the command if there's no callback.
+        returns None if the command was queued
+        """
+        connection = connection or self.r
+        pipe = self.get_unit_of_work_pipeline(connection)
+        if pipe is None:
+            result = getattr(connection, command)(*args, **kwargs)
+            return callback(result) if callback else result
+
+        getattr(pipe, command)(*args, **kwargs)
+        if callback:
+            self.unit_of_work.callbacks.append((id(connection), len(pipe) - 1, callback))
+
+    def run_script(self, script, keys: list, args: list, callback=None):
+        """
+        Same as write() but runs one of the lua scripts registered in self.r
+        """
+        pipe = self.get_unit_of_work_pipeline(self.r)
+        if pipe is None:
+            result = script(keys=keys, args=args)
+            return callback(result) if callback else result
+
+        script(keys=keys, args=args, client=pipe)
+        if callback:
+            self.unit_of_work.callbacks.append((id(self.r), len(pipe) - 1, callback))
+
+    def set_new_item(self, hash_name: str, item: str, channel: str = None):
+        """
+        Stores the given IP, domain or URL in the given hash of the cache db with '{}' as its data
+        if it's not there yet, and publishes it in the given channel only if it was added.
+        The items already stored are remembered in self.seen_items, so checking
+        them again doesn't need redis
+        """
+        seen = self.seen_items[hash_name]
+        if item in seen:
+            return
+
+        def item_added(is_new):
+            seen.add(item)
+            if is_new and channel:
+                self.publish(channel, item)
+
+        # Its VERY important that the data of the first time we see an item
+        # must be '{}', an empty dictionary! if not the logic breaks.
+        # We use the empty dictionary to find if an item exists or not
+        self.write('hsetnx', hash_name, item, '{}', connection=self.rcache, callback=item_added)
+
     def set_slips_mode(self, slips_mode):
         """
         function to store the current mode (daemonized/interactive)
@@ -222,6 +399,11 @@ class Database(ProfilingFlowsDatabase, object):
         self.disabled_detections = conf.disabled_detections()
         self.home_network = conf.get_home_network()
         self.width = conf.get_tw_width_as_float()
+        self.stream_max_len = conf.stream_max_len()
+        self.stream_max_lag = conf.stream_max_lag()
+        self.ip_info_requests.ttl = conf.ip_info_request_ttl()
+        # the labels of the flows are only counted for the ensembling module
+        self.ensembling_enabled = 'ensembling' not in conf.modules_disabled_in_config()
 
 
     def change_redis_limits(self, redis_client):
@@ -363,7 +545,10 @@ class Database(ProfilingFlowsDatabase, object):
             if not self.should_add(profileid):
                 return False
             # Add the profile to the index. The index is called 'profiles'
-            self.r.sadd('profiles', str(profileid))
+            if not self.r.sadd('profiles', str(profileid)):
+                # another profiler worker added it after we checked,
+                # e.g. the daddr of a flow seen by a worker that doesn't own the daddr profile
+                return False
             # Create the hashmap with the profileid. The hasmap of each profile is named with the profileid
             # Add the start time of profile
             self.r.hset(profileid, 'starttime', starttime)
@@ -761,44 +946,30 @@ class Database(ProfilingFlowsDatabase, object):
             return False
         return len(self.getTWsfromProfile(profileid))
 
+    def get_times_contacted(self, profileid, twid, direction):
+        """
+        returns the json of the times each ip was contacted in this tw e.g. '{"1.1.1.1": 3}'
+        or None if there are no ips
+        :param direction: Src or Dst
+        """
+        ips = self.r.hgetall(
+            self.get_aggregate_key(profileid + self.separator + twid, f'{direction}IPs')
+        )
+        if not ips:
+            return None
+        return json.dumps({ip: int(times) for ip, times in ips.items()})
+
     def getSrcIPsfromProfileTW(self, profileid, twid):
         """
         Get the src ip for a specific TW for a specific profileid
         """
-        return self.r.hget(profileid + self.separator + twid, 'SrcIPs')
+        return self.get_times_contacted(profileid, twid, 'Src')
 
     def getDstIPsfromProfileTW(self, profileid, twid):
         """
         Get the dst ip for a specific TW for a specific profileid
         """
-        return self.r.hget(profileid + self.separator + twid, 'DstIPs')
-
-    def getT2ForProfileTW(self, profileid, twid, tupleid, tuple_key: str):
-        """
-        Get T1 and the previous_time for this previous_time, twid and tupleid
-        """
-        try:
-            hash_id = profileid + self.separator + twid
-            data = self.r.hget(hash_id, tuple_key)
-            if not data:
-                return False, False
-            data = json.loads(data)
-            try:
-                (_, previous_two_timestamps) = data[tupleid]
-                return previous_two_timestamps
-            except KeyError:
-                return False, False
-        except Exception as e:
-            exception_line = sys.exc_info()[2].tb_lineno
-            self.outputqueue.put(
-                f'01|database|[DB] Error in getT2ForProfileTW in database.py line {exception_line}'
-            )
-
-            self.outputqueue.put(f'01|database|[DB] {type(e)}')
-            self.outputqueue.put(f'01|database|[DB] {e}')
-            self.outputqueue.put(
-                f'01|profiler|[Profile] {traceback.format_exc()}'
-            )
+        return self.get_times_contacted(profileid, twid, 'Dst')
 
     def has_profile(self, profileid):
         """Check if we have the given profile"""
@@ -934,6 +1105,25 @@ class Database(ProfilingFlowsDatabase, object):
             self.outputqueue.put('01|database|Error in addNewTW')
             self.outputqueue.put(f'01|database|{e}')
 
+    def add_timewindows(self, profileid, timewindows: dict, older=False):
+        """
+        Adds the given TWs to the list of TWs of the given profile, the TWs that already exist aren't changed
+        :param timewindows: dict of {twid: start time of the tw}
+        :param older: True if the TWs are older than the first TW of this profile
+        returns the number of TWs added
+        """
+        added = self.r.zadd(f'tws{profileid}', timewindows, nx=True)
+        if not added:
+            return 0
+        self.print(
+            f'Created and added to DB for profile {profileid} the TWs {", ".join(timewindows)}', 3, 0
+        )
+        if not older:
+            # When a new TW is created for this profile,
+            # change the threat level of the profile to 0(info) and confidence to 0.05
+            self.update_threat_level(profileid, 'info',  0.5)
+        return added
+
     def getTimeTW(self, profileid, twid):
         """Return the time when this TW in this profile was created"""
         # Get all the TW for this profile
@@ -999,12 +1189,7 @@ class Database(ProfilingFlowsDatabase, object):
             key_name = [Src,Dst] + [Port,IP] + [Client,Server] + [TCP,UDP, ICMP, ICMP6] + [Established, NotEstablihed]
             Example: key_name = 'SrcPortClientTCPEstablished'
             """
-            data = self.r.hget(hash_key, key_name)
-            value = {}
-            if data:
-                portdata = json.loads(data)
-                value = portdata
-            return value
+            return self.get_aggregated_data(hash_key, key_name)
         except Exception as inst:
             exception_line = sys.exc_info()[2].tb_lineno
             self.outputqueue.put(
@@ -1013,14 +1198,14 @@ class Database(ProfilingFlowsDatabase, object):
             self.outputqueue.put('01|database|[DB] {}'.format(traceback.print_exc()))
 
     def getOutTuplesfromProfileTW(self, profileid, twid):
-        """Get the out tuples"""
-        data = self.r.hget(profileid + self.separator + twid, 'OutTuples')
-        return data
+        """Get the out tuples as a json str"""
+        if data := self.get_tuples(profileid, twid, 'OutTuples'):
+            return json.dumps(data)
 
     def getInTuplesfromProfileTW(self, profileid, twid):
-        """Get the in tuples"""
-        data = self.r.hget(profileid + self.separator + twid, 'InTuples')
-        return data
+        """Get the in tuples as a json str"""
+        if data := self.get_tuples(profileid, twid, 'InTuples'):
+            return json.dumps(data)
 
     def getFieldSeparator(self):
         """Return the field separator"""
@@ -1330,18 +1515,10 @@ class Database(ProfilingFlowsDatabase, object):
         return False
 
     def get_evidence_by_ID(self, profileid, twid, ID):
-
-        evidence = self.getEvidenceForTW(profileid, twid)
+        evidence = self.r.hget(self.get_evidence_key(profileid, twid), ID)
         if not evidence:
             return False
-
-        evidence: dict = json.loads(evidence)
-        # loop through each evidence in this tw
-        for description, evidence_details in evidence.items():
-            evidence_details = json.loads(evidence_details)
-            if evidence_details.get('ID') == ID:
-                # found an evidence that has a matching ID
-                return evidence_details
+        return json.loads(evidence)
 
     def is_detection_disabled(self, evidence_type: str):
         """
@@ -1468,34 +1645,17 @@ class Database(ProfilingFlowsDatabase, object):
         evidence_to_send = json.dumps(evidence_to_send)
 
 
-        # Check if we have and get the current evidence stored in the DB for
-        # this profileid in this twid
-        current_evidence = self.getEvidenceForTW(profileid, twid)
-        if current_evidence:
-            current_evidence = json.loads(current_evidence)
-        else:
-            current_evidence = {}
-
-        # make ure it's not a duplicate evidence
-        should_publish = False
-        if evidence_ID not in current_evidence.keys():
-            should_publish = True
-
-        # update our current evidence for this profileid and twid.
-        # now the evidence_ID is used as the key
-        current_evidence.update({evidence_ID: evidence_to_send})
-
-        # Set evidence in the database.
-        current_evidence = json.dumps(current_evidence)
-        self.r.hset(
-            profileid + self.separator + twid, 'Evidence', current_evidence
-        )
-
-        self.r.hset('evidence' + profileid, twid, current_evidence)
+        # Each evidence is stored as 1 field in the hash of this profileid and twid,
+        # the sorted set keeps the order in which they were added
+        evidence_key = self.get_evidence_key(profileid, twid)
+        is_new_evidence = self.r.hsetnx(evidence_key, evidence_ID, evidence_to_send)
 
         # This is done to ignore repetition of the same evidence sent.
-        # note that publishing HAS TO be done after updating the 'Evidence' keys
-        if should_publish:
+        # note that publishing HAS TO be done after storing the evidence
+        if is_new_evidence:
+            # a repeated evidence keeps its original place in the order
+            order = self.r.incr('evidence_sequence')
+            self.r.zadd(f'{evidence_key}{self.separator}order', {evidence_ID: order})
             self.publish('evidence_added', evidence_to_send)
 
         # an evidence is generated for this profile
@@ -1544,29 +1704,16 @@ class Database(ProfilingFlowsDatabase, object):
         """
         Delete evidence from the database
         """
-        # 1. delete evidence from 'evidence' key
-        current_evidence = self.getEvidenceForTW(profileid, twid)
-        if current_evidence:
-            current_evidence = json.loads(current_evidence)
-        else:
-            current_evidence = {}
-        # Delete the key regardless of whether it is in the dictionary
-        current_evidence.pop(evidence_ID, None)
-        current_evidence_json = json.dumps(current_evidence)
-        self.r.hset(
-            profileid + self.separator + twid,
-            'Evidence',
-            current_evidence_json,
-        )
-        self.r.hset('evidence' + profileid, twid, current_evidence_json)
+        # 1. delete evidence from the evidence keys of this tw
+        evidence_key = self.get_evidence_key(profileid, twid)
+        pipe = self.r.pipeline()
+        pipe.hdel(evidence_key, evidence_ID)
+        pipe.zrem(f'{evidence_key}{self.separator}order', evidence_ID)
+        pipe.execute()
         # 2. delete evidence from 'alerts' key
         profile_alerts = self.r.hget('alerts', profileid)
         if not profile_alerts:
             # this means that this evidence wasn't a part of an alert
-            # give redis time to the save the changes before calling this function again
-            # removing this sleep will cause this function to be called again before
-            # deleting the evidence ID from the evidence keys
-            time.sleep(0.5)
             return
 
         profile_alerts:dict = json.loads(profile_alerts)
@@ -1611,26 +1758,50 @@ class Database(ProfilingFlowsDatabase, object):
         """
         return self.r.sismember('whitelisted_evidence', evidence_ID)
 
-    def remove_whitelisted_evidence(self, all_evidence:str) -> str:
+    def get_evidence_key(self, profileid, twid) -> str:
         """
-        param all_evidence serialized json dict
-        returns a serialized json dict
+        returns the name of the hash that has all the evidence of this profileid and twid
+        the fields are the evidence IDs and the values are the serialized evidence
         """
-        # remove whitelisted evidence from the given evidence
-        all_evidence = json.loads(all_evidence)
+        return f'{profileid}{self.separator}{twid}{self.separator}evidence'
+
+    def get_evidence_since(self, profileid, twid, evidence_ID=None) -> dict:
+        """
+        Returns the evidence of this profileid and twid that were added after the given evidence ID,
+        in the order they were added. returns all the evidence of the tw if no ID is given
+        or if the given ID isn't stored anymore, e.g. it was whitelisted
+        The format for the returned dict is {evidence_ID: serialized evidence}
+        whitelisted evidence aren't returned
+        """
+        evidence_key = self.get_evidence_key(profileid, twid)
+        order_key = f'{evidence_key}{self.separator}order'
+        start = '-inf'
+        if evidence_ID:
+            score = self.r.zscore(order_key, evidence_ID)
+            if score is not None:
+                # exclusive range
+                start = f'({score}'
+
+        IDs = self.r.zrangebyscore(order_key, start, '+inf')
+        if not IDs:
+            return {}
+
         tw_evidence = {}
-        for ID,evidence in all_evidence.items():
-            if self.is_whitelisted_evidence(ID):
+        for ID, evidence in zip(IDs, self.r.hmget(evidence_key, IDs)):
+            if not evidence or self.is_whitelisted_evidence(ID):
                 continue
             tw_evidence[ID] = evidence
-        return json.dumps(tw_evidence)
+        return tw_evidence
 
     def getEvidenceForTW(self, profileid, twid):
-        """Get the evidence for this TW for this Profile"""
-        evidence = self.r.hget(profileid + self.separator + twid, 'Evidence')
+        """
+        Get the evidence for this TW for this Profile
+        returns a serialized json dict {evidence_ID: serialized evidence}
+        or None if there are no evidence
+        """
+        evidence = self.get_evidence_since(profileid, twid)
         if evidence:
-            evidence = self.remove_whitelisted_evidence(evidence)
-        return evidence
+            return json.dumps(evidence)
 
     def checkBlockedProfTW(self, profileid, twid):
         """
@@ -1641,23 +1812,6 @@ class Database(ProfilingFlowsDatabase, object):
             return True
         return False
 
-    def set_first_stage_ensembling_label_to_flow(
-        self, profileid, twid, uid, ensembling_label
-    ):
-        """
-        Add a final label to the flow
-        """
-        flow = self.get_flow(profileid, twid, uid)
-        if flow:
-            data = json.loads(flow[uid])
-            data['1_ensembling_label'] = ensembling_label
-            data = json.dumps(data)
-            self.r.hset(
-                profileid + self.separator + twid + self.separator + 'flows',
-                uid,
-                data,
-            )
-
     def set_growing_zeek_dir(self):
         """
         Mark a dir as growing so it can be treated like the zeek logs generated by an interface
@@ -1668,23 +1822,77 @@ class Database(ProfilingFlowsDatabase, object):
         """ Did slips mark the given dir as growing?"""
         return 'yes' in str(self.r.get('growing_zeek_dir'))
 
+    def get_ensembling_label(self, module_labels: dict) -> str:
+        """
+        First stage of the ensembling, the label of a flow is the majority vote
+        of the labels the modules gave it. Flows without labels are normal
+        """
+        labels = list(module_labels.values())
+        normal_label_total = labels.count(self.normal_label)
+        malicious_label_total = labels.count(self.malicious_label)
+        if (
+            malicious_label_total == normal_label_total == 0
+            or normal_label_total > malicious_label_total
+        ):
+            return self.normal_label
+        return self.malicious_label
+
+    def count_dstip_label(self, profileid, twid, daddr, label, amount=1):
+        """
+        Second stage of the ensembling, counts the normal and malicious flows to each dstip
+        in this profileid and twid as the flows are added and labeled,
+        so the tw doesn't have to be read again when it's closed
+        """
+        self.write(
+            'hincrby',
+            f'{profileid}{self.separator}{twid}{self.separator}dstip_labels',
+            f'{daddr}{self.separator}{label}',
+            amount
+        )
+
+    def get_dstip_labels(self, profileid, twid) -> dict:
+        """
+        returns the amount of normal and malicious flows to each dstip in this profileid and twid
+        {dstip: {'normal': amount, 'malicious': amount}}
+        """
+        labels = self.r.hgetall(
+            f'{profileid}{self.separator}{twid}{self.separator}dstip_labels'
+        )
+        dstip_labels = {}
+        for field, amount in labels.items():
+            daddr, label = field.rsplit(self.separator, 1)
+            dstip_labels.setdefault(
+                daddr, {self.normal_label: 0, self.malicious_label: 0}
+            )[label] = int(amount)
+        return dstip_labels
+
     def set_module_label_to_flow(
         self, profileid, twid, uid, module_name, module_label
     ):
         """
-        Add a module label to the flow
+        Add a module label to the flow, and update its first stage ensembling label
+        if the ensembling module is enabled
         """
         flow = self.get_flow(profileid, twid, uid)
         if flow and flow[uid]:
             data = json.loads(flow[uid])
+            old_label = self.get_ensembling_label(data['module_labels'])
             # here we dont care if add new module lablel or changing existing one
             data['module_labels'][module_name] = module_label
-            data = json.dumps(data)
-            self.r.hset(
-                profileid + self.separator + twid + self.separator + 'flows',
-                uid,
-                data,
-            )
+            new_label = self.get_ensembling_label(data['module_labels'])
+            if self.ensembling_enabled:
+                data['1_ensembling_label'] = new_label
+            with self.pipeline():
+                self.write(
+                    'hset',
+                    profileid + self.separator + twid + self.separator + 'flows',
+                    uid,
+                    json.dumps(data),
+                )
+                if self.ensembling_enabled and new_label != old_label:
+                    # the flow was counted with the old label when it was added
+                    self.count_dstip_label(profileid, twid, data['daddr'], old_label, -1)
+                    self.count_dstip_label(profileid, twid, data['daddr'], new_label)
             return True
         return False
 
@@ -1796,14 +2004,7 @@ class Database(ProfilingFlowsDatabase, object):
         2- Publishes in the channels that there is a new URL, and that we want
             data from the Threat Intelligence modules
         """
-        data = self.getURLData(url)
-        if data is False:
-            # If there is no data about this URL
-            # Set this URL for the first time in the URLsInfo
-            # Its VERY important that the data of the first time we see a URL
-            # must be '{}', an empty dictionary! if not the logic breaks.
-            # We use the empty dictionary to find if an URL exists or not
-            self.rcache.hset('URLsInfo', url, '{}')
+        self.set_new_item('URLsInfo', url)
 
     def setInfoForURLs(self, url: str, urldata: dict):
         """
@@ -1817,8 +2018,8 @@ class Database(ProfilingFlowsDatabase, object):
         if data is False:
             # This URL is not in the dictionary, add it first:
             self.setNewURL(url)
-            # Now get the data, which should be empty, but just in case
-            data = self.getIPData(url)
+            # the url may be queued in a unit of work, so don't read it back
+            data = {}
         # empty dicts evaluate to False
         dict_has_keys = bool(data)
         if dict_has_keys:
@@ -1855,6 +2056,231 @@ class Database(ProfilingFlowsDatabase, object):
         )
         return self.pubsub
 
+    def subscribe_to_channels(self, channels: list, ignore_subscribe_messages=False):
+        """
+        Subscribe to all the given channels using 1 connection
+        returns the pubsub obj that receives the msgs of all of them
+        """
+        channels = [channel for channel in channels if channel in self.supported_channels]
+        if not channels:
+            return False
+
+        pubsub = self.r.pubsub(ignore_subscribe_messages=ignore_subscribe_messages)
+        pubsub.subscribe(*channels)
+        return pubsub
+
+    def get_stream_key(self, channel: str) -> str:
+        return f'stream_{channel}'
+
+    def publish_to_stream(self, channel: str, data: str):
+        """
+        Appends the msg to the stream of the given channel.
+        Only the last stream_max_len msgs are kept.
+        Waits for the modules reading this stream to catch up
+        if one of them is more than stream_max_lag msgs behind
+        """
+        published = self.published_to_stream.get(channel, 0) + 1
+        self.published_to_stream[channel] = published
+        if published % self.stream_lag_check_interval == 0:
+            self.wait_for_stream_consumers(channel)
+
+        self.write(
+            'xadd',
+            self.get_stream_key(channel),
+            {'data': data},
+            maxlen=self.stream_max_len,
+            approximate=True
+        )
+
+    def wait_for_stream_consumers(self, channel: str, max_wait=60):
+        """
+        Blocks the publisher while a module reading the given stream is lagging behind.
+        modules that didn't read anything for max_wait seconds are considered stuck
+        and aren't waited for, the msgs they didn't read are deleted when the stream is trimmed
+        """
+        waited = 0
+        while waited < max_wait:
+            lagging = [
+                group
+                for group, info in self.get_stream_lag(channel).items()
+                if info['lag'] > self.stream_max_lag
+                and info['idle'] < max_wait * 1000
+            ]
+            if not lagging:
+                return
+            time.sleep(0.1)
+            waited += 0.1
+
+    def subscribe_to_stream(self, channel: str, group: str):
+        """
+        Creates the consumer group of the given module in the stream of the given channel,
+        if it doesn't exist. the group keeps track of the msgs read by this module
+        new groups start reading the msgs published after they were created
+        """
+        if channel not in self.stream_channels:
+            return False
+        try:
+            self.r.xgroup_create(
+                self.get_stream_key(channel), group, id='$', mkstream=True
+            )
+        except redis.exceptions.ResponseError as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+            # the module was restarted, it continues from its last offset
+        return True
+
+    def read_streams(self, streams: dict, group: str, count=100, block=None) -> list:
+        """
+        Reads the msgs of the given module from the given streams
+        :param streams: dict of {channel: offset} offset is '>' to read new msgs
+        or an ID to read the msgs delivered to this module that weren't acked yet,
+        starting after this ID
+        :param block: max ms to wait for new msgs
+        returns a list of msgs in the same format as pub/sub msgs
+        with the additional 'id' key
+        """
+        try:
+            streams = self.r.xreadgroup(
+                group,
+                group,
+                {
+                    self.get_stream_key(channel): offset
+                    for channel, offset in streams.items()
+                },
+                count=count,
+                block=block
+            )
+        except redis.exceptions.ConnectionError as ex:
+            if not self.is_connection_error_logged():
+                self.publish('finished_modules', 'stop_slips')
+                self.print(f'Stopping slips due to redis.exceptions.ConnectionError: {ex}',0,1)
+                self.mark_connection_error_as_logged()
+            return []
+
+        messages = []
+        for stream, entries in streams or []:
+            channel = stream.replace('stream_', '', 1)
+            for msg_id, fields in entries:
+                if not fields:
+                    # the msg was trimmed from the stream before the module processed it
+                    self.ack_stream_message(channel, group, msg_id)
+                    continue
+                messages.append(
+                    {
+                        'type': 'message',
+                        'channel': channel,
+                        'data': fields['data'],
+                        'id': msg_id,
+                    }
+                )
+        return messages
+
+    def get_last_stream_ids(self, channels) -> dict:
+        """
+        returns the ID of the last msg in the stream of each of the given channels
+        {channel: ID or None if the stream is empty}
+        """
+        pipe = self.r.pipeline()
+        for channel in channels:
+            pipe.xrevrange(self.get_stream_key(channel), count=1)
+        return {
+            channel: last[0][0] if last else None
+            for channel, last in zip(channels, pipe.execute())
+        }
+
+    def ack_stream_message(self, channel: str, group: str, msg_id: str):
+        """marks the msg as processed by the given module"""
+        self.r.xack(self.get_stream_key(channel), group, msg_id)
+
+    def get_stream_lag(self, channel: str) -> dict:
+        """
+        returns the lag of each module reading the stream of the given channel
+        {module_name: {'lag': number of msgs it didn't read yet,
+                       'pending': number of msgs it read but didn't process yet,
+                       'idle': ms since it last read from the stream, inf if nothing is reading it}}
+        """
+        key = self.get_stream_key(channel)
+        try:
+            groups = self.r.xinfo_groups(key)
+        except redis.exceptions.ResponseError:
+            # no stream for this channel
+            return {}
+
+        stream = None
+        lag = {}
+        for group in groups:
+            group_lag = group.get('lag')
+            if group_lag is None:
+                # redis < 7 doesn't keep track of the lag
+                if stream is None:
+                    stream = self.r.xinfo_stream(key)
+                group_lag = self.estimate_stream_lag(key, stream, group['last-delivered-id'])
+
+            idle = min(
+                (consumer['idle'] for consumer in self.r.xinfo_consumers(key, group['name'])),
+                default=float('inf')
+            )
+            lag[group['name']] = {
+                'lag': group_lag,
+                'pending': group['pending'],
+                'idle': idle,
+            }
+        return lag
+
+    def estimate_stream_lag(self, key: str, stream: dict, last_delivered_id: str) -> int:
+        """
+        Counts the msgs after the last one delivered to a group, for redis < 7.
+        Only the first stream_lag_sample msgs are read, the lag of groups further behind is
+        estimated using the timestamps in the IDs of the msgs, assuming they're published at a steady rate
+        :param stream: the info of the stream returned by xinfo_stream()
+        """
+        def parse_id(msg_id: str) -> tuple:
+            return tuple(int(part) for part in msg_id.split('-'))
+
+        length = stream['length']
+        if not length:
+            return 0
+        last_delivered = parse_id(last_delivered_id)
+        first = parse_id(stream['first-entry'][0])
+        last = parse_id(stream['last-entry'][0])
+        if last_delivered >= last:
+            return 0
+        if last_delivered < first:
+            # all the msgs in the stream were published after the last one delivered to this group
+            return length
+
+        # the range includes the last msg delivered if it's still in the stream
+        unread = self.r.xrange(
+            key, min=last_delivered_id, max='+', count=self.stream_lag_sample + 1
+        )
+        if unread and unread[0][0] == last_delivered_id:
+            unread = unread[1:]
+        if len(unread) < self.stream_lag_sample:
+            return len(unread)
+
+        duration = last[0] - first[0]
+        if not duration:
+            return length
+        estimated = length * (last[0] - last_delivered[0]) // duration
+        return max(self.stream_lag_sample, min(estimated, length))
+
+    def get_streams_lag(self) -> dict:
+        """returns the lag of all modules in all streams {channel: {module_name: lag}}"""
+        return {
+            channel: {
+                module: info['lag']
+                for module, info in self.get_stream_lag(channel).items()
+            }
+            for channel in self.stream_channels
+        }
+
+    def replay_stream(self, channel: str, group: str, offset='0'):
+        """
+        Makes the given module read again all the msgs of the given channel after the given offset
+        :param offset: ID of a msg in the stream, '0' to read all the msgs still in the stream
+        """
+        self.r.xgroup_setid(self.get_stream_key(channel), group, offset)
+
     def publish_stop(self):
         """
         Publish stop command to terminate slips
@@ -1864,6 +2290,10 @@ class Database(ProfilingFlowsDatabase, object):
         self.print('Sending the stop signal to all listeners', 0, 3)
         for channel in all_channels_list:
             self.r.publish(channel, 'stop_process')
+        for channel in self.stream_channels:
+            if self.r.exists(self.get_stream_key(channel)):
+                # don't trim the stream, modules should get their msgs before stopping
+                self.r.xadd(self.get_stream_key(channel), {'data': 'stop_process'})
 
     def get_all_flows_in_profileid_twid(self, profileid, twid):
         """
@@ -2110,27 +2540,127 @@ class Database(ProfilingFlowsDatabase, object):
         """
         self.rcache.hdel('IoC_domains', *domains)
 
-    def add_ips_to_IoC(self, ips_and_description: dict) -> None:
+    def add_ips_to_IoC(self, ips_and_description: dict) -> bool:
         """
         Store a group of IPs in the db as they were obtained from an IoC source
         :param ips_and_description: is {ip: json.dumps{'source':..,
                                                         'tags':..,
                                                         'threat_level':... ,
                                                         'description':...}}
-
+        returns True if the IPs were added to the IoC filter, the caller should call
+        publish_IoC_filter_update() once it's done adding IoCs
         """
-        if ips_and_description:
-            self.rcache.hmset('IoC_ips', ips_and_description)
+        if not ips_and_description:
+            return False
+        pipe = self.rcache.pipeline()
+        pipe.hmset('IoC_ips', ips_and_description)
+        filter_updated = self.add_to_IoC_filter(pipe, ips_and_description)
+        pipe.execute()
+        return filter_updated
 
-    def add_domains_to_IoC(self, domains_and_description: dict) -> None:
+    def add_domains_to_IoC(self, domains_and_description: dict) -> bool:
         """
         Store a group of domains in the db as they were obtained from
         an IoC source
         :param domains_and_description: is {domain: json.dumps{'source':..,'tags':..,
                                                             'threat_level':... ,'description'}}
+        returns True if the domains were added to the IoC filter, the caller should call
+        publish_IoC_filter_update() once it's done adding IoCs
         """
-        if domains_and_description:
-            self.rcache.hmset('IoC_domains', domains_and_description)
+        if not domains_and_description:
+            return False
+        pipe = self.rcache.pipeline()
+        pipe.hmset('IoC_domains', domains_and_description)
+        filter_updated = self.add_to_IoC_filter(pipe, domains_and_description)
+        pipe.execute()
+        return filter_updated
+
+    def publish_IoC_filter_update(self):
+        """
+        Tells the modules using the IoC filter to load it again.
+        Called once a feed is done adding its IoCs, not after every group of them,
+        loading the filter means reading and deserializing all of it
+        """
+        self.publish('IoC_filter_updated', 'updated')
+
+    def add_to_IoC_filter(self, pipe, iocs) -> bool:
+        """
+        Sets the bits of the given IPs or domains in the IoC filter stored in the db
+        so modules using the filter don't skip them
+        :param pipe: the pipeline used for storing the iocs
+        returns False if there's no filter in the db
+        """
+        info = self.rcache.hgetall('IoC_filter_info')
+        if not info:
+            return False
+
+        ioc_filter = BloomFilter(int(info['bits']), int(info['hashes']))
+        for ioc in iocs:
+            for position in ioc_filter.get_positions(ioc):
+                pipe.setbit('IoC_filter', position, 1)
+        return True
+
+    def build_IoC_filter(self, error_rate=0.001) -> float:
+        """
+        Builds a filter of all the IPs and domains in IoC_ips and IoC_domains and stores it in the db
+        modules load it for skipping the lookups of IoCs we don't have
+        returns the estimated false positive rate of the filter
+        """
+        with self.rcache.pipeline() as pipe:
+            while True:
+                try:
+                    # IoCs added while building the filter would be missing from it,
+                    # it's built again if they're added before it's stored
+                    pipe.watch('IoC_ips', 'IoC_domains')
+                    iocs = pipe.hkeys('IoC_ips') + pipe.hkeys('IoC_domains')
+                    # leave room for the IoCs added by the modules until the next update
+                    ioc_filter = BloomFilter.for_capacity(2 * len(iocs), error_rate)
+                    for ioc in iocs:
+                        ioc_filter.add(ioc)
+                    false_positive_rate = ioc_filter.false_positive_rate()
+
+                    # the filter and its info are replaced at once
+                    pipe.multi()
+                    pipe.set('IoC_filter', ioc_filter.to_bytes())
+                    pipe.hset(
+                        'IoC_filter_info',
+                        mapping={
+                            'bits': ioc_filter.bits,
+                            'hashes': ioc_filter.hashes,
+                            'items': len(iocs),
+                            'false_positive_rate': false_positive_rate,
+                        }
+                    )
+                    pipe.hincrby('IoC_filter_info', 'version', 1)
+                    pipe.execute()
+                    break
+                except redis.exceptions.WatchError:
+                    continue
+        self.publish_IoC_filter_update()
+        return false_positive_rate
+
+    def delete_IoC_filter(self):
+        """
+        Deletes the IoC filter so modules stop using it,
+        done before updating IoC_ips and IoC_domains and building a new one
+        """
+        self.rcache.delete('IoC_filter', 'IoC_filter_info')
+        self.publish('IoC_filter_updated', 'deleted')
+
+    def get_IoC_filter(self):
+        """
+        returns the BloomFilter of all the IPs and domains in IoC_ips and IoC_domains
+        returns None if there's no filter in the db
+        """
+        pipe = self.rcache_raw.pipeline(transaction=True)
+        pipe.hgetall('IoC_filter_info')
+        pipe.get('IoC_filter')
+        info, data = pipe.execute()
+        if not info:
+            return None
+        ioc_filter = BloomFilter(int(info[b'bits']), int(info[b'hashes']), data)
+        ioc_filter.version = int(info.get(b'version', 0))
+        return ioc_filter
 
     def add_ip_range_to_IoC(self, malicious_ip_ranges: dict) -> None:
         """
@@ -2140,6 +2670,14 @@ class Database(ProfilingFlowsDatabase, object):
         """
         if malicious_ip_ranges:
             self.rcache.hmset('IoC_ip_ranges', malicious_ip_ranges)
+            # tells the modules caching the ranges that they should load them again
+            self.rcache.incr('IoC_ip_ranges_version')
+
+    def get_malicious_ip_ranges_version(self) -> int:
+        """
+        returns a number that changes every time IoC_ip_ranges is updated
+        """
+        return int(self.rcache.get('IoC_ip_ranges_version') or 0)
 
     def add_asn_to_IoC(self, blacklisted_ASNs: dict):
         """
@@ -2353,20 +2891,18 @@ class Database(ProfilingFlowsDatabase, object):
         Search in the dB of malicious domains and return a
         description if we found a match
         returns a tuple (description, is_subdomain)
-        description: description of the subdomain if found
-        bool: True if we found a match for exactly the given domain False if we matched a subdomain
-        """
-        domain_description = self.rcache.hget('IoC_domains', domain)
-        if domain_description == None:
-            # try to match subdomain
-            ioc_domains = self.rcache.hgetall('IoC_domains')
-            for malicious_domain, description in ioc_domains.items():
-                #  if the we contacted images.google.com and we have google.com in our blacklists, we find a match
-                if malicious_domain in domain:
-                    return description, True
-            return False, False
-        else:
-            return domain_description, False
+        description: description of the blacklisted domain if found
+        is_subdomain: False if we found a match for exactly the given domain,
+                    True if we matched one of its parent domains
+        """
+        # if we contacted images.google.com and we have google.com in our blacklists, we find a match.
+        # only whole labels are matched, so notgoogle.com doesn't match google.com
+        domains = utils.get_domain_and_parents(domain)
+        descriptions = self.rcache.hmget('IoC_domains', domains)
+        for malicious_domain, description in zip(domains, descriptions):
+            if description:
+                return description, malicious_domain != domain
+        return False, False
 
 
     def get_host_ip(self):
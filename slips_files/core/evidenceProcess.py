@@ -19,6 +19,7 @@ import multiprocessing
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.dispatcher import Dispatcher
 from .notify import Notify
 import json
 from datetime import datetime
@@ -68,8 +69,10 @@ class EvidenceProcess(multiprocessing.Process):
             else:
                 self.popup_alerts = False
 
-        self.c1 = __database__.subscribe('evidence_added')
-        self.c2 = __database__.subscribe('new_blame')
+        self.dispatcher = Dispatcher(self.name)
+        self.dispatcher.register('evidence_added', self.handle_evidence_added)
+        self.dispatcher.register('new_blame', self.handle_new_blame)
+        self.dispatcher.register('tw_closed', self.handle_tw_closed)
         # clear alerts.log
         self.logfile = self.clean_file(output_folder, 'alerts.log')
         self.is_interface = self.is_running_on_interface()
@@ -78,6 +81,9 @@ class EvidenceProcess(multiprocessing.Process):
         self.print(f'Storing Slips logs in {output_folder}')
         # this list will have our local and public ips when using -i
         self.our_ips = utils.get_own_IPs()
+        # the evidence that count towards an alert in each tw, and their accumulated threat level
+        # the format is {profileid_twid: {'threat_level': float, 'evidence': {evidence_ID: weighted threat level}}}
+        self.accumulated_threat_levels = {}
 
     def clear_logs_dir(self, logs_folder):
         self.logs_logfile = False
@@ -521,43 +527,113 @@ class EvidenceProcess(multiprocessing.Process):
         return tw_evidence
 
 
-    def get_accumulated_threat_level(self, tw_evidence):
-        accumulated_threat_level = 0.0
-        # to store all the ids causing this alerts in the database
-        self.IDs_causing_an_alert = []
-        for evidence in tw_evidence.values():
-            evidence = json.loads(evidence)
-            # attacker_direction = evidence.get('attacker_direction')
-            # attacker = evidence.get('attacker')
-            evidence_type = evidence.get('evidence_type')
-            confidence = float(evidence.get('confidence'))
-            threat_level = evidence.get('threat_level')
-            description = evidence.get('description')
-            ID = evidence.get('ID')
-            self.IDs_causing_an_alert.append(ID)
-            # each threat level is a string, get the numerical value of it
-            try:
-                threat_level = utils.threat_levels[
-                    threat_level.lower()
-                ]
-            except KeyError:
-                self.print(
-                    f'Error: Evidence of type {evidence_type} has '
-                    f'an invalid threat level {threat_level}', 0, 1
-                )
-                self.print(f'Description: {description}', 0, 1)
-                threat_level = 0
-
-            # Compute the moving average of evidence
-            new_threat_level = threat_level * confidence
+    def get_weighted_threat_level(self, evidence: dict) -> float:
+        """
+        returns the threat level of the given evidence multiplied by its confidence
+        """
+        evidence_type = evidence.get('evidence_type')
+        confidence = float(evidence.get('confidence'))
+        threat_level = evidence.get('threat_level')
+        description = evidence.get('description')
+        # each threat level is a string, get the numerical value of it
+        try:
+            threat_level = utils.threat_levels[
+                threat_level.lower()
+            ]
+        except KeyError:
             self.print(
-                f'\t\tWeighted Threat Level: {new_threat_level}', 3, 0
+                f'Error: Evidence of type {evidence_type} has '
+                f'an invalid threat level {threat_level}', 0, 1
             )
-            accumulated_threat_level += new_threat_level
-            self.print(
-                f'\t\tAccumulated Threat Level: {accumulated_threat_level}', 3, 0,
+            self.print(f'Description: {description}', 0, 1)
+            threat_level = 0
+
+        # Compute the moving average of evidence
+        new_threat_level = threat_level * confidence
+        self.print(
+            f'\t\tWeighted Threat Level: {new_threat_level}', 3, 0
+        )
+        return new_threat_level
+
+    def load_accumulated_threat_level(self, profileid, twid) -> dict:
+        """
+        Computes the accumulated threat level of the given tw from the evidence stored in the db.
+        Only done the first time we see an evidence of this tw,
+        or if the tw was closed and evidence keeps coming for it
+        """
+        tw_evidence = self.get_evidence_for_tw(profileid, twid) or {}
+        accumulated = {'threat_level': 0.0, 'evidence': {}, 'counted': set()}
+        for evidence_ID, evidence in tw_evidence.items():
+            weighted_threat_level = self.get_weighted_threat_level(json.loads(evidence))
+            accumulated['evidence'][evidence_ID] = weighted_threat_level
+            accumulated['counted'].add(evidence_ID)
+            accumulated['threat_level'] += weighted_threat_level
+        self.accumulated_threat_levels[f'{profileid}{self.separator}{twid}'] = accumulated
+        return accumulated
+
+    def update_accumulated_threat_level(self, profileid, twid, evidence: dict) -> float:
+        """
+        Adds the threat level of the given evidence to the accumulated threat level of its tw
+        only evidence of this profile attacking others count
+        returns the accumulated threat level of the tw
+        """
+        accumulated = self.accumulated_threat_levels.get(f'{profileid}{self.separator}{twid}')
+        if accumulated is None:
+            # the given evidence is already in the db, so it's counted here
+            accumulated = self.load_accumulated_threat_level(profileid, twid)
+        elif (
+            evidence.get('attacker_direction', '') in ('srcip', 'sport', 'srcport')
+            # re-delivered evidence are only counted once
+            and evidence['ID'] not in accumulated['counted']
+        ):
+            accumulated['counted'].add(evidence['ID'])
+            weighted_threat_level = self.get_weighted_threat_level(evidence)
+            accumulated['evidence'][evidence['ID']] = weighted_threat_level
+            accumulated['threat_level'] += weighted_threat_level
+
+        self.print(
+            f'\t\tAccumulated Threat Level: {accumulated["threat_level"]}', 3, 0,
+        )
+        return accumulated['threat_level']
+
+    def remove_from_accumulated_threat_level(self, profileid, twid, evidence_ID):
+        """
+        called when an evidence is deleted or whitelisted so it doesn't count towards an alert
+        """
+        accumulated = self.accumulated_threat_levels.get(f'{profileid}{self.separator}{twid}')
+        if not accumulated:
+            return
+        weighted_threat_level = accumulated['evidence'].pop(evidence_ID, None)
+        if weighted_threat_level is not None:
+            accumulated['threat_level'] = max(
+                0.0, accumulated['threat_level'] - weighted_threat_level
             )
-        return accumulated_threat_level
+
+    def reset_accumulated_threat_level(self, profileid, twid):
+        """
+        The evidence that caused an alert don't count towards the next alerts of the same tw
+        """
+        key = f'{profileid}{self.separator}{twid}'
+        counted = self.accumulated_threat_levels.get(key, {}).get('counted', set())
+        self.accumulated_threat_levels[key] = {
+            'threat_level': 0.0,
+            'evidence': {},
+            # IDs that were already counted stay here so they're not counted again
+            'counted': counted,
+        }
+
+    def get_evidence_causing_alert(self, profileid, twid) -> dict:
+        """
+        returns the evidence counted in the accumulated threat level of this tw
+        The format for the returned dict is {evidence_ID: serialized evidence}
+        """
+        accumulated = self.accumulated_threat_levels[f'{profileid}{self.separator}{twid}']
+        tw_evidence = __database__.get_evidence_since(profileid, twid)
+        return {
+            evidence_ID: tw_evidence[evidence_ID]
+            for evidence_ID in accumulated['evidence']
+            if evidence_ID in tw_evidence
+        }
 
     def get_last_evidence_ID(self, tw_evidence):
         last_evidence_ID = list(tw_evidence.keys())[-1]
@@ -583,219 +659,229 @@ class EvidenceProcess(multiprocessing.Process):
             )
         return alert_to_log
 
+    def handle_evidence_added(self, message):
+        """logs the new evidence and alerts if the accumulated threat level of its profile and tw exceeded the detection threshold"""
+        # Data sent in the channel as a json dict, it needs to be deserialized first
+        data = json.loads(message['data'])
+        profileid = data.get('profileid')
+        srcip = profileid.split(self.separator)[1]
+        twid = data.get('twid')
+        attacker_direction = data.get(
+            'attacker_direction'
+        )   # example: dstip srcip dport sport dstdomain
+        attacker = data.get(
+            'attacker'
+        )   # example: ip, port, inTuple, outTuple, domain
+        evidence_type = data.get(
+            'evidence_type'
+        )   # example: PortScan, ThreatIntelligence, etc..
+        description = data.get('description')
+        timestamp = data.get('stime')
+        # this is all the uids of the flows that cause this evidence
+        all_uids = data.get('uid')
+        # tags = data.get('tags', False)
+        confidence = data.get('confidence', False)
+        threat_level = data.get('threat_level', False)
+        category = data.get('category', False)
+        conn_count = data.get('conn_count', False)
+        port = data.get('port', False)
+        proto = data.get('proto', False)
+        source_target_tag = data.get('source_target_tag', False)
+        evidence_ID = data.get('ID', False)
+        if type(all_uids) == list:
+            # more than 1 flow caused the evidence
+            uid = all_uids[-1]
+        else:
+            # all_uids is just 1 str uid
+            uid = all_uids
+
+        flow = __database__.get_flow(profileid, twid, uid)
+
+        # FP whitelisted alerts happen when the db returns an evidence
+        # that isn't processed in this channel, in the tw_evidence below
+        # to avoid this, we only alert on processed evidence
+        __database__.mark_evidence_as_processed(evidence_ID)
+
+        # Ignore alert if IP is whitelisted
+        if flow and self.whitelist.is_whitelisted_evidence(
+            srcip, attacker, attacker_direction, description
+        ):
+            __database__.cache_whitelisted_evidence_ID(evidence_ID)
+            # Modules add evidence to the db before reaching this point, now
+            # remove evidence from db so it could be completely ignored
+            __database__.deleteEvidence(
+                profileid, twid, evidence_ID
+            )
+            self.remove_from_accumulated_threat_level(profileid, twid, evidence_ID)
+            return
+
+        # Format the time to a common style given multiple type of time variables
+        if self.is_running_on_interface():
+            timestamp: datetime = utils.convert_to_local_timezone(timestamp)
+        flow_datetime = utils.convert_format(timestamp, 'iso')
+
+        # prepare evidence for text log file
+        evidence = self.format_evidence_string(srcip, evidence_type, attacker, description)
+        # prepare evidence for json log file
+        IDEA_dict = utils.IDEA_format(
+            srcip,
+            evidence_type,
+            attacker_direction,
+            attacker,
+            description,
+            confidence,
+            category,
+            conn_count,
+            source_target_tag,
+            port,
+            proto,
+            evidence_ID
+        )
+
+        # to keep the alignment of alerts.json ip + hostname combined should take no more than 26 chars
+        alert_to_log = f'{flow_datetime}: Src IP {srcip:26}. {evidence}'
+        alert_to_log = self.add_hostname_to_alert(alert_to_log, profileid, flow_datetime, evidence)
+
+        # Add the evidence to the log files
+        self.addDataToLogFile(alert_to_log)
+        # add to alerts.json
+        self.addDataToJSONFile(IDEA_dict, all_uids)
+        # if -l is given
+        self.add_to_log_folder(IDEA_dict)
+
+        __database__.set_evidence_for_profileid(IDEA_dict)
+        __database__.publish('report_to_peers', json.dumps(data))
+
+        #
+        # Analysis of evidence for blocking or not
+        # This is done every time we receive 1 new evidence
+        #
+        # The accumulated threat level is for all the types of evidence for this profile
+        accumulated_threat_level = self.update_accumulated_threat_level(
+            profileid, twid, data
+        )
+
+        # This is the part to detect if the accumulated evidence was enough for generating a detection
+        # The detection should be done in attacks per minute. The parameter in the configuration
+        # is attacks per minute
+        # So find out how many attacks corresponds to the width we are using
+        # if the profile was already blocked in this twid, we shouldn't alert
+        if (
+            accumulated_threat_level >= self.detection_threshold_in_this_width
+            and not __database__.checkBlockedProfTW(profileid, twid)
+        ):
+            # Important! It may happen that the evidence is not related to a profileid and twid.
+            # For example when the evidence is on some src IP attacking our home net, and we are not creating
+            # profiles for attackers
+            tw_evidence = self.get_evidence_causing_alert(profileid, twid)
+            self.reset_accumulated_threat_level(profileid, twid)
+            if tw_evidence:
+                IDs_causing_an_alert = list(tw_evidence)
+                ID = self.get_last_evidence_ID(tw_evidence)
+                # store the alert in our database
+                # the alert ID is profileid_twid + the ID of the last evidence causing this alert
+                alert_ID = f'{profileid}_{twid}_{ID}'
+                __database__.set_evidence_causing_alert(
+                    profileid,
+                    twid,
+                    alert_ID,
+                    IDs_causing_an_alert
+                )
+                __database__.publish('new_alert', alert_ID)
+
+                self.send_to_exporting_module(tw_evidence)
+
+                # print the alert
+                alert_to_print = (
+                    self.format_evidence_causing_this_alert(
+                        tw_evidence,
+                        profileid,
+                        twid,
+                        flow_datetime,
+                    )
+                )
+                self.print(f'{alert_to_print}', 1, 0)
+
+                if self.popup_alerts:
+                    # remove the colors from the alerts before printing
+                    alert_to_print = (
+                        alert_to_print.replace(Fore.RED, '')
+                        .replace(Fore.CYAN, '')
+                        .replace(Style.RESET_ALL, '')
+                    )
+                    self.notify.show_popup(alert_to_print)
+
+                # todo if it's already blocked, we shouldn't decide blocking
+                blocked = False
+                if self.is_running_on_interface() and '-p' in sys.argv:
+                    # send ip to the blocking module
+                    if self.decide_blocking(profileid):
+                        blocked = True
+
+                self.mark_as_blocked(
+                    profileid,
+                    twid,
+                    flow_datetime,
+                    accumulated_threat_level,
+                    IDEA_dict,
+                    blocked=blocked
+                )
+
+    def handle_new_blame(self, message):
+        """stores the blame reports received from the p2ptrust module and blocks the IP they are about"""
+        data = message['data']
+        try:
+            data = json.loads(data)
+        except json.decoder.JSONDecodeError:
+            self.print(
+                'Error in the report received from p2ptrust module'
+            )
+            return
+        # The available values for the following variables are defined in go_director
+
+        # available key types: "ip"
+        key_type = data['key_type']
+
+        # if the key type is ip, the ip is validated
+        key = data['key']
+
+        # available evaluation types: 'score_confidence'
+        evaluation_type = data['evaluation_type']
+
+        # this is the score_confidence received from the peer
+        evaluation = data['evaluation']
+        # {"key_type": "ip", "key": "1.2.3.40",
+        # "evaluation_type": "score_confidence",
+        # "evaluation": { "score": 0.9, "confidence": 0.6 }}
+        ip_info = {
+            'p2p4slips': evaluation
+        }
+        ip_info['p2p4slips'].update({'ts': time.time()})
+        __database__.store_blame_report(key, evaluation)
+
+        blocking_data = {
+            'ip': key,
+            'block': True,
+            'to': True,
+            'from': True,
+            'block_for': self.width * 2,  # block for 2 timewindows
+        }
+        blocking_data = json.dumps(blocking_data)
+        __database__.publish('new_blocking', blocking_data)
+
+    def handle_tw_closed(self, message):
+        """removes the accumulated threat level of the closed tw from memory"""
+        # evidence rarely come for closed tws, if they do,
+        # the accumulated threat level is loaded from the db again
+        self.accumulated_threat_levels.pop(message['data'], None)
+
     def run(self):
         while True:
             try:
-                message = __database__.get_message(self.c1)
-                if utils.is_msg_intended_for(message, 'evidence_added'):
-                    # Data sent in the channel as a json dict, it needs to be deserialized first
-                    data = json.loads(message['data'])
-                    profileid = data.get('profileid')
-                    srcip = profileid.split(self.separator)[1]
-                    twid = data.get('twid')
-                    attacker_direction = data.get(
-                        'attacker_direction'
-                    )   # example: dstip srcip dport sport dstdomain
-                    attacker = data.get(
-                        'attacker'
-                    )   # example: ip, port, inTuple, outTuple, domain
-                    evidence_type = data.get(
-                        'evidence_type'
-                    )   # example: PortScan, ThreatIntelligence, etc..
-                    description = data.get('description')
-                    timestamp = data.get('stime')
-                    # this is all the uids of the flows that cause this evidence
-                    all_uids = data.get('uid')
-                    # tags = data.get('tags', False)
-                    confidence = data.get('confidence', False)
-                    threat_level = data.get('threat_level', False)
-                    category = data.get('category', False)
-                    conn_count = data.get('conn_count', False)
-                    port = data.get('port', False)
-                    proto = data.get('proto', False)
-                    source_target_tag = data.get('source_target_tag', False)
-                    evidence_ID = data.get('ID', False)
-                    if type(all_uids) == list:
-                        # more than 1 flow caused the evidence
-                        uid = all_uids[-1]
-                    else:
-                        # all_uids is just 1 str uid
-                        uid = all_uids
-
-                    flow = __database__.get_flow(profileid, twid, uid)
-
-                    # FP whitelisted alerts happen when the db returns an evidence
-                    # that isn't processed in this channel, in the tw_evidence below
-                    # to avoid this, we only alert on processed evidence
-                    __database__.mark_evidence_as_processed(evidence_ID)
-
-                    # Ignore alert if IP is whitelisted
-                    if flow and self.whitelist.is_whitelisted_evidence(
-                        srcip, attacker, attacker_direction, description
-                    ):
-                        __database__.cache_whitelisted_evidence_ID(evidence_ID)
-                        # Modules add evidence to the db before reaching this point, now
-                        # remove evidence from db so it could be completely ignored
-                        __database__.deleteEvidence(
-                            profileid, twid, evidence_ID
-                        )
-                        continue
-
-                    # Format the time to a common style given multiple type of time variables
-                    if self.is_running_on_interface():
-                        timestamp: datetime = utils.convert_to_local_timezone(timestamp)
-                    flow_datetime = utils.convert_format(timestamp, 'iso')
-
-                    # prepare evidence for text log file
-                    evidence = self.format_evidence_string(srcip, evidence_type, attacker, description)
-                    # prepare evidence for json log file
-                    IDEA_dict = utils.IDEA_format(
-                        srcip,
-                        evidence_type,
-                        attacker_direction,
-                        attacker,
-                        description,
-                        confidence,
-                        category,
-                        conn_count,
-                        source_target_tag,
-                        port,
-                        proto,
-                        evidence_ID
-                    )
-
-                    # to keep the alignment of alerts.json ip + hostname combined should take no more than 26 chars
-                    alert_to_log = f'{flow_datetime}: Src IP {srcip:26}. {evidence}'
-                    alert_to_log = self.add_hostname_to_alert(alert_to_log, profileid, flow_datetime, evidence)
-
-                    # Add the evidence to the log files
-                    self.addDataToLogFile(alert_to_log)
-                    # add to alerts.json
-                    self.addDataToJSONFile(IDEA_dict, all_uids)
-                    # if -l is given
-                    self.add_to_log_folder(IDEA_dict)
-
-                    __database__.set_evidence_for_profileid(IDEA_dict)
-                    __database__.publish('report_to_peers', json.dumps(data))
-
-                    #
-                    # Analysis of evidence for blocking or not
-                    # This is done every time we receive 1 new evidence
-                    #
-                    tw_evidence = self.get_evidence_for_tw(profileid, twid)
-
-                    # Important! It may happen that the evidence is not related to a profileid and twid.
-                    # For example when the evidence is on some src IP attacking our home net, and we are not creating
-                    # profiles for attackers
-                    if tw_evidence:
-                        # self.print(f'Evidence: {tw_evidence}. Profileid {profileid}, twid {twid}')
-
-                        # The accumulated threat level is for all the types of evidence for this profile
-                        accumulated_threat_level = self.get_accumulated_threat_level(tw_evidence)
-
-                        ID = self.get_last_evidence_ID(tw_evidence)
-
-                        # if the profile was already blocked in this twid, we shouldn't alert
-                        profile_already_blocked = __database__.checkBlockedProfTW(profileid, twid)
-
-                        # This is the part to detect if the accumulated evidence was enough for generating a detection
-                        # The detection should be done in attacks per minute. The parameter in the configuration
-                        # is attacks per minute
-                        # So find out how many attacks corresponds to the width we are using
-                        if (
-                            accumulated_threat_level >= self.detection_threshold_in_this_width
-                            and not profile_already_blocked
-                        ):
-                            # store the alert in our database
-                            # the alert ID is profileid_twid + the ID of the last evidence causing this alert
-                            alert_ID = f'{profileid}_{twid}_{ID}'
-                            __database__.set_evidence_causing_alert(
-                                profileid,
-                                twid,
-                                alert_ID,
-                                self.IDs_causing_an_alert
-                            )
-                            __database__.publish('new_alert', alert_ID)
-
-                            self.send_to_exporting_module(tw_evidence)
-
-                            # print the alert
-                            alert_to_print = (
-                                self.format_evidence_causing_this_alert(
-                                    tw_evidence,
-                                    profileid,
-                                    twid,
-                                    flow_datetime,
-                                )
-                            )
-                            self.print(f'{alert_to_print}', 1, 0)
-
-                            if self.popup_alerts:
-                                # remove the colors from the alerts before printing
-                                alert_to_print = (
-                                    alert_to_print.replace(Fore.RED, '')
-                                    .replace(Fore.CYAN, '')
-                                    .replace(Style.RESET_ALL, '')
-                                )
-                                self.notify.show_popup(alert_to_print)
-
-                            # todo if it's already blocked, we shouldn't decide blocking
-                            blocked = False
-                            if self.is_running_on_interface() and '-p' in sys.argv:
-                                # send ip to the blocking module
-                                if self.decide_blocking(profileid):
-                                    blocked = True
-
-                            self.mark_as_blocked(
-                                profileid,
-                                twid,
-                                flow_datetime,
-                                accumulated_threat_level,
-                                IDEA_dict,
-                                blocked=blocked
-                            )
-
-                message = __database__.get_message(self.c2)
-                if utils.is_msg_intended_for(message, 'new_blame'):
-                    data = message['data']
-                    try:
-                        data = json.loads(data)
-                    except json.decoder.JSONDecodeError:
-                        self.print(
-                            'Error in the report received from p2ptrust module'
-                        )
-                        continue
-                    # The available values for the following variables are defined in go_director
-
-                    # available key types: "ip"
-                    key_type = data['key_type']
-
-                    # if the key type is ip, the ip is validated
-                    key = data['key']
-
-                    # available evaluation types: 'score_confidence'
-                    evaluation_type = data['evaluation_type']
-
-                    # this is the score_confidence received from the peer
-                    evaluation = data['evaluation']
-                    # {"key_type": "ip", "key": "1.2.3.40",
-                    # "evaluation_type": "score_confidence",
-                    # "evaluation": { "score": 0.9, "confidence": 0.6 }}
-                    ip_info = {
-                        'p2p4slips': evaluation
-                    }
-                    ip_info['p2p4slips'].update({'ts': time.time()})
-                    __database__.store_blame_report(key, evaluation)
-
-                    blocking_data = {
-                        'ip': key,
-                        'block': True,
-                        'to': True,
-                        'from': True,
-                        'block_for': self.width * 2,  # block for 2 timewindows
-                    }
-                    blocking_data = json.dumps(blocking_data)
-                    __database__.publish('new_blocking', blocking_data)
+                # waits for a msg in any of our channels and sends it to its handler
+                # stop_process is ignored, slips.py kills this process last
+                # so we don't miss the evidence generated right before slips stops
+                self.dispatcher.dispatch()
 
             except KeyboardInterrupt:
                 self.shutdown_gracefully()
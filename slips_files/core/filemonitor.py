@@ -27,17 +27,22 @@ from slips_files.common.slips_utils import utils
 class FileEventHandler(RegexMatchingEventHandler):
     REGEX = [r'.*\.log$', r'.*\.conf$']
 
-    def __init__(self, redis_port, dir_to_monitor, input_type):
+    def __init__(self, redis_port, dir_to_monitor, input_type, new_file_event=None):
         super().__init__(self.REGEX)
         self.dir_to_monitor = dir_to_monitor
         __database__.start(redis_port)
         utils.drop_root_privs()
         self.input_type = input_type
+        # threading.Event shared with inputProcess, set when zeek creates a new log file
+        # so it refreshes its list of files to read
+        self.new_file_event = new_file_event
 
     def on_created(self, event):
         filename, ext = os.path.splitext(event.src_path)
         if 'log' in ext:
             __database__.add_zeek_file(filename + ext)
+            if self.new_file_event:
+                self.new_file_event.set()
 
     def on_moved(self, event):
         """this will be triggered everytime zeek renames all log files"""
@@ -0,0 +1,483 @@
+"""
+The records the profiler parses each flow into, one class per family of logs.
+They use __slots__ so a flow doesn't need a dict for its fields,
+and are passed explicitly from the parsers to add_flow_to_profile() and the handle_*() methods
+"""
+
+
+class Flow:
+    """
+    Fields every flow has.
+    Also used for the flows of the log types that slips doesn't analyze, like irc.log
+    """
+    __slots__ = (
+        'flow_type',
+        'starttime',
+        'uid',
+        'saddr',
+        'daddr',
+        # set by the profiler after parsing the flow
+        'profileid',
+        'twid',
+        'saddr_as_obj',
+        'daddr_as_obj',
+    )
+
+    def __init__(self, flow_type: str, starttime, uid, saddr: str, daddr: str):
+        # conn, dns, argus, flow(suricata), etc.
+        self.flow_type = flow_type
+        # a datetime obj until add_flow_to_profile() converts it to a unix timestamp
+        self.starttime = starttime
+        self.uid = uid
+        self.saddr = saddr
+        self.daddr = daddr
+        self.profileid = None
+        self.twid = None
+        self.saddr_as_obj = None
+        self.daddr_as_obj = None
+
+
+class Conn(Flow):
+    """zeek conn.log, suricata flow events, argus and nfdump flows"""
+    __slots__ = (
+        'dur',
+        'endtime',
+        'proto',
+        'appproto',
+        'sport',
+        'dport',
+        'state',
+        'dir',
+        'pkts',
+        'spkts',
+        'dpkts',
+        'bytes',
+        'sbytes',
+        'dbytes',
+        'state_hist',
+        'smac',
+        'dmac',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        dur=0,
+        endtime='',
+        proto='',
+        appproto='',
+        sport='',
+        dport='',
+        state='',
+        dir='->',
+        pkts=0,
+        spkts=0,
+        dpkts=0,
+        bytes=0,
+        sbytes=0,
+        dbytes=0,
+        state_hist='',
+        smac='',
+        dmac='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.dur = dur
+        self.endtime = endtime
+        self.proto = proto
+        self.appproto = appproto
+        self.sport = sport
+        self.dport = dport
+        self.state = state
+        self.dir = dir
+        self.pkts = pkts
+        self.spkts = spkts
+        self.dpkts = dpkts
+        self.bytes = bytes
+        self.sbytes = sbytes
+        self.dbytes = dbytes
+        self.state_hist = state_hist
+        self.smac = smac
+        self.dmac = dmac
+
+
+class DNS(Flow):
+    __slots__ = (
+        'query',
+        'qclass_name',
+        'qtype_name',
+        'rcode_name',
+        'answers',
+        'TTLs',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        query='',
+        qclass_name='',
+        qtype_name='',
+        rcode_name='',
+        answers='',
+        TTLs='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.query = query
+        self.qclass_name = qclass_name
+        self.qtype_name = qtype_name
+        self.rcode_name = rcode_name
+        self.answers = answers
+        self.TTLs = TTLs
+
+
+class HTTP(Flow):
+    __slots__ = (
+        'method',
+        'host',
+        'uri',
+        'httpversion',
+        'user_agent',
+        'request_body_len',
+        'response_body_len',
+        'status_code',
+        'status_msg',
+        'resp_mime_types',
+        'resp_fuids',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        method='',
+        host='',
+        uri='',
+        httpversion='',
+        user_agent='',
+        request_body_len=0,
+        response_body_len=0,
+        status_code='',
+        status_msg='',
+        resp_mime_types='',
+        resp_fuids='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.method = method
+        self.host = host
+        self.uri = uri
+        self.httpversion = httpversion
+        self.user_agent = user_agent
+        self.request_body_len = request_body_len
+        self.response_body_len = response_body_len
+        self.status_code = status_code
+        self.status_msg = status_msg
+        self.resp_mime_types = resp_mime_types
+        self.resp_fuids = resp_fuids
+
+
+class SSL(Flow):
+    __slots__ = (
+        'sport',
+        'dport',
+        'sslversion',
+        'cipher',
+        'resumed',
+        'established',
+        'cert_chain_fuids',
+        'client_cert_chain_fuids',
+        'subject',
+        'issuer',
+        'validation_status',
+        'curve',
+        'server_name',
+        'ja3',
+        'ja3s',
+        'is_DoH',
+        'notbefore',
+        'notafter',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        sport='',
+        dport='',
+        sslversion='',
+        cipher='',
+        resumed='',
+        established='',
+        cert_chain_fuids='',
+        client_cert_chain_fuids='',
+        subject='',
+        issuer='',
+        validation_status='',
+        curve='',
+        server_name='',
+        ja3='',
+        ja3s='',
+        is_DoH='',
+        notbefore='',
+        notafter='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.sport = sport
+        self.dport = dport
+        self.sslversion = sslversion
+        self.cipher = cipher
+        self.resumed = resumed
+        self.established = established
+        self.cert_chain_fuids = cert_chain_fuids
+        self.client_cert_chain_fuids = client_cert_chain_fuids
+        self.subject = subject
+        self.issuer = issuer
+        self.validation_status = validation_status
+        self.curve = curve
+        self.server_name = server_name
+        self.ja3 = ja3
+        self.ja3s = ja3s
+        self.is_DoH = is_DoH
+        # only in suricata tls events
+        self.notbefore = notbefore
+        self.notafter = notafter
+
+
+class SSH(Flow):
+    __slots__ = (
+        'version',
+        'auth_success',
+        'auth_attempts',
+        'client',
+        'server',
+        'cipher_alg',
+        'mac_alg',
+        'compression_alg',
+        'kex_alg',
+        'host_key_alg',
+        'host_key',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        version='',
+        auth_success='',
+        auth_attempts='',
+        client='',
+        server='',
+        cipher_alg='',
+        mac_alg='',
+        compression_alg='',
+        kex_alg='',
+        host_key_alg='',
+        host_key='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.version = version
+        self.auth_success = auth_success
+        self.auth_attempts = auth_attempts
+        self.client = client
+        self.server = server
+        self.cipher_alg = cipher_alg
+        self.mac_alg = mac_alg
+        self.compression_alg = compression_alg
+        self.kex_alg = kex_alg
+        self.host_key_alg = host_key_alg
+        self.host_key = host_key
+
+
+class Notice(Flow):
+    __slots__ = (
+        'sport',
+        'dport',
+        'note',
+        'msg',
+        'scanned_port',
+        'scanning_ip',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        sport='',
+        dport='',
+        note='',
+        msg='',
+        scanned_port='',
+        scanning_ip='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.sport = sport
+        self.dport = dport
+        self.note = note
+        # we're looking for self signed certs in this field
+        self.msg = msg
+        self.scanned_port = scanned_port
+        self.scanning_ip = scanning_ip
+
+
+class DHCP(Flow):
+    __slots__ = (
+        'client_addr',
+        'server_addr',
+        'host_name',
+        'mac',
+        'requested_addr',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        client_addr='',
+        server_addr='',
+        host_name='',
+        mac='',
+        requested_addr='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.client_addr = client_addr
+        self.server_addr = server_addr
+        self.host_name = host_name
+        # this is the client mac
+        self.mac = mac
+        self.requested_addr = requested_addr
+
+
+class FTP(Flow):
+    __slots__ = ('used_port',)
+
+    def __init__(self, flow_type: str, starttime, uid, saddr: str, daddr: str, used_port=False):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.used_port = used_port
+
+
+class SMTP(Flow):
+    __slots__ = ('last_reply',)
+
+    def __init__(self, flow_type: str, starttime, uid, saddr: str, daddr: str, last_reply=''):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.last_reply = last_reply
+
+
+class Files(Flow):
+    __slots__ = (
+        'size',
+        'md5',
+        'sha1',
+        'source',
+        'analyzers',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        size='',
+        md5='',
+        sha1='',
+        source='',
+        analyzers='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        # downloaded file size
+        self.size = size
+        self.md5 = md5
+        self.sha1 = sha1
+        # used for detecting ssl certs
+        self.source = source
+        self.analyzers = analyzers
+
+
+class ARP(Flow):
+    __slots__ = (
+        'operation',
+        'src_mac',
+        'dst_mac',
+        'src_hw',
+        'dst_hw',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        operation='',
+        src_mac='',
+        dst_mac='',
+        src_hw='',
+        dst_hw='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.operation = operation
+        self.src_mac = src_mac
+        self.dst_mac = dst_mac
+        self.src_hw = src_hw
+        self.dst_hw = dst_hw
+
+
+class Software(Flow):
+    __slots__ = (
+        'software_type',
+        'unparsed_version',
+        'version_major',
+        'version_minor',
+    )
+
+    def __init__(
+        self,
+        flow_type: str,
+        starttime,
+        uid,
+        saddr: str,
+        daddr: str,
+        software_type='',
+        unparsed_version='',
+        version_major='',
+        version_minor='',
+    ):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        # can be 'SSH::SERVER' or 'SSH::CLIENT'
+        self.software_type = software_type
+        self.unparsed_version = unparsed_version
+        self.version_major = version_major
+        self.version_minor = version_minor
+
+
+class Weird(Flow):
+    __slots__ = ('name', 'addl')
+
+    def __init__(self, flow_type: str, starttime, uid, saddr: str, daddr: str, name='', addl=''):
+        Flow.__init__(self, flow_type, starttime, uid, saddr, daddr)
+        self.name = name
+        self.addl = addl
@@ -30,6 +30,7 @@ import json
 import traceback
 import threading
 import subprocess
+import heapq
 
 # Input Process
 class InputProcess(multiprocessing.Process):
@@ -97,6 +98,8 @@ class InputProcess(multiprocessing.Process):
             target=self.run_zeek,
             daemon=True
         )
+        # set by filemonitor.py when zeek creates a new log file
+        self.new_zeek_file = threading.Event()
 
     def read_configuration(self):
         conf = ConfigParser()
@@ -254,49 +257,60 @@ class InputProcess(multiprocessing.Process):
 
         return timestamp, nline
 
-    def cache_nxt_line_in_file(self, filename):
+    def cache_nxt_line_in_file(self, filename) -> bool:
+        """
+        Reads the next flow from the given file, caches it and pushes its ts
+        to the heap of earliest lines
+        returns True if a line was cached, False if the file has nothing to read for now
+        """
         file_handler = self.get_file_handler(filename)
         if not file_handler:
             return False
 
-
         # Only read the next line if the previous line  from this file was sent
         if filename in self.cache_lines:
             # We have still something to send, do not read the next line from this file
             return False
 
         # We don't have any waiting line for this file, so proceed
-        try:
-            zeek_line = file_handler.readline()
-        except ValueError:
-            # remover thread just finished closing all old handles.
-            # comes here if I/O operation failed due to a closed file.
-            # to get the new dict of open handles.
-            return False
+        while True:
+            try:
+                zeek_line = file_handler.readline()
+            except ValueError:
+                # remover thread just finished closing all old handles.
+                # comes here if I/O operation failed due to a closed file.
+                # to get the new dict of open handles.
+                return False
 
-        # Did the file end?
-        if not zeek_line or zeek_line.startswith('#'):
-            # We reached the end of one of the files that we were reading.
-            # Wait for more data to come from another file
-            return False
+            # Did the file end?
+            if not zeek_line:
+                # We reached the end of one of the files that we were reading.
+                # Wait for more data to come from another file
+                return False
 
-        timestamp, nline = self.get_ts_from_line(zeek_line)
-        if not timestamp:
-            return False
+            if zeek_line.startswith('#'):
+                # zeek headers and footers, skip them
+                continue
 
+            timestamp, nline = self.get_ts_from_line(zeek_line)
+            if timestamp:
+                break
 
-        self.file_time[filename] = timestamp
         # Store the line in the cache
         self.cache_lines[filename] = {
             'type': filename,
             'data': nline
         }
+        heapq.heappush(self.earliest_lines, (timestamp, filename))
         return True
 
     def should_stop_zeek(self):
         # If we don't have any cached lines to send,
         # it may mean that new lines are not arriving. Check
         if not self.cache_lines:
+            if self.is_static_input and not self.files_to_read:
+                # every file in a zeek dir/file that isn't growing was read till the end
+                return True
             # Verify that we didn't have any new lines in the
             # last 10 seconds. Seems enough for any network to have ANY traffic
             # Since we actually read something form any file, update the last time of read
@@ -312,64 +326,80 @@ class InputProcess(multiprocessing.Process):
         for file, handle in self.open_file_handlers.items():
             self.print(f'Closing file {file}', 2, 0)
             handle.close()
-    def get_earliest_line(self):
+
+    def refresh_zeek_files(self):
         """
-        loops through all the caches lines and returns the line with the earliest ts
+        Gets the list of zeek files from the db and starts reading the ones we don't know about
+        this is only called at the start and when filemonitor.py tells us a new file was created
         """
-        # Now read lines in order. The line with the earliest timestamp first
-        files_sorted_by_ts = sorted(self.file_time, key=self.file_time.get)
-        try:
-            # get the file that has the earliest flow
-            file_with_earliest_flow = files_sorted_by_ts[0]
-        except IndexError:
-            # No more sorted keys. Just loop waiting for more lines
-            # It may happen that we check all the files in the folder,
-            # and there is still no files for us.
-            # To cover this case, just refresh the list of files
-            self.zeek_files = __database__.get_all_zeek_file()
-            # time.sleep(1)
-            return False, False
+        for filename in __database__.get_all_zeek_file():
+            # filename is the log file name with .log extension in case of interface or pcap
+            # and without the ext in case of zeek files
+            if not filename.endswith('.log'):
+                filename += '.log'
+
+            if filename in self.zeek_files or self.is_ignored_file(filename):
+                continue
 
+            self.zeek_files.add(filename)
+            self.files_to_read.add(filename)
+
+    def get_earliest_line(self):
+        """
+        pops the cached line with the earliest ts
+        """
         # to fix the problem of evidence being generated BEFORE their corresponding flows are added to our db
         # make sure we read flows in the following order:
         # dns.log  (make it a priority to avoid FP connection without dns resolution alerts)
         # conn.log
         # any other flow
-        # for key in cache_lines:
-        #     if 'dns' in key:
-        #         file_with_earliest_flow = key
-        #         break
-        # comes here if we're done with all conn.log flows and it's time to process other files
-        earliest_line = self.cache_lines[file_with_earliest_flow]
+        try:
+            # get the file that has the earliest flow
+            _, file_with_earliest_flow = heapq.heappop(self.earliest_lines)
+        except IndexError:
+            # No cached lines. Just loop waiting for more lines
+            return False, False
+
+        earliest_line = self.cache_lines.pop(file_with_earliest_flow)
         return earliest_line, file_with_earliest_flow
 
     def read_zeek_files(self) -> int:
         try:
-            # Get the zeek files in the folder now
-            self.zeek_files = __database__.get_all_zeek_file()
+            # a heap of (ts, filename), one entry for each cached line
+            self.earliest_lines = []
+            # files that don't have a cached line and should be read from
+            self.files_to_read = set()
+            self.zeek_files = set()
             self.open_file_handlers = {}
-            self.file_time = {}
             self.cache_lines = {}
+            # zeek files given with -f that are not growing are read only once,
+            # when we reach the end of them, they're done
+            self.is_static_input = (
+                self.input_type in ('zeek_folder', 'zeek_log_file')
+                and not __database__.is_growing_zeek_dir()
+            )
+            # Get the zeek files in the folder now
+            self.new_zeek_file.clear()
+            self.refresh_zeek_files()
             # Try to keep track of when was the last update so we stop this reading
             self.last_updated_file_time = datetime.now()
 
             lines = 0
             while True:
                 self.check_if_time_to_del_rotated_files()
-                # Go to all the files generated by Zeek and read 1
-                # line from each of them
-                for filename in self.zeek_files:
-                    # filename is the log file name with .log extension in case of interface or pcap
-                    # and without the ext in case of zeek files
-                    if not filename.endswith('.log'):
-                        filename += '.log'
-
-                    if self.is_ignored_file(filename):
-                        continue
-
-                    # reads 1 line from the given file and cache it
-                    # from in self.cache_lines
-                    self.cache_nxt_line_in_file(filename)
+                if self.new_zeek_file.is_set():
+                    # filemonitor.py detected new files created by Zeek
+                    # while we were processing them.
+                    self.new_zeek_file.clear()
+                    self.refresh_zeek_files()
+
+                # read 1 line from each file that doesn't have a cached line
+                for filename in list(self.files_to_read):
+                    if self.cache_nxt_line_in_file(filename):
+                        self.files_to_read.discard(filename)
+                    elif self.is_static_input:
+                        # we reached the end of this file, it won't grow
+                        self.files_to_read.discard(filename)
 
                 if self.should_stop_zeek():
                     break
@@ -384,12 +414,8 @@ class InputProcess(multiprocessing.Process):
                 # when testing, no need to read the whole file!
                 if lines == 10 and self.testing:
                     break
-                # Delete this line from the cache and the time list
-                del self.cache_lines[file_with_earliest_flow]
-                del self.file_time[file_with_earliest_flow]
-                # Get the new list of files. Since new files may have been created by
-                # Zeek while we were processing them.
-                self.zeek_files = __database__.get_all_zeek_file()
+                # the next line of this file should be read in the next iteration
+                self.files_to_read.add(file_with_earliest_flow)
 
             self.close_all_handles()
 
@@ -638,7 +664,9 @@ class InputProcess(multiprocessing.Process):
         # some process to tell us which files to read in real time when they appear
         # Get the file eventhandler
         # We have to set event_handler and event_observer before running zeek.
-        event_handler = FileEventHandler(self.redis_port, self.zeek_folder, self.input_type)
+        event_handler = FileEventHandler(
+            self.redis_port, self.zeek_folder, self.input_type, self.new_zeek_file
+        )
         # Create an observer
         self.event_observer = Observer()
         # Schedule the observer with the callback on the file handler
@@ -18,8 +18,25 @@
 from slips_files.core.database.database import __database__
 from slips_files.common.config_parser import ConfigParser
 from slips_files.common.slips_utils import utils
+from slips_files.common.timewindow_cache import TimewindowCache
 from datetime import datetime, timedelta
 from .whitelist import Whitelist
+from .flows import (
+    Flow,
+    Conn,
+    DNS,
+    HTTP,
+    SSL,
+    SSH,
+    Notice,
+    DHCP,
+    FTP,
+    SMTP,
+    Files,
+    ARP,
+    Software,
+    Weird,
+)
 import multiprocessing
 import json
 import sys
@@ -36,10 +53,13 @@ class ProfilerProcess(multiprocessing.Process):
     """A class to create the profiles for IPs and the rest of data"""
 
     def __init__(
-        self, inputqueue, outputqueue, verbose, debug, redis_port
+        self, inputqueue, outputqueue, verbose, debug, redis_port, worker_id=0
     ):
         self.name = 'Profiler'
         multiprocessing.Process.__init__(self)
+        # slips can run many profilers, each one processes the profiles of a shard of saddrs
+        self.worker_id = worker_id
+        self.worker_name = self.get_worker_name(worker_id)
         self.inputqueue = inputqueue
         self.outputqueue = outputqueue
         self.timeformat = None
@@ -56,6 +76,8 @@ class ProfilerProcess(multiprocessing.Process):
         # there has to be a timeout or it will wait forever and never receive a new line
         self.timeout = 0.0000001
         self.c1 = __database__.subscribe('reload_whitelist')
+        # finds the tw of each flow without asking the db
+        self.tw_cache = TimewindowCache()
         self.separators = {
             'zeek': '',
             'suricata': '',
@@ -65,6 +87,13 @@ class ProfilerProcess(multiprocessing.Process):
             'argus-tabs': '\t'
         }
 
+    @staticmethod
+    def get_worker_name(worker_id: int) -> str:
+        """
+        returns the name used by the given profiler worker in the finished_modules channel
+        """
+        return 'Profiler' if worker_id == 0 else f'Profiler_{worker_id}'
+
     def print(self, text, verbose=1, debug=0):
         """
         Function to use to print text using the outputqueue of slips.
@@ -256,9 +285,10 @@ class ProfilerProcess(multiprocessing.Process):
             self.print(traceback.print_exc(),0,1)
             sys.exit(1)
 
-    def process_zeek_tabs_input(self, new_line: str) -> None:
+    def process_zeek_tabs_input(self, new_line: dict):
         """
         Process the tab line from zeek.
+        returns the record of the flow, or None if the log type isn't known
         """
         line = new_line['data']
         line = line.rstrip('\n')
@@ -270,113 +300,62 @@ class ProfilerProcess(multiprocessing.Process):
             # using regex split, split line when you encounter more than 2 spaces in a row
             line = split(r'\s{2,}', line)
 
+        def get_field(index: int, default=''):
+            try:
+                return line[index]
+            except IndexError:
+                return default
 
-        # Generic fields in Zeek
-        self.column_values: dict = {}
-        # We need to set it to empty at the beginning so any new flow has
-        # the key 'type'
-        self.column_values['type'] = ''
-        try:
-            self.column_values['starttime'] = utils.convert_to_datetime(line[0])
-        except IndexError:
-            self.column_values['starttime'] = ''
+        def get_float(index: int) -> float:
+            try:
+                return float(line[index])
+            except (IndexError, ValueError):
+                return 0
 
+        # Generic fields in Zeek
         try:
-            self.column_values['uid'] = line[1]
-        except IndexError:
-            self.column_values['uid'] = False
-        try:
-            self.column_values['saddr'] = line[2]
-        except IndexError:
-            self.column_values['saddr'] = ''
-        try:
-            self.column_values['daddr'] = line[4]
+            starttime = utils.convert_to_datetime(line[0])
         except IndexError:
-            self.column_values['daddr'] = ''
+            starttime = ''
+        uid = get_field(1, False)
+        saddr = get_field(2)
+        daddr = get_field(4)
 
-        if 'conn.log' in new_line['type']:
-            self.column_values['type'] = 'conn'
-            try:
-                self.column_values['dur'] = float(line[8])
-            except (IndexError, ValueError):
-                self.column_values['dur'] = 0
-            self.column_values['endtime'] = str(
-                self.column_values['starttime']
-            ) + str(timedelta(seconds=self.column_values['dur']))
-            self.column_values['proto'] = line[6]
-            try:
-                self.column_values['appproto'] = line[7]
-            except IndexError:
+        file_type = new_line['type']
+        if 'conn.log' in file_type:
+            dur = get_float(8)
+            spkts = get_float(16)
+            dpkts = get_float(18)
+            sbytes = get_float(9)
+            dbytes = get_float(10)
+            state = get_field(11)
+            return Conn(
+                'conn',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                dur=dur,
+                endtime=str(starttime) + str(timedelta(seconds=dur)),
+                proto=line[6],
                 # no service recognized
-                self.column_values['appproto'] = ''
-            try:
-                self.column_values['sport'] = line[3]
-            except IndexError:
-                self.column_values['sport'] = ''
-            self.column_values['dir'] = '->'
-            try:
-                self.column_values['dport'] = line[5]
-            except IndexError:
-                self.column_values['dport'] = ''
-            try:
-                self.column_values['state'] = line[11]
-            except IndexError:
-                self.column_values['state'] = ''
-            try:
-                self.column_values['spkts'] = float(line[16])
-            except (IndexError, ValueError):
-                self.column_values['spkts'] = 0
-            try:
-                self.column_values['dpkts'] = float(line[18])
-            except (IndexError, ValueError):
-                self.column_values['dpkts'] = 0
-            self.column_values['pkts'] = (
-                self.column_values['spkts'] + self.column_values['dpkts']
-            )
-            try:
-                self.column_values['sbytes'] = float(line[9])
-            except (IndexError, ValueError):
-                self.column_values['sbytes'] = 0
-            try:
-                self.column_values['dbytes'] = float(line[10])
-            except (IndexError, ValueError):
-                self.column_values['dbytes'] = 0
-            self.column_values['bytes'] = (
-                self.column_values['sbytes'] + self.column_values['dbytes']
+                appproto=get_field(7),
+                sport=get_field(3),
+                dport=get_field(5),
+                state=state,
+                dir='->',
+                pkts=spkts + dpkts,
+                spkts=spkts,
+                dpkts=dpkts,
+                bytes=sbytes + dbytes,
+                sbytes=sbytes,
+                dbytes=dbytes,
+                state_hist=get_field(15, state),
+                smac=get_field(21),
+                dmac=get_field(22),
             )
-            try:
-                self.column_values['state_hist'] = line[15]
-            except IndexError:
-                self.column_values['state_hist'] = self.column_values['state']
 
-            try:
-                self.column_values['smac'] = line[21]
-            except IndexError:
-                self.column_values['smac'] = ''
-
-            try:
-                self.column_values['dmac'] = line[22]
-            except IndexError:
-                self.column_values['dmac'] = ''
-
-        elif 'dns.log' in new_line['type']:
-            self.column_values['type'] = 'dns'
-            try:
-                self.column_values['query'] = line[9]
-            except IndexError:
-                self.column_values['query'] = ''
-            try:
-                self.column_values['qclass_name'] = line[11]
-            except IndexError:
-                self.column_values['qclass_name'] = ''
-            try:
-                self.column_values['qtype_name'] = line[13]
-            except IndexError:
-                self.column_values['qtype_name'] = ''
-            try:
-                self.column_values['rcode_name'] = line[15]
-            except IndexError:
-                self.column_values['rcode_name'] = ''
+        elif 'dns.log' in file_type:
             try:
                 answers = line[21]
                 if type(answers) == str:
@@ -385,340 +364,224 @@ class ProfilerProcess(multiprocessing.Process):
                     answers = answers.split(',')
                 # ignore dns TXT records
                 answers = [answer for answer in answers if 'TXT ' not in answer]
-                self.column_values['answers'] = answers
-            except IndexError:
-                self.column_values['answers'] = ''
-            try:
-                self.column_values['TTLs'] = line[22]
-            except IndexError:
-                self.column_values['TTLs'] = ''
-        elif 'http.log' in new_line['type']:
-            self.column_values['type'] = 'http'
-            try:
-                self.column_values['method'] = line[7]
-            except IndexError:
-                self.column_values['method'] = ''
-            try:
-                self.column_values['host'] = line[8]
-            except IndexError:
-                self.column_values['host'] = ''
-            try:
-                self.column_values['uri'] = line[9]
-            except IndexError:
-                self.column_values['uri'] = ''
-            try:
-                self.column_values['httpversion'] = line[11]
-            except IndexError:
-                self.column_values['httpversion'] = ''
-            try:
-                self.column_values['user_agent'] = line[12]
-            except IndexError:
-                self.column_values['user_agent'] = ''
-            try:
-                self.column_values['request_body_len'] = line[13]
-            except IndexError:
-                self.column_values['request_body_len'] = 0
-            try:
-                self.column_values['response_body_len'] = line[14]
-            except IndexError:
-                self.column_values['response_body_len'] = 0
-            try:
-                self.column_values['status_code'] = line[15]
-            except IndexError:
-                self.column_values['status_code'] = ''
-            try:
-                self.column_values['status_msg'] = line[16]
-            except IndexError:
-                self.column_values['status_msg'] = ''
-            try:
-                self.column_values['resp_mime_types'] = line[28]
-            except IndexError:
-                self.column_values['resp_mime_types'] = ''
-            try:
-                self.column_values['resp_fuids'] = line[26]
-            except IndexError:
-                self.column_values['resp_fuids'] = ''
-
-        elif 'ssl.log' in new_line['type']:
-            self.column_values['type'] = 'ssl'
-            try:
-                self.column_values['sport'] = line[3]
-            except IndexError:
-                self.column_values['sport'] = ''
-            try:
-                self.column_values['dport'] = line[5]
-            except IndexError:
-                self.column_values['dport'] = ''
-            try:
-                self.column_values['sslversion'] = line[6]
-            except IndexError:
-                self.column_values['sslversion'] = ''
-            try:
-                self.column_values['cipher'] = line[7]
-            except IndexError:
-                self.column_values['cipher'] = ''
-            try:
-                self.column_values['curve'] = line[8]
-            except IndexError:
-                self.column_values['curve'] = ''
-            try:
-                self.column_values['server_name'] = line[9]
             except IndexError:
-                self.column_values['server_name'] = ''
-            try:
-                self.column_values['resumed'] = line[10]
-            except IndexError:
-                self.column_values['resumed'] = ''
-            try:
-                self.column_values['established'] = line[13]
-            except IndexError:
-                self.column_values['established'] = ''
-            try:
-                self.column_values['cert_chain_fuids'] = line[14]
-            except IndexError:
-                self.column_values['cert_chain_fuids'] = ''
-            try:
-                self.column_values['client_cert_chain_fuids'] = line[15]
-            except IndexError:
-                self.column_values['client_cert_chain_fuids'] = ''
-            try:
-                self.column_values['subject'] = line[16]
-            except IndexError:
-                self.column_values['subject'] = ''
-            try:
-                self.column_values['issuer'] = line[17]
-            except IndexError:
-                self.column_values['issuer'] = ''
-            try:
-                self.column_values['validation_status'] = line[20]
-            except IndexError:
-                self.column_values['validation_status'] = ''
+                answers = ''
+            return DNS(
+                'dns',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                query=get_field(9),
+                qclass_name=get_field(11),
+                qtype_name=get_field(13),
+                rcode_name=get_field(15),
+                answers=answers,
+                TTLs=get_field(22),
+            )
 
-            try:
-                self.column_values['ja3'] = line[21]
-            except IndexError:
-                self.column_values['ja3'] = ''
-            try:
-                self.column_values['ja3s'] = line[22]
-            except IndexError:
-                self.column_values['ja3s'] = ''
+        elif 'http.log' in file_type:
+            return HTTP(
+                'http',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                method=get_field(7),
+                host=get_field(8),
+                uri=get_field(9),
+                httpversion=get_field(11),
+                user_agent=get_field(12),
+                request_body_len=get_field(13, 0),
+                response_body_len=get_field(14, 0),
+                status_code=get_field(15),
+                status_msg=get_field(16),
+                resp_mime_types=get_field(28),
+                resp_fuids=get_field(26),
+            )
 
-            try:
-                self.column_values['is_DoH'] = line[23]
-            except IndexError:
-                self.column_values['is_DoH'] = ''
+        elif 'ssl.log' in file_type:
+            return SSL(
+                'ssl',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                sport=get_field(3),
+                dport=get_field(5),
+                sslversion=get_field(6),
+                cipher=get_field(7),
+                curve=get_field(8),
+                server_name=get_field(9),
+                resumed=get_field(10),
+                established=get_field(13),
+                cert_chain_fuids=get_field(14),
+                client_cert_chain_fuids=get_field(15),
+                subject=get_field(16),
+                issuer=get_field(17),
+                validation_status=get_field(20),
+                ja3=get_field(21),
+                ja3s=get_field(22),
+                is_DoH=get_field(23),
+            )
 
-        elif 'ssh.log' in new_line['type']:
-            self.column_values['type'] = 'ssh'
-            try:
-                self.column_values['version'] = line[6]
-            except IndexError:
-                self.column_values['version'] = ''
+        elif 'ssh.log' in file_type:
             # Zeek can put in column 7 the auth success if it has one
             # or the auth attempts only. However if the auth
             # success is there, the auth attempts are too.
             if 'T' in line[7]:
-                try:
-                    self.column_values['auth_success'] = line[7]
-                except IndexError:
-                    self.column_values['auth_success'] = ''
-                try:
-                    self.column_values['auth_attempts'] = line[8]
-                except IndexError:
-                    self.column_values['auth_attempts'] = ''
-                try:
-                    self.column_values['client'] = line[10]
-                except IndexError:
-                    self.column_values['client'] = ''
-                try:
-                    self.column_values['server'] = line[11]
-                except IndexError:
-                    self.column_values['server'] = ''
-                try:
-                    self.column_values['cipher_alg'] = line[12]
-                except IndexError:
-                    self.column_values['cipher_alg'] = ''
-                try:
-                    self.column_values['mac_alg'] = line[13]
-                except IndexError:
-                    self.column_values['mac_alg'] = ''
-                try:
-                    self.column_values['compression_alg'] = line[14]
-                except IndexError:
-                    self.column_values['compression_alg'] = ''
-                try:
-                    self.column_values['kex_alg'] = line[15]
-                except IndexError:
-                    self.column_values['kex_alg'] = ''
-                try:
-                    self.column_values['host_key_alg'] = line[16]
-                except IndexError:
-                    self.column_values['host_key_alg'] = ''
-                try:
-                    self.column_values['host_key'] = line[17]
-                except IndexError:
-                    self.column_values['host_key'] = ''
-            elif 'T' not in line[7]:
-                self.column_values['auth_success'] = ''
-                try:
-                    self.column_values['auth_attempts'] = line[7]
-                except IndexError:
-                    self.column_values['auth_attempts'] = ''
-                try:
-                    self.column_values['client'] = line[9]
-                except IndexError:
-                    self.column_values['client'] = ''
-                try:
-                    self.column_values['server'] = line[10]
-                except IndexError:
-                    self.column_values['server'] = ''
-                try:
-                    self.column_values['cipher_alg'] = line[11]
-                except IndexError:
-                    self.column_values['cipher_alg'] = ''
-                try:
-                    self.column_values['mac_alg'] = line[12]
-                except IndexError:
-                    self.column_values['mac_alg'] = ''
-                try:
-                    self.column_values['compression_alg'] = line[13]
-                except IndexError:
-                    self.column_values['compression_alg'] = ''
-                try:
-                    self.column_values['kex_alg'] = line[14]
-                except IndexError:
-                    self.column_values['kex_alg'] = ''
-                try:
-                    self.column_values['host_key_alg'] = line[15]
-                except IndexError:
-                    self.column_values['host_key_alg'] = ''
-                try:
-                    self.column_values['host_key'] = line[16]
-                except IndexError:
-                    self.column_values['host_key'] = ''
-        elif 'irc' in new_line['type']:
-            self.column_values['type'] = 'irc'
-        elif 'long' in new_line['type']:
-            self.column_values['type'] = 'long'
-        elif 'dhcp.log' in new_line['type']:
-            self.column_values['type'] = 'dhcp'
+                auth_success = get_field(7)
+                # the index of the auth attempts
+                offset = 8
+            else:
+                auth_success = ''
+                offset = 7
+            return SSH(
+                'ssh',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                version=get_field(6),
+                auth_success=auth_success,
+                auth_attempts=get_field(offset),
+                client=get_field(offset + 2),
+                server=get_field(offset + 3),
+                cipher_alg=get_field(offset + 4),
+                mac_alg=get_field(offset + 5),
+                compression_alg=get_field(offset + 6),
+                kex_alg=get_field(offset + 7),
+                host_key_alg=get_field(offset + 8),
+                host_key=get_field(offset + 9),
+            )
+        elif 'irc' in file_type:
+            return Flow('irc', starttime, uid, saddr, daddr)
+        elif 'long' in file_type:
+            return Flow('long', starttime, uid, saddr, daddr)
+        elif 'dhcp.log' in file_type:
             #  daddr in dhcp.log is the server_addr at index 3, not 4 like most log files
-            self.column_values['daddr'] = line[3]
-            self.column_values['client_addr'] = line[2]   # the same as saddr
-            self.column_values['server_addr'] = line[3]
-            self.column_values['mac'] = line[4]   # this is the client mac
-            self.column_values['host_name'] = line[5]
-            self.column_values['requested_addr'] = line[8]
-            self.column_values['saddr'] = self.column_values['client_addr']
-            self.column_values['daddr'] = self.column_values['server_addr']
-        elif 'dce_rpc' in new_line['type']:
-            self.column_values['type'] = 'dce_rpc'
-        elif 'dnp3' in new_line['type']:
-            self.column_values['type'] = 'dnp3'
-        elif 'ftp' in new_line['type']:
-            self.column_values['type'] = 'ftp'
-            self.column_values['used_port'] = line[17]
-        elif 'kerberos' in new_line['type']:
-            self.column_values['type'] = 'kerberos'
-        elif 'mysql' in new_line['type']:
-            self.column_values['type'] = 'mysql'
-        elif 'modbus' in new_line['type']:
-            self.column_values['type'] = 'modbus'
-        elif 'ntlm' in new_line['type']:
-            self.column_values['type'] = 'ntlm'
-        elif 'rdp' in new_line['type']:
-            self.column_values['type'] = 'rdp'
-        elif 'sip' in new_line['type']:
-            self.column_values['type'] = 'sip'
-        elif 'smb_cmd' in new_line['type']:
-            self.column_values['type'] = 'smb_cmd'
-        elif 'smb_files' in new_line['type']:
-            self.column_values['type'] = 'smb_files'
-        elif 'smb_mapping' in new_line['type']:
-            self.column_values['type'] = 'smb_mapping'
-        elif 'smtp.log' in new_line['type']:
+            return DHCP(
+                'dhcp',
+                starttime,
+                uid,
+                # the same as client_addr
+                line[2],
+                line[3],
+                client_addr=line[2],
+                server_addr=line[3],
+                # this is the client mac
+                mac=line[4],
+                host_name=line[5],
+                requested_addr=line[8],
+            )
+        elif 'dce_rpc' in file_type:
+            return Flow('dce_rpc', starttime, uid, saddr, daddr)
+        elif 'dnp3' in file_type:
+            return Flow('dnp3', starttime, uid, saddr, daddr)
+        elif 'ftp' in file_type:
+            return FTP('ftp', starttime, uid, saddr, daddr, used_port=line[17])
+        elif 'kerberos' in file_type:
+            return Flow('kerberos', starttime, uid, saddr, daddr)
+        elif 'mysql' in file_type:
+            return Flow('mysql', starttime, uid, saddr, daddr)
+        elif 'modbus' in file_type:
+            return Flow('modbus', starttime, uid, saddr, daddr)
+        elif 'ntlm' in file_type:
+            return Flow('ntlm', starttime, uid, saddr, daddr)
+        elif 'rdp' in file_type:
+            return Flow('rdp', starttime, uid, saddr, daddr)
+        elif 'sip' in file_type:
+            return Flow('sip', starttime, uid, saddr, daddr)
+        elif 'smb_cmd' in file_type:
+            return Flow('smb_cmd', starttime, uid, saddr, daddr)
+        elif 'smb_files' in file_type:
+            return Flow('smb_files', starttime, uid, saddr, daddr)
+        elif 'smb_mapping' in file_type:
+            return Flow('smb_mapping', starttime, uid, saddr, daddr)
+        elif 'smtp.log' in file_type:
             # "ts uid id.orig_h id.orig_p id.resp_h id.resp_p trans_depth helo mailfrom
             # rcptto date from to reply_to msg_id in_reply_to subject x_originating_ip
             # first_received second_received last_reply path user_agent tls fuids is_webmail"
-            self.column_values['type'] = 'smtp'
-            self.column_values['last_reply'] = line[20]
-        elif 'socks.log' in new_line['type']:
-            self.column_values['type'] = 'socks'
-        elif 'syslog.log' in new_line['type']:
-            self.column_values['type'] = 'syslog'
-        elif 'tunnel.log' in new_line['type']:
-            self.column_values['type'] = 'tunnel'
-        elif 'notice.log' in new_line['type']:
+            return SMTP('smtp', starttime, uid, saddr, daddr, last_reply=line[20])
+        elif 'socks.log' in file_type:
+            return Flow('socks', starttime, uid, saddr, daddr)
+        elif 'syslog.log' in file_type:
+            return Flow('syslog', starttime, uid, saddr, daddr)
+        elif 'tunnel.log' in file_type:
+            return Flow('tunnel', starttime, uid, saddr, daddr)
+        elif 'notice.log' in file_type:
             # fields	ts	uid	id.orig_h	id.orig_p	id.resp_h	id.resp_p	fuid	file_mime_type	file_desc
             # proto	note	msg	sub	src	dst	p	n	peer_descr	actions	suppress_for
-            self.column_values['type'] = 'notice'
             # portscan notices don't have id.orig_h or id.resp_h fields, instead they have src and dst
-            if self.column_values['saddr'] == '-':
-                try:
-                    self.column_values['saddr'] = line[13]   #  src field
-                except IndexError:
-                    # line doesn't have a p field
-                    # keep it - as it is
-                    pass
-
-            if self.column_values['daddr'] == '-':
-                self.column_values['daddr'] = line[14]  #  dst field
-                if self.column_values['daddr'] == '-':
-                    self.column_values['daddr'] = self.column_values['saddr']
-
-            self.column_values['dport'] = line[5]   # id.orig_p
-            if self.column_values['dport'] == '-':
-                try:
-                    self.column_values['dport'] = line[15]   # p field
-                except IndexError:
-                    # line doesn't have a p field
-                    # keep it - as it is
-                    pass
-            self.column_values['sport'] = line[3]
-            self.column_values['note'] = line[10]
-            self.column_values['scanning_ip'] = self.column_values['saddr']
-            self.column_values['scanned_port'] = self.column_values['dport']
-            self.column_values['msg'] = line[
-                11
-            ]   # we're looking for self signed certs in this field
-        elif 'files.log' in new_line['type']:
+            if saddr == '-':
+                # if the line doesn't have a src field, keep it - as it is
+                saddr = get_field(13, saddr)
+
+            if daddr == '-':
+                daddr = line[14]  #  dst field
+                if daddr == '-':
+                    daddr = saddr
+
+            dport = line[5]   # id.orig_p
+            if dport == '-':
+                # if the line doesn't have a p field, keep it - as it is
+                dport = get_field(15, dport)
+            return Notice(
+                'notice',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                sport=line[3],
+                dport=dport,
+                note=line[10],
+                # we're looking for self signed certs in this field
+                msg=line[11],
+                scanned_port=dport,
+                scanning_ip=saddr,
+            )
+        elif 'files.log' in file_type:
             """Parse the fields we're interested in in the files.log file"""
             # the slash before files to distinguish between 'files' in the dir name and file.log
-            self.column_values.update(
-                {
-                    'type': 'files',
-                    'uid': line[4],
-                    'saddr': line[2],
-                    'daddr': line[3],  # rx_hosts
-                    'size': line[13],  # downloaded file size
-                    'md5': line[19],
-                    # used for detecting ssl certs
-                    'source': line[5],
-                    'analyzers': line[7],
-                    'sha1': line[19],
-                }
+            return Files(
+                'files',
+                starttime,
+                line[4],
+                line[2],
+                # rx_hosts
+                line[3],
+                # downloaded file size
+                size=line[13],
+                md5=line[19],
+                sha1=line[19],
+                # used for detecting ssl certs
+                source=line[5],
+                analyzers=line[7],
             )
 
-        elif 'arp.log' in new_line['type']:
-            self.column_values['type'] = 'arp'
-            self.column_values['operation'] = line[1]
-            self.column_values['src_mac'] = line[2]
-            self.column_values['dst_mac'] = line[3]
-            self.column_values['saddr'] = line[4]
-            self.column_values['daddr'] = line[5]
-            self.column_values['src_hw'] = line[6]
-            self.column_values['dst_hw'] = line[7]
-
-        elif 'weird' in new_line['type']:
-            self.column_values['type'] = 'weird'
-            self.column_values['name'] = line[6]
-            self.column_values['addl'] = line[7]
+        elif 'arp.log' in file_type:
+            return ARP(
+                'arp',
+                starttime,
+                uid,
+                line[4],
+                line[5],
+                operation=line[1],
+                src_mac=line[2],
+                dst_mac=line[3],
+                src_hw=line[6],
+                dst_hw=line[7],
+            )
 
+        elif 'weird' in file_type:
+            return Weird(
+                'weird', starttime, uid, saddr, daddr, name=line[6], addl=line[7]
+            )
 
     def process_zeek_input(self, new_line: dict):
         """
         Process one zeek line(new_line) and extract columns
-        (parse them into column_values dict) to send to the database
+        returns the record of the flow to send to the database, or None if the log type isn't known
         """
         line = new_line['data']
         file_type = new_line['type']
@@ -733,495 +596,377 @@ class ProfilerProcess(multiprocessing.Process):
             file_type = file_type.split('/')[-1]
 
         # Generic fields in Zeek
-        self.column_values = {}
-        # We need to set it to empty at the beginning so any new flow has the key 'type'
-        self.column_values['type'] = ''
         # to set the default value to '' if ts isn't found
         ts = line.get('ts', False)
-        if ts:
-            self.column_values['starttime'] = utils.convert_to_datetime(ts)
-        else:
-            self.column_values['starttime'] = ''
-
-        self.column_values['uid'] = line.get('uid', False)
-        self.column_values['saddr'] = line.get('id.orig_h', '')
-        self.column_values['daddr'] = line.get('id.resp_h', '')
+        starttime = utils.convert_to_datetime(ts) if ts else ''
+        uid = line.get('uid', False)
+        saddr = line.get('id.orig_h', '')
+        daddr = line.get('id.resp_h', '')
 
         # Handle each zeek file type separately
         if 'conn' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'conn',
-                    'dur': float(line.get('duration', 0)),
-                    'endtime': str(self.column_values['starttime'])
-                    + str(timedelta(seconds=float(line.get('duration', 0)))),
-                    'proto': line['proto'],
-                    'appproto': line.get('service', ''),
-                    'sport': line.get('id.orig_p', ''),
-                    'dport': line.get('id.resp_p', ''),
-                    'state': line.get('conn_state', ''),
-                    'dir': '->',
-                    'spkts': line.get('orig_pkts', 0),
-                    'dpkts': line.get('resp_pkts', 0),
-                    'sbytes': line.get('orig_bytes', 0),
-                    'dbytes': line.get('resp_bytes', 0),
-                    'pkts': line.get('orig_pkts', 0)
-                    + line.get('resp_pkts', 0),
-                    'bytes': line.get('orig_bytes', 0)
-                    + line.get('resp_bytes', 0),
-                    'state_hist': line.get(
-                        'history', line.get('conn_state', '')
-                    ),
-                    'smac': line.get('orig_l2_addr', ''),
-                    'dmac': line.get('resp_l2_addr', ''),
-                }
-            )
             # orig_bytes: The number of payload bytes the src sent.
             # orig_ip_bytes: the length of the header + the payload
-
-        elif 'dns' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'dns',
-                    'query': line.get('query', ''),
-                    'qclass_name': line.get('qclass_name', ''),
-                    'qtype_name': line.get('qtype_name', ''),
-                    'rcode_name': line.get('rcode_name', ''),
-                    'answers': line.get('answers', ''),
-                    'TTLs': line.get('TTLs', ''),
-                }
+            dur = float(line.get('duration', 0))
+            spkts = line.get('orig_pkts', 0)
+            dpkts = line.get('resp_pkts', 0)
+            sbytes = line.get('orig_bytes', 0)
+            dbytes = line.get('resp_bytes', 0)
+            return Conn(
+                'conn',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                dur=dur,
+                endtime=str(starttime) + str(timedelta(seconds=dur)),
+                proto=line['proto'],
+                appproto=line.get('service', ''),
+                sport=line.get('id.orig_p', ''),
+                dport=line.get('id.resp_p', ''),
+                state=line.get('conn_state', ''),
+                dir='->',
+                pkts=spkts + dpkts,
+                spkts=spkts,
+                dpkts=dpkts,
+                bytes=sbytes + dbytes,
+                sbytes=sbytes,
+                dbytes=dbytes,
+                state_hist=line.get('history', line.get('conn_state', '')),
+                smac=line.get('orig_l2_addr', ''),
+                dmac=line.get('resp_l2_addr', ''),
             )
 
-            if type(self.column_values['answers']) == str:
+        elif 'dns' in file_type:
+            answers = line.get('answers', '')
+            if type(answers) == str:
                 # If the answer is only 1, Zeek gives a string
                 # so convert to a list
-                self.column_values.update(
-                    {'answers': [self.column_values['answers']]}
-                )
+                answers = [answers]
+            return DNS(
+                'dns',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                query=line.get('query', ''),
+                qclass_name=line.get('qclass_name', ''),
+                qtype_name=line.get('qtype_name', ''),
+                rcode_name=line.get('rcode_name', ''),
+                answers=answers,
+                TTLs=line.get('TTLs', ''),
+            )
 
         elif 'http' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'http',
-                    'method': line.get('method', ''),
-                    'host': line.get('host', ''),
-                    'uri': line.get('uri', ''),
-                    'httpversion': line.get('version', 0),
-                    'user_agent': line.get('user_agent', ''),
-                    'request_body_len': line.get('request_body_len', 0),
-                    'response_body_len': line.get('response_body_len', 0),
-                    'status_code': line.get('status_code', ''),
-                    'status_msg': line.get('status_msg', ''),
-                    'resp_mime_types': line.get('resp_mime_types', ''),
-                    'resp_fuids': line.get('resp_fuids', ''),
-                }
+            return HTTP(
+                'http',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                method=line.get('method', ''),
+                host=line.get('host', ''),
+                uri=line.get('uri', ''),
+                httpversion=line.get('version', 0),
+                user_agent=line.get('user_agent', ''),
+                request_body_len=line.get('request_body_len', 0),
+                response_body_len=line.get('response_body_len', 0),
+                status_code=line.get('status_code', ''),
+                status_msg=line.get('status_msg', ''),
+                resp_mime_types=line.get('resp_mime_types', ''),
+                resp_fuids=line.get('resp_fuids', ''),
             )
 
         elif 'ssl' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'ssl',
-                    'sslversion': line.get('version', ''),
-                    'sport': line.get('id.orig_p', ','),
-                    'dport': line.get('id.resp_p', ','),
-                    'cipher': line.get('cipher', ''),
-                    'resumed': line.get('resumed', ''),
-                    'established': line.get('established', ''),
-                    'cert_chain_fuids': line.get('cert_chain_fuids', ''),
-                    'client_cert_chain_fuids': line.get(
-                        'client_cert_chain_fuids', ''
-                    ),
-                    'subject': line.get('subject', ''),
-                    'issuer': line.get('issuer', ''),
-                    'validation_status': line.get('validation_status', ''),
-                    'curve': line.get('curve', ''),
-                    'server_name': line.get('server_name', ''),
-                    'ja3': line.get('ja3', ''),
-                    'is_DoH': line.get('is_DoH', 'false'),
-                    'ja3s': line.get('ja3s', ''),
-                }
+            return SSL(
+                'ssl',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                sslversion=line.get('version', ''),
+                sport=line.get('id.orig_p', ','),
+                dport=line.get('id.resp_p', ','),
+                cipher=line.get('cipher', ''),
+                resumed=line.get('resumed', ''),
+                established=line.get('established', ''),
+                cert_chain_fuids=line.get('cert_chain_fuids', ''),
+                client_cert_chain_fuids=line.get('client_cert_chain_fuids', ''),
+                subject=line.get('subject', ''),
+                issuer=line.get('issuer', ''),
+                validation_status=line.get('validation_status', ''),
+                curve=line.get('curve', ''),
+                server_name=line.get('server_name', ''),
+                ja3=line.get('ja3', ''),
+                is_DoH=line.get('is_DoH', 'false'),
+                ja3s=line.get('ja3s', ''),
             )
 
         elif 'ssh' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'ssh',
-                    'version': line.get('version', ''),
-                    'auth_success': line.get('auth_success', ''),
-                    'auth_attempts': line.get('auth_attempts', ''),
-                    'client': line.get('client', ''),
-                    'server': line.get('server', ''),
-                    'cipher_alg': line.get('cipher_alg', ''),
-                    'mac_alg': line.get('mac_alg', ''),
-                    'compression_alg': line.get('compression_alg', ''),
-                    'kex_alg': line.get('kex_alg', ''),
-                    'host_key_alg': line.get('host_key_alg', ''),
-                    'host_key': line.get('host_key', ''),
-                }
+            return SSH(
+                'ssh',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                version=line.get('version', ''),
+                auth_success=line.get('auth_success', ''),
+                auth_attempts=line.get('auth_attempts', ''),
+                client=line.get('client', ''),
+                server=line.get('server', ''),
+                cipher_alg=line.get('cipher_alg', ''),
+                mac_alg=line.get('mac_alg', ''),
+                compression_alg=line.get('compression_alg', ''),
+                kex_alg=line.get('kex_alg', ''),
+                host_key_alg=line.get('host_key_alg', ''),
+                host_key=line.get('host_key', ''),
             )
 
         elif 'irc' in file_type:
-            self.column_values.update({'type': 'irc'})
+            return Flow('irc', starttime, uid, saddr, daddr)
         elif 'long' in file_type:
-            self.column_values.update({'type': 'long'})
+            return Flow('long', starttime, uid, saddr, daddr)
         elif 'dhcp' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'dhcp',
-                    'client_addr': line.get('client_addr', ''),
-                    'server_addr': line.get('server_addr', ''),
-                    'host_name': line.get('host_name', ''),
-                    'mac': line.get('mac', ''),  # this is the client mac
-                    'saddr': line.get('client_addr', ''),
-                    'daddr': line.get('server_addr', ''),
-                    'requested_addr': line.get('requested_addr', ''),
-                }
-            )
-            # self.column_values['domain'] = line.get('domain','')
-            # self.column_values['assigned_addr'] = line.get('assigned_addr','')
-
+            saddr = line.get('client_addr', '')
+            daddr = line.get('server_addr', '')
             # Some zeek flow don't have saddr or daddr, seen in dhcp.log and notice.log use the mac address instead
-            if (
-                self.column_values['saddr'] == ''
-                and self.column_values['daddr'] == ''
-                and line.get('mac', False)
-            ):
-                self.column_values.update({'saddr': line.get('mac', '')})
+            if saddr == '' and daddr == '' and line.get('mac', False):
+                saddr = line.get('mac', '')
+            return DHCP(
+                'dhcp',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                client_addr=line.get('client_addr', ''),
+                server_addr=line.get('server_addr', ''),
+                host_name=line.get('host_name', ''),
+                mac=line.get('mac', ''),  # this is the client mac
+                requested_addr=line.get('requested_addr', ''),
+            )
 
         elif 'dce_rpc' in file_type:
-            self.column_values.update({'type': 'dce_rpc'})
+            return Flow('dce_rpc', starttime, uid, saddr, daddr)
         elif 'dnp3' in file_type:
-            self.column_values.update({'type': 'dnp3'})
+            return Flow('dnp3', starttime, uid, saddr, daddr)
         elif 'ftp' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'ftp',
-                    'used_port': line.get('data_channel.resp_p', False),
-                }
+            return FTP(
+                'ftp',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                used_port=line.get('data_channel.resp_p', False),
             )
 
         elif 'kerberos' in file_type:
-            self.column_values.update({'type': 'kerberos'})
+            return Flow('kerberos', starttime, uid, saddr, daddr)
         elif 'mysql' in file_type:
-            self.column_values.update({'type': 'mysql'})
+            return Flow('mysql', starttime, uid, saddr, daddr)
         elif 'modbus' in file_type:
-            self.column_values.update({'type': 'modbus'})
+            return Flow('modbus', starttime, uid, saddr, daddr)
         elif 'ntlm' in file_type:
-            self.column_values.update({'type': 'ntlm'})
+            return Flow('ntlm', starttime, uid, saddr, daddr)
         elif 'rdp' in file_type:
-            self.column_values.update({'type': 'rdp'})
+            return Flow('rdp', starttime, uid, saddr, daddr)
         elif 'sip' in file_type:
-            self.column_values.update({'type': 'sip'})
+            return Flow('sip', starttime, uid, saddr, daddr)
         elif 'smb_cmd' in file_type:
-            self.column_values.update({'type': 'smb_cmd'})
+            return Flow('smb_cmd', starttime, uid, saddr, daddr)
         elif 'smb_files' in file_type:
-            self.column_values.update({'type': 'smb_files'})
+            return Flow('smb_files', starttime, uid, saddr, daddr)
         elif 'smb_mapping' in file_type:
-            self.column_values.update({'type': 'smb_mapping'})
+            return Flow('smb_mapping', starttime, uid, saddr, daddr)
         elif 'smtp' in file_type:
-            self.column_values.update(
-                {'type': 'smtp', 'last_reply': line.get('last_reply', '')}
+            return SMTP(
+                'smtp', starttime, uid, saddr, daddr, last_reply=line.get('last_reply', '')
             )
         elif 'socks' in file_type:
-            self.column_values.update({'type': 'socks'})
+            return Flow('socks', starttime, uid, saddr, daddr)
         elif 'syslog' in file_type:
-            self.column_values.update({'type': 'syslog'})
+            return Flow('syslog', starttime, uid, saddr, daddr)
         elif 'tunnel' in file_type:
-            self.column_values.update({'type': 'tunnel'})
+            return Flow('tunnel', starttime, uid, saddr, daddr)
         elif 'notice' in file_type:
             """Parse the fields we're interested in in the notice.log file"""
             # notice fields: ts - uid id.orig_h(saddr) - id.orig_p(sport) - id.resp_h(daddr) - id.resp_p(dport) - note - msg
-            self.column_values.update(
-                {
-                    'type': 'notice',
-                    'sport': line.get('id.orig_p', ''),
-                    'dport': line.get('id.resp_p', ''),
-                    # self.column_values['scanned_ip'] = line.get('dst', '')
-                    'note': line.get('note', ''),
-                    'msg': line.get(
-                        'msg', ''
-                    ),  # we,'re looking for self signed certs in this field
-                    'scanned_port': line.get('p', ''),
-                    'scanning_ip': line.get('src', ''),
-                }
-            )
-
             # portscan notices don't have id.orig_h or id.resp_h fields, instead they have src and dst
-            if self.column_values['saddr'] == '':
-                self.column_values.update({'saddr': line.get('src', '')})
-            if self.column_values['daddr'] == '':
+            if saddr == '':
+                saddr = line.get('src', '')
+            if daddr == '':
                 # set daddr to src for now because the notice that contains portscan doesn't have a dst field and slips needs it to work
-                self.column_values.update(
-                    {'daddr': line.get('dst', self.column_values['saddr'])}
-                )
+                daddr = line.get('dst', saddr)
+            return Notice(
+                'notice',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                sport=line.get('id.orig_p', ''),
+                dport=line.get('id.resp_p', ''),
+                note=line.get('note', ''),
+                # we,'re looking for self signed certs in this field
+                msg=line.get('msg', ''),
+                scanned_port=line.get('p', ''),
+                scanning_ip=line.get('src', ''),
+            )
 
         elif 'files.log' in file_type:
             """Parse the fields we're interested in in the files.log file"""
             # the slash before files to distinguish between 'files' in the dir name and file.log
-            saddr =  line.get('tx_hosts', [''])[0]
-            if saddr:
-                self.column_values['saddr'] = saddr
-
-            daddr = line.get('rx_hosts', [''])[0]
-            if daddr:
-                self.column_values['daddr'] = daddr
-
-            self.column_values.update(
-                {
-                    'type': 'files',
-                    'uid': line.get('conn_uids', [''])[0],
-                    'size': line.get('seen_bytes', ''),  # downloaded file size
-                    'md5': line.get('md5', ''),
-                    # used for detecting ssl certs
-                    'source': line.get('source', ''),
-                    'analyzers': line.get('analyzers', ''),
-                    'sha1': line.get('sha1', ''),
-                }
+            return Files(
+                'files',
+                starttime,
+                line.get('conn_uids', [''])[0],
+                line.get('tx_hosts', [''])[0] or saddr,
+                line.get('rx_hosts', [''])[0] or daddr,
+                size=line.get('seen_bytes', ''),  # downloaded file size
+                md5=line.get('md5', ''),
+                sha1=line.get('sha1', ''),
+                # used for detecting ssl certs
+                source=line.get('source', ''),
+                analyzers=line.get('analyzers', ''),
             )
         elif 'arp' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'arp',
-                    'src_mac': line.get('src_mac', ''),
-                    'dst_mac': line.get('dst_mac', ''),
-                    'saddr': line.get('orig_h', ''),
-                    'daddr': line.get('resp_h', ''),
-                    'dst_hw': line.get('resp_hw', ''),
-                    'src_hw': line.get('orig_hw', ''),
-                    'operation': line.get('operation', ''),
-                }
+            return ARP(
+                'arp',
+                starttime,
+                uid,
+                line.get('orig_h', ''),
+                line.get('resp_h', ''),
+                operation=line.get('operation', ''),
+                src_mac=line.get('src_mac', ''),
+                dst_mac=line.get('dst_mac', ''),
+                src_hw=line.get('orig_hw', ''),
+                dst_hw=line.get('resp_hw', ''),
             )
         elif 'software' in file_type:
             software_type = line.get('software_type', '')
             # store info about everything except http:broswer
             # we're already reading browser UA from http.log
             if software_type == 'HTTP::BROWSER':
-                return True
-            self.column_values.update(
-                {
-                    'type': 'software',
-                    'saddr': line.get('host', ''),
-                    'software_type': software_type,
-                    'unparsed_version': line.get('unparsed_version', ''),
-                    'version.major': line.get('version.major', ''),
-                    'version.minor': line.get('version.minor', ''),
-                }
+                return None
+            return Software(
+                'software',
+                starttime,
+                uid,
+                line.get('host', ''),
+                daddr,
+                software_type=software_type,
+                unparsed_version=line.get('unparsed_version', ''),
+                version_major=line.get('version.major', ''),
+                version_minor=line.get('version.minor', ''),
             )
 
         elif 'weird' in file_type:
-            self.column_values.update(
-                {
-                    'type': 'weird',
-                    'name': line.get('name', ''),
-                    'addl': line.get('addl', ''),
-                }
+            return Weird(
+                'weird',
+                starttime,
+                uid,
+                saddr,
+                daddr,
+                name=line.get('name', ''),
+                addl=line.get('addl', ''),
             )
-        else:
-            return False
-        return True
+        return None
 
-    def process_argus_input(self, new_line):
+    def process_argus_input(self, new_line: dict) -> Conn:
         """
         Process the line and extract columns for argus
         """
         line = new_line['data']
-        self.column_values = {
-            'starttime': False,
-            'endtime': False,
-            'dur': False,
-            'proto': False,
-            'appproto': False,
-            'saddr': False,
-            'sport': False,
-            'dir': False,
-            'daddr': False,
-            'dport': False,
-            'state': False,
-            'pkts': False,
-            'spkts': False,
-            'dpkts': False,
-            'bytes': False,
-            'sbytes': False,
-            'dbytes': False,
-            'type': 'argus',
-        }
-
         nline = line.strip().split(self.separator)
-        try:
-            self.column_values['starttime'] = utils.convert_to_datetime(
-                nline[self.column_idx['starttime']]
-            )
-        except KeyError:
-            pass
-        try:
-            self.column_values['endtime'] = nline[self.column_idx['endtime']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['dur'] = nline[self.column_idx['dur']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['proto'] = nline[self.column_idx['proto']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['appproto'] = nline[self.column_idx['appproto']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['saddr'] = nline[self.column_idx['saddr']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['sport'] = nline[self.column_idx['sport']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['dir'] = nline[self.column_idx['dir']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['daddr'] = nline[self.column_idx['daddr']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['dport'] = nline[self.column_idx['dport']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['state'] = nline[self.column_idx['state']]
-        except KeyError:
-            pass
-        try:
-            self.column_values['pkts'] = int(nline[self.column_idx['pkts']])
-        except KeyError:
-            pass
-        try:
-            self.column_values['spkts'] = int(nline[self.column_idx['spkts']])
-        except KeyError:
-            pass
-        try:
-            self.column_values['dpkts'] = int(nline[self.column_idx['dpkts']])
-        except KeyError:
-            pass
-        try:
-            self.column_values['bytes'] = int(nline[self.column_idx['bytes']])
-        except KeyError:
-            pass
-        try:
-            self.column_values['sbytes'] = int(
-                nline[self.column_idx['sbytes']]
-            )
-        except KeyError:
-            pass
-        try:
-            self.column_values['dbytes'] = int(
-                nline[self.column_idx['dbytes']]
-            )
-        except KeyError:
-            pass
 
-    def process_nfdump_input(self, new_line):
+        def get_field(column: str):
+            try:
+                return nline[self.column_idx[column]]
+            except KeyError:
+                return False
+
+        def get_int(column: str):
+            try:
+                return int(nline[self.column_idx[column]])
+            except KeyError:
+                return False
+
+        starttime = get_field('starttime')
+        if starttime:
+            starttime = utils.convert_to_datetime(starttime)
+        return Conn(
+            'argus',
+            starttime,
+            False,
+            get_field('saddr'),
+            get_field('daddr'),
+            dur=get_field('dur'),
+            endtime=get_field('endtime'),
+            proto=get_field('proto'),
+            appproto=get_field('appproto'),
+            sport=get_field('sport'),
+            dport=get_field('dport'),
+            state=get_field('state'),
+            dir=get_field('dir'),
+            pkts=get_int('pkts'),
+            spkts=get_int('spkts'),
+            dpkts=get_int('dpkts'),
+            bytes=get_int('bytes'),
+            sbytes=get_int('sbytes'),
+            dbytes=get_int('dbytes'),
+        )
+
+    def process_nfdump_input(self, new_line: dict) -> Conn:
         """
         Process the line and extract columns for nfdump
         """
         self.separator = ','
-        self.column_values = {
-            'starttime': False,
-            'endtime': False,
-            'dur': False,
-            'proto': False,
-            'appproto': False,
-            'saddr': False,
-            'sport': False,
-            'dir': False,
-            'daddr': False,
-            'dport': False,
-            'state': False,
-            'pkts': False,
-            'spkts': False,
-            'dpkts': False,
-            'bytes': False,
-            'sbytes': False,
-            'dbytes': False,
-            'type': 'nfdump',
-        }
         # Read the lines fast
         line = new_line['data']
         nline = line.strip().split(self.separator)
-        try:
-            self.column_values['starttime'] = utils.convert_to_datetime(nline[0])
-        except IndexError:
-            pass
-        try:
-            self.column_values['endtime'] = utils.convert_to_datetime(nline[1])
-        except IndexError:
-            pass
-        try:
-            self.column_values['dur'] = nline[2]
-        except IndexError:
-            pass
-        try:
-            self.column_values['proto'] = nline[7]
-        except IndexError:
-            pass
-        try:
-            self.column_values['saddr'] = nline[3]
-        except IndexError:
-            pass
-        try:
-            self.column_values['sport'] = nline[5]
-        except IndexError:
-            pass
-        try:
+
+        def get_field(index: int):
+            try:
+                return nline[index]
+            except IndexError:
+                return False
+
+        starttime = get_field(0)
+        if starttime:
+            starttime = utils.convert_to_datetime(starttime)
+        endtime = get_field(1)
+        if endtime:
+            endtime = utils.convert_to_datetime(endtime)
+        spkts = get_field(11)
+        dpkts = get_field(13)
+        sbytes = get_field(12)
+        dbytes = get_field(14)
+        return Conn(
+            'nfdump',
+            starttime,
+            False,
+            get_field(3),
+            get_field(4),
+            dur=get_field(2),
+            endtime=endtime,
+            proto=get_field(7),
+            appproto=False,
+            sport=get_field(5),
+            dport=get_field(6),
+            state=get_field(8),
             # Direction: ingress=0, egress=1
-            self.column_values['dir'] = nline[22]
-        except IndexError:
-            pass
-        try:
-            self.column_values['daddr'] = nline[4]
-        except IndexError:
-            pass
-        try:
-            self.column_values['dport'] = nline[6]
-        except IndexError:
-            pass
-        try:
-            self.column_values['state'] = nline[8]
-        except IndexError:
-            pass
-        try:
-            self.column_values['spkts'] = nline[11]
-        except IndexError:
-            pass
-        try:
-            self.column_values['dpkts'] = nline[13]
-        except IndexError:
-            pass
-        try:
-            self.column_values['pkts'] = (
-                self.column_values['spkts'] + self.column_values['dpkts']
-            )
-        except IndexError:
-            pass
-        try:
-            self.column_values['sbytes'] = nline[12]
-        except IndexError:
-            pass
-        try:
-            self.column_values['dbytes'] = nline[14]
-        except IndexError:
-            pass
-        try:
-            self.column_values['bytes'] = (
-                self.column_values['sbytes'] + self.column_values['dbytes']
-            )
-        except IndexError:
-            pass
+            dir=get_field(22),
+            pkts=spkts + dpkts,
+            spkts=spkts,
+            dpkts=dpkts,
+            bytes=sbytes + dbytes,
+            sbytes=sbytes,
+            dbytes=dbytes,
+        )
 
-    def process_suricata_input(self, line) -> None:
-        """Read suricata json input and store it in column_values"""
+    def process_suricata_input(self, line):
+        """
+        Read suricata json input
+        returns the record of the flow, or None if the line has no data
+        """
 
         # convert to dict if it's not a dict already
         if type(line) == str:
@@ -1233,277 +978,152 @@ class ProfilerProcess(multiprocessing.Process):
                 line = json.loads(line['data'])
             except KeyError:
                 # can't find the line!
-                return
+                return None
 
-        self.column_values: dict = {}
         try:
-            self.column_values['starttime'] = utils.convert_to_datetime(line['timestamp'])
-        # except (KeyError, ValueError):
+            starttime = utils.convert_to_datetime(line['timestamp'])
         except ValueError:
             # Reason for catching ValueError:
             # "ValueError: time data '1900-01-00T00:00:08.511802+0000' does not match format '%Y-%m-%dT%H:%M:%S.%f%z'"
             # It means some flow do not have valid timestamp. It seems to me if suricata does not know the timestamp, it put
             # there this not valid time.
-            self.column_values['starttime'] = False
-        self.column_values['endtime'] = False
-        self.column_values['dur'] = 0
-        self.column_values['flow_id'] = line.get('flow_id', False)
-        self.column_values['saddr'] = line.get('src_ip', False)
-        self.column_values['sport'] = line.get('src_port', False)
-        self.column_values['daddr'] = line.get('dest_ip', False)
-        self.column_values['dport'] = line.get('dest_port', False)
-        self.column_values['proto'] = line.get('proto', False)
-        self.column_values['type'] = line.get('event_type', False)
-        self.column_values['dir'] = '->'
-        self.column_values['appproto'] = line.get('app_proto', False)
-
-        if self.column_values['type']:
-            """
-            suricata available event_type values:
-            -flow
-            -tls
-            -http
-            -dns
-            -alert
-            -fileinfo
-            -stats (only one line - it is conclusion of entire capture)
-            """
-            if self.column_values['type'] == 'flow':
-                # A suricata line of flow type usually has 2 components.
-                # 1. flow information
-                # 2. tcp information
-                if line.get('flow', None):
-                    try:
-                        # Define time again, because this is line of flow type and
-                        # we do not want timestamp but start time.
-                        self.column_values['starttime'] = utils.convert_to_datetime(
-                            line['flow']['start']
-                        )
-                    except KeyError:
-                        self.column_values['starttime'] = False
-                    try:
-                        self.column_values['endtime'] = utils.convert_to_datetime(
-                            line['flow']['end']
-                        )
-                    except KeyError:
-                        self.column_values['endtime'] = False
-
-                    try:
-                        self.column_values['dur'] = (
-                            self.column_values['endtime']
-                            - self.column_values['starttime']
-                        ).total_seconds()
-                    except (KeyError, TypeError):
-                        self.column_values['dur'] = 0
-                    try:
-                        self.column_values['spkts'] = line['flow'][
-                            'pkts_toserver'
-                        ]
-                    except KeyError:
-                        self.column_values['spkts'] = 0
-                    try:
-                        self.column_values['dpkts'] = line['flow'][
-                            'pkts_toclient'
-                        ]
-                    except KeyError:
-                        self.column_values['dpkts'] = 0
-
-                    self.column_values['pkts'] = (
-                        self.column_values['dpkts']
-                        + self.column_values['spkts']
-                    )
-
-                    try:
-                        self.column_values['sbytes'] = line['flow'][
-                            'bytes_toserver'
-                        ]
-                    except KeyError:
-                        self.column_values['sbytes'] = 0
-
-                    try:
-                        self.column_values['dbytes'] = line['flow'][
-                            'bytes_toclient'
-                        ]
-                    except KeyError:
-                        self.column_values['dbytes'] = 0
-
-                    self.column_values['bytes'] = (
-                        self.column_values['dbytes']
-                        + self.column_values['sbytes']
-                    )
-
-                    try:
-                        """
-                        There are different states in which a flow can be.
-                        Suricata distinguishes three flow-states for TCP and two for UDP. For TCP,
-                        these are: New, Established and Closed,for UDP only new and established.
-                        For each of these states Suricata can employ different timeouts.
-                        """
-                        self.column_values['state'] = line['flow']['state']
-                    except KeyError:
-                        self.column_values['state'] = ''
-            elif self.column_values['type'] == 'http':
-                if line.get('http', None):
-                    try:
-                        self.column_values['method'] = line['http'][
-                            'http_method'
-                        ]
-                    except KeyError:
-                        self.column_values['method'] = ''
-                    try:
-                        self.column_values['host'] = line['http']['hostname']
-                    except KeyError:
-                        self.column_values['host'] = ''
-                    try:
-                        self.column_values['uri'] = line['http']['url']
-                    except KeyError:
-                        self.column_values['uri'] = ''
-                    try:
-                        self.column_values['user_agent'] = line['http'][
-                            'http_user_agent'
-                        ]
-                    except KeyError:
-                        self.column_values['user_agent'] = ''
-                    try:
-                        self.column_values['status_code'] = line['http'][
-                            'status'
-                        ]
-                    except KeyError:
-                        self.column_values['status_code'] = ''
-                    try:
-                        self.column_values['httpversion'] = line['http'][
-                            'protocol'
-                        ]
-                    except KeyError:
-                        self.column_values['httpversion'] = ''
-                    try:
-                        self.column_values['response_body_len'] = line['http'][
-                            'length'
-                        ]
-                    except KeyError:
-                        self.column_values['response_body_len'] = 0
-                    try:
-                        self.column_values['request_body_len'] = line['http'][
-                            'request_body_len'
-                        ]
-                    except KeyError:
-                        self.column_values['request_body_len'] = 0
-                    self.column_values['status_msg'] = ''
-                    self.column_values['resp_mime_types'] = ''
-                    self.column_values['resp_fuids'] = ''
-
-            elif self.column_values['type'] == 'dns':
-                if line.get('dns', None):
-                    try:
-                        self.column_values['query'] = line['dns']['rdata']
-                    except KeyError:
-                        self.column_values['query'] = ''
-                    try:
-                        self.column_values['TTLs'] = line['dns']['ttl']
-                    except KeyError:
-                        self.column_values['TTLs'] = ''
-
-                    try:
-                        self.column_values['qtype_name'] = line['dns'][
-                            'rrtype'
-                        ]
-                    except KeyError:
-                        self.column_values['qtype_name'] = ''
-                    # can not find in eve.json:
-                    self.column_values['qclass_name'] = ''
-                    self.column_values['rcode_name'] = ''
-                    self.column_values['answers'] = ''
-                    if type(self.column_values['answers']) == str:
-                        # If the answer is only 1, Zeek gives a string
-                        # so convert to a list
-                        self.column_values['answers'] = [
-                            self.column_values['answers']
-                        ]
-            elif self.column_values['type'] == 'tls':
-                if line.get('tls', None):
-                    try:
-                        self.column_values['sslversion'] = line['tls'][
-                            'version'
-                        ]
-                    except KeyError:
-                        self.column_values['sslversion'] = ''
-                    try:
-                        self.column_values['subject'] = line['tls']['subject']
-                    except KeyError:
-                        self.column_values['subject'] = ''
-                    try:
-                        self.column_values['issuer'] = line['tls']['issuerdn']
-                    except KeyError:
-                        self.column_values['issuer'] = ''
-                    try:
-                        self.column_values['server_name'] = line['tls']['sni']
-                    except KeyError:
-                        self.column_values['server_name'] = ''
-
-                    try:
-                        self.column_values['notbefore'] = utils.convert_to_datetime(
-                            line['tls']['notbefore']
-                        )
-                    except KeyError:
-                        self.column_values['notbefore'] = ''
-
-                    try:
-                        self.column_values['notafter'] = utils.convert_to_datetime(
-                            line['tls']['notafter']
-                        )
-                    except KeyError:
-                        self.column_values['notafter'] = ''
-
-            elif self.column_values['type'] == 'alert':
-                if line.get('alert', None):
-                    try:
-                        self.column_values['signature'] = line['alert'][
-                            'signature'
-                        ]
-                    except KeyError:
-                        self.column_values['signature'] = ''
-                    try:
-                        self.column_values['category'] = line['alert'][
-                            'category'
-                        ]
-                    except KeyError:
-                        self.column_values['category'] = ''
-                    try:
-                        self.column_values['severity'] = line['alert'][
-                            'severity'
-                        ]
-                    except KeyError:
-                        self.column_values['severity'] = ''
-            elif self.column_values['type'] == 'fileinfo':
+            starttime = False
+        saddr = line.get('src_ip', False)
+        sport = line.get('src_port', False)
+        daddr = line.get('dest_ip', False)
+        dport = line.get('dest_port', False)
+        flow_type = line.get('event_type', False)
+        """
+        suricata available event_type values:
+        -flow
+        -tls
+        -http
+        -dns
+        -alert
+        -fileinfo
+        -stats (only one line - it is conclusion of entire capture)
+        """
+        if flow_type == 'flow':
+            flow = Conn(
+                flow_type,
+                starttime,
+                False,
+                saddr,
+                daddr,
+                dur=0,
+                endtime=False,
+                proto=line.get('proto', False),
+                appproto=line.get('app_proto', False),
+                sport=sport,
+                dport=dport,
+                dir='->',
+            )
+            # A suricata line of flow type usually has 2 components.
+            # 1. flow information
+            # 2. tcp information
+            flow_info = line.get('flow', None)
+            if flow_info:
                 try:
-                    self.column_values['filesize'] = line['fileinfo']['size']
+                    # Define time again, because this is line of flow type and
+                    # we do not want timestamp but start time.
+                    flow.starttime = utils.convert_to_datetime(flow_info['start'])
                 except KeyError:
-                    self.column_values['filesize'] = ''
-            elif self.column_values['type'] == 'ssh':
+                    flow.starttime = False
                 try:
-                    self.column_values['client'] = line['ssh']['client']['software_version']
+                    flow.endtime = utils.convert_to_datetime(flow_info['end'])
                 except KeyError:
-                    self.column_values['client'] = ''
-
+                    flow.endtime = False
                 try:
-                    self.column_values['version'] = line['ssh']['client']['proto_version']
-                except KeyError:
-                    self.column_values['version'] = ''
+                    flow.dur = (flow.endtime - flow.starttime).total_seconds()
+                except TypeError:
+                    flow.dur = 0
+                flow.spkts = flow_info.get('pkts_toserver', 0)
+                flow.dpkts = flow_info.get('pkts_toclient', 0)
+                flow.pkts = flow.dpkts + flow.spkts
+                flow.sbytes = flow_info.get('bytes_toserver', 0)
+                flow.dbytes = flow_info.get('bytes_toclient', 0)
+                flow.bytes = flow.dbytes + flow.sbytes
+                """
+                There are different states in which a flow can be.
+                Suricata distinguishes three flow-states for TCP and two for UDP. For TCP,
+                these are: New, Established and Closed,for UDP only new and established.
+                For each of these states Suricata can employ different timeouts.
+                """
+                flow.state = flow_info.get('state', '')
+            return flow
+
+        elif flow_type == 'http':
+            http = line.get('http', {})
+            return HTTP(
+                flow_type,
+                starttime,
+                False,
+                saddr,
+                daddr,
+                method=http.get('http_method', ''),
+                host=http.get('hostname', ''),
+                uri=http.get('url', ''),
+                user_agent=http.get('http_user_agent', ''),
+                status_code=http.get('status', ''),
+                httpversion=http.get('protocol', ''),
+                response_body_len=http.get('length', 0),
+                request_body_len=http.get('request_body_len', 0),
+            )
 
-                try:
-                    self.column_values['server'] = line['ssh']['server']['software_version']
-                except KeyError:
-                    self.column_values['server'] = ''
-                # these fields aren't available in suricata, they're available in zeek only
-                self.column_values['auth_success'] = ''
-                self.column_values['auth_attempts'] = ''
-                self.column_values['cipher_alg'] = ''
-                self.column_values['mac_alg'] = ''
-                self.column_values['kex_alg'] = ''
-                self.column_values['compression_alg'] = ''
-                self.column_values['host_key_alg'] = ''
-                self.column_values['host_key'] = ''
+        elif flow_type == 'dns':
+            dns = line.get('dns', {})
+            return DNS(
+                flow_type,
+                starttime,
+                False,
+                saddr,
+                daddr,
+                query=dns.get('rdata', ''),
+                TTLs=dns.get('ttl', ''),
+                qtype_name=dns.get('rrtype', ''),
+                # can not find in eve.json:
+                qclass_name='',
+                rcode_name='',
+                answers=[''],
+            )
 
+        elif flow_type == 'tls':
+            tls = line.get('tls', {})
+            notbefore = tls.get('notbefore', '')
+            notafter = tls.get('notafter', '')
+            return SSL(
+                flow_type,
+                starttime,
+                False,
+                saddr,
+                daddr,
+                sport=sport,
+                dport=dport,
+                sslversion=tls.get('version', ''),
+                subject=tls.get('subject', ''),
+                issuer=tls.get('issuerdn', ''),
+                server_name=tls.get('sni', ''),
+                notbefore=utils.convert_to_datetime(notbefore) if notbefore else '',
+                notafter=utils.convert_to_datetime(notafter) if notafter else '',
+            )
+
+        elif flow_type == 'ssh':
+            ssh = line.get('ssh', {})
+            client = ssh.get('client', {})
+            # the rest of the fields aren't available in suricata, they're available in zeek only
+            return SSH(
+                flow_type,
+                starttime,
+                False,
+                saddr,
+                daddr,
+                client=client.get('software_version', ''),
+                version=client.get('proto_version', ''),
+                server=ssh.get('server', {}).get('software_version', ''),
+            )
+
+        # alert, fileinfo and the rest of the events aren't analyzed by slips
+        return Flow(flow_type, starttime, False, saddr, daddr)
 
     def publish_to_new_MAC(self, mac, ip, host_name=False):
         """
@@ -1534,7 +1154,7 @@ class ProfilerProcess(multiprocessing.Process):
             })
         __database__.publish('new_MAC', json.dumps(to_send))
 
-    def is_supported_flow(self):
+    def is_supported_flow(self, flow: Flow) -> bool:
 
         supported_types = (
             'ssh',
@@ -1556,15 +1176,15 @@ class ProfilerProcess(multiprocessing.Process):
         )
 
         if (
-            not self.column_values
-            or self.column_values['starttime'] is None
-            or self.column_values['type'] not in supported_types
+            not flow
+            or flow.starttime is None
+            or flow.flow_type not in supported_types
         ):
             return False
         return True
 
-    def get_starttime(self):
-        ts = self.column_values['starttime']
+    def get_starttime(self, flow: Flow):
+        ts = flow.starttime
         try:
             # seconds.
             # make sure starttime is a datetime obj (not a str) so we can get the timestamp
@@ -1574,13 +1194,12 @@ class ProfilerProcess(multiprocessing.Process):
             starttime = ts
         return starttime
 
-    def get_uid(self):
+    def get_uid(self, flow: Flow):
         """
         Generates a uid if none is found
         """
         # This uid check is for when we read things that are not zeek
-
-        uid = self.column_values.get('uid', False)
+        uid = flow.uid
         if not uid:
             # In the case of other tools that are not Zeek, there is no UID. So we generate a new one here
             # Zeeks uses human-readable strings in Base62 format, from 112 bits usually.
@@ -1588,133 +1207,137 @@ class ProfilerProcess(multiprocessing.Process):
             uid = base64.b64encode(
                 binascii.b2a_hex(os.urandom(9))
             ).decode('utf-8')
-        self.column_values['uid'] = uid
+        flow.uid = uid
         return uid
 
-    def get_rev_profile(self):
+    def get_rev_profile(self, flow: Flow):
         """
         get the profileid and twid of the daddr at the current starttime,
          not the source address
         """
-        if not self.daddr:
+        if not flow.daddr:
             # some flows don't have a daddr like software.log flows
             return False, False
-        rev_profileid = __database__.getProfileIdFromIP(self.daddr_as_obj)
+        rev_profileid = __database__.getProfileIdFromIP(flow.daddr_as_obj)
         if not rev_profileid:
             self.print(
                 'The dstip profile was not here... create', 3, 0
             )
             # Create a reverse profileid for managing the data going to the dstip.
-            rev_profileid = f'profile_{self.daddr}'
+            rev_profileid = f'profile_{flow.daddr}'
             __database__.addProfile(
-                rev_profileid, self.starttime, self.width
+                rev_profileid, flow.starttime, self.width
             )
             # Try again
             rev_profileid = __database__.getProfileIdFromIP(
-                self.daddr_as_obj
+                flow.daddr_as_obj
             )
 
         # in the database, Find the id of the tw where the flow belongs.
-        rev_twid = __database__.get_timewindow(self.starttime, rev_profileid)
+        rev_twid = self.tw_cache.get_timewindow(flow.starttime, rev_profileid)
         return rev_profileid, rev_twid
 
-    def publish_to_new_dhcp(self):
+    def publish_to_new_dhcp(self, flow: DHCP):
         """
         Publish the GW addr in the new_dhcp channel
         """
-        epoch_time = utils.convert_format(self.starttime, 'unixtimestamp')
         # this channel is used for setting the default gw ip,
         # only 1 flow is enough for that
         # on home networks, the router serves as a simple DHCP server
         to_send = {
-            'uid': self.uid,
-            'server_addr': self.column_values.get('server_addr', False),
-            'client_addr': self.column_values.get('client_addr', False),
-            'requested_addr': self.column_values.get('requested_addr', False),
-            'profileid': self.profileid,
-            'twid': __database__.get_timewindow(epoch_time, self.profileid),
-            'ts': epoch_time
+            'uid': flow.uid,
+            'server_addr': flow.server_addr,
+            'client_addr': flow.client_addr,
+            'requested_addr': flow.requested_addr,
+            'profileid': flow.profileid,
+            'twid': flow.twid,
+            'ts': flow.starttime
         }
         __database__.publish('new_dhcp', json.dumps(to_send))
 
 
-    def publish_to_new_software(self):
+    def publish_to_new_software(self, flow: Software):
         """
         Send the whole flow to new_software channel
         """
-        epoch_time = utils.convert_format(self.starttime, 'unixtimestamp')
-        self.column_values.update(
-            {
-                'starttime': epoch_time,
-                'twid': __database__.get_timewindow(epoch_time, self.profileid),
-            }
-        )
+        to_send = {
+            'type': flow.flow_type,
+            'starttime': flow.starttime,
+            'uid': flow.uid,
+            'saddr': flow.saddr,
+            'daddr': flow.daddr,
+            'twid': flow.twid,
+            'software_type': flow.software_type,
+            'unparsed_version': flow.unparsed_version,
+            'version.major': flow.version_major,
+            'version.minor': flow.version_minor,
+        }
         __database__.publish(
-            'new_software', json.dumps(self.column_values)
+            'new_software', json.dumps(to_send)
         )
 
-    def add_flow_to_profile(self):
+    def add_flow_to_profile(self, flow: Flow):
         """
         This is the main function that takes the columns of a flow and does all the magic to
         convert it into a working data in our system.
         It includes checking if the profile exists and how to put the flow correctly.
         It interprets each column
+        :param flow: the record returned by one of the process_*_input() methods
         """
 
         try:
-            if not self.is_supported_flow():
+            if not self.is_supported_flow(flow):
                 return False
 
-            self.uid = self.get_uid()
-            self.flow_type = self.column_values['type']
-            self.saddr = self.column_values['saddr']
-            self.daddr = self.column_values['daddr']
-            self.profileid = f'profile_{self.saddr}'
+            self.get_uid(flow)
+            flow.profileid = f'profile_{flow.saddr}'
 
             try:
-                self.saddr_as_obj = ipaddress.ip_address(self.saddr)
-                self.daddr_as_obj = ipaddress.ip_address(self.daddr)
+                flow.saddr_as_obj = ipaddress.ip_address(flow.saddr)
+                flow.daddr_as_obj = ipaddress.ip_address(flow.daddr)
             except (ipaddress.AddressValueError, ValueError):
                 # Its a mac
-                if self.flow_type != 'software':
+                if flow.flow_type != 'software':
                     # software flows are allowed to not have a daddr
                     return False
 
             # Check if the flow is whitelisted and we should not process
-            if self.whitelist.is_whitelisted_flow(self.column_values, self.flow_type):
+            if self.whitelist.is_whitelisted_flow(flow):
                 return True
 
             # 5th. Store the data according to the paremeters
             # Now that we have the profileid and twid, add the data from the flow in this tw for this profile
             self.print(
-                'Storing data in the profile: {}'.format(self.profileid), 3, 0
+                'Storing data in the profile: {}'.format(flow.profileid), 3, 0
             )
-            self.starttime = self.get_starttime()
+            flow.starttime = self.get_starttime(flow)
             # For this 'forward' profile, find the id in the database of the tw where the flow belongs.
-            self.twid = __database__.get_timewindow(self.starttime, self.profileid)
-
-            if self.home_net:
-                # Home network is defined in slips.conf. Create profiles for home IPs only
-                for network in self.home_net:
-                    if self.saddr_as_obj in network:
-                        # if a new profile is added for this saddr
-                        __database__.addProfile(
-                            self.profileid, self.starttime, self.width
-                        )
-                        self.store_features_going_out()
+            flow.twid = self.tw_cache.get_timewindow(flow.starttime, flow.profileid)
+
+            # all the writes and publishes of this flow are sent to the db at once
+            with __database__.pipeline():
+                if self.home_net:
+                    # Home network is defined in slips.conf. Create profiles for home IPs only
+                    for network in self.home_net:
+                        if flow.saddr_as_obj in network:
+                            # if a new profile is added for this saddr
+                            __database__.addProfile(
+                                flow.profileid, flow.starttime, self.width
+                            )
+                            self.store_features_going_out(flow)
 
+                        if self.analysis_direction == 'all':
+                            # in all mode we create profiled for daddrs too
+                            if flow.daddr_as_obj and flow.daddr_as_obj in network:
+                                self.handle_in_flows(flow)
+                else:
+                    # home_network param wasn't set in slips.conf
+                    # Create profiles for all ips we see
+                    __database__.addProfile(flow.profileid, flow.starttime, self.width)
+                    self.store_features_going_out(flow)
                     if self.analysis_direction == 'all':
-                        # in all mode we create profiled for daddrs too
-                        if self.daddr_as_obj in network:
-                            self.handle_in_flows()
-            else:
-                # home_network param wasn't set in slips.conf
-                # Create profiles for all ips we see
-                __database__.addProfile(self.profileid, self.starttime, self.width)
-                self.store_features_going_out()
-                if self.analysis_direction == 'all':
-                    # No home. Store all
-                    self.handle_in_flows()
+                        # No home. Store all
+                        self.handle_in_flows(flow)
             return True
         except Exception as ex:
             # For some reason we can not use the output queue here.. check
@@ -1724,301 +1347,295 @@ class ProfilerProcess(multiprocessing.Process):
             self.print(traceback.print_exc(),0,1)
             return False
 
-    def handle_conn(self):
+    def handle_conn(self, flow: Conn):
         role = 'Client'
 
-        tupleid = f'{self.daddr_as_obj}-{self.column_values["dport"]}-{self.column_values["proto"]}'
-        # Compute the symbol for this flow, for this TW, for this profile.
-        # The symbol is based on the 'letters' of the original Startosphere ips tool
-        symbol = self.compute_symbol('OutTuples')
-        # Change symbol for its internal data. Symbol is a tuple and is confusing if we ever change the API
         # Add the out tuple
-        __database__.add_tuple(
-            self.profileid, self.twid, tupleid, symbol, role, self.starttime, self.uid
-        )
+        self.add_tuple(flow, flow.profileid, flow.twid, role)
         # Add the dstip
         __database__.add_ips(
-            self.profileid, self.twid, self.daddr_as_obj, self.column_values, role
+            flow.profileid, flow.twid, flow.daddr_as_obj, flow, role
         )
         # Add the dstport
         port_type = 'Dst'
         __database__.add_port(
-            self.profileid,
-            self.twid,
-            self.daddr_as_obj,
-            self.column_values,
+            flow.profileid,
+            flow.twid,
+            flow.daddr_as_obj,
+            flow,
             role,
             port_type,
         )
         # Add the srcport
         port_type = 'Src'
         __database__.add_port(
-            self.profileid,
-            self.twid,
-            self.daddr_as_obj,
-            self.column_values,
+            flow.profileid,
+            flow.twid,
+            flow.daddr_as_obj,
+            flow,
             role,
             port_type,
         )
         # Add the flow with all the fields interpreted
         __database__.add_flow(
-            profileid=self.profileid,
-            twid=self.twid,
-            stime=self.starttime,
-            dur=self.column_values['dur'],
-            saddr=str(self.saddr_as_obj),
-            sport=self.column_values['sport'],
-            daddr=str(self.daddr_as_obj),
-            dport=self.column_values['dport'],
-            proto=self.column_values['proto'],
-            state=self.column_values['state'],
-            pkts=self.column_values['pkts'],
-            allbytes=self.column_values['bytes'],
-            spkts=self.column_values['spkts'],
-            sbytes=self.column_values['sbytes'],
-            appproto=self.column_values['appproto'],
-            smac=self.column_values.get('smac',''),
-            dmac=self.column_values.get('dmac',''),
-            uid=self.uid,
+            profileid=flow.profileid,
+            twid=flow.twid,
+            stime=flow.starttime,
+            dur=flow.dur,
+            saddr=str(flow.saddr_as_obj),
+            sport=flow.sport,
+            daddr=str(flow.daddr_as_obj),
+            dport=flow.dport,
+            proto=flow.proto,
+            state=flow.state,
+            pkts=flow.pkts,
+            allbytes=flow.bytes,
+            spkts=flow.spkts,
+            sbytes=flow.sbytes,
+            appproto=flow.appproto,
+            smac=flow.smac,
+            dmac=flow.dmac,
+            uid=flow.uid,
             label=self.label,
-            flow_type=self.flow_type,
+            flow_type=flow.flow_type,
+            state_hist=flow.state_hist,
         )
-        self.publish_to_new_MAC(self.column_values.get('smac'), self.saddr)
-        self.publish_to_new_MAC(self.column_values.get('dmac'), self.daddr)
+        self.publish_to_new_MAC(flow.smac, flow.saddr)
+        self.publish_to_new_MAC(flow.dmac, flow.daddr)
 
-    def handle_dns(self):
+    def handle_dns(self, flow: DNS):
         __database__.add_out_dns(
-            self.profileid,
-            self.twid,
-            self.column_values['daddr'],
-            self.starttime,
-            self.flow_type,
-            self.uid,
-            self.column_values['query'],
-            self.column_values['qclass_name'],
-            self.column_values['qtype_name'],
-            self.column_values['rcode_name'],
-            self.column_values['answers'],
-            self.column_values['TTLs']
+            flow.profileid,
+            flow.twid,
+            flow.daddr,
+            flow.starttime,
+            flow.flow_type,
+            flow.uid,
+            flow.query,
+            flow.qclass_name,
+            flow.qtype_name,
+            flow.rcode_name,
+            flow.answers,
+            flow.TTLs
         )
 
-    def handle_http(self):
+    def handle_http(self, flow: HTTP):
         __database__.add_out_http(
-            self.daddr,
-            self.profileid,
-            self.twid,
-            self.starttime,
-            self.flow_type,
-            self.uid,
-            self.column_values['method'],
-            self.column_values['host'],
-            self.column_values['uri'],
-            self.column_values['httpversion'],
-            self.column_values['user_agent'],
-            self.column_values['request_body_len'],
-            self.column_values['response_body_len'],
-            self.column_values['status_code'],
-            self.column_values['status_msg'],
-            self.column_values['resp_mime_types'],
-            self.column_values['resp_fuids'],
+            flow.daddr,
+            flow.profileid,
+            flow.twid,
+            flow.starttime,
+            flow.flow_type,
+            flow.uid,
+            flow.method,
+            flow.host,
+            flow.uri,
+            flow.httpversion,
+            flow.user_agent,
+            flow.request_body_len,
+            flow.response_body_len,
+            flow.status_code,
+            flow.status_msg,
+            flow.resp_mime_types,
+            flow.resp_fuids,
         )
 
-    def handle_ssl(self):
+    def handle_ssl(self, flow: SSL):
         __database__.add_out_ssl(
-            self.profileid,
-            self.twid,
-            self.starttime,
-            self.daddr_as_obj,
-            self.column_values['dport'],
-            self.flow_type,
-            self.uid,
-            self.column_values['sslversion'],
-            self.column_values['cipher'],
-            self.column_values['resumed'],
-            self.column_values['established'],
-            self.column_values['cert_chain_fuids'],
-            self.column_values['client_cert_chain_fuids'],
-            self.column_values['subject'],
-            self.column_values['issuer'],
-            self.column_values['validation_status'],
-            self.column_values['curve'],
-            self.column_values['server_name'],
-            self.column_values['ja3'],
-            self.column_values['ja3s'],
-            self.column_values['is_DoH'],
+            flow.profileid,
+            flow.twid,
+            flow.starttime,
+            flow.daddr_as_obj,
+            flow.dport,
+            flow.flow_type,
+            flow.uid,
+            flow.sslversion,
+            flow.cipher,
+            flow.resumed,
+            flow.established,
+            flow.cert_chain_fuids,
+            flow.client_cert_chain_fuids,
+            flow.subject,
+            flow.issuer,
+            flow.validation_status,
+            flow.curve,
+            flow.server_name,
+            flow.ja3,
+            flow.ja3s,
+            flow.is_DoH,
         )
 
-    def handle_ssh(self):
+    def handle_ssh(self, flow: SSH):
         __database__.add_out_ssh(
-            self.profileid,
-            self.twid,
-            self.starttime,
-            self.flow_type,
-            self.uid,
-            self.column_values['version'],
-            self.column_values['auth_attempts'],
-            self.column_values['auth_success'],
-            self.column_values['client'],
-            self.column_values['server'],
-            self.column_values['cipher_alg'],
-            self.column_values['mac_alg'],
-            self.column_values['compression_alg'],
-            self.column_values['kex_alg'],
-            self.column_values['host_key_alg'],
-            self.column_values['host_key'],
-            self.daddr
+            flow.profileid,
+            flow.twid,
+            flow.starttime,
+            flow.flow_type,
+            flow.uid,
+            flow.version,
+            flow.auth_attempts,
+            flow.auth_success,
+            flow.client,
+            flow.server,
+            flow.cipher_alg,
+            flow.mac_alg,
+            flow.compression_alg,
+            flow.kex_alg,
+            flow.host_key_alg,
+            flow.host_key,
+            flow.daddr
         )
 
-    def handle_notice(self):
+    def handle_notice(self, flow: Notice):
         __database__.add_out_notice(
-                self.profileid,
-                self.twid,
-                self.starttime,
-                self.daddr,
-                self.column_values['sport'],
-                self.column_values['dport'],
-                self.column_values['note'],
-                self.column_values['msg'],
-                self.column_values['scanned_port'],
-                self.column_values['scanning_ip'],
-                self.uid,
+                flow.profileid,
+                flow.twid,
+                flow.starttime,
+                flow.daddr,
+                flow.sport,
+                flow.dport,
+                flow.note,
+                flow.msg,
+                flow.scanned_port,
+                flow.scanning_ip,
+                flow.uid,
         )
 
-        if 'Gateway_addr_identified' in self.column_values['note']:
+        if 'Gateway_addr_identified' in flow.note:
             # get the gw addr form the msg
-            gw_addr = self.column_values['msg'].split(': ')[-1].strip()
+            gw_addr = flow.msg.split(': ')[-1].strip()
             __database__.set_default_gateway("IP", gw_addr)
 
-    def handle_ftp(self):
-        used_port = self.column_values['used_port']
+    def handle_ftp(self, flow: FTP):
+        used_port = flow.used_port
         if used_port:
             __database__.set_ftp_port(used_port)
 
-    def handle_smtp(self):
+    def handle_smtp(self, flow: SMTP):
         to_send = {
-                'uid': self.uid,
-                'daddr': self.daddr,
-                'saddr': self.saddr,
-                'profileid': self.profileid,
-                'twid': self.twid,
-                'ts': self.starttime,
-                'last_reply': self.column_values['last_reply'],
+                'uid': flow.uid,
+                'daddr': flow.daddr,
+                'saddr': flow.saddr,
+                'profileid': flow.profileid,
+                'twid': flow.twid,
+                'ts': flow.starttime,
+                'last_reply': flow.last_reply,
             }
         to_send = json.dumps(to_send)
         __database__.publish('new_smtp', to_send)
 
-    def handle_in_flows(self):
+    def handle_in_flows(self, flow: Flow):
         """
         Adds a flow for the daddr <- saddr connection
         """
         # they are not actual flows to add in slips,
         # they are info about some ips derived by zeek from the flows
         execluded_flows = ('software')
-        if self.flow_type in execluded_flows:
+        if flow.flow_type in execluded_flows:
             return
-        rev_profileid, rev_twid = self.get_rev_profile()
-        self.store_features_going_in(rev_profileid, rev_twid)
+        rev_profileid, rev_twid = self.get_rev_profile(flow)
+        self.store_features_going_in(flow, rev_profileid, rev_twid)
 
-    def handle_software(self):
+    def handle_software(self, flow: Software):
         __database__.add_software_to_profile(
-            self.profileid,
-            self.column_values['software_type'],
-            self.column_values['version.major'],
-            self.column_values['version.minor'],
-            self.column_values['uid']
+            flow.profileid,
+            flow.software_type,
+            flow.version_major,
+            flow.version_minor,
+            flow.uid
         )
-        self.publish_to_new_software()
+        self.publish_to_new_software(flow)
 
-    def handle_dhcp(self):
-        if self.column_values.get('mac', False):
+    def handle_dhcp(self, flow: DHCP):
+        if flow.mac:
             # send this to ip_info module to get vendor info about this MAC
             self.publish_to_new_MAC(
-                self.column_values.get('mac', False),
-                self.saddr,
-                host_name=(self.column_values.get('host_name', False))
+                flow.mac,
+                flow.saddr,
+                host_name=flow.host_name
             )
-        server_addr = self.column_values.get('server_addr', False)
+        server_addr = flow.server_addr
 
         if server_addr:
             __database__.store_dhcp_server(server_addr)
-            __database__.mark_profile_as_dhcp(self.profileid)
+            __database__.mark_profile_as_dhcp(flow.profileid)
 
-        self.publish_to_new_dhcp()
+        self.publish_to_new_dhcp(flow)
 
-    def handle_files(self):
+    def handle_files(self, flow: Files):
         """ Send files.log data to new_downloaded_file channel in vt module to see if it's malicious"""
         to_send = {
-            'uid': self.uid,
-            'daddr': self.daddr,
-            'saddr': self.saddr,
-            'size': self.column_values['size'],
-            'md5': self.column_values['md5'],
-            'sha1': self.column_values['sha1'],
-            'analyzers': self.column_values['analyzers'],
-            'source': self.column_values['source'],
-            'profileid': self.profileid,
-            'twid': self.twid,
-            'ts': self.starttime,
+            'uid': flow.uid,
+            'daddr': flow.daddr,
+            'saddr': flow.saddr,
+            'size': flow.size,
+            'md5': flow.md5,
+            'sha1': flow.sha1,
+            'analyzers': flow.analyzers,
+            'source': flow.source,
+            'profileid': flow.profileid,
+            'twid': flow.twid,
+            'ts': flow.starttime,
         }
         to_send = json.dumps(to_send)
         __database__.publish('new_downloaded_file', to_send)
 
-    def handle_arp(self):
+    def handle_arp(self, flow: ARP):
         to_send = {
-            'uid': self.uid,
-            'daddr': self.daddr,
-            'saddr': self.saddr,
-            'dst_mac': self.column_values['dst_mac'],
-            'src_mac': self.column_values['src_mac'],
-            'dst_hw': self.column_values['dst_hw'],
-            'src_hw': self.column_values['src_hw'],
-            'operation': self.column_values['operation'],
-            'ts': self.starttime,
-            'profileid': self.profileid,
-            'twid': self.twid,
+            'uid': flow.uid,
+            'daddr': flow.daddr,
+            'saddr': flow.saddr,
+            'dst_mac': flow.dst_mac,
+            'src_mac': flow.src_mac,
+            'dst_hw': flow.dst_hw,
+            'src_hw': flow.src_hw,
+            'operation': flow.operation,
+            'ts': flow.starttime,
+            'profileid': flow.profileid,
+            'twid': flow.twid,
         }
         # send to arp module
         to_send = json.dumps(to_send)
         __database__.publish('new_arp', to_send)
 
         self.publish_to_new_MAC(
-            self.column_values['dst_mac'], self.daddr
+            flow.dst_mac, flow.daddr
         )
         self.publish_to_new_MAC(
-            self.column_values['src_mac'], self.saddr
+            flow.src_mac, flow.saddr
         )
 
         # Add the flow with all the fields interpreted
         __database__.add_flow(
-            profileid=self.profileid,
-            twid=self.twid,
-            stime=self.starttime,
+            profileid=flow.profileid,
+            twid=flow.twid,
+            stime=flow.starttime,
             dur='0',
-            saddr=str(self.saddr_as_obj),
-            daddr=str(self.daddr_as_obj),
+            saddr=str(flow.saddr_as_obj),
+            daddr=str(flow.daddr_as_obj),
             proto='ARP',
-            uid=self.uid,
+            uid=flow.uid,
             flow_type='arp'
         )
 
-    def handle_weird(self):
+    def handle_weird(self, flow: Weird):
         """
         handles weird.log zeek flows
         """
         to_send = {
-            'uid': self.uid,
-            'ts': self.starttime,
-            'daddr': self.daddr,
-            'saddr': self.saddr,
-            'profileid': self.profileid,
-            'twid': self.twid,
-            'name': self.column_values['name'],
-            'addl': self.column_values['addl']
+            'uid': flow.uid,
+            'ts': flow.starttime,
+            'daddr': flow.daddr,
+            'saddr': flow.saddr,
+            'profileid': flow.profileid,
+            'twid': flow.twid,
+            'name': flow.name,
+            'addl': flow.addl
         }
         to_send = json.dumps(to_send)
         __database__.publish('new_weird', to_send)
 
-    def store_features_going_out(self):
+    def store_features_going_out(self, flow: Flow):
         """
         function for adding the features going out of the profile
         """
@@ -2043,20 +1660,20 @@ class ProfilerProcess(multiprocessing.Process):
 
         try:
             # call the function that handles this flow
-            cases[self.flow_type]()
+            cases[flow.flow_type](flow)
         except KeyError:
             # does flow contain a part of the key?
-            for flow in cases:
-                if flow in self.flow_type:
-                    cases[flow]()
+            for case in cases:
+                if case in flow.flow_type:
+                    cases[case](flow)
             else:
                 return False
 
         # if the flow type matched any of the ifs above,
         # mark this profile as modified
-        __database__.markProfileTWAsModified(self.profileid, self.twid, '')
+        __database__.markProfileTWAsModified(flow.profileid, flow.twid, '')
 
-    def store_features_going_in(self, profileid, twid):
+    def store_features_going_in(self, flow: Conn, profileid, twid):
         """
         If we have the all direction set , slips creates profiles for each IP, the src and dst
         store features going our adds the conn in the profileA from IP A -> IP B in the db
@@ -2066,30 +1683,25 @@ class ProfilerProcess(multiprocessing.Process):
 
         # self.print(f'Storing features going in for profile {profileid} and tw {twid}')
         if not (
-            'flow' in self.flow_type
-            or 'conn' in self.flow_type
-            or 'argus' in self.flow_type
-            or 'nfdump' in self.flow_type
+            'flow' in flow.flow_type
+            or 'conn' in flow.flow_type
+            or 'argus' in flow.flow_type
+            or 'nfdump' in flow.flow_type
         ):
             return
-        symbol = self.compute_symbol('InTuples')
-
         # Add the src tuple using the src ip, and dst port
-        tupleid = f'{self.daddr_as_obj}-{self.column_values["dport"]}-{self.column_values["proto"]}'
-        __database__.add_tuple(
-            profileid, twid, tupleid, symbol, role, self.starttime, self.uid
-        )
+        self.add_tuple(flow, profileid, twid, role)
 
         # Add the srcip and srcport
         __database__.add_ips(
-            profileid, twid, self.saddr_as_obj, self.column_values, role
+            profileid, twid, flow.saddr_as_obj, flow, role
         )
         port_type = 'Src'
         __database__.add_port(
             profileid,
             twid,
-            self.daddr_as_obj,
-            self.column_values,
+            flow.daddr_as_obj,
+            flow,
             role,
             port_type,
         )
@@ -2099,8 +1711,8 @@ class ProfilerProcess(multiprocessing.Process):
         __database__.add_port(
             profileid,
             twid,
-            self.daddr_as_obj,
-            self.column_values,
+            flow.daddr_as_obj,
+            flow,
             role,
             port_type,
         )
@@ -2109,134 +1721,57 @@ class ProfilerProcess(multiprocessing.Process):
         __database__.add_flow(
             profileid=profileid,
             twid=twid,
-            stime=self.starttime,
-            dur=self.column_values['dur'],
-            saddr=str(self.saddr_as_obj),
-            sport=self.column_values['sport'],
-            daddr=str(self.daddr_as_obj),
-            dport=self.column_values['dport'],
-            proto=self.column_values['proto'],
-            state=self.column_values['state'],
-            pkts=self.column_values['pkts'],
-            allbytes=self.column_values['bytes'],
-            spkts=self.column_values['spkts'],
-            sbytes=self.column_values['sbytes'],
-            appproto=self.column_values['appproto'],
-            uid=self.uid,
+            stime=flow.starttime,
+            dur=flow.dur,
+            saddr=str(flow.saddr_as_obj),
+            sport=flow.sport,
+            daddr=str(flow.daddr_as_obj),
+            dport=flow.dport,
+            proto=flow.proto,
+            state=flow.state,
+            pkts=flow.pkts,
+            allbytes=flow.bytes,
+            spkts=flow.spkts,
+            sbytes=flow.sbytes,
+            appproto=flow.appproto,
+            uid=flow.uid,
             label=self.label,
-            flow_type=self.flow_type
+            flow_type=flow.flow_type
         )
         __database__.markProfileTWAsModified(profileid, twid, '')
 
-    def compute_symbol(
-        self,
-        tuple_key: str,
-    ):
+    def compute_letters(self, flow: Conn) -> str:
         """
-        This function computes the new symbol for the tuple according to the
+        This function computes the letters for the tuple according to the
         original stratosphere ips model of letters
         Here we do not apply any detection model, we just create the letters
-        as one more feature twid is the starttime of the flow
+        as one more feature
+        The letter depends on the size, the duration and the periodicity of the flow,
+        and the periodicity depends on the time of the 2 previous flows of the same tuple,
+        so the periodicity and the final symbol are computed in the db by add_tuple()
+        returns the letter of this flow for each periodicity -1, 1, 2, 3 and 4
         """
-        tupleid = f'{self.daddr_as_obj}-{self.column_values["dport"]}-{self.column_values["proto"]}'
-
-        # current_time = self.column_values['starttime']
-        current_duration = self.column_values['dur']
-        current_size = self.column_values['bytes']
+        current_duration = flow.dur
+        current_size = flow.bytes
 
         try:
             current_duration = float(current_duration)
             current_size = int(current_size)
-            now_ts = float(self.starttime)
             self.print(
-                'Starting compute symbol. Profileid: {}, Tupleid {}, time:{} ({}), dur:{}, size:{}'.format(
-                    self.profileid,
-                    tupleid,
-                    self.twid,
-                    type(self.twid),
+                'Starting compute letters. Profileid: {}, time:{} ({}), dur:{}, size:{}'.format(
+                    flow.profileid,
+                    flow.twid,
+                    type(flow.twid),
                     current_duration,
                     current_size,
                 ),3,0
             )
-            # Variables for computing the symbol of each tuple
-            T2 = False
-            TD = False
             # Thresholds learnt from Stratosphere ips first version
-            # Timeout time, after 1hs
-            tto = timedelta(seconds=3600)
-            tt1 = float(1.05)
-            tt2 = float(1.3)
-            tt3 = float(5)
             td1 = float(0.1)
             td2 = float(10)
             ts1 = float(250)
             ts2 = float(1100)
 
-            # Get the time of the last flow in this tuple, and the last last
-            # Implicitely this is converting what we stored as 'now' into 'last_ts' and what we stored as 'last_ts' as 'last_last_ts'
-            (last_last_ts, last_ts) = __database__.getT2ForProfileTW(
-                self.profileid, self.twid, tupleid, tuple_key
-            )
-            # self.print(f'Profileid: {profileid}. Data extracted from DB. last_ts: {last_ts}, last_last_ts: {last_last_ts}', 0, 5)
-
-            def compute_periodicity(
-                now_ts: float, last_ts: float, last_last_ts: float
-            ):
-                """Function to compute the periodicity"""
-                zeros = ''
-                if last_last_ts is False or last_ts is False:
-                    TD = -1
-                    T1 = None
-                    T2 = None
-                else:
-                    # Time diff between the past flow and the past-past flow.
-                    T1 = last_ts - last_last_ts
-                    # Time diff between the current flow and the past flow.
-                    # We already computed this before, but we can do it here again just in case
-                    T2 = now_ts - last_ts
-
-                    # We have a time out of 1hs. After that, put 1 number 0 for each hs
-                    # It should not happen that we also check T1... right?
-                    if T2 >= tto.total_seconds():
-                        t2_in_hours = T2 / tto.total_seconds()
-                        # Shoud round it. Because we need the time to pass to really count it
-                        # For example:
-                        # 7100 / 3600 =~ 1.972  ->  int(1.972) = 1
-                        for i in range(int(t2_in_hours)):
-                            # Add the zeros to the symbol object
-                            zeros += '0'
-
-                    # Compute TD
-                    try:
-                        if T2 >= T1:
-                            TD = T2 / T1
-                        else:
-                            TD = T1 / T2
-                    except ZeroDivisionError:
-                        TD = 1
-
-                    # Decide the periodic based on TD and the thresholds
-                    if TD <= tt1:
-                        # Strongly periodicity
-                        TD = 1
-                    elif TD <= tt2:
-                        # Weakly periodicity
-                        TD = 2
-                    elif TD <= tt3:
-                        # Weakly not periodicity
-                        TD = 3
-                    elif TD > tt3:
-                        # Strongly not periodicity
-                        TD = 4
-                self.print(
-                    'Compute Periodicity: Profileid: {}, Tuple: {}, T1={}, T2={}, TD={}'.format(
-                        self.profileid, tupleid, T1, T2, TD
-                    ),
-                    3,
-                    0,
-                )
-                return TD, zeros
-
             def compute_duration():
                 """Function to compute letter of the duration"""
                 if current_duration <= td1:
@@ -2255,214 +1790,186 @@ class ProfilerProcess(multiprocessing.Process):
                 elif current_size > ts2:
                     return 3
 
-            def compute_letter():
-                """Function to compute letter"""
-                # format of this map is as follows
-                # {periodicity: {'size' : {duration: letter, duration: letter, etc.}}
-                periodicity_map = {
-                    # every key in this dict represents a periodicity
-                    '-1': {
-                        # every key in this dict is a size 1,2,3
-                        # 'size' : {duration: letter, diration: letter, etc.}
-                        '1': {'1': '1', '2': '2', '3': '3'},
-                        '2': {'1': '4', '2': '5', '3': '6'},
-                        '3': {'1': '7', '2': '8', '3': '9'},
-                    },
-                    '1': {
-                        '1': {'1': 'a', '2': 'b', '3': 'c'},
-                        '2': {'1': 'd', '2': 'e', '3': 'f'},
-                        '3': {'1': 'g', '2': 'h', '3': 'i'},
-                    },
-                    '2': {
-                        '1': {'1': 'A', '2': 'B', '3': 'C'},
-                        '2': {'1': 'D', '2': 'E', '3': 'F'},
-                        '3': {'1': 'G', '2': 'H', '3': 'I'},
-                    },
-                    '3': {
-                        '1': {'1': 'r', '2': 's', '3': 't'},
-                        '2': {'1': 'u', '2': 'v', '3': 'w'},
-                        '3': {'1': 'x', '2': 'y', '3': 'z'},
-                    },
-                    '4': {
-                        '1': {'1': 'R', '2': 'S', '3': 'T'},
-                        '2': {'1': 'U', '2': 'V', '3': 'W'},
-                        '3': {'1': 'X', '2': 'Y', '3': 'Z'},
-                    },
-                }
-                return periodicity_map[str(periodicity)][str(size)][
-                    str(duration)
-                ]
-
-            def compute_timechar():
-                """Function to compute the timechar"""
-                # self.print(f'Compute timechar. Profileid: {profileid} T2: {T2}', 0, 5)
-                if not isinstance(T2, bool):
-                    if T2 <= timedelta(seconds=5).total_seconds():
-                        return '.'
-                    elif T2 <= timedelta(seconds=60).total_seconds():
-                        return ','
-                    elif T2 <= timedelta(seconds=300).total_seconds():
-                        return '+'
-                    elif T2 <= timedelta(seconds=3600).total_seconds():
-                        return '*'
-                    else:
-                        # Changed from 0 to ''
-                        return ''
-                else:
-                    return ''
-
-            # Here begins the function's code
-            try:
-                # Update value of T2
-                if now_ts and last_ts:
-                    T2 = now_ts - last_ts
-                else:
-                    T2 = False
-                # Are flows sorted?
-                if T2 < 0:
-                    # Flows are not sorted!
-                    # What is going on here when the flows are not ordered?? Are we losing flows?
-                    # Put a warning
-                    self.print(
-                        'Warning: Coming flows are not sorted -> Some time diff are less than zero.',
-                        0,
-                        2,
-                    )
-                    pass
-            except TypeError:
-                T2 = False
-            # self.print("T2:{}".format(T2), 0, 1)
-            # p = __database__.start_profiling()
-            # Compute the rest
-            periodicity, zeros = compute_periodicity(
-                now_ts, last_ts, last_last_ts
-            )
-            duration = compute_duration()
-            # self.print("Duration: {}".format(duration), 0, 1)
-            size = compute_size()
-            # self.print("Size: {}".format(size), 0, 1)
-            letter = compute_letter()
-            # self.print("Letter: {}".format(letter), 0, 1)
-            timechar = compute_timechar()
-            # self.print("TimeChar: {}".format(timechar), 0, 1)
-            self.print(
-                'Profileid: {}, Tuple: {}, Periodicity: {}, Duration: {}, Size: {}, Letter: {}. TimeChar: {}'.format(
-                    self.profileid,
-                    tupleid,
-                    periodicity,
-                    duration,
-                    size,
-                    letter,
-                    timechar,
-                ),
-                3,
-                0,
+            # format of this map is as follows
+            # {periodicity: {'size' : {duration: letter, duration: letter, etc.}}
+            periodicity_map = {
+                # every key in this dict represents a periodicity
+                '-1': {
+                    # every key in this dict is a size 1,2,3
+                    # 'size' : {duration: letter, diration: letter, etc.}
+                    '1': {'1': '1', '2': '2', '3': '3'},
+                    '2': {'1': '4', '2': '5', '3': '6'},
+                    '3': {'1': '7', '2': '8', '3': '9'},
+                },
+                '1': {
+                    '1': {'1': 'a', '2': 'b', '3': 'c'},
+                    '2': {'1': 'd', '2': 'e', '3': 'f'},
+                    '3': {'1': 'g', '2': 'h', '3': 'i'},
+                },
+                '2': {
+                    '1': {'1': 'A', '2': 'B', '3': 'C'},
+                    '2': {'1': 'D', '2': 'E', '3': 'F'},
+                    '3': {'1': 'G', '2': 'H', '3': 'I'},
+                },
+                '3': {
+                    '1': {'1': 'r', '2': 's', '3': 't'},
+                    '2': {'1': 'u', '2': 'v', '3': 'w'},
+                    '3': {'1': 'x', '2': 'y', '3': 'z'},
+                },
+                '4': {
+                    '1': {'1': 'R', '2': 'S', '3': 'T'},
+                    '2': {'1': 'U', '2': 'V', '3': 'W'},
+                    '3': {'1': 'X', '2': 'Y', '3': 'Z'},
+                },
+            }
+            duration = str(compute_duration())
+            size = str(compute_size())
+            return ''.join(
+                periodicity_map[periodicity][size][duration]
+                for periodicity in ('-1', '1', '2', '3', '4')
             )
-            # p = __database__.end_profiling(p)
-            symbol = zeros + letter + timechar
-            # Return the symbol, the current time of the flow and the T1 value
-            return symbol, (last_ts, now_ts)
         except Exception as ex:
             # For some reason we can not use the output queue here.. check
-            self.print('Error in compute_symbol in Profiler Process.', 0, 1)
+            self.print('Error in compute_letters in Profiler Process.', 0, 1)
             self.print('{}'.format(traceback.format_exc()), 0, 1)
 
+    def add_tuple(self, flow: Conn, profileid, twid, role):
+        """
+        Computes the symbol of this flow and adds it to its tuple
+        """
+        tupleid = f'{flow.daddr_as_obj}-{flow.dport}-{flow.proto}'
+        # Compute the symbol for this flow, for this TW, for this profile.
+        # The symbol is based on the 'letters' of the original Startosphere ips tool
+        letters = self.compute_letters(flow)
+        if not letters:
+            return
 
+        starttime = flow.starttime
+
+        def tuple_added(symbol, timestamps):
+            # Are flows sorted?
+            last_ts = timestamps[1]
+            if last_ts and float(starttime) < last_ts:
+                # Flows are not sorted!
+                # What is going on here when the flows are not ordered?? Are we losing flows?
+                # Put a warning
+                self.print(
+                    'Warning: Coming flows are not sorted -> Some time diff are less than zero.',
+                    0,
+                    2,
+                )
+            self.print(
+                f'Profileid: {profileid}, Tuple: {tupleid}, Symbol: {symbol}', 3, 0
+            )
+
+        # the symbol is computed when the unit of work of this flow is sent to the db
+        __database__.add_tuple(
+            profileid, twid, tupleid, letters, role, starttime, flow.uid, callback=tuple_added
+        )
 
     def shutdown_gracefully(self):
+        # store the tws modified since the last flush before stopping
+        __database__.flush_modified_tws()
+        __database__.report_suppressed_ip_info_requests()
         # can't use self.name because multiprocessing library adds the child number to the name so it's not const
-        __database__.publish('finished_modules', 'Profiler')
+        __database__.publish('finished_modules', self.worker_name)
 
     def run(self):
         utils.drop_root_privs()
+        # stores the modified tws and closes the old ones periodically
+        __database__.start_tw_closer()
         rec_lines = 0
         # Main loop function
         while True:
             try:
-                line = self.inputqueue.get()
-                if 'stop' in line:
-                    # if timewindows are not updated for a long time (see at logsProcess.py),
-                    # we will stop slips automatically.The 'stop_process' line is sent from logsProcess.py.
-                    self.shutdown_gracefully()
-                    self.print(
-                        'Stopping Profiler Process. Received {} lines ({})'.format(
-                            rec_lines,
-                            utils.convert_format(datetime.now(), utils.alerts_format),
-                        ), 2,0
-                    )
-                    return True
+                # inputProcess sends the lines in batches
+                lines = self.inputqueue.get()
+                for line in lines:
+                    if 'stop' in line:
+                        # if timewindows are not updated for a long time (see at logsProcess.py),
+                        # we will stop slips automatically.The 'stop_process' line is sent from logsProcess.py.
+                        self.shutdown_gracefully()
+                        self.print(
+                            'Stopping Profiler Process. Received {} lines ({}). '
+                            'Suppressed {} repeated TI and p2p requests'.format(
+                                rec_lines,
+                                utils.convert_format(datetime.now(), utils.alerts_format),
+                                __database__.ip_info_requests.suppressed,
+                            ), 2,0
+                        )
+                        return True
+
+                    # Received new input data
+                    # Extract the columns smartly
+                    self.print('< Received Line: {}'.format(line), 2, 0)
+                    rec_lines += 1
+
+                    if not self.input_type:
+                        # Find the type of input received
+                        self.define_type(line)
+                        # Find the number of flows we're going to receive of input received
+                        if self.worker_id == 0:
+                            # only 1 profiler should initialize the progress bar
+                            self.outputqueue.put(f"initialize progress bar")
+
+                    # What type of input do we have?
+                    if not self.input_type:
+                        # the above define_type can't define the type of input
+                        self.print("Can't determine input type.", 5, 6)
+
+                    elif self.input_type == 'zeek':
+                        # self.print('Zeek line')
+                        flow = self.process_zeek_input(line)
+                        # Add the flow to the profile
+                        self.add_flow_to_profile(flow)
 
-                # Received new input data
-                # Extract the columns smartly
-                self.print('< Received Line: {}'.format(line), 2, 0)
-                rec_lines += 1
-
-                if not self.input_type:
-                    # Find the type of input received
-                    self.define_type(line)
-                    # Find the number of flows we're going to receive of input received
-                    self.outputqueue.put(f"initialize progress bar")
-
-                # What type of input do we have?
-                if not self.input_type:
-                    # the above define_type can't define the type of input
-                    self.print("Can't determine input type.", 5, 6)
-
-                elif self.input_type == 'zeek':
-                    # self.print('Zeek line')
-                    self.process_zeek_input(line)
-                    # Add the flow to the profile
-                    self.add_flow_to_profile()
-
-                    self.outputqueue.put(f"update progress bar")
-
-                elif (
-                    self.input_type == 'argus'
-                    or self.input_type == 'argus-tabs'
-                ):
-                    # self.print('Argus line')
-                    # Argus puts the definition of the columns on the first line only
-                    # So read the first line and define the columns
-                    try:
-                        if '-f' in sys.argv and 'argus' in sys.argv:
-                            # argus from stdin
-                            self.define_columns(
-                                {
-                                    'data': "StartTime,Dur,Proto,SrcAddr,Sport,"
-                                            "Dir,"
-                                            "DstAddr,Dport,State,sTos,dTos,TotPkts,"
-                                            "TotBytes,SrcBytes,SrcPkts,Label"
-                                }
-                            )
+                        self.outputqueue.put(f"update progress bar")
 
-                        _ = self.column_idx['starttime']
-                        self.process_argus_input(line)
+                    elif (
+                        self.input_type == 'argus'
+                        or self.input_type == 'argus-tabs'
+                    ):
+                        # self.print('Argus line')
+                        # Argus puts the definition of the columns on the first line only
+                        # So read the first line and define the columns
+                        try:
+                            if '-f' in sys.argv and 'argus' in sys.argv:
+                                # argus from stdin
+                                self.define_columns(
+                                    {
+                                        'data': "StartTime,Dur,Proto,SrcAddr,Sport,"
+                                                "Dir,"
+                                                "DstAddr,Dport,State,sTos,dTos,TotPkts,"
+                                                "TotBytes,SrcBytes,SrcPkts,Label"
+                                    }
+                                )
+
+                            _ = self.column_idx['starttime']
+                            flow = self.process_argus_input(line)
+                            # Add the flow to the profile
+                            self.add_flow_to_profile(flow)
+                            self.outputqueue.put(f"update progress bar")
+                        except (AttributeError, KeyError):
+                            # Define columns. Do not add this line to profile, its only headers
+                            self.define_columns(line)
+                    elif self.input_type == 'suricata':
+                        flow = self.process_suricata_input(line)
                         # Add the flow to the profile
-                        self.add_flow_to_profile()
+                        self.add_flow_to_profile(flow)
                         self.outputqueue.put(f"update progress bar")
-                    except (AttributeError, KeyError):
-                        # Define columns. Do not add this line to profile, its only headers
-                        self.define_columns(line)
-                elif self.input_type == 'suricata':
-                    self.process_suricata_input(line)
-                    # Add the flow to the profile
-                    self.add_flow_to_profile()
-                    self.outputqueue.put(f"update progress bar")
-                elif self.input_type == 'zeek-tabs':
-                    # self.print('Zeek-tabs line')
-                    self.process_zeek_tabs_input(line)
-                    # Add the flow to the profile
-                    self.add_flow_to_profile()
-                    self.outputqueue.put(f"update progress bar")
-                elif self.input_type == 'nfdump':
-                    self.process_nfdump_input(line)
-                    self.add_flow_to_profile()
-                    self.outputqueue.put(f"update progress bar")
-                else:
-                    self.print("Can't recognize input file type.")
-                    return False
-
-
+                    elif self.input_type == 'zeek-tabs':
+                        # self.print('Zeek-tabs line')
+                        flow = self.process_zeek_tabs_input(line)
+                        # Add the flow to the profile
+                        self.add_flow_to_profile(flow)
+                        self.outputqueue.put(f"update progress bar")
+                    elif self.input_type == 'nfdump':
+                        flow = self.process_nfdump_input(line)
+                        self.add_flow_to_profile(flow)
+                        self.outputqueue.put(f"update progress bar")
+                    else:
+                        self.print("Can't recognize input file type.")
+                        return False
 
                 # listen on this channel in case whitelist.conf is changed, we need to process the new changes
                 message = __database__.get_message(self.c1)
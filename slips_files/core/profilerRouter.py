@@ -0,0 +1,169 @@
+import bisect
+import zlib
+
+
+class ProfilerRouter:
+    """
+    Sends every line read by inputProcess to the profiler worker that owns its source address.
+
+    Each worker owns a shard of profile_<saddr> in a consistent hash ring, so all flows
+    of the same profile are processed by the same worker, in the order they were read.
+    With analysis_direction = all, the worker of a flow also adds it to the profile of its daddr,
+    which may be owned by another worker, so all the writes to a profile are atomic
+    (HINCRBY, HSETNX, SADD, ZADD NX and the add_tuple script) instead of reading and writing back.
+    Lines whose source address can't be found without parsing them all go to the same worker.
+    """
+    # number of points each worker has in the hash ring
+    virtual_nodes = 100
+    # max number of cached saddr->worker entries
+    max_cached_owners = 100000
+
+    def __init__(self, queues: list):
+        """
+        :param queues: one BatchQueue per profiler worker
+        """
+        self.queues = queues
+        self.ring = sorted(
+            (self.hash(f'Profiler_{worker}_{vnode}'), worker)
+            for worker in range(len(queues))
+            for vnode in range(self.virtual_nodes)
+        )
+        self.ring_hashes = [point for point, _ in self.ring]
+        # cache of the worker of each saddr
+        self.owners = {}
+        # index of the saddr column in argus files, read from their header line
+        self.argus_saddr_idx = None
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return zlib.crc32(key.encode())
+
+    def get_worker(self, saddr: str) -> int:
+        """returns the index of the worker that owns the profile of the given saddr"""
+        try:
+            return self.owners[saddr]
+        except KeyError:
+            pass
+
+        idx = bisect.bisect(self.ring_hashes, self.hash(f'profile_{saddr}'))
+        worker = self.ring[idx % len(self.ring)][1]
+        if len(self.owners) >= self.max_cached_owners:
+            self.owners.clear()
+        self.owners[saddr] = worker
+        return worker
+
+    @staticmethod
+    def get_json_field(data: str, field: str) -> str:
+        """
+        returns the value of the given str field of a serialized json
+        without deserializing the whole line
+        """
+        start = data.find(f'"{field}":"')
+        if start == -1:
+            return ''
+        start += len(field) + 4
+        return data[start:data.find('"', start)]
+
+    @staticmethod
+    def get_zeek_saddr(file_type: str, line: dict) -> str:
+        """
+        returns the saddr of a zeek json line,
+        the same field profilerProcess.process_zeek_input() uses as saddr
+        """
+        if 'dhcp' in file_type:
+            return line.get('client_addr') or line.get('mac', '')
+        if 'files.log' in file_type:
+            return line.get('tx_hosts', [''])[0]
+        if 'arp' in file_type:
+            return line.get('orig_h', '')
+        if 'software' in file_type:
+            return line.get('host', '')
+        if 'notice' in file_type:
+            return line.get('id.orig_h') or line.get('src', '')
+        return line.get('id.orig_h', '')
+
+    @staticmethod
+    def get_zeek_tabs_saddr(file_type: str, line: str) -> str:
+        """
+        returns the saddr of a zeek tab separated line,
+        the same field profilerProcess.process_zeek_tabs_input() uses as saddr
+        """
+        line = line.split('\t')
+        try:
+            if 'arp.log' in file_type:
+                return line[4]
+            if 'notice.log' in file_type and line[2] == '-':
+                return line[13]
+            return line[2]
+        except IndexError:
+            return ''
+
+    def get_saddr(self, line: dict):
+        """
+        returns the source address of the given line
+        returns None if the line should be sent to all workers
+        """
+        file_type = line.get('type', '')
+        data = line.get('data', '')
+        if file_type == 'stdin':
+            file_type = line.get('line_type', '')
+
+        if type(data) == dict:
+            return self.get_zeek_saddr(file_type, data)
+
+        if file_type in ('argus', 'argus-tabs'):
+            separator = ',' if file_type == 'argus' else '\t'
+            fields = data.strip().split(separator)
+            if self.argus_saddr_idx is None:
+                for idx, field in enumerate(fields):
+                    if 'srca' in field.lower():
+                        # this is the header line, all workers need it to define the columns
+                        self.argus_saddr_idx = idx
+                        return None
+                # no header line, e.g. argus lines given in stdin
+                return ''
+            try:
+                return fields[self.argus_saddr_idx]
+            except IndexError:
+                return ''
+
+        if file_type == 'nfdump':
+            try:
+                return data.split(',')[3]
+            except IndexError:
+                return ''
+
+        if file_type == 'suricata':
+            return self.get_json_field(data, 'src_ip')
+
+        # zeek tab files
+        return self.get_zeek_tabs_saddr(file_type, data)
+
+    def put(self, line):
+        if len(self.queues) == 1:
+            self.queues[0].put(line)
+            return
+
+        if isinstance(line, str):
+            # control msgs like 'stop' are sent to all workers
+            self.broadcast(line)
+            return
+
+        saddr = self.get_saddr(line)
+        if saddr is None:
+            self.broadcast(line)
+            return
+
+        self.queues[self.get_worker(saddr)].put(line)
+
+    def broadcast(self, line):
+        for queue in self.queues:
+            queue.put(line)
+
+    def depth(self) -> int:
+        """returns the number of lines waiting in all workers' queues"""
+        return sum(queue.depth() for queue in self.queues)
+
+    def close(self):
+        for queue in self.queues:
+            queue.close()
@@ -4,10 +4,135 @@ from slips_files.common.config_parser import ConfigParser
 import ipaddress
 import validators
 from slips_files.common.slips_utils import utils
+from slips_files.common.ip_range_index import IPRangeIndex
 import tld
 import os
 
 
+class CompiledWhitelist:
+    """
+    The entries of the whitelist that ignore flows, compiled into in-memory structures
+    so checking if a flow is whitelisted doesn't read the whitelist from the db.
+
+    each entry is stored in the structures of the directions it whitelists,
+    an entry whitelisted 'from' both is stored in src and dst.
+    The compiled whitelist can't be modified, when the whitelist changes a new one is compiled.
+    """
+    def __init__(
+            self,
+            whitelisted_IPs: dict,
+            whitelisted_domains: dict,
+            whitelisted_orgs: dict,
+            whitelisted_macs: dict,
+            org_info: dict
+    ):
+        """
+        the whitelisted_* dicts are the ones stored in the db by Whitelist.read_whitelist()
+        :param org_info: {org: {'IPs': ranges sorted by first octet, 'domains': [..], 'asn': [..]}}
+        of the whitelisted orgs
+        """
+        directions = ('src', 'dst')
+        self.ips = {direction: set() for direction in directions}
+        self.macs = {direction: set() for direction in directions}
+        # whitelisted domains are checked for subdomains too
+        self.domains = set()
+        self.domains_by_direction = {direction: set() for direction in directions}
+        self.orgs = {direction: [] for direction in directions}
+        self.org_ranges = {}
+        # the domains of each org and their parent domains, except the TLDs
+        self.org_domains = {}
+        self.org_asns = {}
+
+        for entries, compiled in (
+            (whitelisted_IPs, self.ips),
+            (whitelisted_macs, self.macs),
+            (whitelisted_domains, self.domains_by_direction),
+            (whitelisted_orgs, self.orgs),
+        ):
+            for entry, info in entries.items():
+                if not self.should_ignore_flows(info['what_to_ignore']):
+                    continue
+                for direction in self.get_directions(info['from']):
+                    if isinstance(compiled[direction], set):
+                        compiled[direction].add(entry)
+                    else:
+                        compiled[direction].append(entry)
+                if entries is whitelisted_domains:
+                    self.domains.add(entry)
+
+        for direction, orgs in self.orgs.items():
+            self.org_ranges[direction] = IPRangeIndex(
+                (ip_range, org)
+                for org in orgs
+                for ranges in org_info.get(org, {}).get('IPs', {}).values()
+                for ip_range in ranges
+            )
+
+        for org in set(self.orgs['src'] + self.orgs['dst']):
+            info = org_info.get(org, {})
+            self.org_asns[org] = set(info.get('asn', []))
+            self.org_domains[org] = {
+                parent
+                for org_domain in info.get('domains', [])
+                for parent in utils.get_domain_and_parents(org_domain)
+                if '.' in parent
+            }
+
+    @staticmethod
+    def should_ignore_flows(what_to_ignore) -> bool:
+        return 'flows' in what_to_ignore or 'both' in what_to_ignore
+
+    @staticmethod
+    def get_directions(from_) -> list:
+        """returns the directions whitelisted by the given 'from' value of an entry"""
+        if 'both' in from_:
+            return ['src', 'dst']
+        return [direction for direction in ('src', 'dst') if direction in from_]
+
+    def is_whitelisted_ip(self, ip: str, direction: str) -> bool:
+        return ip in self.ips[direction]
+
+    def is_whitelisted_mac(self, mac: str, direction: str) -> bool:
+        return mac in self.macs[direction]
+
+    def is_whitelisted_domain(self, domain: str, direction=None) -> bool:
+        """
+        checks if the given domain or any of its parent domains is whitelisted
+        :param direction: src or dst, or None to match domains whitelisted in any direction
+        """
+        whitelisted = self.domains if direction is None else self.domains_by_direction[direction]
+        if not whitelisted or not domain:
+            return False
+        return any(parent in whitelisted for parent in utils.get_domain_and_parents(domain))
+
+    def is_ip_in_org(self, ip: str, direction: str) -> bool:
+        """checks if the ip is in the ranges of any org whitelisted in the given direction"""
+        return ip in self.org_ranges[direction]
+
+    def is_asn_in_org(self, ip_asn: str, direction: str) -> bool:
+        """checks if the given asnorg of an ip belongs to any org whitelisted in the given direction"""
+        if not ip_asn or ip_asn == 'Unknown':
+            return False
+        return any(
+            org.lower() in ip_asn.lower() or ip_asn in self.org_asns[org]
+            for org in self.orgs[direction]
+        )
+
+    def is_domain_in_org(self, domain: str, direction: str) -> bool:
+        """
+        checks if the given domain is a domain, a subdomain or a parent domain of
+        the domains of any org whitelisted in the given direction
+        """
+        if not domain:
+            return False
+        for org in self.orgs[direction]:
+            if org in domain:
+                return True
+            if any(parent in self.org_domains[org] for parent in utils.get_domain_and_parents(domain)):
+                return True
+        return False
+
+
 class Whitelist:
     def __init__(self, outputqueue, redis_port):
         self.name = 'whitelist'
@@ -15,6 +140,10 @@ class Whitelist:
         self.read_configuration()
         self.org_info_path = 'slips_files/organizations_info/'
         self.ignored_flow_types = ('arp')
+        # the index of the IP ranges of each org, built the first time we check an org
+        self.org_ranges_index = {}
+        # compiled the first time a flow is checked, and again after the whitelist changes
+        self.compiled_whitelist = None
         __database__.start(redis_port)
 
 
@@ -42,23 +171,40 @@ class Whitelist:
         conf = ConfigParser()
         self.whitelist_path = conf.whitelist_path()
 
-    def is_whitelisted_asn(self, ip, org):
+    def get_asnorg(self, ip) -> str:
+        """returns the asnorg of the given ip from the db, or None if we don't have it"""
         ip_data = __database__.getIPData(ip)
         try:
-            ip_asn = ip_data['asn']['asnorg']
-            org_asn = json.loads(__database__.get_org_info(org, 'asn'))
-            if (
-                ip_asn
-                and ip_asn != 'Unknown'
-                and (org.lower() in ip_asn.lower() or ip_asn in org_asn)
-            ):
-                # this ip belongs to a whitelisted org, ignore flow
-                # self.print(f"The ASN {ip_asn} of IP {ip} "
-                #            f"is in the values of org {org}. Whitelisted.")
-                return True
+            return ip_data['asn']['asnorg']
         except (KeyError, TypeError):
-            # No asn data for src ip
-            pass
+            # No asn data for this ip
+            return None
+
+    def compile_whitelist(self) -> CompiledWhitelist:
+        """
+        compiles the whitelist stored in the db, and the info of the whitelisted orgs
+        """
+        whitelisted_orgs = __database__.get_whitelist('organizations')
+        org_info = {}
+        for org in whitelisted_orgs:
+            org_info[org] = {
+                'IPs': __database__.get_org_IPs(org),
+                'domains': json.loads(__database__.get_org_info(org, 'domains')),
+                'asn': json.loads(__database__.get_org_info(org, 'asn')),
+            }
+        self.compiled_whitelist = CompiledWhitelist(
+            __database__.get_whitelist('IPs'),
+            __database__.get_whitelist('domains'),
+            whitelisted_orgs,
+            __database__.get_whitelist('mac'),
+            org_info
+        )
+        return self.compiled_whitelist
+
+    def get_compiled_whitelist(self) -> CompiledWhitelist:
+        if self.compiled_whitelist is None:
+            return self.compile_whitelist()
+        return self.compiled_whitelist
 
     def is_ignored_flow_type(self, flow_type) -> bool:
         """
@@ -149,164 +295,86 @@ class Whitelist:
         return False
 
 
-    def is_whitelisted_flow(self, column_values, flow_type) -> bool:
+    def is_whitelisted_flow(self, flow) -> bool:
         """
         Checks if the src IP or dst IP or domain or organization of this flow is whitelisted.
+        The whitelist is checked in memory, the db is only read for the domains, MAC and ASN of
+        the IPs of this flow, and only if there are whitelisted domains, MACs or orgs to compare them to
         """
-        saddr = column_values.get('saddr', '')
-        daddr = column_values.get('daddr', '')
-        # get the domains of the IPs this flow
-        (
-            domains_to_check_dst,
-            domains_to_check_src,
-        ) = self.get_domains_of_flow(saddr, daddr)
+        whitelist = self.get_compiled_whitelist()
+        saddr = flow.saddr
+        daddr = flow.daddr
+        # the domains of the IPs of this flow, read only if needed
+        domains_of_flow = None
 
         # check if we have whitelisted domains
-
-        # first get the domains of the flows we ewnt to check if whitelisted
-        # Domain names are stored in different zeek files using different names.
-        # Try to get the domain from each file.
-        ssl_domain = column_values.get('server_name', '')  # ssl.log
-        http_domain = column_values.get('host', '')  # http.log
-        notice_domain = column_values.get('sub', '').replace(
-            'CN=', ''
-        )  # in notice.log
-        domains_to_check = [ssl_domain, http_domain, notice_domain]
-
-        for domain in domains_to_check:
-            if self.is_whitelisted_domain(domain, saddr, daddr, 'flows'):
-                return True
-
-
-        if whitelisted_IPs := __database__.get_whitelist('IPs'):
-            # self.print('Check the IPs')
-            # Check if the IPs are whitelisted
-            ips_to_whitelist = list(whitelisted_IPs.keys())
-
-            if saddr in ips_to_whitelist:
-                # The flow has the src IP to whitelist
-                from_ = whitelisted_IPs[saddr]['from']
-                what_to_ignore = whitelisted_IPs[saddr]['what_to_ignore']
-                if ('src' in from_ or 'both' in from_) and (
-                        self.should_ignore_flows(what_to_ignore)
-                ):
-                    # self.print(f"Whitelisting the src IP {column_values['saddr']}")
+        if whitelist.domains:
+            # first get the domains of the flows we ewnt to check if whitelisted
+            # Domain names are stored in different zeek files using different names.
+            # Try to get the domain from each file.
+            ssl_domain = getattr(flow, 'server_name', '')  # ssl.log
+            http_domain = getattr(flow, 'host', '')  # http.log
+            for domain in (ssl_domain, http_domain):
+                if whitelist.is_whitelisted_domain(domain):
                     return True
 
-            if daddr in ips_to_whitelist:   # should be if and not elif
-                # The flow has the dst IP to whitelist
-                from_ = whitelisted_IPs[daddr]['from']
-                what_to_ignore = whitelisted_IPs[daddr]['what_to_ignore']
-                if ('dst' in from_ or 'both' in from_) and (
-                    self.should_ignore_flows(what_to_ignore)
-                ):
-                    # self.print(f"Whitelisting the dst IP {column_values['daddr']}")
-                    return True
+            dst_domains, src_domains = self.get_domains_of_flow(saddr, daddr)
+            domains_of_flow = {'src': src_domains, 'dst': dst_domains}
+            for direction, domains in domains_of_flow.items():
+                for domain in domains:
+                    if whitelist.is_whitelisted_domain(domain, direction):
+                        return True
+
+        # Check if the IPs are whitelisted
+        if (
+            whitelist.is_whitelisted_ip(saddr, 'src')
+            or whitelist.is_whitelisted_ip(daddr, 'dst')
+        ):
+            return True
 
-        if whitelisted_macs := __database__.get_whitelist('mac'):
+        if whitelist.macs['src'] or whitelist.macs['dst']:
             # try to get the mac address of the current flow
-            src_mac = column_values.get('src_mac', False)
+            src_mac = getattr(flow, 'src_mac', False)
             if not src_mac:
-                src_mac = column_values.get('mac', False)
+                src_mac = getattr(flow, 'mac', False)
 
-            if not src_mac:
+            if not src_mac and whitelist.macs['src']:
                 src_mac = __database__.get_mac_addr_from_profile(
                     f'profile_{saddr}'
                 )
                 if src_mac:
                     src_mac = src_mac[0]
 
-            if src_mac and src_mac in list(whitelisted_macs.keys()):
-                # the src mac of this flow is whitelisted, but which direction?
-                from_ = whitelisted_macs[src_mac]['from']
-                what_to_ignore = whitelisted_macs[src_mac]['what_to_ignore']
-
-                if (
-                    ('src' in from_ or 'both' in from_)
-                    and
-                    (self.should_ignore_flows(what_to_ignore))
-                ):
-                    # self.print(f"The source MAC of this flow {src_mac} is whitelisted")
-                    return True
-
-            dst_mac = column_values.get('dst_mac', False)
-            if dst_mac and dst_mac in list(whitelisted_macs.keys()):
-                # the dst mac of this flow is whitelisted, but which direction?
-                from_ = whitelisted_macs[dst_mac]['from']
-                what_to_ignore = whitelisted_macs[dst_mac]['what_to_ignore']
-
-                if (
-                    ('dst' in from_ or 'both' in from_)
-                    and
-                    (self.should_ignore_flows(what_to_ignore))
-                ):
-                    # self.print(f"The dst MAC of this flow {dst_mac} is whitelisted")
-                    return True
+            dst_mac = getattr(flow, 'dst_mac', False)
+            if (
+                whitelist.is_whitelisted_mac(src_mac, 'src')
+                or whitelist.is_whitelisted_mac(dst_mac, 'dst')
+            ):
+                return True
 
-        if self.is_ignored_flow_type(flow_type):
+        if self.is_ignored_flow_type(flow.flow_type):
             return False
 
-        if whitelisted_orgs := __database__.get_whitelist('organizations'):
-            # self.print('Check if the organization is whitelisted')
-            # Check if IP belongs to a whitelisted organization range
-            # Check if the ASN of this IP is any of these organizations
-
-            for org in whitelisted_orgs:
-                from_ = whitelisted_orgs[org]['from']  # src or dst or both
-                what_to_ignore = whitelisted_orgs[org][
-                    'what_to_ignore'
-                ]  # flows, alerts or both
-                # self.print(f'Checking {org}, from:{from_} type {what_to_ignore}')
-
-                if self.should_ignore_flows(what_to_ignore):
-                    # We want to block flows from this org. get the domains of this flow based on the direction.
-                    if 'both' in from_:
-                        domains_to_check = (
-                            domains_to_check_src + domains_to_check_dst
-                        )
-                    elif 'src' in from_:
-                        domains_to_check = domains_to_check_src
-                    elif 'dst' in from_:
-                        domains_to_check = domains_to_check_dst
-
-                    if 'src' in from_ or 'both' in from_:
-                        # Method 1 Check if src IP belongs to a whitelisted organization range
-                        try:
-                            if self.is_ip_in_org(saddr, org):
-                                # self.print(f"The src IP {saddr} is in the ranges of org {org}. Whitelisted.")
-                                return True
-                        except ValueError:
-                            # Some flows don't have IPs, but mac address or just - in some cases
-                            return False
-
-                        # Method 2 Check if the ASN of this src IP is any of these organizations
-                        if self.is_whitelisted_asn(saddr, org):
-                            # this ip belongs to a whitelisted org, ignore flow
-                            # self.print(f"The src IP {saddr} belong to {org}. Whitelisted because of ASN.")
-                            return True
-
-                    if 'dst' in from_ or 'both' in from_:
-                        # Method 1 Check if dst IP belongs to a whitelisted organization range
-                        try:
-                            if self.is_ip_in_org(column_values['daddr'], org):
-                                # self.print(f"The dst IP {column_values['daddr']} "
-                                #            f"is in the network range of org {org}. Whitelisted.")
-                                return True
-                        except ValueError:
-                            # Some flows don't have IPs, but mac address or just - in some cases
-                            return False
+        # Check if the IPs or the domains of this flow belong to a whitelisted organization
+        for direction, ip in (('src', saddr), ('dst', daddr)):
+            if not whitelist.orgs[direction]:
+                continue
+            # Method 1 Check if the IP belongs to a whitelisted organization range
+            if whitelist.is_ip_in_org(ip, direction):
+                return True
 
-                        # Method 2 Check if the ASN of this dst IP is any of these organizations
-                        if self.is_whitelisted_asn(daddr, org):
-                            # this ip belongs to a whitelisted org, ignore flow
-                            return True
+            # Method 2 Check if the ASN of this IP is any of these organizations
+            if whitelist.is_asn_in_org(self.get_asnorg(ip), direction):
+                return True
 
-                    # either we're blocking src, dst, or both check the domain of this flow
-                    # Method 3 Check if the domains of this flow belong to this org
-                    # domains to check are usually 1 or 2 domains
-                    for flow_domain in domains_to_check:
-                        if self.is_domain_in_org(flow_domain, org):
-                            return True
+            # Method 3 Check if the domains of this flow belong to this org
+            # domains to check are usually 1 or 2 domains
+            if domains_of_flow is None:
+                dst_domains, src_domains = self.get_domains_of_flow(saddr, daddr)
+                domains_of_flow = {'src': src_domains, 'dst': dst_domains}
+            for flow_domain in domains_of_flow[direction]:
+                if whitelist.is_domain_in_org(flow_domain, direction):
+                    return True
 
         return False
 
@@ -494,6 +562,8 @@ class Whitelist:
         __database__.set_whitelist('domains', whitelisted_domains)
         __database__.set_whitelist('organizations', whitelisted_orgs)
         __database__.set_whitelist('mac', whitelisted_mac)
+        # compile the new whitelist the next time a flow is checked
+        self.compiled_whitelist = None
 
         return line_number
 
@@ -541,22 +611,37 @@ class Whitelist:
         return domains_to_check_dst, domains_to_check_src
 
 
+    def get_org_ranges_index(self, org):
+        """
+        returns an IPRangeIndex of the IP ranges of the given org
+        returns None if the org has no IP ranges in the db
+        """
+        if org in self.org_ranges_index:
+            return self.org_ranges_index[org]
+
+        # organization IPs are sorted by first octet in the db
+        org_subnets: dict = __database__.get_org_IPs(org)
+        if not org_subnets:
+            # the org IPs may not be loaded yet, don't cache it
+            return None
+
+        index = IPRangeIndex(
+            (ip_range, org)
+            for ranges in org_subnets.values()
+            for ip_range in ranges
+        )
+        self.org_ranges_index[org] = index
+        return index
+
     def is_ip_in_org(self, ip:str, org):
         """
         Check if the given ip belongs to the given org
         """
         try:
-            org_subnets: dict = __database__.get_org_IPs(org)
-
-            first_octet:str = utils.get_first_octet(ip)
-            if not first_octet:
-                return
-            ip_obj = ipaddress.ip_address(ip)
-            # organization IPs are sorted by first octet for faster search
-            for range in org_subnets.get(first_octet, []):
-                if ip_obj in ipaddress.ip_network(range):
-                    return True
-        except (KeyError, TypeError):
+            org_ranges = self.get_org_ranges_index(org)
+            if org_ranges and ip in org_ranges:
+                return True
+        except (KeyError, TypeError, AttributeError):
             # comes here if the whitelisted org doesn't have
             # info in slips/organizations_info (not a famous org)
             # and ip doesn't have asn info.
@@ -0,0 +1,137 @@
+"""
+Compares the idle CPU usage and the wake-up latency of a module receiving msgs
+from flowalerts' channels by polling 1 pubsub per channel, the way modules used to,
+and by using the Dispatcher.
+The idle CPU is the CPU time used by the receiving process while no msgs are published,
+the wake-up latency is the time between publishing a msg and the handler receiving it.
+the dispatcher receives the msgs of the high volume channels from redis streams.
+needs a running redis server, the streams used are deleted after the benchmark, no db is flushed.
+
+usage: python3 -m tests.benchmarks.bench_dispatcher [redis_port]
+"""
+import json
+import multiprocessing
+import random
+import statistics
+import sys
+import time
+import redis
+from slips_files.core.database.database import __database__
+from slips_files.common.dispatcher import Dispatcher
+from slips_files.common.slips_utils import utils
+
+
+channels = [
+    'new_flow',
+    'new_ssh',
+    'new_notice',
+    'new_ssl',
+    'tw_closed',
+    'new_dns_flow',
+    'new_downloaded_file',
+    'new_smtp',
+    'new_software',
+    'new_weird',
+]
+idle_seconds = 5
+msgs = 1000
+
+
+def connect(redis_port):
+    __database__.r = redis.StrictRedis(
+        port=redis_port, db=0, decode_responses=True
+    )
+    __database__.stream_max_len = 100000
+    __database__.stream_max_lag = 50000
+
+
+class Receiver:
+    """receives msgs in a separate process and reports its CPU usage and latencies"""
+    def __init__(self, redis_port, ready, results):
+        self.redis_port = redis_port
+        self.ready = ready
+        self.results = results
+        self.latencies = []
+        self.idle_cpu = None
+        self.cpu_start = None
+
+    def handle(self, message):
+        received = time.time()
+        if self.idle_cpu is None:
+            # the first msg ends the idle period
+            self.idle_cpu = time.process_time() - self.cpu_start
+        self.latencies.append(received - json.loads(message['data'])['sent'])
+
+    def polling(self):
+        """how modules used to receive msgs"""
+        connect(self.redis_port)
+        pubsubs = [__database__.subscribe(channel) for channel in channels]
+        self.start()
+        while True:
+            for pubsub in pubsubs:
+                message = __database__.get_message(pubsub)
+                if message and message['data'] == 'stop_process':
+                    return self.stop()
+                if message and utils.is_msg_intended_for(message, message['channel']):
+                    self.handle(message)
+
+    def dispatcher(self):
+        connect(self.redis_port)
+        dispatcher = Dispatcher('bench_dispatcher')
+        for channel in channels:
+            dispatcher.register(channel, self.handle)
+        self.start()
+        while dispatcher.dispatch():
+            pass
+        self.stop()
+
+    def start(self):
+        self.cpu_start = time.process_time()
+        self.ready.set()
+
+    def stop(self):
+        self.results.put((self.idle_cpu, self.latencies))
+
+
+def bench(mode, redis_port):
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    receiver = Receiver(redis_port, ready, results)
+    process = multiprocessing.Process(target=getattr(receiver, mode))
+    process.start()
+    ready.wait()
+    # the old modules only used pub/sub
+    publish = __database__.r.publish if mode == 'polling' else __database__.publish
+
+    # nothing is published in this period
+    time.sleep(idle_seconds)
+
+    for _ in range(msgs):
+        publish(random.choice(channels), json.dumps({'sent': time.time()}))
+        time.sleep(0.001)
+    for channel in channels:
+        publish(channel, 'stop_process')
+
+    idle_cpu, latencies = results.get()
+    process.join()
+    latencies.sort()
+    print(
+        f'{mode:10}: idle CPU {idle_cpu / idle_seconds * 100:6.1f}%, '
+        f'wake-up latency median {statistics.median(latencies) * 1e6:8.1f} us, '
+        f'p99 {latencies[int(len(latencies) * 0.99)] * 1e6:8.1f} us, '
+        f'{len(latencies)}/{msgs} msgs received'
+    )
+
+
+def main():
+    redis_port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    connect(redis_port)
+    print(f'{len(channels)} channels, {idle_seconds}s idle, {msgs} msgs')
+    bench('polling', redis_port)
+    bench('dispatcher', redis_port)
+    for channel in __database__.stream_channels:
+        __database__.r.delete(__database__.get_stream_key(channel))
+
+
+if __name__ == '__main__':
+    main()
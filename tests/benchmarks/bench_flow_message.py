@@ -0,0 +1,94 @@
+"""
+Compares the cost of encoding a new_flow msg and decoding it in all of its subscribers
+(flowalerts, timeline, flowmldetection and virustotal) using the old format, where the flow
+is json encoded 3 times, and the current format of slips_files/common/flow_message.py.
+doesn't need redis.
+
+usage: python3 -m tests.benchmarks.bench_flow_message
+"""
+import json
+import time
+from slips_files.common import flow_message
+from slips_files.common.flow_message import encode_flow_msg, decode_flow_msg
+
+
+flows = 100000
+subscribers = 4
+profileid = 'profile_192.168.1.1'
+twid = 'timewindow1'
+stime = '1637150000.2'
+uid = 'CAeDWs37BipkfP21u8'
+flow = {
+    'ts': stime,
+    'dur': '0.032',
+    'saddr': '192.168.1.1',
+    'sport': 51234,
+    'daddr': '8.8.8.8',
+    'dport': 443,
+    'proto': 'tcp',
+    'origstate': 'SF',
+    'state': 'Established',
+    'pkts': 12,
+    'allbytes': 4521,
+    'spkts': 7,
+    'sbytes': 1320,
+    'appproto': 'ssl',
+    'smac': 'aa:bb:cc:dd:ee:ff',
+    'dmac': '',
+    'label': '',
+    'flow_type': 'conn',
+    'module_labels': {},
+}
+
+
+def old_encode():
+    """how add_flow() used to encode the flow"""
+    to_send = {
+        'profileid': profileid,
+        'twid': twid,
+        'flow': json.dumps({uid: json.dumps(flow)}),
+        'stime': stime,
+    }
+    return json.dumps(to_send)
+
+
+def old_decode(data):
+    """how the subscribers used to decode the flow"""
+    data = json.loads(data)
+    flow = json.loads(data['flow'])
+    uid = next(iter(flow))
+    return json.loads(flow[uid])
+
+
+def new_encode():
+    return encode_flow_msg(profileid, twid, stime, uid, flow)
+
+
+def new_decode(data):
+    return decode_flow_msg(data)['flow']
+
+
+def bench(encode, decode):
+    start = time.time()
+    for _ in range(flows):
+        data = encode()
+        for _ in range(subscribers):
+            decode(data)
+    return (time.time() - start) / flows
+
+
+def main():
+    print(f'{flows} flows, {subscribers} subscribers')
+    print(f'old format:   {bench(old_encode, old_decode) * 1e6:8.2f} us/flow')
+    codec = 'orjson' if flow_message.orjson else 'json'
+    print(f'{codec:12}: {bench(new_encode, new_decode) * 1e6:8.2f} us/flow')
+    if flow_message.orjson:
+        # compare with the stdlib codec too
+        orjson = flow_message.orjson
+        flow_message.orjson = None
+        print(f'json        : {bench(new_encode, new_decode) * 1e6:8.2f} us/flow')
+        flow_message.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
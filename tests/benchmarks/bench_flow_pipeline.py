@@ -0,0 +1,195 @@
+"""
+Counts the redis round trips the profiler needs to store 1 flow of each type
+(the db calls of handle_conn, handle_dns, handle_http, handle_ssl and handle_ssh)
+when every db method talks to redis on its own, when the writes of each flow are sent
+in 1 unit of work (Database.pipeline(), what the profiler does),
+and when a batch of flows is sent in 1 unit of work.
+1 round trip is counted for each command or pipeline sent to redis.
+needs a running redis server, db 0 and 1 of the given port are flushed
+before and after the benchmark, same as the unit tests do.
+
+usage: python3 -m tests.benchmarks.bench_flow_pipeline [redis_port]
+"""
+import ipaddress
+import sys
+import time
+import redis
+from redis.connection import Connection
+from slips_files.core.database.database import __database__
+from slips_files.common.seen_set import SeenSet
+from slips_files.core.flows import Conn
+from slips_files.core.database._profile_flow import (
+    ADD_TUPLE_LUA,
+    UPDATE_TIMES_CONTACTED_LUA,
+)
+
+
+flows = 2000
+batch_size = 100
+profileid = 'profile_192.168.1.1'
+twid = 'timewindow1'
+round_trips = 0
+
+
+def count_round_trips(send_packed_command):
+    def send(*args, **kwargs):
+        global round_trips
+        round_trips += 1
+        return send_packed_command(*args, **kwargs)
+    return send
+
+
+def do_nothing(*arg):
+    pass
+
+
+def connect(redis_port):
+    __database__.r = redis.StrictRedis(
+        port=redis_port, db=0, decode_responses=True
+    )
+    __database__.rcache = redis.StrictRedis(
+        port=redis_port, db=1, decode_responses=True
+    )
+    __database__.add_tuple_script = __database__.r.register_script(ADD_TUPLE_LUA)
+    __database__.update_times_contacted_script = __database__.r.register_script(
+        UPDATE_TIMES_CONTACTED_LUA
+    )
+    __database__.print = do_nothing
+    __database__.stream_max_len = 100000
+    __database__.stream_max_lag = 100000
+    __database__.width = 3600
+
+
+def conn_flow(flow):
+    """the db calls of ProfilerProcess.handle_conn()"""
+    daddr = f'10.0.{flow // 250}.{flow % 250}'
+    uid = f'conn{flow}'
+    starttime = 1637150000 + flow
+    flow = Conn(
+        'conn',
+        starttime,
+        uid,
+        '192.168.1.1',
+        daddr,
+        dport=443,
+        sport=51234,
+        bytes=1200,
+        pkts=10,
+        spkts=6,
+        sbytes=600,
+        state='SF',
+        proto='tcp',
+    )
+    daddr_as_obj = ipaddress.ip_address(daddr)
+    __database__.add_tuple(
+        profileid, twid, f'{daddr}-443-tcp', '1aArR', 'Client', starttime, uid
+    )
+    __database__.add_ips(profileid, twid, daddr_as_obj, flow, 'Client')
+    __database__.add_port(profileid, twid, daddr_as_obj, flow, 'Client', 'Dst')
+    __database__.add_port(profileid, twid, daddr_as_obj, flow, 'Client', 'Src')
+    __database__.add_flow(
+        profileid=profileid,
+        twid=twid,
+        stime=starttime,
+        dur='0.5',
+        saddr='192.168.1.1',
+        sport=51234,
+        daddr=daddr,
+        dport=443,
+        proto='tcp',
+        state='SF',
+        pkts=10,
+        allbytes=1200,
+        spkts=6,
+        sbytes=600,
+        appproto='ssl',
+        uid=uid,
+        flow_type='conn',
+    )
+    __database__.publish('new_MAC', '{"MAC": "aa:bb:cc:dd:ee:ff"}')
+    __database__.publish('new_MAC', '{"MAC": "ff:ee:dd:cc:bb:aa"}')
+
+
+def dns_flow(flow):
+    __database__.add_out_dns(
+        profileid, twid, '8.8.8.8', 1637150000 + flow, 'dns', f'dns{flow}',
+        f'domain{flow}.com', 'C_INTERNET', 'A', 'NOERROR', [f'10.1.0.{flow % 250}'], [60]
+    )
+
+
+def http_flow(flow):
+    __database__.add_out_http(
+        '10.0.0.1', profileid, twid, 1637150000 + flow, 'http', f'http{flow}',
+        'GET', f'domain{flow}.com', '/', '1.1', 'curl', 0, 100, 200, 'OK', [], []
+    )
+
+
+def ssl_flow(flow):
+    __database__.add_out_ssl(
+        profileid, twid, 1637150000 + flow, ipaddress.ip_address('10.0.0.1'), 443,
+        'ssl', f'ssl{flow}', 'TLSv12', 'cipher', False, True, [], [], 'subject',
+        'issuer', 'ok', 'x25519', f'domain{flow}.com', 'ja3', 'ja3s', False
+    )
+
+
+def ssh_flow(flow):
+    __database__.add_out_ssh(
+        profileid, twid, 1637150000 + flow, 'ssh', f'ssh{flow}', 2, 1, True,
+        'client', 'server', 'aes', 'hmac', 'none', 'curve25519', 'ed25519', 'key', '10.0.0.1'
+    )
+
+
+def bench(store_flow, unit_of_work):
+    """returns the round trips per flow and the flows per second"""
+    global round_trips
+    __database__.r.flushdb()
+    __database__.rcache.flushdb()
+    # the cache db was flushed, so the items seen before aren't stored anymore
+    __database__.seen_items = {
+        'IPsInfo': SeenSet(),
+        'DomainsInfo': SeenSet(),
+        'URLsInfo': SeenSet(),
+    }
+    round_trips = 0
+    start = time.time()
+    if unit_of_work == 'none':
+        for flow in range(flows):
+            store_flow(flow)
+    elif unit_of_work == 'flow':
+        for flow in range(flows):
+            with __database__.pipeline():
+                store_flow(flow)
+    else:
+        for batch in range(0, flows, batch_size):
+            with __database__.pipeline():
+                for flow in range(batch, batch + batch_size):
+                    store_flow(flow)
+    return round_trips / flows, flows / (time.time() - start)
+
+
+def main():
+    redis_port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    connect(redis_port)
+    Connection.send_packed_command = count_round_trips(Connection.send_packed_command)
+
+    print(f'{flows} flows of each type, batches of {batch_size} flows')
+    print(f'{"":6}{"no unit of work":>28}{"1 unit of work per flow":>28}{"1 per batch":>28}')
+    for name, store_flow in (
+        ('conn', conn_flow),
+        ('dns', dns_flow),
+        ('http', http_flow),
+        ('ssl', ssl_flow),
+        ('ssh', ssh_flow),
+    ):
+        line = f'{name:6}'
+        for unit_of_work in ('none', 'flow', 'batch'):
+            per_flow, flows_per_sec = bench(store_flow, unit_of_work)
+            line += f'{per_flow:8.2f} trips {flows_per_sec:8.0f} flows/s'
+        print(line)
+
+    __database__.r.flushdb()
+    __database__.rcache.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Measures how long the profiler takes to parse each flow of the bundled datasets
+into its record (slips_files/core/flows.py) and how much memory the records of
+all the flows take, compared to the same fields stored in a dict,
+the way the profiler stored them before using records.
+doesn't need redis, only the parsers of the profiler are used.
+
+usage: python3 -m tests.benchmarks.bench_flow_records
+"""
+import glob
+import json
+import os
+import time
+import tracemalloc
+from slips_files.core.profilerProcess import ProfilerProcess
+
+
+# the same logs slips ignores when reading a zeek dir
+ignored_logs = ('capture_loss', 'loaded_scripts', 'packet_filter', 'stats', 'ocsp', 'reporter', 'x509', 'pe')
+rounds = 5
+
+
+def do_nothing(*arg):
+    pass
+
+
+def zeek_lines(zeek_dir):
+    lines = []
+    for path in sorted(glob.glob(f'{zeek_dir}/*.log')):
+        if os.path.basename(path)[:-4] in ignored_logs:
+            continue
+        with open(path) as log:
+            for line in log:
+                if line.startswith('#'):
+                    continue
+                data = json.loads(line) if line.startswith('{') else line
+                lines.append({'type': path, 'data': data})
+    return lines
+
+
+def file_lines(path, input_type):
+    with open(path) as file:
+        return [{'type': input_type, 'data': line} for line in file]
+
+
+def get_profiler():
+    # the parsers don't use the db, so the process isn't initialized
+    profiler = ProfilerProcess.__new__(ProfilerProcess)
+    profiler.print = do_nothing
+    profiler.separator = ','
+    return profiler
+
+
+def parse(profiler, parser, lines):
+    flows = []
+    for line in lines:
+        flows.append(parser(line))
+    return flows
+
+
+def as_dict(flow):
+    """the fields of the given record in a dict"""
+    fields = {}
+    for cls in type(flow).__mro__:
+        for field in getattr(cls, '__slots__', ()):
+            fields[field] = getattr(flow, field)
+    return fields
+
+
+def memory_per_flow(create_flows) -> float:
+    tracemalloc.start()
+    flows = create_flows()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used / len(flows)
+
+
+def main():
+    datasets = (
+        ('zeek json', 'process_zeek_input', zeek_lines('dataset/test9-mixed-zeek-dir')),
+        ('zeek tabs', 'process_zeek_tabs_input', zeek_lines('dataset/test10-mixed-zeek-dir')),
+        ('argus', 'process_argus_input', file_lines('dataset/test2-malicious.binetflow', 'argus')),
+        ('suricata', 'process_suricata_input', file_lines('dataset/test6-malicious.suricata.json', 'suricata')),
+    )
+    print(f'{"":10}{"flows":>8}{"parse time":>16}{"record":>12}{"dict":>12}')
+    for name, parser_name, lines in datasets:
+        profiler = get_profiler()
+        if parser_name == 'process_argus_input':
+            # the first line is the header
+            profiler.define_columns(lines[0])
+            lines = lines[1:]
+        parser = getattr(profiler, parser_name)
+        # only the flows slips analyzes
+        lines = [line for line in lines if profiler.is_supported_flow(parser(line))]
+
+        best = min(
+            measure_parse_time(profiler, parser, lines) for _ in range(rounds)
+        )
+        record_size = memory_per_flow(lambda: parse(profiler, parser, lines))
+        # the records are freed once converted, only the dicts and the fields stay in memory
+        dict_size = memory_per_flow(
+            lambda: [as_dict(flow) for flow in parse(profiler, parser, lines)]
+        )
+        print(
+            f'{name:10}{len(lines):8}{best / len(lines) * 1e6:11.2f} us/fl'
+            f'{record_size:9.0f} B/fl{dict_size:9.0f} B/fl'
+        )
+
+
+def measure_parse_time(profiler, parser, lines) -> float:
+    start = time.perf_counter()
+    parse(profiler, parser, lines)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
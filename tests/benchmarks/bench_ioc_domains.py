@@ -0,0 +1,97 @@
+"""
+Compares the time it takes to check if a domain or any of its parent domains is blacklisted
+using the old substring scan of all IoC_domains and the current per-label lookup
+in Database.is_domain_malicious(), with 500k blacklisted domains.
+needs a running redis server, the IoC domains are stored in db 0 of the given port, it's flushed
+before and after the benchmark, same as the unit tests do.
+
+usage: python3 -m tests.benchmarks.bench_ioc_domains [redis_port]
+"""
+import json
+import random
+import string
+import sys
+import time
+import redis
+from slips_files.core.database.database import __database__
+
+
+ioc_domains_count = 500000
+lookups = 10000
+# the old scan transfers all the domains, so it's much slower
+substring_scan_lookups = 5
+
+
+def random_label(length):
+    return ''.join(random.choices(string.ascii_lowercase, k=length))
+
+
+def generate_ioc_domains():
+    description = json.dumps({'source': 'benchmark', 'threat_level': 'high'})
+    domains = {}
+    while len(domains) < ioc_domains_count:
+        domain = f'{random_label(random.randint(5, 12))}.{random.choice(("com", "net", "org", "xyz"))}'
+        domains[domain] = description
+    return domains
+
+
+def substring_scan(domain):
+    """how is_domain_malicious() used to match subdomains"""
+    description = __database__.rcache.hget('IoC_domains', domain)
+    if description is not None:
+        return description, False
+    for malicious_domain, description in __database__.rcache.hgetall('IoC_domains').items():
+        if malicious_domain in domain:
+            return description, True
+    return False, False
+
+
+def bench(lookup, domains):
+    start = time.time()
+    matches = sum(1 for domain in domains if lookup(domain)[0])
+    return (time.time() - start) / len(domains), matches
+
+
+def main():
+    redis_port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    __database__.rcache = redis.StrictRedis(
+        port=redis_port, db=0, decode_responses=True
+    )
+    __database__.rcache.flushdb()
+
+    ioc_domains = generate_ioc_domains()
+    pipe = __database__.rcache.pipeline()
+    items = list(ioc_domains.items())
+    for idx in range(0, len(items), 10000):
+        pipe.hset('IoC_domains', mapping=dict(items[idx: idx + 10000]))
+    pipe.execute()
+    blacklisted = random.sample(list(ioc_domains), lookups // 2)
+
+    # half are subdomains of blacklisted domains, half aren't blacklisted
+    queries = [f'{random_label(6)}.{domain}' for domain in blacklisted]
+    queries += [f'{random_label(8)}.{random_label(10)}.com' for _ in range(lookups // 2)]
+    random.shuffle(queries)
+
+    print(f'{ioc_domains_count} IoC domains, {lookups} lookups')
+    per_lookup, matches = bench(__database__.is_domain_malicious, queries)
+    print(f'label lookup:   {per_lookup * 1e6:12.1f} us/lookup, {matches} matches')
+
+    per_lookup, _ = bench(substring_scan, queries[:substring_scan_lookups])
+    print(f'substring scan: {per_lookup * 1e6:12.1f} us/lookup')
+
+    # false matches of the substring scan
+    false_matches = [
+        f'not{blacklisted[0]}',
+        f'{blacklisted[0]}.example.org',
+    ]
+    for domain in false_matches:
+        print(
+            f'{domain}: substring scan: {bool(substring_scan(domain)[0])}, '
+            f'label lookup: {bool(__database__.is_domain_malicious(domain)[0])}'
+        )
+
+    __database__.rcache.flushdb()
+
+
+if __name__ == '__main__':
+    main()
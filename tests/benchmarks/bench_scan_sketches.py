@@ -0,0 +1,62 @@
+"""
+Measures the memory the port scan detection takes for 1 horizontal port scan of
+increasing width, counting the dst IPs exactly and with sketches of different
+precisions (scan_sketches in slips.conf), and how far the count of the sketches is
+from the real amount of dst IPs scanned.
+doesn't need redis, only the state of the detection is used.
+
+usage: python3 -m tests.benchmarks.bench_scan_sketches
+"""
+import time
+import tracemalloc
+from modules.network_discovery.portscan_state import PortscanState
+
+
+widths = (100, 1000, 10000, 65536, 262144)
+# None counts exactly
+precisions = (None, 10, 12, 14)
+max_uids = 1000
+
+
+def do_nothing(*arg):
+    return False
+
+
+def scan(width, precision):
+    """
+    returns the state of a profile that sent 1 flow to port 80 of each IP of a network of the given width
+    """
+    portscans = PortscanState(
+        do_nothing,
+        sketch_precision=precision,
+        max_uids=max_uids if precision else None
+    )
+    for i in range(width):
+        dstip = f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+        portscans.add_to_dport(
+            'profile_10.0.0.1_timewindow1', 'TCP', 'Not Established', '80', dstip, 1, 0.0, f'C{i:017}'
+        )
+    return portscans
+
+
+def main():
+    print(f'{"width":>8}{"precision":>11}{"memory":>12}{"counted":>10}{"error":>9}{"time":>13}')
+    for width in widths:
+        for precision in precisions:
+            tracemalloc.start()
+            start = time.perf_counter()
+            portscans = scan(width, precision)
+            elapsed = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            port = portscans.dports['profile_10.0.0.1_timewindow1'][('TCP', 'Not Established', '80')]
+            counted = len(port.dstips)
+            error = abs(counted - width) / width * 100
+            print(
+                f'{width:8}{str(precision or "exact"):>11}{memory / 1024:9.0f} KB'
+                f'{counted:10}{error:8.2f}%{elapsed / width * 1e6:8.2f} us/fl'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures scheduling a delayed check for each flow with 1 thread per check, like flowalerts
+used to do for the connections without dns, vs. scheduling all the checks in 1 Scheduler.
+Prints the time to schedule the checks, the amount of threads alive after scheduling them and the time until
+all the checks ran.
+
+usage: python3 -m tests.benchmarks.bench_scheduler
+"""
+import threading
+import time
+from slips_files.common.scheduler import Scheduler
+
+
+flows = (1000, 5000, 20000)
+# seconds each check waits, 15 in flowalerts
+delay = 1
+# shut down after each run so their threads aren't counted in the next one
+schedulers = []
+
+
+def schedule_with_threads(amount, check):
+    for uid in range(amount):
+        timer = threading.Timer(delay, check, (uid,))
+        timer.start()
+    return threading.active_count()
+
+
+def schedule_with_scheduler(amount, check):
+    scheduler = Scheduler('bench')
+    scheduler.start()
+    schedulers.append(scheduler)
+    for uid in range(amount):
+        scheduler.schedule(delay, check, (uid,), key=uid)
+    return threading.active_count()
+
+
+def main():
+    print(f'{"flows":>8}{"":>11}{"schedule":>12}{"threads":>9}{"all ran":>10}')
+    for amount in flows:
+        for name, schedule in (('threads', schedule_with_threads), ('scheduler', schedule_with_scheduler)):
+            checked = []
+            done = threading.Event()
+
+            def check(uid):
+                checked.append(uid)
+                if len(checked) == amount:
+                    done.set()
+
+            start = time.perf_counter()
+            try:
+                max_threads = schedule(amount, check)
+            except RuntimeError:
+                # can't start new thread
+                print(f'{amount:8}{name:>11}    too many threads')
+                continue
+            scheduled = time.perf_counter() - start
+            done.wait()
+            elapsed = time.perf_counter() - start
+            while schedulers:
+                schedulers.pop().shutdown()
+            print(f'{amount:8}{name:>11}{scheduled:10.3f} s{max_threads:9}{elapsed:8.2f} s')
+
+
+if __name__ == '__main__':
+    main()
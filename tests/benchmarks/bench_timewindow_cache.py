@@ -0,0 +1,67 @@
+"""
+Compares how many flows per second the profiler can assign to a TW using
+Database.get_timewindow(), that asks redis for the first and last TW of the profile of each flow,
+and the in-memory TimewindowCache of slips_files/common/timewindow_cache.py,
+that only writes to redis when a new TW is created.
+needs a running redis server, db 0 of the given port is flushed
+before and after the benchmark, same as the unit tests do.
+
+usage: python3 -m tests.benchmarks.bench_timewindow_cache [redis_port]
+"""
+import random
+import sys
+import time
+import redis
+from slips_files.core.database.database import __database__
+from slips_files.common.timewindow_cache import TimewindowCache
+
+
+flows_count = 100000
+profiles = 100
+# 1 day of traffic with 1h TWs
+duration = 24 * 3600
+width = 3600
+
+
+def do_nothing(*arg):
+    pass
+
+
+def generate_flows():
+    start = 1637150000
+    flows = []
+    for flow in range(flows_count):
+        # flows arrive mostly in order, with some of them a bit late
+        ts = start + duration * flow / flows_count - random.uniform(0, 30)
+        flows.append((ts, f'profile_10.0.0.{random.randrange(profiles)}'))
+    return flows
+
+
+def bench(get_timewindow, flows):
+    __database__.r.flushdb()
+    start = time.time()
+    for ts, profileid in flows:
+        get_timewindow(ts, profileid)
+    return flows_count / (time.time() - start)
+
+
+def main():
+    redis_port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    __database__.r = redis.StrictRedis(
+        port=redis_port, db=0, decode_responses=True
+    )
+    __database__.print = do_nothing
+    __database__.width = width
+    flows = generate_flows()
+
+    print(f'{flows_count} flows, {profiles} profiles, {duration // width} TWs')
+    flows_per_sec = bench(__database__.get_timewindow, flows)
+    print(f'without cache: {flows_per_sec:12.0f} flows/sec')
+    flows_per_sec = bench(TimewindowCache().get_timewindow, flows)
+    print(f'with cache:    {flows_per_sec:12.0f} flows/sec')
+
+    __database__.r.flushdb()
+
+
+if __name__ == '__main__':
+    main()
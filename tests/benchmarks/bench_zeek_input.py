@@ -0,0 +1,74 @@
+"""
+Measures how many zeek lines per second inputProcess.py reads from a zeek dir
+and sends to the profiler.
+needs a running redis server, same as the unit tests.
+
+usage: python3 -m tests.benchmarks.bench_zeek_input [redis_port]
+"""
+import sys
+import time
+from slips_files.core.inputProcess import InputProcess
+from slips_files.core.database.database import __database__
+
+
+zeek_dirs = (
+    'dataset/test9-mixed-zeek-dir/',
+    'dataset/test14-malicious-zeek-dir/',
+)
+
+
+def do_nothing(*arg):
+    pass
+
+
+class CountingQueue:
+    """takes the place of the profiler queue, only counts what's sent to it"""
+    def __init__(self):
+        self.lines = 0
+
+    def put(self, line):
+        self.lines += 1
+
+    def close(self):
+        pass
+
+
+def bench_zeek_dir(zeek_dir, redis_port):
+    profiler_queue = CountingQueue()
+    input_process = InputProcess(
+        CountingQueue(),
+        profiler_queue,
+        'zeek_folder',
+        zeek_dir,
+        None,
+        'zeek',
+        zeek_dir,
+        False,
+        redis_port
+    )
+    input_process.print = do_nothing
+    input_process.stop_queues = do_nothing
+    # files from the previous dir
+    __database__.r.delete('zeekfiles')
+
+    start = time.time()
+    input_process.read_zeek_folder()
+    elapsed = time.time() - start
+    if input_process.event_observer:
+        input_process.event_observer.stop()
+
+    return profiler_queue.lines, elapsed
+
+
+def main():
+    redis_port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    for zeek_dir in zeek_dirs:
+        lines, elapsed = bench_zeek_dir(zeek_dir, redis_port)
+        print(
+            f'{zeek_dir}: {lines} lines in {elapsed:.2f}s '
+            f'({lines / elapsed:.0f} lines/sec)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+from slips_files.common.batch_queue import BatchQueue
+
+
+def test_batch_size():
+    queue = BatchQueue(batch_size=3, flush_interval=10000, capacity=10)
+    for i in range(7):
+        queue.put({'type': 'zeek', 'data': i})
+    assert [line['data'] for line in queue.get()] == [0, 1, 2]
+    assert [line['data'] for line in queue.get()] == [3, 4, 5]
+    # the 7th line is still buffered
+    assert queue.depth() == 0
+
+
+def test_flush_interval():
+    queue = BatchQueue(batch_size=100, flush_interval=10, capacity=10)
+    queue.put({'type': 'zeek', 'data': 1})
+    # the flusher thread should send it after 10ms
+    assert queue.get() == [{'type': 'zeek', 'data': 1}]
+
+
+def test_stop_msgs_are_sent_right_away():
+    queue = BatchQueue(batch_size=100, flush_interval=10000, capacity=10)
+    queue.put({'type': 'zeek', 'data': 1})
+    queue.put('stop')
+    assert queue.get() == [{'type': 'zeek', 'data': 1}, 'stop']
+
+
+def test_depth():
+    queue = BatchQueue(batch_size=2, flush_interval=10000, capacity=10)
+    for i in range(4):
+        queue.put(i)
+    assert queue.depth() == 4
+    queue.get()
+    assert queue.depth() == 2
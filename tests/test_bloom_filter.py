@@ -0,0 +1,30 @@
+from slips_files.common.bloom_filter import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom_filter = BloomFilter.for_capacity(10000, error_rate=0.01)
+    iocs = [f'10.0.{i // 256}.{i % 256}' for i in range(10000)]
+    for ioc in iocs:
+        bloom_filter.add(ioc)
+    assert all(ioc in bloom_filter for ioc in iocs)
+
+
+def test_false_positive_rate():
+    bloom_filter = BloomFilter.for_capacity(10000, error_rate=0.01)
+    for i in range(10000):
+        bloom_filter.add(f'malicious{i}.com')
+    false_positives = sum(
+        f'benign{i}.com' in bloom_filter for i in range(10000)
+    )
+    assert false_positives / 10000 < 0.02
+    assert 0.005 < bloom_filter.false_positive_rate() < 0.02
+
+
+def test_load_from_bytes():
+    bloom_filter = BloomFilter.for_capacity(100)
+    bloom_filter.add('1.2.3.4')
+    # redis doesn't store the trailing zero bytes of the filter
+    data = bloom_filter.to_bytes().rstrip(b'\x00')
+    loaded_filter = BloomFilter(bloom_filter.bits, bloom_filter.hashes, data)
+    assert '1.2.3.4' in loaded_filter
+    assert loaded_filter.to_bytes() == bloom_filter.to_bytes()
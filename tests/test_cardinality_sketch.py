@@ -0,0 +1,44 @@
+from slips_files.common.cardinality_sketch import HyperLogLog, DistinctCounter, UidReservoir
+
+
+def test_hyperloglog():
+    hll = HyperLogLog(precision=12)
+    for i in range(20000):
+        hll.add(f'192.168.{i // 256}.{i % 256}')
+    # the standard error with precision 12 is 1.6%
+    assert abs(len(hll) - 20000) < 20000 * 0.05
+    assert '192.168.0.1' in hll
+    # adding the same items again doesn't change the estimate
+    assert not hll.add('192.168.0.1')
+
+
+def test_distinct_counter():
+    counter = DistinctCounter()
+    assert counter.add('1.1.1.1')
+    assert not counter.add('1.1.1.1')
+    assert len(counter) == 1
+
+    counter = DistinctCounter(precision=4)
+    # counts exactly until it has 2 items, then uses a sketch of 16 registers
+    for ip in ('1.1.1.1', '2.2.2.2'):
+        counter.add(ip)
+    assert counter.sketch is None
+    counter.add('3.3.3.3')
+    assert counter.sketch is not None
+    assert counter.items is None
+    assert '1.1.1.1' in counter
+    assert len(counter) == 3
+
+
+def test_uid_reservoir():
+    uids = UidReservoir()
+    for i in range(10):
+        uids.add(f'uid{i}')
+    assert len(uids.uids) == 10
+
+    uids = UidReservoir(max_size=5)
+    for i in range(100):
+        uids.add(f'uid{i}')
+    assert len(uids.uids) == 5
+    assert len(uids) == 100
+    assert len(set(uids.uids)) == 5
@@ -1,4 +1,5 @@
 from slips_files.common.slips_utils import utils
+from slips_files.core.flows import Conn
 import ipaddress
 import redis
 import os
@@ -28,6 +29,8 @@ def create_db_instace(outputQueue):
     __database__.disabled_detections = []
     __database__.home_network = utils.home_network_ranges
     __database__.width = 3600
+    __database__.stream_max_len = 1000
+    __database__.stream_max_lag = 1000
     __database__.connect_to_redis_server(6381)
     __database__.r.flushdb()
     __database__.setSlipsInternalTime(0)
@@ -114,6 +117,55 @@ def test_timewindows(outputQueue):
     assert database.getLastTWforProfile(profileid) == [('timewindow2', 5.0)]
 
 
+def test_mark_tw_as_modified(outputQueue):
+    database = create_db_instace(outputQueue)
+    database.modified_tws = {}
+    database.tws_to_close = []
+    database.tw_deadlines = {}
+    database.closing_tws = True
+    # only flush when we call flush_modified_tws()
+    database.last_modified_tws_flush = time.time()
+    database.modified_tws_flush_interval = 100
+
+    database.markProfileTWAsModified(profileid, twid, '')
+    database.markProfileTWAsModified(profileid, twid, '')
+    assert database.getModifiedTW() == []
+    database.flush_modified_tws()
+    assert len(database.getModifiedTW()) == 1
+
+    profileid_tw = f'{profileid}_{twid}'
+    database.close_expired_tws()
+    assert not database.r.sismember('ClosedTW', profileid_tw)
+    # a whole tw width passed without modifications
+    database.setSlipsInternalTime(time.time() + database.width)
+    database.close_expired_tws()
+    assert database.r.sismember('ClosedTW', profileid_tw)
+    assert database.getModifiedTW() == []
+    assert database.tws_to_close == []
+
+
+def test_tw_modified_by_another_process_isnt_closed(outputQueue):
+    database = create_db_instace(outputQueue)
+    database.tws_to_close = []
+    database.tw_deadlines = {}
+    database.closing_tws = True
+    profileid_tw = f'{profileid}_{twid}'
+    database.markProfileTWAsModified(profileid, twid, '')
+    database.flush_modified_tws()
+
+    now = time.time()
+    database.setSlipsInternalTime(now + database.width)
+    # another profiler added a flow to this tw after this one did
+    database.r.zadd('ModifiedTW', {profileid_tw: now + 10})
+    database.close_expired_tws()
+    assert not database.r.sismember('ClosedTW', profileid_tw)
+    assert database.tw_deadlines[profileid_tw] == now + 10 + database.width
+
+    database.setSlipsInternalTime(now + 10 + database.width)
+    database.close_expired_tws()
+    assert database.r.sismember('ClosedTW', profileid_tw)
+
+
 def getSlipsInternalTime():
     """return a random time for testing"""
     return 50.0
@@ -125,55 +177,97 @@ def test_add_ips(outputQueue):
     database.addProfile(profileid, '00:00', '1')
     # add a tw to that profile
     database.addNewTW(profileid, 0.0)
-    columns = {
-        'dport': 80,
-        'sport': 80,
-        'totbytes': 80,
-        'pkts': 20,
-        'sbytes': 30,
-        'bytes': 30,
-        'spkts': 70,
-        'state': 'Not Established',
-        'uid': '1234',
-        'proto': 'TCP',
-        'saddr': '8.8.8.8',
-        'daddr': test_ip,
-        'starttime': '20.0',
-    }
+    flow = Conn(
+        'conn',
+        '20.0',
+        '1234',
+        '8.8.8.8',
+        test_ip,
+        dport=80,
+        sport=80,
+        pkts=20,
+        sbytes=30,
+        bytes=30,
+        spkts=70,
+        state='Not Established',
+        proto='TCP',
+    )
     # make sure ip is added
     assert (
         database.add_ips(
-            profileid, twid, ipaddress.ip_address(test_ip), columns, 'Server'
+            profileid, twid, ipaddress.ip_address(test_ip), flow, 'Server'
         )
         == True
     )
-    hash_id = profileid + '_' + twid
-    stored_dstips = database.r.hget(hash_id, 'SrcIPs')
+    stored_dstips = database.getSrcIPsfromProfileTW(profileid, twid)
     assert stored_dstips == '{"192.168.1.1": 1}'
+    added_ips = database.getDataFromProfileTW(
+        profileid, twid, 'Src', 'Not Established', 'TCP', 'Server', 'IPs'
+    )
+    assert added_ips[test_ip] == {
+        'totalflows': 1,
+        'totalpkt': 20,
+        'totalbytes': 30,
+        'stime': '20.0',
+        'uid': ['1234'],
+        'dstports': {'80': 70},
+    }
+
+
+def test_ask_for_ip_info(outputQueue):
+    from slips_files.common.recent_requests import RecentRequests
+    database = create_db_instace(outputQueue)
+    database.ip_info_requests = RecentRequests(ttl=300)
+    database.reported_suppressed_requests = 0
+    ti_requests = database.subscribe('give_threat_intelligence')
+    # skip the subscription msgs
+    while database.get_message(ti_requests, timeout=0.5):
+        pass
+
+    for uid, starttime in (('1', 10.0), ('2', 20.0)):
+        database.ask_for_ip_info(
+            '8.8.8.8', profileid, twid, 'TCP', starttime, uid, 'dstip'
+        )
+    # only the first flow is sent, with its uid
+    msg = database.get_message(ti_requests, timeout=1)
+    assert json.loads(msg['data'])['uid'] == '1'
+    assert database.get_message(ti_requests, timeout=0.5) is None
+
+    database.report_suppressed_ip_info_requests()
+    assert database.get_suppressed_ip_info_requests() == 1
 
 
 def test_add_port(outputQueue):
     database = create_db_instace(outputQueue)
-    columns = {
-        'dport': 80,
-        'sport': 88,
-        'totbytes': 80,
-        'pkts': 20,
-        'sbytes': 30,
-        'bytes': 30,
-        'spkts': 70,
-        'state': 'Not Established',
-        'proto': 'TCP',
-        'saddr': '8.8.8.8',
-        'daddr': test_ip,
-        'uid': '1234',
-        'starttime': '20.0',
+    flow = Conn(
+        'conn',
+        '20.0',
+        '1234',
+        '8.8.8.8',
+        test_ip,
+        dport=80,
+        sport=88,
+        pkts=20,
+        sbytes=30,
+        bytes=30,
+        spkts=70,
+        state='Not Established',
+        proto='TCP',
+    )
+    database.add_port(profileid, twid, test_ip, flow, 'Server', 'Dst')
+    added_ports = database.getDataFromProfileTW(
+        profileid, twid, 'Dst', 'Not Established', 'TCP', 'Server', 'Ports'
+    )
+    assert added_ports == {
+        '80': {
+            'totalflows': 1,
+            'totalpkt': 20,
+            'totalbytes': 30,
+            'srcips': {
+                test_ip: {'pkts': 20, 'spkts': 70, 'stime': '20.0', 'uid': ['1234']}
+            }
+        }
     }
-    database.add_port(profileid, twid, test_ip, columns, 'Server', 'Dst')
-    hash_key = profileid + '_' + twid
-    added_ports = database.r.hgetall(hash_key)
-    assert 'DstPortsServerTCPNot Established' in added_ports.keys()
-    assert test_ip in added_ports['DstPortsServerTCPNot Established']
 
 
 def test_setEvidence(outputQueue):
@@ -190,29 +284,41 @@ def test_setEvidence(outputQueue):
     database.setEvidence(evidence_type, attacker_direction, attacker, threat_level, confidence, description,
                          timestamp, category, profileid=profileid, twid=twid, uid=uid)
 
-    added_evidence = database.r.hget('evidence' + profileid, twid)
-    added_evidence2 = database.r.hget(profileid + '_' + twid, 'Evidence')
-    assert added_evidence2 == added_evidence
-
-    added_evidence = json.loads(added_evidence)
+    added_evidence = json.loads(database.getEvidenceForTW(profileid, twid))
     description = 'SSH Successful to IP :8.8.8.8. From IP 192.168.1.1'
     #  note that added_evidence may have evidence from other unit tests
-    evidence_uid =  next(iter(added_evidence))
+    evidence_uid = next(iter(added_evidence))
     evidence_details = json.loads(added_evidence[evidence_uid])
     assert 'description' in evidence_details
     assert evidence_details['description'] == description
+    assert database.get_evidence_by_ID(profileid, twid, evidence_uid) == evidence_details
+
+
+def test_get_evidence_since(outputQueue):
+    database = create_db_instace(outputQueue)
+    for description in ('first', 'second', 'third'):
+        database.setEvidence('PortScan', 'srcip', test_ip, 'low', 0.5, description,
+                             time.time(), 'Recon.Scanning', profileid=profileid,
+                             twid='timewindow2', uid='123')
+    all_evidence = database.get_evidence_since(profileid, 'timewindow2')
+    IDs = list(all_evidence)
+    assert [json.loads(all_evidence[ID])['description'] for ID in IDs[-3:]] == [
+        'first', 'second', 'third'
+    ]
+    new_evidence = database.get_evidence_since(profileid, 'timewindow2', IDs[-2])
+    assert list(new_evidence) == IDs[-1:]
 
 
 def test_deleteEvidence(outputQueue):
     database = create_db_instace(outputQueue)
-    description = 'SSH Successful to IP :8.8.8.8. From IP 192.168.1.1'
-    database.deleteEvidence(profileid, twid, description)
-    added_evidence = json.loads(database.r.hget('evidence' + profileid, twid))
-    added_evidence2 = json.loads(
-        database.r.hget(profileid + '_' + twid, 'Evidence')
-    )
-    assert 'SSHSuccessful-by-192.168.1.1' not in added_evidence
-    assert 'SSHSuccessful-by-192.168.1.1' not in added_evidence2
+    database.setEvidence('PortScan', 'srcip', test_ip, 'low', 0.5, 'to delete',
+                         time.time(), 'Recon.Scanning', profileid=profileid,
+                         twid=twid, uid='123')
+    evidence_ID = next(iter(json.loads(database.getEvidenceForTW(profileid, twid))))
+    database.deleteEvidence(profileid, twid, evidence_ID)
+    added_evidence = database.getEvidenceForTW(profileid, twid)
+    assert not added_evidence or evidence_ID not in json.loads(added_evidence)
+    assert not database.get_evidence_by_ID(profileid, twid, evidence_ID)
 
 
 def test_module_labels(outputQueue):
@@ -233,6 +339,23 @@ def test_module_labels(outputQueue):
     assert labels['test'] == 'malicious'
 
 
+def test_dstip_labels(outputQueue):
+    """tests that the flows to each dstip are counted with the ensembling label of their module labels"""
+    database = create_db_instace(outputQueue)
+    database.ensembling_enabled = True
+    add_flow(database)
+    uid = '1234'
+    # flows without module labels are normal
+    assert database.get_dstip_labels(profileid, twid) == {'8.8.8.8': {'normal': 1, 'malicious': 0}}
+    database.set_module_label_to_flow(profileid, twid, uid, 'test', 'malicious')
+    assert database.get_dstip_labels(profileid, twid) == {'8.8.8.8': {'normal': 0, 'malicious': 1}}
+    # 1 normal and 1 malicious label is malicious
+    database.set_module_label_to_flow(profileid, twid, uid, 'test2', 'normal')
+    assert database.get_dstip_labels(profileid, twid) == {'8.8.8.8': {'normal': 0, 'malicious': 1}}
+    flow = json.loads(database.get_flow(profileid, twid, uid)[uid])
+    assert flow['1_ensembling_label'] == 'malicious'
+
+
 def test_setInfoForDomains(outputQueue):
     database = create_db_instace(outputQueue)
     """ tests setInfoForDomains, setNewDomain and getDomainData """
@@ -304,3 +427,108 @@ def test_get_the_other_ip_version(outputQueue):
     # the other ip version is ipv6
     other_ip = json.loads(database.get_the_other_ip_version(profileid))
     assert other_ip == ipv6
+
+
+def test_add_tuple(outputQueue):
+    database = create_db_instace(outputQueue)
+    tupleid = '8.8.8.8-53-udp'
+    # letters for periodicity -1, 1, 2, 3, 4 of a small short flow
+    letters = '1aArR'
+    symbol, previous_timestamps = database.add_tuple(
+        profileid, twid, tupleid, letters, 'Client', 10.0, '1'
+    )
+    assert symbol == '1'
+    assert previous_timestamps == (False, False)
+
+    symbol, previous_timestamps = database.add_tuple(
+        profileid, twid, tupleid, letters, 'Client', 20.0, '2'
+    )
+    assert symbol == '1,'
+    assert previous_timestamps == (False, 10.0)
+
+    # same time diff as the previous flow, strongly periodic
+    symbol, previous_timestamps = database.add_tuple(
+        profileid, twid, tupleid, letters, 'Client', 30.0, '3'
+    )
+    assert symbol == 'a,'
+    assert previous_timestamps == (10.0, 20.0)
+    assert database.get_tuples(profileid, twid, 'OutTuples') == {
+        tupleid: ['11,a,', [20.0, 30.0]]
+    }
+
+
+def test_pipeline(outputQueue):
+    database = create_db_instace(outputQueue)
+    flows_key = f'{profileid}_{twid}_flows'
+    new_ip = '10.20.30.40'
+    database.rcache.hdel('IPsInfo', new_ip)
+    new_ips = database.subscribe('new_ip')
+    # skip the subscription msgs
+    while database.get_message(new_ips, timeout=0.5):
+        pass
+
+    with database.pipeline():
+        # queued until the unit of work is sent
+        assert add_flow(database) is None
+        database.setNewIP(new_ip)
+        database.setNewIP(new_ip)
+        assert not database.r.hexists(flows_key, '1234')
+        assert database.rcache.hget('IPsInfo', new_ip) is None
+
+    assert database.r.hexists(flows_key, '1234')
+    assert database.rcache.hget('IPsInfo', new_ip) == '{}'
+    # published after the flow was stored
+    assert database.r.xlen(database.get_stream_key('new_flow')) == 1
+    # new_ip is only published the first time the ip is seen
+    assert database.get_message(new_ips, timeout=1)['data'] == new_ip
+    assert database.get_message(new_ips, timeout=0.5) is None
+
+    # the queued writes are discarded if the unit of work fails
+    try:
+        with database.pipeline():
+            database.setNewIP('10.20.30.41')
+            raise ValueError
+    except ValueError:
+        pass
+    assert database.rcache.hget('IPsInfo', '10.20.30.41') is None
+
+
+def test_set_new_item(outputQueue):
+    database = create_db_instace(outputQueue)
+    domain = 'seen.example.com'
+    database.rcache.hdel('DomainsInfo', domain)
+    new_domains = database.subscribe('new_dns')
+    # skip the subscription msgs
+    while database.get_message(new_domains, timeout=0.5):
+        pass
+
+    database.setNewDomain(domain)
+    assert database.rcache.hget('DomainsInfo', domain) == '{}'
+    assert domain in database.seen_items['DomainsInfo']
+    # the data of a seen domain isn't overwritten
+    database.rcache.hset('DomainsInfo', domain, '{"a": 1}')
+    database.setNewDomain(domain)
+    assert database.rcache.hget('DomainsInfo', domain) == '{"a": 1}'
+    # new_dns is only published the first time the domain is seen
+    assert database.get_message(new_domains, timeout=1)['data'] == domain
+    assert database.get_message(new_domains, timeout=0.5) is None
+
+    url = 'http://seen.example.com/a'
+    database.rcache.hdel('URLsInfo', url)
+    database.setNewURL(url)
+    assert database.getURLData(url) == {}
+    assert url in database.seen_items['URLsInfo']
+
+
+def test_is_domain_malicious(outputQueue):
+    database = create_db_instace(outputQueue)
+    description = json.dumps({'source': 'test_feed', 'threat_level': 'high'})
+    database.add_domains_to_IoC({'evil-test.com': description})
+
+    assert database.is_domain_malicious('evil-test.com') == (description, False)
+    assert database.is_domain_malicious('images.evil-test.com') == (description, True)
+    # only whole labels should match
+    assert database.is_domain_malicious('notevil-test.com') == (False, False)
+    assert database.is_domain_malicious('evil-test.com.example.org') == (False, False)
+
+    database.delete_domains_from_IoC_domains(['evil-test.com'])
@@ -0,0 +1,133 @@
+from slips_files.common.dispatcher import Dispatcher
+import pytest
+
+
+def do_nothing(*arg):
+    """Used to override the print function because using the self.print causes broken pipes"""
+    pass
+
+
+def create_dispatcher():
+    from slips_files.core.database.database import __database__
+    __database__.print = do_nothing
+    __database__.connect_to_redis_server(6381)
+    __database__.r.flushdb()
+    __database__.stream_max_len = 1000
+    __database__.stream_max_lag = 1000
+    return __database__, Dispatcher('test_dispatcher', timeout=0.1)
+
+
+def dispatch_until(dispatcher, condition, tries=20):
+    """keeps dispatching until the condition is met or we run out of tries"""
+    for _ in range(tries):
+        if not dispatcher.dispatch():
+            return False
+        if condition():
+            break
+    return True
+
+
+def test_dispatch():
+    database, dispatcher = create_dispatcher()
+    received = {'new_flow': [], 'tw_closed': []}
+    dispatcher.register('new_flow', received['new_flow'].append)
+    dispatcher.register('tw_closed', received['tw_closed'].append)
+
+    database.publish('tw_closed', 'profile_192.168.1.1_timewindow1')
+    database.publish('new_flow', 'flow')
+    assert dispatch_until(
+        dispatcher, lambda: received['new_flow'] and received['tw_closed']
+    )
+    assert received['new_flow'][0]['data'] == 'flow'
+    assert received['tw_closed'][0]['data'] == 'profile_192.168.1.1_timewindow1'
+
+
+def test_tw_closed_dispatched_after_the_flows_before_it():
+    database, dispatcher = create_dispatcher()
+    received = []
+    dispatcher.register('new_flow', lambda msg: received.append(msg['data']))
+    dispatcher.register('tw_closed', lambda msg: received.append(msg['data']))
+    for flow in range(3):
+        database.publish('new_flow', f'flow{flow}')
+    database.publish('tw_closed', 'profile_192.168.1.1_timewindow1')
+    assert dispatch_until(dispatcher, lambda: len(received) == 4)
+    assert received == ['flow0', 'flow1', 'flow2', 'profile_192.168.1.1_timewindow1']
+
+
+def test_dispatch_stop_process():
+    database, dispatcher = create_dispatcher()
+    received = []
+    dispatcher.register('new_flow', received.append)
+    database.publish('new_flow', 'stop_process')
+    assert not dispatch_until(dispatcher, lambda: False)
+    assert received == []
+
+
+def test_stream_msgs_dispatched_before_stopping():
+    database, dispatcher = create_dispatcher()
+    received = []
+    dispatcher.register('new_flow', received.append)
+    dispatcher.register('tw_closed', do_nothing)
+    for flow in range(3):
+        database.publish('new_flow', f'flow{flow}')
+    # the pub/sub stop msg is received first
+    database.publish_stop()
+    assert not dispatch_until(dispatcher, lambda: False)
+    assert [msg['data'] for msg in received] == ['flow0', 'flow1', 'flow2']
+
+
+def test_register_unsupported_channel():
+    database, dispatcher = create_dispatcher()
+    with pytest.raises(ValueError):
+        dispatcher.register('unsupported_channel', do_nothing)
+
+
+def test_stream_lag_and_replay():
+    database, dispatcher = create_dispatcher()
+    received = []
+    dispatcher.register('new_dns_flow', received.append)
+    for flow in range(3):
+        database.publish('new_dns_flow', f'flow{flow}')
+    assert database.get_stream_lag('new_dns_flow')['test_dispatcher']['lag'] == 3
+
+    assert dispatch_until(dispatcher, lambda: len(received) == 3)
+    lag = database.get_stream_lag('new_dns_flow')['test_dispatcher']
+    assert lag['lag'] == 0
+    assert lag['pending'] == 0
+
+    database.replay_stream('new_dns_flow', 'test_dispatcher', '0')
+    assert dispatch_until(dispatcher, lambda: len(received) == 6)
+    assert [msg['data'] for msg in received] == ['flow0', 'flow1', 'flow2'] * 2
+
+
+def test_stream_unacked_msgs_after_restart():
+    database, dispatcher = create_dispatcher()
+    dispatcher.register('new_flow', do_nothing)
+    database.publish('new_flow', 'flow')
+    # the module read the msg and stopped before processing it
+    assert len(database.read_streams({'new_flow': '>'}, 'test_dispatcher')) == 1
+
+    received = []
+    restarted_dispatcher = Dispatcher('test_dispatcher', timeout=0.1)
+    restarted_dispatcher.register('new_flow', received.append)
+    assert dispatch_until(restarted_dispatcher, lambda: received)
+    assert received[0]['data'] == 'flow'
+    assert database.get_stream_lag('new_flow')['test_dispatcher']['pending'] == 0
+
+
+def test_trimmed_pending_msgs():
+    database, dispatcher = create_dispatcher()
+    dispatcher.register('new_flow', do_nothing)
+    database.publish('new_flow', 'flow1')
+    database.publish('new_flow', 'flow2')
+    # the module read the msgs and stopped before processing them
+    assert len(database.read_streams({'new_flow': '>'}, 'test_dispatcher')) == 2
+    # the first msg was trimmed before the module was restarted
+    database.r.xtrim(database.get_stream_key('new_flow'), 1, approximate=False)
+
+    received = []
+    restarted_dispatcher = Dispatcher('test_dispatcher', timeout=0.1)
+    restarted_dispatcher.register('new_flow', received.append)
+    assert dispatch_until(restarted_dispatcher, lambda: received)
+    assert [msg['data'] for msg in received] == ['flow2']
+    assert database.get_stream_lag('new_flow')['test_dispatcher']['pending'] == 0
@@ -0,0 +1,40 @@
+from slips_files.common.flow_message import encode_flow_msg, decode_flow_msg, FLOW_MSG_VERSION
+import json
+import pytest
+
+
+def test_encode_decode():
+    flow = {'daddr': '8.8.8.8', 'dport': 53, 'module_labels': {}}
+    msg = decode_flow_msg(
+        encode_flow_msg(
+            'profile_192.168.1.1',
+            'timewindow1',
+            '1637150000.2',
+            'CAeDWs37BipkfP21u8',
+            flow,
+            rcode_name='NOERROR',
+        )
+    )
+    assert msg == {
+        'version': FLOW_MSG_VERSION,
+        'profileid': 'profile_192.168.1.1',
+        'twid': 'timewindow1',
+        'stime': '1637150000.2',
+        'uid': 'CAeDWs37BipkfP21u8',
+        'flow': flow,
+        'rcode_name': 'NOERROR',
+    }
+
+
+def test_decode_unsupported_version():
+    # the old msgs had the flow encoded inside the msg
+    old_msg = json.dumps(
+        {
+            'profileid': 'profile_192.168.1.1',
+            'twid': 'timewindow1',
+            'flow': json.dumps({'CAeDWs37BipkfP21u8': json.dumps({'daddr': '8.8.8.8'})}),
+            'stime': '1637150000.2',
+        }
+    )
+    with pytest.raises(ValueError):
+        decode_flow_msg(old_msg)
@@ -0,0 +1,48 @@
+from slips_files.common.ip_range_index import IPRangeIndex
+import ipaddress
+import random
+
+
+def test_lookup():
+    index = IPRangeIndex(
+        [
+            ('10.0.0.0/8', 'big'),
+            ('10.1.0.0/16', 'medium'),
+            ('10.1.1.0/24', 'small'),
+            ('10.2.0.0/16', 'other'),
+            ('2a00:1450::/32', 'ipv6'),
+            ('not a range', 'invalid'),
+        ]
+    )
+    assert len(index) == 5
+    assert index.lookup('10.1.1.5') == 'small'
+    assert index.lookup('10.1.2.5') == 'medium'
+    # after the end of a nested range, the ip belongs to the range containing it
+    assert index.lookup('10.3.0.1') == 'big'
+    assert index.lookup('11.0.0.1') is None
+    assert index.lookup('2a00:1450:4001::1') == 'ipv6'
+    assert '2a00:1451::1' not in index
+    assert index.lookup('invalid ip') is None
+
+
+def test_lookup_matches_ipaddress():
+    random.seed(1)
+    ranges = [
+        f'{random.randint(1, 3)}.{random.randint(0, 255)}.0.0/{random.randint(8, 24)}'
+        for _ in range(200)
+    ]
+    index = IPRangeIndex((ip_range, ip_range) for ip_range in ranges)
+    networks = [ipaddress.ip_network(ip_range, strict=False) for ip_range in ranges]
+    for _ in range(500):
+        ip = ipaddress.ip_address(
+            f'{random.randint(1, 4)}.{random.randint(0, 255)}.{random.randint(0, 255)}.1'
+        )
+        match = index.lookup(ip)
+        containing = [network for network in networks if ip in network]
+        if not containing:
+            assert match is None
+        else:
+            # the smallest range is returned
+            assert ipaddress.ip_network(match, strict=False).prefixlen == max(
+                network.prefixlen for network in containing
+            )
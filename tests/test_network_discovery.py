@@ -0,0 +1,259 @@
+"""Unit test for modules/network_discovery/network_discovery.py"""
+from modules.network_discovery.network_discovery import PortScanProcess
+from modules.network_discovery.portscan_state import PortscanState, crossed_threshold
+from slips_files.core.profilerProcess import ProfilerProcess
+from slips_files.common.flow_message import encode_flow_msg
+
+
+profileid = 'profile_192.168.1.1'
+twid = 'timewindow1'
+
+
+def do_nothing(*args):
+    """Used to override the print function because using the self.print causes broken pipes"""
+    pass
+
+
+def create_network_discovery_instance(outputQueue):
+    """Create an instance of network_discovery.py
+    needed by every other test in this file"""
+    network_discovery = PortScanProcess(outputQueue, 6380)
+    # override the self.print function to avoid broken pipes
+    network_discovery.print = do_nothing
+    return network_discovery
+
+
+def create_profilerProcess_instance(outputQueue, inputQueue):
+    profilerProcess = ProfilerProcess(inputQueue, outputQueue, 1, 0, 6380)
+    profilerProcess.print = do_nothing
+    profilerProcess.whitelist_path = 'tests/test_whitelist.conf'
+    # we're testing another functionality here
+    profilerProcess.whitelist.is_whitelisted_flow = do_nothing
+    return profilerProcess
+
+
+def get_flow_msg(dstip, dport, uid, state='Not Established', state_hist=''):
+    flow = {
+        'saddr': '192.168.1.1',
+        'daddr': dstip,
+        'dport': dport,
+        'proto': 'tcp',
+        'state': state,
+        'spkts': 1,
+    }
+    return {
+        'channel': 'new_flow',
+        'data': encode_flow_msg(profileid, twid, 1637150000.2, uid, flow, state_hist=state_hist),
+    }
+
+
+def test_portscan_state():
+    resolved = {'8.8.8.8'}
+    portscans = PortscanState(lambda ip: ip in resolved)
+    profileid_twid = f'{profileid}_{twid}'
+    args = ('TCP', 'Not Established')
+
+    port = portscans.add_to_dport(profileid_twid, *args, '80', '1.1.1.1', 2, 10.0, 'uid1')
+    assert len(port.dstips) == 1
+    # the same dst IP again doesn't cross any threshold
+    assert portscans.add_to_dport(profileid_twid, *args, '80', '1.1.1.1', 3, 11.0, 'uid2') is None
+    # resolved IPs aren't counted
+    assert portscans.add_to_dport(profileid_twid, *args, '80', '8.8.8.8', 1, 12.0, 'uid3') is None
+    assert port.pkts_sent == 5
+    assert port.uids.uids == ['uid1', 'uid2']
+    assert port.stime == 10.0
+
+    ip = portscans.add_to_dstip(profileid_twid, *args, '1.1.1.1', '80', 2, 10.0, 'uid1')
+    assert len(ip.dports) == 1
+    assert portscans.add_to_dstip(profileid_twid, *args, '1.1.1.1', '80', 3, 11.0, 'uid2') is None
+    assert portscans.add_to_dstip(profileid_twid, *args, '1.1.1.1', '443', 1, 12.0, 'uid3') is ip
+    assert ip.pkts_sent == 6
+    assert ip.uids.uids == ['uid1', 'uid2', 'uid3']
+
+    scan, is_new_dstip = portscans.add_to_icmp_scan(profileid_twid, '0x0008', '1.1.1.1', 1, 10.0, 'uid1')
+    assert is_new_dstip
+    assert portscans.add_to_icmp_scan(profileid_twid, '0x0008', '1.1.1.1', 1, 11.0, 'uid2') == (scan, False)
+    assert portscans.add_to_icmp_scan(profileid_twid, '0x0008', '2.2.2.2', 1, 12.0, 'uid3') == (scan, True)
+    assert scan.first_dstip == '1.1.1.1'
+    assert scan.stime == 10.0
+    assert scan.last_dstip_stime == 12.0
+    assert len(scan.uids) == 3
+
+    portscans.remove_tw(profileid_twid)
+    assert not portscans.dports
+    assert not portscans.dstips
+    assert not portscans.icmp_scans
+
+
+def test_portscan_state_with_sketches():
+    portscans = PortscanState(lambda ip: False, sketch_precision=10, max_uids=100)
+    profileid_twid = f'{profileid}_{twid}'
+    for i in range(50000):
+        dstip = f'10.{i // 65536}.{i // 256 % 256}.{i % 256}'
+        port = portscans.add_to_dport(profileid_twid, 'TCP', 'Not Established', '80', dstip, 1, 10.0, f'uid{i}')
+        if port and crossed_threshold(len(port.dstips), port.detected, 5):
+            port.detected = len(port.dstips)
+
+    port = portscans.dports[profileid_twid][('TCP', 'Not Established', '80')]
+    # the standard error with precision 10 is 3.25%
+    assert abs(len(port.dstips) - 50000) < 50000 * 0.1
+    assert abs(port.detected - 50000) < 50000 * 0.1
+    assert len(port.uids.uids) == 100
+    assert len(port.uids) == 50000
+    assert len(port.dstips.sketch.registers) == 1024
+
+
+def test_horizontal_portscan(outputQueue, database):
+    network_discovery = create_network_discovery_instance(outputQueue)
+    evidence = []
+    network_discovery.set_evidence_horizontal_portscan = (
+        lambda *args: evidence.append(args)
+    )
+    for i in range(10):
+        network_discovery.handle_new_flow(get_flow_msg(f'1.1.1.{i}', 80, f'uid{i}'))
+        # flipped flows aren't part of horizontal port scans
+        network_discovery.handle_new_flow(
+            get_flow_msg(f'2.2.2.{i}', 443, f'flipped{i}', state_hist='^dA')
+        )
+    # only the first evidence is set right away, the next ones are combined
+    assert len(evidence) == 1
+    assert evidence[0][-1] == 5
+    key = f'{profileid}-{twid}-Not Established-TCP-80'
+    assert [amount for *_, amount in network_discovery.pending_horizontal_ps_evidence[key]] == [10]
+
+
+def get_old_detections(database, profileid, twid, cache: dict) -> list:
+    """
+    The port scans the detection used to find by reading all the dst ports and dst IPs
+    of the profile and tw from the db every time it was modified
+    """
+    detections = []
+    for state in ('Established', 'Not Established'):
+        for protocol in ('TCP', 'UDP'):
+            dports = database.getDataFromProfileTW(
+                profileid, twid, 'Dst', state, protocol, 'Client', 'Ports'
+            )
+            for dport, dport_info in dports.items():
+                dstips = {
+                    dip: info
+                    for dip, info in dport_info['dstips'].items()
+                    if not database.get_dns_resolution(dip).get('domains')
+                }
+                amount = len(dstips)
+                key = ('HorizontalPortscan', protocol, dport)
+                if amount % 5 == 0 and cache.get((state, *key), 0) < amount:
+                    cache[(state, *key)] = amount
+                    detections.append((
+                        *key,
+                        amount,
+                        sum(info['spkts'] for info in dstips.values()),
+                        sorted(uid for info in dstips.values() for uid in info['uid']),
+                        float(next(iter(dstips.values()))['stime']),
+                    ))
+
+            dstips = database.getDataFromProfileTW(
+                profileid, twid, 'Dst', state, protocol, 'Client', 'IPs'
+            )
+            for dstip, dstip_info in dstips.items():
+                dstports = dstip_info['dstports']
+                amount = len(dstports)
+                key = ('VerticalPortscan', protocol, dstip)
+                if amount % 5 == 0 and cache.get((state, *key), 0) < amount:
+                    cache[(state, *key)] = amount
+                    detections.append((
+                        *key,
+                        amount,
+                        sum(dstports.values()),
+                        sorted(dstip_info['uid']),
+                        float(dstip_info['stime']),
+                    ))
+
+    sports = database.getDataFromProfileTW(
+        profileid, twid, 'Src', 'Established', 'ICMP', 'Client', 'Ports'
+    )
+    for sport, sport_info in sports.items():
+        scanned_ips = sport_info['dstips']
+        if len(scanned_ips) == 1:
+            scanned_ip, scan_info = next(iter(scanned_ips.items()))
+            amount = len(scan_info['uid'])
+            key = ('ICMPScan', sport, scanned_ip)
+            timestamp = scan_info['stime']
+        else:
+            amount = len(scanned_ips)
+            key = ('ICMPScan', sport)
+            # the stime of the last IP scanned
+            timestamp = list(scanned_ips.values())[-1]['stime']
+        if amount % 5 == 0 and cache.get(key, 0) < amount:
+            cache[key] = amount
+            detections.append((
+                'ICMPScan',
+                len(scanned_ips),
+                sum(info['spkts'] for info in scanned_ips.values()),
+                sorted(uid for info in scanned_ips.values() for uid in info['uid']),
+                float(timestamp),
+            ))
+    return detections
+
+
+def test_same_portscans_as_reading_the_db(outputQueue, inputQueue, database, monkeypatch):
+    """
+    Checks that detecting the port scans and ICMP scans of test11-portscan.binetflow incrementally
+    finds the same scans as reading all the dst ports and IPs of the tw after each flow
+    """
+    database.r.flushdb()
+    network_discovery = create_network_discovery_instance(outputQueue)
+    profilerProcess = create_profilerProcess_instance(outputQueue, inputQueue)
+    profilerProcess.separator = ','
+
+    detections = []
+
+    def set_evidence_horizontal_portscan(
+            timestamp, pkts_sent, protocol, profileid, twid, uids, dport, amount_of_dips
+    ):
+        network_discovery.alerted_once_horizontal_ps = False
+        detections.append((
+            'HorizontalPortscan', protocol, dport, amount_of_dips,
+            pkts_sent, sorted(uids), float(timestamp)
+        ))
+
+    def set_evidence_vertical_portscan(
+            timestamp, pkts_sent, protocol, profileid, twid, uids, amount_of_dports, dstip
+    ):
+        network_discovery.alerted_once_vertical_ps = False
+        detections.append((
+            'VerticalPortscan', protocol, dstip, amount_of_dports,
+            pkts_sent, sorted(uids), float(timestamp)
+        ))
+
+    def set_evidence_icmpscan(
+            number_of_scanned_ips, timestamp, pkts_sent, protocol, profileid, twid, uids, *_, **__
+    ):
+        detections.append((
+            'ICMPScan', number_of_scanned_ips, pkts_sent, sorted(uids), float(timestamp)
+        ))
+
+    network_discovery.set_evidence_horizontal_portscan = set_evidence_horizontal_portscan
+    network_discovery.set_evidence_icmpscan = set_evidence_icmpscan
+    network_discovery.set_evidence_vertical_portscan = set_evidence_vertical_portscan
+    # get the msgs the profiler publishes in new_flow
+    new_flows = []
+    monkeypatch.setattr(
+        database, 'publish',
+        lambda channel, data: new_flows.append(data) if channel == 'new_flow' else None
+    )
+
+    old_detections = []
+    cache = {}
+    with open('dataset/test11-portscan.binetflow') as binetflow:
+        profilerProcess.define_columns({'data': next(binetflow), 'type': 'argus'})
+        for line in binetflow:
+            flow = profilerProcess.process_argus_input({'data': line, 'type': 'argus'})
+            profilerProcess.add_flow_to_profile(flow)
+            old_detections += get_old_detections(database, flow.profileid, flow.twid, cache)
+            for data in new_flows:
+                network_discovery.handle_new_flow({'channel': 'new_flow', 'data': data})
+            new_flows.clear()
+
+    assert old_detections
+    # both find the port scans of each flow in a different order
+    assert sorted(detections) == sorted(old_detections)
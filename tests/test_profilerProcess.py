@@ -1,6 +1,7 @@
 """Unit test for ../profilerProcess.py"""
 from slips_files.core.profilerProcess import ProfilerProcess
 from slips_files.core.whitelist import Whitelist
+from slips_files.core.flows import Conn, DNS, SSL
 import subprocess
 import configparser
 import pytest
@@ -172,14 +173,15 @@ def test_add_flow_to_profile(outputQueue, inputQueue, file, type_, database):
     }
 
     # process it
-    assert profilerProcess.process_zeek_input(sample_flow) == True
+    flow = profilerProcess.process_zeek_input(sample_flow)
+    assert flow
     # add to profile
-    added_to_prof = profilerProcess.add_flow_to_profile()
+    added_to_prof = profilerProcess.add_flow_to_profile(flow)
     assert added_to_prof == True
 
-    uid = profilerProcess.uid
-    profileid =  profilerProcess.profileid
-    twid =  profilerProcess.twid
+    uid = flow.uid
+    profileid = flow.profileid
+    twid = flow.twid
 
     # make sure it's added
     if type_ == 'conn':
@@ -189,3 +191,35 @@ def test_add_flow_to_profile(outputQueue, inputQueue, file, type_, database):
             database.get_altflow_from_uid(profileid, twid, uid) != None
         )
     assert added_flow != None
+
+
+@pytest.mark.parametrize(
+    'file,input_type,flow_class',
+    [
+        ('dataset/test9-mixed-zeek-dir/conn.log', 'zeek', Conn),
+        ('dataset/test9-mixed-zeek-dir/dns.log', 'zeek', DNS),
+        ('dataset/test10-mixed-zeek-dir/conn.log', 'zeek-tabs', Conn),
+        ('dataset/test10-mixed-zeek-dir/ssl.log', 'zeek-tabs', SSL),
+    ],
+)
+def test_flow_records(outputQueue, inputQueue, file, input_type, flow_class):
+    profilerProcess = create_profilerProcess_instance(outputQueue, inputQueue)
+    with open(file) as f:
+        while True:
+            line = f.readline()
+            # get the first line that isn't a comment
+            if not line.startswith('#'):
+                break
+
+    if input_type == 'zeek':
+        line = json.loads(line)
+        expected_saddr = line['id.orig_h']
+        flow = profilerProcess.process_zeek_input({'data': line, 'type': file})
+    else:
+        expected_saddr = line.split('\t')[2]
+        flow = profilerProcess.process_zeek_tabs_input({'data': line, 'type': file})
+
+    assert type(flow) == flow_class
+    assert flow.saddr == expected_saddr
+    # records don't have a dict of fields
+    assert not hasattr(flow, '__dict__')
@@ -0,0 +1,65 @@
+from slips_files.core.profilerRouter import ProfilerRouter
+
+
+class ListQueue:
+    def __init__(self):
+        self.lines = []
+
+    def put(self, line):
+        self.lines.append(line)
+
+    def depth(self):
+        return len(self.lines)
+
+
+def create_router(workers):
+    return ProfilerRouter([ListQueue() for _ in range(workers)])
+
+
+def zeek_line(saddr, daddr='8.8.8.8'):
+    return {
+        'type': 'conn.log',
+        'data': {'id.orig_h': saddr, 'id.resp_h': daddr}
+    }
+
+
+def test_same_profile_same_worker():
+    router = create_router(4)
+    for daddr in ('1.1.1.1', '8.8.8.8', '9.9.9.9'):
+        router.put(zeek_line('192.168.1.5', daddr=daddr))
+    assert sorted(queue.depth() for queue in router.queues) == [0, 0, 0, 3]
+
+
+def test_profiles_are_spread():
+    router = create_router(4)
+    for i in range(200):
+        router.put(zeek_line(f'10.0.0.{i}'))
+    assert all(queue.depth() > 0 for queue in router.queues)
+    assert router.depth() == 200
+
+
+def test_stop_is_broadcast():
+    router = create_router(3)
+    router.put('stop')
+    assert all(queue.lines == ['stop'] for queue in router.queues)
+
+
+def test_argus_header_is_broadcast():
+    router = create_router(3)
+    header = {'type': 'argus', 'data': 'StartTime,Dur,Proto,SrcAddr,Sport,Dir,DstAddr'}
+    router.put(header)
+    assert all(queue.lines == [header] for queue in router.queues)
+    line = {'type': 'argus', 'data': '2021/01/01 10:00:00,1,tcp,10.0.0.1,80,->,1.1.1.1'}
+    router.put(line)
+    assert router.depth() == 4
+    assert router.queues[router.get_worker('10.0.0.1')].lines[-1] == line
+
+
+def test_zeek_tabs_and_suricata_saddr():
+    router = create_router(2)
+    assert router.get_saddr(
+        {'type': 'conn.log', 'data': '1.0\tCabc\t10.0.0.2\t5353'}
+    ) == '10.0.0.2'
+    assert router.get_saddr(
+        {'type': 'suricata', 'data': '{"event_type":"flow","src_ip":"10.0.0.3","src_port":1}'}
+    ) == '10.0.0.3'
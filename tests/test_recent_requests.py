@@ -0,0 +1,38 @@
+from slips_files.common.recent_requests import RecentRequests
+
+
+def test_should_send():
+    requests = RecentRequests(ttl=10)
+    assert requests.should_send(('1.1.1.1', 'dstip'), 100)
+    assert not requests.should_send(('1.1.1.1', 'dstip'), 105)
+    # a different lookup type of the same ip
+    assert requests.should_send(('1.1.1.1', 'srcip'), 105)
+    # expired
+    assert requests.should_send(('1.1.1.1', 'dstip'), 110)
+    assert requests.suppressed == 1
+
+
+def test_flows_out_of_order():
+    requests = RecentRequests(ttl=10)
+    assert requests.should_send('1.1.1.1', 100)
+    assert not requests.should_send('1.1.1.1', 95)
+
+
+def test_disabled():
+    requests = RecentRequests(ttl=0)
+    assert requests.should_send('1.1.1.1', 100)
+    assert requests.should_send('1.1.1.1', 100)
+    assert requests.suppressed == 0
+
+
+def test_eviction():
+    requests = RecentRequests(ttl=10, max_size=2)
+    for ip in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+        assert requests.should_send(ip, 100)
+    assert len(requests) == 2
+    # the oldest request was forgotten
+    assert requests.should_send('1.1.1.1', 101)
+
+    # expired requests are forgotten
+    assert requests.should_send('4.4.4.4', 200)
+    assert len(requests) == 1
@@ -0,0 +1,68 @@
+from slips_files.common.scheduler import Scheduler
+import threading
+import time
+
+
+def test_scheduler():
+    scheduler = Scheduler('test')
+    calls = []
+    done = threading.Event()
+    scheduler.schedule(0.2, calls.append, ('last',), key='last')
+    scheduler.schedule(0.1, calls.append, ('first',), key='first')
+    # the same key can't be scheduled again while it's waiting
+    assert not scheduler.schedule(0.1, calls.append, ('again',), key='first')
+    scheduler.schedule(0.1, calls.append, ('cancelled',), key='cancelled')
+    assert scheduler.cancel('cancelled')
+    assert 'cancelled' not in scheduler
+    scheduler.schedule(0.3, done.set)
+    assert len(scheduler) == 3
+
+    scheduler.start()
+    assert done.wait(5)
+    assert calls == ['first', 'last']
+    scheduler.shutdown()
+    assert not scheduler.is_alive()
+
+
+def test_key_is_kept_while_running():
+    scheduler = Scheduler('test')
+    checked_again = []
+
+    def check(uid):
+        # the 2nd call knows that it's a check after waiting
+        if ('check', uid) not in scheduler:
+            scheduler.schedule(0.01, check, (uid,), key=('check', uid))
+        else:
+            checked_again.append(uid)
+
+    check('uid1')
+    assert not checked_again
+    scheduler.start()
+    # waits for the calls waiting
+    scheduler.shutdown()
+    assert checked_again == ['uid1']
+    assert not len(scheduler)
+
+
+def test_failing_call():
+    errors = []
+    scheduler = Scheduler('test', print_error=errors.append)
+    calls = []
+    scheduler.schedule(0, lambda: 1 / 0)
+    scheduler.schedule(0, calls.append, (1,))
+    scheduler.start()
+    scheduler.shutdown()
+    assert 'ZeroDivisionError' in errors[0]
+    assert calls == [1]
+
+
+def test_shutdown_waits_for_the_delay():
+    scheduler = Scheduler('test')
+    called_at = []
+    scheduler.schedule(0.3, lambda: called_at.append(time.monotonic()))
+    scheduler.start()
+    shutdown_at = time.monotonic()
+    scheduler.shutdown()
+    # the call wasn't run before its delay
+    assert called_at[0] - shutdown_at >= 0.25
+    assert not scheduler.is_alive()
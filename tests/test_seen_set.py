@@ -0,0 +1,15 @@
+from slips_files.common.seen_set import SeenSet
+
+
+def test_seen_set():
+    seen = SeenSet(max_size=2)
+    assert '1.1.1.1' not in seen
+    seen.add('1.1.1.1')
+    seen.add('2.2.2.2')
+    assert '1.1.1.1' in seen
+    # 2.2.2.2 is the least recently used now
+    seen.add('3.3.3.3')
+    assert len(seen) == 2
+    assert '2.2.2.2' not in seen
+    assert '1.1.1.1' in seen
+    assert '3.3.3.3' in seen
@@ -1,4 +1,5 @@
 from ..slips_files.common.slips_utils import Utils
+from datetime import datetime
 
 
 def create_utils_instance():
@@ -15,3 +16,30 @@ def test_get_hash_from_file():
         utils.get_hash_from_file('modules/template/__init__.py')
         == '2d12747a3369505a4d3b722a0422f8ffc8af5514355cdb0eb18178ea7071b8d0'
     )
+
+
+def test_get_domain_and_parents():
+    utils = create_utils_instance()
+    assert utils.get_domain_and_parents('images.google.com') == [
+        'images.google.com',
+        'google.com',
+        'com',
+    ]
+    assert utils.get_domain_and_parents('google.com.') == ['google.com', 'com']
+
+
+def test_convert_to_datetime():
+    utils = create_utils_instance()
+    assert utils.convert_to_datetime('2021/10/05 14:20:46.658107') == datetime(
+        2021, 10, 5, 14, 20, 46, 658107
+    )
+    # the format of the previous ts is tried first
+    assert utils.convert_to_datetime('2021/10/05 14:20:47.000001') == datetime(
+        2021, 10, 5, 14, 20, 47, 1
+    )
+    assert utils.convert_to_datetime('2021-10-05 14:20:46') == datetime(
+        2021, 10, 5, 14, 20, 46
+    )
+    assert utils.convert_to_datetime('1633436446.5') == datetime.fromtimestamp(
+        1633436446.5
+    )
@@ -0,0 +1,44 @@
+from slips_files.common.state_store import StateStore
+
+
+tw1 = 'profile_192.168.1.1_timewindow1'
+tw10 = 'profile_192.168.1.1_timewindow10'
+
+
+def test_close_tw():
+    store = StateStore()
+    store.set('a', 1, tw1)
+    store.set('b', 2, tw10)
+    # updating a key moves it to the tw of the update
+    store.set('c', 3, tw1)
+    store.set('c', 4, tw10)
+    assert store['c'] == 4
+
+    store.close_tw(tw1)
+    assert 'a' not in store
+    assert store.get('b') == 2
+    assert store.get('c') == 4
+    store.close_tw(tw10)
+    assert not len(store)
+    assert store.stats() == {
+        'size': 0, 'tws': 0, 'hits': 3, 'misses': 0, 'expired': 3, 'evicted': 0
+    }
+
+
+def test_lru_eviction():
+    store = StateStore(max_size=2)
+    store.set('a', 1, tw1)
+    store.set('b', 2, tw1)
+    # a is used so b is the least recently used
+    assert store['a'] == 1
+    store.set('c', 3, tw1)
+    assert 'b' not in store
+    assert store.get('b') is None
+    assert store.pop('a') == 1
+    assert store.pop('a') is None
+    stats = store.stats()
+    assert stats['evicted'] == 1
+    assert stats['misses'] == 1
+    assert stats['size'] == 1
+    store.close_tw(tw1)
+    assert not store.keys_per_tw
@@ -0,0 +1,124 @@
+from slips_files.common.timewindow_cache import TimewindowCache
+from datetime import datetime
+from itertools import islice
+import json
+import pytest
+
+
+def do_nothing(*arg):
+    """Used to override the print function because using the self.print causes broken pipes"""
+    pass
+
+
+class OutputQueue:
+    """the db sends a msg per tw created, nothing reads them in these tests"""
+    put = staticmethod(do_nothing)
+
+
+def create_db_instance(width):
+    from slips_files.core.database.database import __database__
+    __database__.outputqueue = OutputQueue()
+    __database__.print = do_nothing
+    __database__.width = width
+    __database__.connect_to_redis_server(6381)
+    __database__.r.flushdb()
+    return __database__
+
+
+def read_zeek_json(path):
+    with open(path) as conn_log:
+        for line in conn_log:
+            flow = json.loads(line)
+            yield flow['ts'], flow['id.orig_h'], flow['id.resp_h']
+
+
+def read_zeek_tabs(path):
+    with open(path) as conn_log:
+        for line in conn_log:
+            if line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            yield float(fields[0]), fields[2], fields[4]
+
+
+def read_binetflow(path):
+    with open(path) as binetflow:
+        # skip the header
+        next(binetflow)
+        for line in binetflow:
+            fields = line.split(',')
+            starttime = datetime.strptime(fields[0], '%Y/%m/%d %H:%M:%S.%f').timestamp()
+            yield starttime, fields[3], fields[6]
+
+
+def get_twids(flows, get_timewindow):
+    """returns the twid of the src and dst profile of each flow"""
+    twids = []
+    for starttime, saddr, daddr in flows:
+        twids.append(get_timewindow(starttime, f'profile_{saddr}'))
+        twids.append(get_timewindow(starttime, f'profile_{daddr}'))
+    return twids
+
+
+@pytest.mark.parametrize(
+    'read_flows,path',
+    [
+        (read_zeek_json, 'dataset/test9-mixed-zeek-dir/conn.log'),
+        (read_zeek_tabs, 'dataset/test10-mixed-zeek-dir/conn.log'),
+        (read_binetflow, 'dataset/test2-malicious.binetflow'),
+        (read_binetflow, 'dataset/test11-portscan.binetflow'),
+    ],
+)
+@pytest.mark.parametrize('width', [60, 3600])
+def test_same_twids_as_db(read_flows, path, width):
+    flows = list(islice(read_flows(path), 500))
+    database = create_db_instance(width)
+    twids = get_twids(flows, database.get_timewindow)
+    tws_in_db = {
+        profile: database.r.zrange(profile, 0, -1, withscores=True)
+        for profile in database.r.keys('tws*')
+    }
+
+    database.r.flushdb()
+    tw_cache = TimewindowCache()
+    assert get_twids(flows, tw_cache.get_timewindow) == twids
+    # the same tws are created, with the same start times
+    for profile, tws in tws_in_db.items():
+        cached_tws = database.r.zrange(profile, 0, -1, withscores=True)
+        assert [twid for twid, _ in cached_tws] == [twid for twid, _ in tws]
+        assert [start for _, start in cached_tws] == pytest.approx([start for _, start in tws])
+
+    # a new cache loads the tw boundaries from the db
+    assert get_twids(flows, TimewindowCache().get_timewindow) == twids
+
+
+def test_flow_at_the_start_of_a_tw():
+    width = 3600
+    database = create_db_instance(width)
+    profileid = 'profile_192.168.1.1'
+    tw_cache = TimewindowCache()
+    start = 22.335172
+    assert tw_cache.get_timewindow(start, profileid) == 'timewindow1'
+    # the first tw of the profile is now timewindow0, and its start
+    # plus the width isn't exactly the start of timewindow1
+    assert tw_cache.get_timewindow(start - width, profileid) == 'timewindow0'
+    assert tw_cache.get_timewindow(start + 2 * width, profileid) == 'timewindow3'
+
+    tw_cache = TimewindowCache()
+    assert tw_cache.get_timewindow(start, profileid) == 'timewindow1'
+    assert tw_cache.get_timewindow(start - width, profileid) == 'timewindow0'
+    assert tw_cache.get_timewindow(start + width, profileid) == 'timewindow2'
+    assert tw_cache.get_timewindow(start + 2 * width - 0.000001, profileid) == 'timewindow2'
+
+
+def test_first_tw_created_by_another_worker():
+    database = create_db_instance(3600)
+    profileid = 'profile_192.168.1.1'
+    tw_cache = TimewindowCache()
+    other_worker = TimewindowCache()
+    # both workers see the profile without tws
+    assert not tw_cache.load(profileid)
+    assert other_worker.get_timewindow(1000, profileid) == 'timewindow1'
+    # the flow is 1 tw after the first flow of the other worker
+    assert tw_cache.create_first_timewindow(profileid, 4600) == [1000, 1, 1]
+    assert tw_cache.get_timewindow(4600, profileid) == 'timewindow2'
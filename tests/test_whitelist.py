@@ -1,4 +1,4 @@
-from slips_files.core.whitelist import Whitelist
+from slips_files.core.whitelist import Whitelist, CompiledWhitelist
 import configparser
 import pytest
 
@@ -47,3 +47,75 @@ def test_load_org_IPs(org, outputQueue, inputQueue, subnet):
     first_octet = subnet.split('.')[0]
     assert first_octet in whitelist.load_org_IPs(org)
     assert subnet in whitelist.load_org_IPs(org)[first_octet]
+
+
+def create_compiled_whitelist():
+    whitelisted_IPs = {
+        '1.1.1.1': {'from': 'src', 'what_to_ignore': 'flows'},
+        '2.2.2.2': {'from': 'both', 'what_to_ignore': 'both'},
+        '3.3.3.3': {'from': 'both', 'what_to_ignore': 'alerts'},
+    }
+    whitelisted_domains = {
+        'slack.com': {'from': 'dst', 'what_to_ignore': 'flows'},
+    }
+    whitelisted_orgs = {
+        'google': {'from': 'both', 'what_to_ignore': 'flows'},
+    }
+    whitelisted_macs = {
+        'aa:bb:cc:dd:ee:ff': {'from': 'dst', 'what_to_ignore': 'both'},
+    }
+    org_info = {
+        'google': {
+            'IPs': {'216': ['216.73.80.0/20']},
+            'domains': ['mail.google.com'],
+            'asn': ['AS6432'],
+        }
+    }
+    return CompiledWhitelist(
+        whitelisted_IPs, whitelisted_domains, whitelisted_orgs, whitelisted_macs, org_info
+    )
+
+
+@pytest.mark.parametrize(
+    'ip,direction,expected',
+    [
+        ('1.1.1.1', 'src', True),
+        ('1.1.1.1', 'dst', False),
+        ('2.2.2.2', 'dst', True),
+        # only alerts are ignored
+        ('3.3.3.3', 'src', False),
+    ],
+)
+def test_compiled_whitelist_ips(ip, direction, expected):
+    whitelist = create_compiled_whitelist()
+    assert whitelist.is_whitelisted_ip(ip, direction) == expected
+
+
+@pytest.mark.parametrize(
+    'domain,direction,expected',
+    [
+        ('slack.com', None, True),
+        ('test.slack.com', 'dst', True),
+        ('test.slack.com', 'src', False),
+        ('slack.com.test', None, False),
+        ('notslack.com', None, False),
+    ],
+)
+def test_compiled_whitelist_domains(domain, direction, expected):
+    whitelist = create_compiled_whitelist()
+    assert whitelist.is_whitelisted_domain(domain, direction) == expected
+
+
+def test_compiled_whitelist_orgs():
+    whitelist = create_compiled_whitelist()
+    assert whitelist.is_ip_in_org('216.73.81.1', 'src')
+    assert not whitelist.is_ip_in_org('216.73.100.1', 'dst')
+    assert whitelist.is_asn_in_org('AS6432', 'dst')
+    assert whitelist.is_asn_in_org('GOOGLE LLC', 'src')
+    assert not whitelist.is_asn_in_org('Unknown', 'src')
+    # subdomain and parent domain of the org domains
+    assert whitelist.is_domain_in_org('a.mail.google.com', 'dst')
+    assert whitelist.is_domain_in_org('google.com', 'dst')
+    assert not whitelist.is_domain_in_org('example.com', 'dst')
+    assert whitelist.is_whitelisted_mac('aa:bb:cc:dd:ee:ff', 'dst')
+    assert not whitelist.is_whitelisted_mac('aa:bb:cc:dd:ee:ff', 'src')
@@ -178,15 +178,17 @@ def set_intuples(profile, timewindow):
     :return: (tuple, string, ip_info)
     """
     data = []
-    intuples = __database__.db.hget("profile_" + profile + '_' + timewindow, 'InTuples')
+    # each tuple is a field in this hash, and the ts of its last flows are in <tuple>|timestamps
+    intuples = __database__.db.hgetall("profile_" + profile + '_' + timewindow + '_InTuples')
     if intuples:
-        intuples = json.loads(intuples)
         for key, value in intuples.items():
+            if key.endswith('|timestamps'):
+                continue
             ip, port, protocol = key.split("-")
             ip_info = get_ip_info(ip)
 
             outtuple_dict = dict()
-            outtuple_dict.update({'tuple': key, 'string': value[0]})
+            outtuple_dict.update({'tuple': key, 'string': value})
             outtuple_dict.update(ip_info)
             data.append(outtuple_dict)
 
@@ -204,15 +206,16 @@ def set_outtuples(profile, timewindow):
     """
 
     data = []
-    outtuples = __database__.db.hget("profile_" + profile + '_' + timewindow, 'OutTuples')
+    # each tuple is a field in this hash, and the ts of its last flows are in <tuple>|timestamps
+    outtuples = __database__.db.hgetall("profile_" + profile + '_' + timewindow + '_OutTuples')
     if outtuples:
-        outtuples = json.loads(outtuples)
-
         for key, value in outtuples.items():
+            if key.endswith('|timestamps'):
+                continue
             ip, port, protocol = key.split("-")
             ip_info = get_ip_info(ip)
             outtuple_dict = dict()
-            outtuple_dict.update({'tuple': key, 'string': value[0]})
+            outtuple_dict.update({'tuple': key, 'string': value})
             outtuple_dict.update(ip_info)
             data.append(outtuple_dict)
 
@@ -299,9 +302,7 @@ def set_alerts(profile, timewindow):
         alerts = json.loads(alerts)
         alerts_tw = alerts.get(timewindow, dict())
         tws = get_all_tw_with_ts(profile)
-        evidences = __database__.db.hget("evidence" + profile, timewindow)
-        if evidences:
-            evidences = json.loads(evidences)
+        evidences = __database__.db.hgetall(f"{profile}_{timewindow}_evidence")
 
         for alert_ID, evidence_ID_list in alerts_tw.items():
             evidence_count = len(evidence_ID_list)
@@ -331,8 +332,7 @@ def set_evidence(profile, timewindow, alert_id):
         alerts = json.loads(alerts)
         alerts_tw = alerts[timewindow]
         evidence_ID_list = alerts_tw[alert_id]
-        evidences = __database__.db.hget("evidence" + "profile_" + profile, timewindow)
-        evidences = json.loads(evidences)
+        evidences = __database__.db.hgetall(f"profile_{profile}_{timewindow}_evidence")
 
         for evidence_ID in evidence_ID_list:
             temp_evidence = json.loads(evidences[evidence_ID])
@@ -351,9 +351,8 @@ def set_evidence_general(profile, timewindow):
     :return: {"data": data} where data is a list of evidences
     """
     data = []
-    evidence = __database__.db.hget("evidence"+"profile_" + profile, timewindow)
+    evidence = __database__.db.hgetall(f"profile_{profile}_{timewindow}_evidence")
     if evidence:
-        evidence = json.loads(evidence)
         for id, content in evidence.items():
             content = json.loads(content)
             if "source_target_tag" not in content:
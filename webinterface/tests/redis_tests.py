@@ -59,18 +59,14 @@ def test_type_tws_correct():
 
 
 def test_type_outtuples_correct():
-    test_key = "profile_188.110.58.51_timewindow1"
-    test_field = "OutTuples"
+    test_key = "profile_188.110.58.51_timewindow1_OutTuples"
     assert __database__.type(test_key) == TYPE_HASH
 
-    outtuples = __database__.hget(test_key, test_field)
-    assert is_json(outtuples) == True
-
-    outtuples = json.loads(outtuples)
-    assert (type(outtuples) is dict) == True
-
-    first_keypair = list(outtuples.items())[0]
-    assert (type(first_keypair[1]) is list) == True
+    outtuples = __database__.hgetall(test_key)
+    tupleid = next(field for field in outtuples if not field.endswith('|timestamps'))
+    # each tuple has its letters and the ts of its last 2 flows
+    assert f'{tupleid}|timestamps' in outtuples
+    assert len(outtuples[f'{tupleid}|timestamps'].split(',')) == 2
 
 
 def test_type_IPsInfo_correct():